@@ -1,6 +1,6 @@
 from flask import Flask, render_template, session, redirect, url_for, send_from_directory
 from flask_session import Session
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from datetime import timedelta
 import os
 import signal
@@ -12,6 +12,10 @@ import uuid
 from config import Config
 from routes import register_blueprints
 from database.db_manager_flask import init_db, DatabaseManagerFlask
+from database.import_jobs import import_jobs
+from database.sample_enrichment import enrichment_jobs
+from utils.bat_trainer import bat_training_jobs
+from utils.training_jobs import training_jobs
 
 # Application version
 __version__ = "1.0.0"
@@ -44,6 +48,10 @@ def create_app(config_class=Config):
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
     Session(app)
     
+    # Local BLAST reference for /sequence/blast-consensus (see README); config.py takes precedence
+    app.config.setdefault('BLAST_REFERENCE_FASTA', os.environ.get('BLAST_REFERENCE_FASTA'))
+    app.config.setdefault('BLAST_BACKEND', os.environ.get('BLAST_BACKEND', 'auto'))
+    
     # Initialize SocketIO for real-time updates
     socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
     
@@ -52,6 +60,10 @@ def create_app(config_class=Config):
     
     # Set socketio instance for the database manager
     DatabaseManagerFlask.set_socketio(socketio)
+    import_jobs.set_socketio(socketio)
+    enrichment_jobs.set_socketio(socketio)
+    bat_training_jobs.set_socketio(socketio)
+    training_jobs.set_socketio(socketio)
     
     # Register blueprints
     register_blueprints(app)
@@ -113,6 +125,50 @@ def create_app(config_class=Config):
         """Handle subscription to real-time updates"""
         emit('status', {'msg': f'Subscribed to {data.get("table", "all")} updates'})
     
+    @socketio.on('join_import_job')
+    def handle_join_import_job(data):
+        """Join the room of one of the user's import jobs and send its current progress"""
+        job = import_jobs.get((data or {}).get('job_id'), session.get('user_id'))
+        if job is None:
+            emit('import_progress', {'job_id': (data or {}).get('job_id'), 'completed': True, 'success': False,
+                                     'status': 'Import job not found'})
+            return
+        join_room(job.room)
+        emit('import_progress', job.snapshot())
+    
+    @socketio.on('join_enrich_job')
+    def handle_join_enrich_job(data):
+        """Join the room of one of the user's sheet enrichment jobs and send its current progress"""
+        job = enrichment_jobs.get((data or {}).get('job_id'), session.get('user_id'))
+        if job is None:
+            emit('enrich_progress', {'job_id': (data or {}).get('job_id'), 'completed': True, 'success': False,
+                                     'status': 'Enrichment job not found'})
+            return
+        join_room(job.room)
+        emit('enrich_progress', job.snapshot())
+    
+    @socketio.on('join_bat_train_job')
+    def handle_join_bat_train_job(data):
+        """Join the room of one of the user's bat model training jobs and send its current progress"""
+        job = bat_training_jobs.get((data or {}).get('job_id'), session.get('user_id'))
+        if job is None:
+            emit('bat_train_progress', {'job_id': (data or {}).get('job_id'), 'completed': True, 'success': False,
+                                        'status': 'Training job not found'})
+            return
+        join_room(job.room)
+        emit('bat_train_progress', job.snapshot())
+    
+    @socketio.on('join_training_job')
+    def handle_join_training_job(data):
+        """Join the room of one of the user's chat/ML model training jobs and send its current progress"""
+        job = training_jobs.get((data or {}).get('job_id'), session.get('user_id'))
+        if job is None:
+            emit('training_progress', {'job_id': (data or {}).get('job_id'), 'completed': True, 'success': False,
+                                       'status': 'Training job not found'})
+            return
+        join_room(job.room)
+        emit('training_progress', job.snapshot())
+    
     return app, socketio
 
 
@@ -0,0 +1,104 @@
+"""
+Benchmark: row-by-row vs batched DataFrame import
+
+Compares the old per-row INSERT loop (iterrows + pd.isna tuple per row) with
+DatabaseManagerFlask.bulk_insert_dataframe on synthetic host/screening-like
+frames. Runs against a temporary SQLite file so it needs no server; against
+MariaDB the batched path gains more because executemany uses the bulk protocol.
+
+Usage:
+    python benchmarks/bench_import_dataframe.py [--rows 10000 100000] [--chunk-size 5000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.db_manager_flask import DatabaseManagerFlask  # noqa: E402
+
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic sheet with text, int, float and date columns and ~10% missing values"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'source_id': [f'CANB_{i:07d}' for i in range(rows)],
+        'province': rng.choice(['Vientiane', 'Luang Prabang', 'Champasak', None], rows),
+        'sample_count': rng.integers(0, 50, rows),
+        'weight_g': rng.normal(25.0, 6.0, rows),
+        'forearm_mm': rng.normal(48.0, 9.0, rows),
+        'collected_at': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        'notes': rng.choice(['saliva', 'anal swab', 'blood', 'tissue'], rows),
+    })
+    for col in ['weight_g', 'forearm_mm', 'notes']:
+        df.loc[rng.random(rows) < 0.1, col] = None
+    return df
+
+
+def create_table(conn, table_name: str):
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f'''CREATE TABLE "{table_name}" (
+        source_id TEXT, province TEXT, sample_count INTEGER, weight_g REAL,
+        forearm_mm REAL, collected_at TEXT, notes TEXT
+    )''')
+    conn.commit()
+
+
+def insert_row_by_row(conn, df: pd.DataFrame, table_name: str) -> int:
+    """The previous import_dataframe loop, adapted to SQLite placeholders"""
+    cursor = conn.cursor()
+    count = 0
+    for _, row in df.iterrows():
+        placeholders = ', '.join(['?'] * len(row))
+        insert_sql = f'INSERT INTO "{table_name}" VALUES ({placeholders})'
+        values = tuple(None if pd.isna(val) else val for val in row.values)
+        cursor.execute(insert_sql, values)
+        count += 1
+    conn.commit()
+    return count
+
+
+def run(rows_list, chunk_size):
+    # Keep collected_at as text so both paths bind the same parameter types
+    sqlite3.register_adapter(pd.Timestamp, lambda ts: ts.isoformat(sep=' '))
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    conn = sqlite3.connect(db_path)
+    try:
+        print(f"{'rows':>10} {'row-by-row (s)':>16} {'batched (s)':>12} {'speedup':>8}")
+        for rows in rows_list:
+            df = make_frame(rows)
+
+            create_table(conn, 'bench_rows')
+            started = time.perf_counter()
+            insert_row_by_row(conn, df, 'bench_rows')
+            row_time = time.perf_counter() - started
+
+            create_table(conn, 'bench_batched')
+            started = time.perf_counter()
+            inserted = DatabaseManagerFlask.bulk_insert_dataframe(
+                conn, df, 'bench_batched', 'sqlite', chunk_size=chunk_size
+            )
+            batched_time = time.perf_counter() - started
+
+            assert inserted == rows
+            counts = [conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in ('bench_rows', 'bench_batched')]
+            assert counts == [rows, rows], counts
+
+            print(f"{rows:>10} {row_time:>16.3f} {batched_time:>12.3f} {row_time / batched_time:>7.1f}x")
+    finally:
+        conn.close()
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--chunk-size', type=int, default=DatabaseManagerFlask.IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    run(args.rows, args.chunk_size)
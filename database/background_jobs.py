@@ -0,0 +1,150 @@
+"""
+Background jobs with progress pushed over SocketIO
+
+Shared by the Excel import, sheet enrichment and model training jobs. A job
+keeps its progress state behind a lock and has its own SocketIO room; the
+manager runs jobs on a lazily created executor, tracks them by job ID, only
+shows a job to its owner, throttles progress events and forgets finished jobs
+after a TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+
+class BackgroundJob:
+    """
+    Progress state of one job. Subclasses set ROOM_PREFIX and pass their own
+    state fields to __init__.
+    """
+
+    ROOM_PREFIX = 'job'
+
+    def __init__(self, job_id: str, owner: Any, **state):
+        self.job_id = job_id
+        self.owner = owner
+        self.finished_at = None
+        self.last_emit = 0.0
+        self._lock = threading.Lock()
+        self._state = {
+            'job_id': job_id,
+            'status': 'Queued',
+            **state,
+            'completed': False,
+            'success': None,
+            'result': None,
+        }
+
+    @property
+    def room(self) -> str:
+        return f'{self.ROOM_PREFIX}_{self.job_id}'
+
+    @property
+    def completed(self) -> bool:
+        return self._state['completed']
+
+    def owned_by(self, owner: Any) -> bool:
+        return owner == self.owner
+
+    def update(self, **changes) -> Dict[str, Any]:
+        """Apply changes to the progress state and return a snapshot of it"""
+        with self._lock:
+            self._apply(changes)
+            return self._snapshot()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._snapshot()
+
+    def _apply(self, changes: Dict[str, Any]):
+        self._state.update(changes)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return dict(self._state)
+
+
+class BackgroundJobManager:
+    """
+    Runs jobs on a bounded executor and tracks them by job ID.
+
+    Args:
+        max_workers: Jobs that run at the same time; further jobs wait in the queue
+        ttl: Seconds a finished job is kept
+        emit_interval: Minimum seconds between progress events for one job
+    """
+
+    # SocketIO event progress snapshots are emitted as
+    EVENT = 'job_progress'
+    THREAD_NAME_PREFIX = 'background-job'
+
+    def __init__(self, max_workers: int = 2, ttl: float = 3600.0, emit_interval: float = 0.25):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.emit_interval = emit_interval
+        self._socketio = None
+        self._executor = None
+        self._jobs: 'OrderedDict[str, BackgroundJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_socketio(self, socketio):
+        """Set the SocketIO instance progress events are emitted on"""
+        self._socketio = socketio
+
+    def _create_executor(self) -> Executor:
+        """Called once, under the manager lock, when the first job is submitted"""
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.THREAD_NAME_PREFIX)
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _add(self, job: BackgroundJob) -> BackgroundJob:
+        with self._lock:
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str, owner: Any) -> Optional[BackgroundJob]:
+        """Look up a job; jobs are only visible to the owner that started them"""
+        self.expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or not job.owned_by(owner):
+            return None
+        return job
+
+    def expire(self):
+        """Forget finished jobs older than the TTL"""
+        now = time.time()
+        with self._lock:
+            stale = [job_id for job_id, job in self._jobs.items()
+                     if job.finished_at is not None and now - job.finished_at > self.ttl]
+            expired = [self._jobs.pop(job_id) for job_id in stale]
+        for job in expired:
+            self._on_expired(job)
+
+    def _on_expired(self, job: BackgroundJob):
+        """Release what a forgotten job still holds (files, shared state)"""
+
+    @staticmethod
+    def _remove_file(path: Optional[str]):
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _emit(self, job: BackgroundJob, snapshot: Dict[str, Any], force: bool = False):
+        now = time.monotonic()
+        if not force and now - job.last_emit < self.emit_interval:
+            return
+        job.last_emit = now
+        if self._socketio:
+            try:
+                self._socketio.emit(self.EVENT, snapshot, room=job.room)
+            except Exception as e:
+                print(f"[ERROR] Failed to emit {self.EVENT} for job {job.job_id}: {e}")
@@ -0,0 +1,187 @@
+"""
+BLAST result cache
+
+blast_consensus used to search every consensus again, even when the same
+sequence had been searched before: a consensus re-generated with a different
+trim setting that comes out the same, or the same reads uploaded in a new
+session. Hits are now cached in a blast_cache table of the user's database,
+next to blast_results / blast_hits, keyed by
+
+    (MD5 of the sequence, program, database, Entrez filter, CACHE_VERSION)
+
+The sequence hash is the MD5 SequenceDBManager uses for its file hashes,
+taken over the upper-cased sequence. For the local engine the "database" is
+an ID of the reference FASTA and its index, so changing the reference misses
+the cache. Entries expire after a TTL (NCBI's databases change), and bumping
+CACHE_VERSION retires all of them.
+
+The table is created the first time a database is used. It is one of the
+SYSTEM_TABLES, so the identifier and full-text indexes leave it out.
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+from database.db_manager_flask import DatabaseManagerFlask
+
+# Bump when the cached hit format changes
+CACHE_VERSION = 1
+
+DEFAULT_TTL_DAYS = 30
+
+LOOKUP_BATCH = 500
+
+
+def sequence_hash(sequence: str) -> str:
+    """MD5 of a sequence, ignoring case and surrounding whitespace"""
+    return hashlib.md5(sequence.strip().upper().encode()).hexdigest()
+
+
+class BlastCache:
+    """
+    Cached BLAST hits in the blast_cache table.
+
+    Args:
+        conn: Open connection to the user's database
+        db_type: 'sqlite' or 'mysql'
+        ttl_days: Days an entry is used after it was stored
+    """
+
+    # connection_key() of the databases whose blast_cache table is known to exist
+    _ready = set()
+    _ready_lock = threading.Lock()
+
+    SQLITE_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS blast_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sequence_hash TEXT NOT NULL,
+            program TEXT NOT NULL,
+            database_used TEXT NOT NULL,
+            entrez_query TEXT NOT NULL DEFAULT '',
+            cache_version INTEGER NOT NULL,
+            query_length INTEGER,
+            total_hits INTEGER DEFAULT 0,
+            hits_json TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            hit_count INTEGER DEFAULT 0,
+            last_hit_at DATETIME,
+            UNIQUE (sequence_hash, program, database_used, entrez_query, cache_version)
+        )
+    '''
+
+    MYSQL_SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS blast_cache (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            sequence_hash CHAR(32) NOT NULL,
+            program VARCHAR(50) NOT NULL,
+            database_used VARCHAR(255) NOT NULL,
+            entrez_query VARCHAR(255) NOT NULL DEFAULT '',
+            cache_version INT NOT NULL,
+            query_length INT,
+            total_hits INT DEFAULT 0,
+            hits_json LONGTEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            hit_count INT DEFAULT 0,
+            last_hit_at DATETIME,
+            UNIQUE KEY blast_cache_key (sequence_hash, program, database_used, entrez_query, cache_version)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    '''
+
+    def __init__(self, conn, db_type: str = 'sqlite', ttl_days: float = DEFAULT_TTL_DAYS):
+        self.conn = conn
+        self.db_type = db_type
+        self.ttl = timedelta(days=ttl_days)
+        self.placeholder = '%s' if db_type == 'mysql' else '?'
+        self._ensure_table()
+
+    def _ensure_table(self):
+        """Create blast_cache the first time a database is used, and tell the schema caches"""
+        key = DatabaseManagerFlask.table_stats.connection_key(self.conn)
+        if key is not None and key in BlastCache._ready:
+            return
+        cursor = self.conn.cursor()
+        if self.db_type == 'mysql':
+            cursor.execute("SHOW TABLES LIKE 'blast_cache'")
+        else:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'blast_cache'")
+        if cursor.fetchone() is None:
+            cursor.execute(self.MYSQL_SCHEMA if self.db_type == 'mysql' else self.SQLITE_SCHEMA)
+            self.conn.commit()
+            DatabaseManagerFlask.schema_changed(self.conn, 'blast_cache')
+        if key is not None:
+            with BlastCache._ready_lock:
+                BlastCache._ready.add(key)
+
+    def get_many(self, hashes: Iterable[str], program: str, database: str,
+                 entrez_query: str = '') -> Dict[str, Dict[str, Any]]:
+        """
+        Unexpired cached results.
+
+        Returns:
+            Sequence hash -> {'sequence_length', 'hits', 'cached_at'}
+        """
+        hashes = list(dict.fromkeys(hashes))
+        p = self.placeholder
+        now = datetime.now()
+        cursor = self.conn.cursor()
+        found, ids = {}, []
+        for start in range(0, len(hashes), LOOKUP_BATCH):
+            chunk = hashes[start:start + LOOKUP_BATCH]
+            cursor.execute(f"""
+                SELECT id, sequence_hash, query_length, hits_json, created_at FROM blast_cache
+                WHERE program = {p} AND database_used = {p} AND entrez_query = {p} AND cache_version = {p}
+                  AND expires_at > {p} AND sequence_hash IN ({', '.join([p] * len(chunk))})
+            """, [program, database, entrez_query, CACHE_VERSION, now] + chunk)
+            for entry_id, seq_hash, query_length, hits_json, created_at in cursor.fetchall():
+                found[seq_hash] = {
+                    'sequence_length': query_length,
+                    'hits': json.loads(hits_json),
+                    'cached_at': created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at
+                }
+                ids.append(entry_id)
+        if ids:
+            cursor.executemany(f"UPDATE blast_cache SET hit_count = hit_count + 1, last_hit_at = {p} WHERE id = {p}",
+                               [(now, entry_id) for entry_id in ids])
+            self.conn.commit()
+        return found
+
+    def put_many(self, entries: List[Tuple[str, int, List[Dict[str, Any]]]], program: str, database: str,
+                 entrez_query: str = '') -> int:
+        """
+        Store search results, replacing older entries for the same key.
+
+        Args:
+            entries: (sequence hash, query length, hits) per searched sequence
+
+        Returns:
+            Number of entries stored
+        """
+        if not entries:
+            return 0
+        p = self.placeholder
+        now = datetime.now()
+        cursor = self.conn.cursor()
+        # Expired entries are never read again
+        cursor.execute(f"DELETE FROM blast_cache WHERE expires_at <= {p}", (now,))
+        cursor.executemany(f"""
+            REPLACE INTO blast_cache
+            (sequence_hash, program, database_used, entrez_query, cache_version, query_length, total_hits,
+             hits_json, created_at, expires_at)
+            VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p}, {p}, {p}, {p})
+        """, [(seq_hash, program, database, entrez_query, CACHE_VERSION, query_length, len(hits),
+               json.dumps(hits, default=str), now, now + self.ttl)
+              for seq_hash, query_length, hits in entries])
+        self.conn.commit()
+        return len(entries)
+
+    def clear(self) -> int:
+        """Remove every cached entry; returns how many there were"""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM blast_cache")
+        removed = cursor.rowcount
+        self.conn.commit()
+        return removed
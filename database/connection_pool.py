@@ -0,0 +1,637 @@
+"""
+Thread-safe connection pools for the Flask database manager
+
+Connections are checked out per thread: every call made by the same request
+(or background thread) gets the same connection, and the connection goes
+back to its pool when the request is torn down or the thread releases it.
+
+For SQLite, read-only reader connections and a single dedicated writer
+connection are available for code that knows its access pattern, so readers
+run in parallel under WAL while bulk writes are serialized. MariaDB pools are
+keyed by (host, port, user, database) so different servers never share one.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import mariadb
+from mariadb import Error as MariaDBError
+
+
+class PooledSQLiteConnection(sqlite3.Connection):
+    """sqlite3 connection that hands itself back to its pool on close()"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._read_only = False
+        self._last_used = time.monotonic()
+
+    def close(self):
+        """Return the connection to its pool instead of closing it"""
+        pool = self._pool
+        if pool is not None:
+            pool.release(self)
+        else:
+            super().close()
+
+    def _close_physical(self):
+        """Really close the underlying SQLite handle"""
+        self._pool = None
+        try:
+            sqlite3.Connection.close(self)
+        except sqlite3.Error:
+            pass
+
+
+class _ThreadLease:
+    """Per-thread checkout record; returns the connection if the thread dies holding it"""
+
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+        self.holders = 1
+
+    def __del__(self):
+        # Thread exited without releasing (e.g. a background worker); drop the
+        # connection rather than hand a possibly mid-transaction handle to someone else.
+        if self.conn is not None:
+            try:
+                self.pool._reclaim(self.conn)
+            except Exception:
+                pass
+
+
+class SQLiteConnectionPool:
+    """
+    Connection pool for a single SQLite database file.
+
+    Args:
+        db_path: Absolute path to the database file
+        max_connections: Maximum read-write connections checked out at once
+        max_readers: Maximum read-only connections checked out at once
+        checkout_timeout: Seconds to wait for a free slot before giving up
+        health_check_after: Idle seconds after which a connection is probed before reuse
+        idle_timeout: Idle seconds after which a pooled connection is closed
+        busy_timeout_ms: SQLite busy timeout applied to every connection
+        on_first_connect: Optional callback run once with the first connection
+    """
+
+    def __init__(self, db_path: str, max_connections: int = 32, max_readers: int = 8,
+                 checkout_timeout: float = 30.0, health_check_after: float = 60.0,
+                 idle_timeout: float = 600.0, busy_timeout_ms: int = 30000,
+                 on_first_connect: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.max_readers = max_readers
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.idle_timeout = idle_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self._on_first_connect = on_first_connect
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._reader_slots = threading.BoundedSemaphore(max_readers)
+        self._writer_lock = threading.RLock()
+        self._idle: List[PooledSQLiteConnection] = []
+        self._idle_readers: List[PooledSQLiteConnection] = []
+        self._writer: Optional[PooledSQLiteConnection] = None
+        self._open = 0
+        self._open_readers = 0
+        self._in_use = 0
+        self._readers_in_use = 0
+        self._initialized = False
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'reader_checkouts': 0,
+            'writer_checkouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'health_checks': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Connection construction
+    # ------------------------------------------------------------------
+    def _connect(self, read_only: bool = False) -> PooledSQLiteConnection:
+        """Open a new physical connection"""
+        try:
+            if read_only:
+                conn = sqlite3.connect(
+                    f"{Path(self.db_path).as_uri()}?mode=ro", uri=True,
+                    check_same_thread=False, factory=PooledSQLiteConnection
+                )
+                conn.execute("PRAGMA query_only = ON")
+            else:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=PooledSQLiteConnection)
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        except sqlite3.Error as e:
+            raise ConnectionError(f"Failed to connect to SQLite database: {e}")
+
+        conn._read_only = read_only
+        with self._lock:
+            self._stats['created'] += 1
+            run_init = not read_only and not self._initialized
+            self._initialized = True
+        if run_init and self._on_first_connect:
+            self._on_first_connect(conn)
+        conn._pool = self
+        return conn
+
+    def _healthy(self, conn: PooledSQLiteConnection) -> bool:
+        """Probe a connection only if it has been idle long enough to be suspect"""
+        if time.monotonic() - conn._last_used < self.health_check_after:
+            return True
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except (sqlite3.ProgrammingError, sqlite3.OperationalError):
+            return False
+
+    def _record_wait(self, started: float):
+        waited_ms = (time.monotonic() - started) * 1000.0
+        with self._lock:
+            if waited_ms >= 1.0:
+                self._stats['waits'] += 1
+            self._stats['total_wait_ms'] += waited_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited_ms)
+
+    def _acquire_slot(self, semaphore: threading.BoundedSemaphore, kind: str):
+        started = time.monotonic()
+        if not semaphore.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise ConnectionError(
+                f"No SQLite {kind} connection available for {self.db_path} "
+                f"after {self.checkout_timeout:.0f}s"
+            )
+        self._record_wait(started)
+
+    def _pop_idle(self, idle: List[PooledSQLiteConnection]) -> Optional[PooledSQLiteConnection]:
+        """Take the most recently used healthy connection, pruning stale ones"""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not idle:
+                    return None
+                conn = idle.pop()
+            if now - conn._last_used > self.idle_timeout or not self._healthy(conn):
+                self._discard(conn)
+                continue
+            return conn
+
+    # ------------------------------------------------------------------
+    # Per-thread read-write connections
+    # ------------------------------------------------------------------
+    def acquire(self) -> PooledSQLiteConnection:
+        """Return the calling thread's connection, checking one out if needed"""
+        if self._closed:
+            raise ConnectionError(f"Connection pool for {self.db_path} is closed")
+
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None and lease.conn is not None:
+            lease.holders += 1
+            lease.conn._last_used = time.monotonic()
+            return lease.conn
+
+        self._acquire_slot(self._slots, 'read-write')
+        try:
+            conn = self._pop_idle(self._idle)
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self._open += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+        conn._last_used = time.monotonic()
+        self._local.lease = _ThreadLease(self, conn)
+        return conn
+
+    def release(self, conn: PooledSQLiteConnection, force: bool = False):
+        """
+        Give a connection back to the pool.
+
+        Calls from the owning thread only return the connection once every
+        holder in that thread has closed it, unless force is set.
+        """
+        if conn._read_only or conn is self._writer:
+            # Readers and the writer are returned by their context managers
+            return
+
+        lease = getattr(self._local, 'lease', None)
+        if lease is None or lease.conn is not conn:
+            # Not this thread's checkout (already released or handed across threads)
+            return
+        lease.holders -= 1
+        if lease.holders > 0 and not force:
+            return
+
+        lease.conn = None
+        self._local.lease = None
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn, in_use=True)
+                return
+
+        conn._last_used = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            if self._closed:
+                self._open -= 1
+                conn._close_physical()
+            else:
+                self._idle.append(conn)
+        self._slots.release()
+
+    def release_thread(self):
+        """Return the calling thread's connection regardless of open holders"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None and lease.conn is not None:
+            self.release(lease.conn, force=True)
+
+    def _reclaim(self, conn: PooledSQLiteConnection):
+        """Drop a connection whose owning thread exited without releasing it"""
+        self._discard(conn, in_use=True)
+
+    def _discard(self, conn: PooledSQLiteConnection, in_use: bool = False):
+        """Close a connection and free its slot"""
+        conn._close_physical()
+        with self._lock:
+            self._stats['discarded'] += 1
+            if conn._read_only:
+                self._open_readers -= 1
+                if in_use:
+                    self._readers_in_use -= 1
+            else:
+                self._open -= 1
+                if in_use:
+                    self._in_use -= 1
+        if in_use:
+            (self._reader_slots if conn._read_only else self._slots).release()
+
+    # ------------------------------------------------------------------
+    # Read-only readers and the dedicated writer
+    # ------------------------------------------------------------------
+    @contextmanager
+    def reader(self):
+        """Check out a read-only connection for the duration of the block"""
+        self._acquire_slot(self._reader_slots, 'reader')
+        try:
+            conn = self._pop_idle(self._idle_readers)
+            if conn is None:
+                conn = self._connect(read_only=True)
+                with self._lock:
+                    self._open_readers += 1
+        except Exception:
+            self._reader_slots.release()
+            raise
+
+        with self._lock:
+            self._readers_in_use += 1
+            self._stats['reader_checkouts'] += 1
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    def _release_reader(self, conn: PooledSQLiteConnection):
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+        conn._last_used = time.monotonic()
+        with self._lock:
+            self._readers_in_use -= 1
+            if self._closed:
+                self._open_readers -= 1
+                conn._close_physical()
+            else:
+                self._idle_readers.append(conn)
+        self._reader_slots.release()
+
+    @contextmanager
+    def writer(self):
+        """
+        Hold the single writer connection for the duration of the block.
+
+        The block runs as one transaction: committed on success, rolled
+        back if it raises.
+        """
+        started = time.monotonic()
+        if not self._writer_lock.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise ConnectionError(f"SQLite writer for {self.db_path} is busy")
+        self._record_wait(started)
+        try:
+            if self._writer is None or not self._healthy(self._writer):
+                if self._writer is not None:
+                    self._writer._close_physical()
+                self._writer = self._connect()
+            conn = self._writer
+            with self._lock:
+                self._stats['writer_checkouts'] += 1
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn._last_used = time.monotonic()
+        finally:
+            self._writer_lock.release()
+
+    # ------------------------------------------------------------------
+    # Lifecycle and metrics
+    # ------------------------------------------------------------------
+    def close(self):
+        """Close idle connections; checked-out ones close when returned"""
+        with self._lock:
+            self._closed = True
+            idle = self._idle + self._idle_readers
+            self._idle = []
+            self._idle_readers = []
+            for conn in idle:
+                if conn._read_only:
+                    self._open_readers -= 1
+                else:
+                    self._open -= 1
+        for conn in idle:
+            conn._close_physical()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer._close_physical()
+                self._writer = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, checkout and wait-time metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            checkouts = stats['checkouts'] + stats['reader_checkouts'] + stats['writer_checkouts']
+            stats.update({
+                'db_path': self.db_path,
+                'max_connections': self.max_connections,
+                'max_readers': self.max_readers,
+                'open_connections': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'open_readers': self._open_readers,
+                'readers_in_use': self._readers_in_use,
+                'idle_readers': len(self._idle_readers),
+                'writer_open': self._writer is not None,
+                'saturation': round(self._in_use / self.max_connections, 3) if self.max_connections else 0.0,
+                'avg_wait_ms': round(stats['total_wait_ms'] / checkouts, 3) if checkouts else 0.0,
+            })
+            stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+            stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        return stats
+
+
+class PooledMariaDBConnection:
+    """Proxy around a pooled MariaDB connection whose close() returns it to the HaoXai pool"""
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Return the connection to its pool instead of closing it"""
+        if self._pool is not None:
+            self._pool.release(self)
+
+
+class MariaDBConnectionPool:
+    """
+    Connection pool for one MariaDB/MySQL (host, port, user, database).
+
+    Wraps mariadb.ConnectionPool with a slot semaphore so callers wait for a
+    free connection (up to checkout_timeout) instead of failing immediately,
+    and hands out one connection per thread like SQLiteConnectionPool.
+
+    Args:
+        params: Connection parameters (host, user, password, database, port)
+        pool_size: Maximum connections (the driver caps this at 64)
+        checkout_timeout: Seconds to wait for a free connection before giving up
+        health_check_after: Idle seconds after which a connection is pinged before reuse
+        on_first_connect: Optional callback run once with the first connection
+    """
+
+    def __init__(self, params: Dict[str, Any], pool_size: int = 32, checkout_timeout: float = 30.0,
+                 health_check_after: float = 60.0,
+                 on_first_connect: Optional[Callable[[Any], None]] = None):
+        self.key = self.pool_key(params)
+        self.pool_size = min(int(pool_size), 64)
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self._on_first_connect = on_first_connect
+
+        digest = hashlib.sha1(repr(self.key).encode('utf-8')).hexdigest()[:10]
+        self.pool_name = f"HaoXai_{digest}_{uuid.uuid4().hex[:6]}"
+        try:
+            self._pool = mariadb.ConnectionPool(
+                pool_name=self.pool_name,
+                pool_size=self.pool_size,
+                host=params['host'],
+                user=params['user'],
+                password=params['password'],
+                database=params['database'],
+                port=int(params.get('port', 3306)),
+                connect_timeout=10,
+                local_infile=bool(params.get('local_infile', False))
+            )
+        except MariaDBError as e:
+            raise ConnectionError(f"Failed to create MariaDB connection pool: {e}")
+        print(f"[DEBUG] Created MariaDB connection pool {self.pool_name} for {self.describe()}")
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        # Keyed by id() of the driver's connection objects, which the pool reuses,
+        # so this never grows beyond pool_size entries
+        self._last_used: Dict[int, float] = {}
+        self._in_use = 0
+        self._initialized = False
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'health_checks': 0,
+            'reconnects': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+        }
+
+    @staticmethod
+    def pool_key(params: Dict[str, Any]) -> Tuple[str, int, str, str]:
+        """Identity of the server and schema a pool connects to"""
+        return (
+            str(params.get('host')),
+            int(params.get('port', 3306)),
+            str(params.get('user')),
+            str(params.get('database')),
+        )
+
+    def describe(self) -> str:
+        host, port, user, database = self.key
+        return f"{user}@{host}:{port}/{database}"
+
+    def _healthy(self, raw) -> bool:
+        """Ping a connection only if it has been idle long enough to be suspect"""
+        last_used = self._last_used.get(id(raw))
+        if last_used is None or time.monotonic() - last_used < self.health_check_after:
+            return True
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            raw.ping()
+            return True
+        except MariaDBError:
+            return False
+
+    def acquire(self) -> PooledMariaDBConnection:
+        """Return the calling thread's connection, checking one out if needed"""
+        if self._closed:
+            raise ConnectionError(f"Connection pool for {self.describe()} is closed")
+
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None and lease.conn is not None:
+            lease.holders += 1
+            return lease.conn
+
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise ConnectionError(
+                f"No MariaDB connection available for {self.describe()}: "
+                f"all {self.pool_size} connections busy for {self.checkout_timeout:.0f}s"
+            )
+        waited_ms = (time.monotonic() - started) * 1000.0
+
+        try:
+            raw = self._pool.get_connection()
+            if not self._healthy(raw):
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                raw.reconnect()
+        except MariaDBError as e:
+            self._slots.release()
+            with self._lock:
+                self._stats['errors'] += 1
+            print(f"[ERROR] MariaDB pool error: {e}")
+            raise ConnectionError(f"No MariaDB connection available: {e}")
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited_ms >= 1.0:
+                self._stats['waits'] += 1
+            self._stats['total_wait_ms'] += waited_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited_ms)
+            run_init = not self._initialized
+            self._initialized = True
+
+        conn = PooledMariaDBConnection(raw, self)
+        if run_init and self._on_first_connect:
+            self._on_first_connect(conn)
+        self._local.lease = _ThreadLease(self, conn)
+        return conn
+
+    def release(self, conn: PooledMariaDBConnection, force: bool = False):
+        """
+        Give a connection back to the pool.
+
+        Calls from the owning thread only return the connection once every
+        holder in that thread has closed it, unless force is set.
+        """
+        lease = getattr(self._local, 'lease', None)
+        if lease is None or lease.conn is not conn:
+            return
+        lease.holders -= 1
+        if lease.holders > 0 and not force:
+            return
+        lease.conn = None
+        self._local.lease = None
+        self._reclaim(conn)
+
+    def release_thread(self):
+        """Return the calling thread's connection regardless of open holders"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None and lease.conn is not None:
+            self.release(lease.conn, force=True)
+
+    def _reclaim(self, conn: PooledMariaDBConnection):
+        """Hand the driver connection back to mariadb.ConnectionPool and free its slot"""
+        raw, conn._conn, conn._pool = conn._conn, None, None
+        if raw is None:
+            return
+        self._last_used[id(raw)] = time.monotonic()
+        try:
+            raw.rollback()
+        except MariaDBError:
+            pass
+        try:
+            # close() on a pooled driver connection returns it to the driver pool
+            raw.close()
+        except MariaDBError as e:
+            print(f"[DEBUG] Error returning MariaDB connection to pool: {e}")
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def close(self):
+        """Close the underlying driver pool"""
+        self._closed = True
+        try:
+            self._pool.close()
+        except MariaDBError:
+            pass
+        self._last_used.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, saturation, checkout and wait-time metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            checkouts = stats['checkouts']
+            stats.update({
+                'pool_name': self.pool_name,
+                'server': self.describe(),
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'available': self.pool_size - self._in_use,
+                'saturation': round(self._in_use / self.pool_size, 3) if self.pool_size else 0.0,
+                'avg_wait_ms': round(stats['total_wait_ms'] / checkouts, 3) if checkouts else 0.0,
+                'total_wait_ms': round(stats['total_wait_ms'], 3),
+                'max_wait_ms': round(stats['max_wait_ms'], 3),
+            })
+        return stats
@@ -6,24 +6,316 @@ import mariadb
 from mariadb import Error as MariaDBError
 from typing import Union, Dict, Any, List
 import os
+import tempfile
+import threading
+from pathlib import Path
 from contextlib import contextmanager
 import pandas as pd
-from flask import g
 import json
+from database.connection_pool import SQLiteConnectionPool, MariaDBConnectionPool
+from database.table_stats import TableStatsCache, count_rows, estimate_rows
+from database.schema_graph import schema_graphs
+from database.identifier_index import identifier_indexes
+from database.fulltext_search import fulltext_indexes
 
 
 class DatabaseManagerFlask:
     """Handles database connections and operations for Flask application"""
-    _connections = {}
+    _sqlite_pools = {}
+    _mariadb_pools = {}
+    _pools_lock = threading.Lock()
     _connection_types = {}
-    _mariadb_pool = None
     _socketio = None
+    IMPORT_CHUNK_SIZE = 5000
+    # Row counts shown by the dashboard and schema summaries
+    table_stats = TableStatsCache()
 
     @classmethod
     def set_socketio(cls, socketio):
         """Set the SocketIO instance for real-time updates."""
         cls._socketio = socketio
     
+    @classmethod
+    def get_sqlite_pool(cls, db_path: str) -> SQLiteConnectionPool:
+        """Get or create the connection pool for a SQLite database file"""
+        db_path = os.path.abspath(db_path)
+        pool = cls._sqlite_pools.get(db_path)
+        if pool is None:
+            with cls._pools_lock:
+                pool = cls._sqlite_pools.get(db_path)
+                if pool is None:
+                    pool = SQLiteConnectionPool(
+                        db_path,
+                        on_first_connect=lambda conn: cls.initialize_recycle_bin(conn, 'sqlite')
+                    )
+                    cls._sqlite_pools[db_path] = pool
+                    cls._connection_types[db_path] = 'sqlite'
+        return pool
+    
+    @classmethod
+    def get_mariadb_pool(cls, db_params: Dict[str, Any]) -> MariaDBConnectionPool:
+        """Get or create the connection pool for a MariaDB/MySQL server and database"""
+        key = MariaDBConnectionPool.pool_key(db_params)
+        pool = cls._mariadb_pools.get(key)
+        if pool is None:
+            with cls._pools_lock:
+                pool = cls._mariadb_pools.get(key)
+                if pool is None:
+                    pool = MariaDBConnectionPool(
+                        db_params,
+                        on_first_connect=lambda conn: cls.initialize_recycle_bin(conn, 'mysql')
+                    )
+                    cls._mariadb_pools[key] = pool
+        return pool
+    
+    @classmethod
+    @contextmanager
+    def sqlite_reader(cls, db_path: str):
+        """
+        Check out a read-only SQLite connection for the duration of a with-block.
+        
+        Readers run in parallel with each other and with the writer under WAL.
+        """
+        with cls.get_sqlite_pool(db_path).reader() as conn:
+            yield conn
+    
+    @classmethod
+    @contextmanager
+    def sqlite_writer(cls, db_path: str):
+        """
+        Hold the single SQLite writer connection for a with-block.
+        
+        The block is committed on success and rolled back on error.
+        """
+        with cls.get_sqlite_pool(db_path).writer() as conn:
+            yield conn
+    
+    @classmethod
+    def open_result_cursor(cls, db_path: Union[str, Dict[str, Any]], connection_type: str, query: str):
+        """
+        Execute a read query on a dedicated connection outside the pools.
+        
+        Used for long-lived result cursors that outlive the request, so rows
+        can be paged or streamed without pinning a pooled connection.
+        
+        Returns:
+            (connection, cursor) tuple; the caller owns both
+        """
+        if connection_type == 'sqlite':
+            uri = f"{Path(os.path.abspath(db_path)).as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            cursor = conn.cursor()
+        elif connection_type == 'mysql':
+            conn = mariadb.connect(
+                host=db_path['host'],
+                user=db_path['user'],
+                password=db_path['password'],
+                database=db_path['database'],
+                port=int(db_path.get('port', 3306)),
+                connect_timeout=10
+            )
+            try:
+                # Read queries only: a data-modifying statement (e.g. WITH ... UPDATE) fails
+                # here instead of running and being reported as an empty result
+                conn.cursor().execute("SET SESSION TRANSACTION READ ONLY")
+            except Exception:
+                conn.close()
+                raise
+            # Unbuffered so rows stay on the server until they are paged in
+            cursor = conn.cursor(buffered=False)
+        else:
+            raise ValueError(f"Unsupported database type: {connection_type}")
+        
+        try:
+            cursor.execute(query)
+        except Exception:
+            conn.close()
+            raise
+        return conn, cursor
+    
+    @classmethod
+    def release_thread_connections(cls):
+        """
+        Return the calling thread's pooled connections.
+        
+        Called at request teardown; background threads should call it when done.
+        """
+        for pool in list(cls._sqlite_pools.values()) + list(cls._mariadb_pools.values()):
+            pool.release_thread()
+    
+    @classmethod
+    def pool_stats(cls) -> Dict[str, List[Dict[str, Any]]]:
+        """Connection pool metrics for every open SQLite database and MariaDB server"""
+        return {
+            'sqlite': [pool.stats() for pool in list(cls._sqlite_pools.values())],
+            'mariadb': [pool.stats() for pool in list(cls._mariadb_pools.values())],
+        }
+    
+    @classmethod
+    def stats_key(cls, db_path: Union[str, Dict[str, Any]], connection_type: str) -> tuple:
+        """Key of a database in the table stats cache"""
+        if connection_type == 'sqlite':
+            return ('sqlite', os.path.abspath(db_path))
+        return ('mysql',) + MariaDBConnectionPool.pool_key(db_path)
+    
+    @classmethod
+    def schema_graph(cls, db_path: Union[str, Dict[str, Any]], connection_type: str, cursor):
+        """Cached columns, keys and FK graph of a database (built with cursor when missing)"""
+        return schema_graphs.get(cls.stats_key(db_path, connection_type), cursor, connection_type)
+    
+    @classmethod
+    def schema_changed(cls, connection, table_name: str = None):
+        """
+        Forget cached metadata after DDL on a connection's database: the FK
+        graph, and the row count of table_name if one was dropped or recreated.
+        """
+        key = cls.table_stats.connection_key(connection)
+        # Without a key there is no telling which database changed, so drop every graph
+        schema_graphs.invalidate(key)
+        if table_name:
+            cls.table_stats.invalidate(key, table_name)
+            for index in cls.row_indexes(key):
+                index.drop_table(table_name)
+    
+    @classmethod
+    def identifier_index(cls, db_path: Union[str, Dict[str, Any]], connection_type: str):
+        """Identifier index of a database (see database.identifier_index)"""
+        return identifier_indexes.get(cls.stats_key(db_path, connection_type))
+    
+    @classmethod
+    def fulltext_index(cls, db_path: Union[str, Dict[str, Any]], connection_type: str):
+        """Full-text index of a database (see database.fulltext_search)"""
+        return fulltext_indexes.get(cls.stats_key(db_path, connection_type))
+    
+    @classmethod
+    def row_indexes(cls, key) -> list:
+        """The identifier and full-text indexes built for a database so far"""
+        indexes = (identifier_indexes.existing(key), fulltext_indexes.existing(key))
+        return [index for index in indexes if index is not None]
+    
+    @classmethod
+    def rows_changed(cls, connection, table_name: str):
+        """
+        Forget cached per-row data after writes whose effect isn't known in
+        detail: the table's row count, and its identifier and full-text
+        index entries.
+        """
+        cls._rows_changed(cls.table_stats.connection_key(connection), table_name)
+    
+    @classmethod
+    def rows_changed_in(cls, db_path: Union[str, Dict[str, Any]], connection_type: str, table_name: str):
+        """rows_changed for writers that hold the database path or MySQL config instead of a pooled connection"""
+        try:
+            key = cls.stats_key(db_path, connection_type)
+        except (AttributeError, TypeError, ValueError):
+            return  # A config stats_key can't read (e.g. a mysql:// URL) has no cached data either
+        cls._rows_changed(key, table_name)
+    
+    @classmethod
+    def _rows_changed(cls, key, table_name: str):
+        cls.table_stats.invalidate(key, table_name)
+        for index in cls.row_indexes(key):
+            index.mark_stale(table_name)
+    
+    @classmethod
+    def get_table_counts(cls, db_path: Union[str, Dict[str, Any]], connection_type: str,
+                         tables: List[str] = None, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Row counts per table, served from the table stats cache.
+        
+        Missing or expired SQLite counts are counted on the spot. For MySQL the
+        information_schema.TABLES estimate is returned straight away and the
+        exact counts are taken on a background thread, which emits
+        stats_updated with them when done.
+        
+        Args:
+            tables: Tables to count; all tables when omitted
+            refresh: Ignore cached counts
+        
+        Returns:
+            {table: {'rows': int, 'estimated': bool}}
+        """
+        key = cls.stats_key(db_path, connection_type)
+        if connection_type == 'sqlite' and os.path.exists(db_path):
+            # Counting only reads: a WAL reader runs beside the writer and other requests
+            with cls.sqlite_reader(db_path) as conn:
+                return cls._count_tables(conn, db_path, connection_type, key, tables, refresh)
+        return cls._count_tables(cls.get_connection(db_path, connection_type), db_path, connection_type, key,
+                                 tables, refresh)
+    
+    @classmethod
+    def _count_tables(cls, conn, db_path: Union[str, Dict[str, Any]], connection_type: str, key: tuple,
+                      tables: List[str], refresh: bool) -> Dict[str, Dict[str, Any]]:
+        cursor = conn.cursor()
+        if tables is None:
+            tables = cls.get_tables(conn, connection_type)
+        
+        counts, missing = {}, []
+        for table in tables:
+            cached = None if refresh else cls.table_stats.get(key, table)
+            if cached is None or cached['estimated']:
+                missing.append(table)
+            if cached is not None:
+                counts[table] = cached
+        if not missing:
+            return counts
+        
+        if connection_type == 'sqlite':
+            for table in missing:
+                try:
+                    rows = count_rows(cursor, connection_type, table)
+                except sqlite3.Error:
+                    continue
+                cls.table_stats.set(key, table, rows)
+                counts[table] = {'rows': rows, 'estimated': False}
+            return {table: counts[table] for table in tables if table in counts}
+        
+        try:
+            estimates = estimate_rows(cursor, connection_type, [t for t in missing if t not in counts])
+        except MariaDBError as e:
+            print(f"[WARNING] Row estimates unavailable: {e}")
+            estimates = {}
+        for table, rows in estimates.items():
+            cls.table_stats.set(key, table, rows, estimated=True)
+            counts[table] = {'rows': rows, 'estimated': True}
+        for table in missing:
+            counts.setdefault(table, {'rows': 0, 'estimated': True})
+        
+        claimed = cls.table_stats.claim_refresh(key, missing)
+        if claimed:
+            threading.Thread(
+                target=cls._refresh_table_counts, args=(db_path, connection_type, key, claimed),
+                name='table-stats-refresh', daemon=True
+            ).start()
+        return {table: counts[table] for table in tables if table in counts}
+    
+    @classmethod
+    def _refresh_table_counts(cls, db_path: Dict[str, Any], connection_type: str, key: tuple, tables: List[str]):
+        """Take exact counts for tables currently showing estimates and push them to clients"""
+        counts = {}
+        try:
+            cursor = cls.get_connection(db_path, connection_type).cursor()
+            for table in tables:
+                try:
+                    counts[table] = count_rows(cursor, connection_type, table)
+                except MariaDBError as e:
+                    print(f"[WARNING] Could not count rows in {table}: {e}")
+                    continue
+                cls.table_stats.set(key, table, counts[table])
+        except Exception as e:
+            print(f"[ERROR] Table stats refresh failed: {e}")
+        finally:
+            cls.table_stats.release_refresh(key, tables)
+            cls.release_thread_connections()
+        
+        if counts and cls._socketio:
+            cls._socketio.emit('stats_updated', {
+                'tables_affected': list(counts),
+                'row_counts': counts,
+                'action': 'refresh',
+                'timestamp': pd.Timestamp.now().isoformat()
+            })
+    
     @classmethod
     def get_connection(cls, db_path: Union[str, Dict[str, Any]], connection_type: str = 'sqlite'):
         """
@@ -44,112 +336,22 @@ class DatabaseManagerFlask:
                 # Create the database file if it doesn't exist
                 open(db_path, 'a').close()
             
-            # Check if connection exists and is valid
-            needs_new_connection = False
-            if db_path in cls._connections:
-                try:
-                    # Test if connection is still valid
-                    cursor = cls._connections[db_path].cursor()
-                    cursor.execute("SELECT 1")
-                except (sqlite3.ProgrammingError, sqlite3.OperationalError):
-                    # Connection is closed or invalid, need new one
-                    needs_new_connection = True
-                    try:
-                        cls._connections[db_path].close()
-                    except:
-                        pass
-                    del cls._connections[db_path]
-            else:
-                needs_new_connection = True
-            
-            if needs_new_connection:
-                try:
-                    conn = sqlite3.connect(db_path, check_same_thread=False)
-                    cursor = conn.cursor()
-                    cursor.execute("PRAGMA foreign_keys = ON")
-                    cursor.execute("PRAGMA journal_mode=WAL")
-                    cls._connections[db_path] = conn
-                    cls._connection_types[db_path] = 'sqlite'
-                    cls.initialize_recycle_bin(conn, 'sqlite')
-                except sqlite3.Error as e:
-                    raise ConnectionError(f"Failed to connect to SQLite database: {e}")
-            
-            return cls._connections[db_path]
+            # Each thread gets its own pooled connection; it is returned at request teardown
+            return cls.get_sqlite_pool(db_path).acquire()
         
         elif connection_type == 'mysql':
             if not isinstance(db_path, dict):
                 raise ValueError("For MySQL/MariaDB, db_path must be a dictionary")
             
-            # Use g to store connection for the current request context
-            try:
-                if 'db_conn' in g and cls._connection_types.get(f"mysql_{id(g.db_conn)}") == 'mysql':
-                    return g.db_conn
-            except (RuntimeError, AttributeError):
-                # Outside request context
-                pass
-
             # Validate required parameters
             required = ['host', 'user', 'password', 'database']
             missing = [param for param in required if param not in db_path]
             if missing:
                 raise ValueError(f"Missing required MySQL connection parameters: {', '.join(missing)}")
             
-            # Create connection pool if it doesn't exist
-            if not cls._mariadb_pool:
-                try:
-                    pool_name = "HaoXai_pool"
-                    # Try to create pool, but be prepared if it already exists globally
-                    try:
-                        cls._mariadb_pool = mariadb.ConnectionPool(
-                            pool_name=pool_name,
-                            host=db_path['host'],
-                            user=db_path['user'],
-                            password=db_path['password'],
-                            database=db_path['database'],
-                            port=int(db_path.get('port', 3306)),
-                            pool_size=32,  # Increased for stability
-                            connect_timeout=10
-                        )
-                        print(f"[DEBUG] Created MariaDB connection pool: {pool_name}")
-                    except mariadb.ProgrammingError as pe:
-                        if "already exists" in str(pe):
-                            # Try to get existing pool (some drivers allow this, or we just try to get a connection)
-                            # MariaDB python driver doesn't have a direct get_pool, but we can try mariadb.connect
-                            # with the same pool_name to "reattach" if needed, OR we trust the first creation.
-                            # Since we can't easily reattach, we'll try to use the name globally
-                            print(f"[DEBUG] MariaDB pool '{pool_name}' already exists globally.")
-                            # Fallback: create a dummy pool object that uses mariadb.connect(pool_name=...)
-                            # or just try to get one below.
-                        else:
-                            raise
-                except MariaDBError as e:
-                    raise ConnectionError(f"Failed to create MariaDB connection pool: {e}")
-            
-            try:
-                # Use pool to get a connection
-                if cls._mariadb_pool:
-                    conn = cls._mariadb_pool.get_connection()
-                else:
-                    # Fallback if pool exists but our reference is lost (unlikely but possible during reloads)
-                    conn = mariadb.connect(pool_name="HaoXai_pool")
-                
-                # Store connection type info
-                conn_key = f"mysql_{id(conn)}"
-                cls._connection_types[conn_key] = 'mysql'
-                
-                # Store in g for the current request
-                try:
-                    g.db_conn = conn
-                except (RuntimeError, AttributeError):
-                    pass
-                
-                # Check for RecycleBin on new connections if not already checked for this session
-                cls.initialize_recycle_bin(conn, 'mysql')
-                
-                return conn
-            except MariaDBError as e:
-                print(f"[ERROR] MariaDB pool error: {e}")
-                raise ConnectionError(f"No MariaDB connection available: {e}")
+            # One pool per (host, port, user, database); the connection is held by
+            # this thread until request teardown or release_thread_connections()
+            return cls.get_mariadb_pool(db_path).acquire()
         
         else:
             raise ValueError(f"Unsupported database type: {connection_type}")
@@ -265,10 +467,125 @@ class DatabaseManagerFlask:
         return schema
     
     @classmethod
-    def import_dataframe(cls, connection, df: pd.DataFrame, table_name: str, db_type: str) -> Dict[str, int]:
+    def dataframe_to_rows(cls, df: pd.DataFrame) -> List[tuple]:
+        """
+        Convert a DataFrame to DB-API parameter tuples.
+        
+        NaN/NaT become None and NumPy scalars become Python objects, done once
+        per column instead of once per cell.
+        """
+        columns = []
+        for col in df.columns:
+            series = df[col]
+            values = series.to_numpy(dtype=object, copy=True)
+            mask = series.isna().to_numpy()
+            if mask.any():
+                values[mask] = None
+            columns.append(values)
+        return list(zip(*columns)) if columns else [()] * len(df)
+    
+    @classmethod
+    def _load_data_chunk(cls, cursor, rows: List[tuple], table_name: str):
+        """Load one chunk through LOAD DATA LOCAL INFILE from a temp CSV file"""
+        def field(val):
+            if val is None:
+                return 'NULL'
+            if isinstance(val, bool):
+                return '1' if val else '0'
+            if isinstance(val, (int, float)):
+                return repr(val)
+            return '"' + str(val).replace('"', '""') + '"'
+        
+        fd, csv_path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                for row in rows:
+                    f.write(','.join(field(val) for val in row))
+                    f.write('\n')
+            path_sql = csv_path.replace('\\', '/').replace("'", "\\'")
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE '{path_sql}' INTO TABLE `{table_name}` "
+                "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' ENCLOSED BY '\"' ESCAPED BY '' "
+                "LINES TERMINATED BY '\\n'"
+            )
+        finally:
+            os.remove(csv_path)
+    
+    @classmethod
+    def bulk_insert_dataframe(cls, connection, df: pd.DataFrame, table_name: str, db_type: str,
+                              chunk_size: int = None, use_load_data: bool = False) -> int:
+        """
+        Insert DataFrame rows in chunks, one transaction per chunk.
+        
+        Rows are matched to table columns by position, like a plain
+        INSERT ... VALUES. Each chunk goes out with executemany (or LOAD DATA
+        LOCAL INFILE for MySQL when use_load_data is set and the server allows
+        it) and a data_import_progress event is emitted after each commit.
+        
+        Args:
+            chunk_size: Rows per chunk (defaults to IMPORT_CHUNK_SIZE)
+            use_load_data: Try LOAD DATA LOCAL INFILE before executemany (MySQL only)
+        
+        Returns:
+            Number of rows inserted
+        """
+        chunk_size = max(1, int(chunk_size or cls.IMPORT_CHUNK_SIZE))
+        rows = cls.dataframe_to_rows(df)
+        total = len(rows)
+        if not total:
+            return 0
+        
+        if db_type == 'sqlite':
+            placeholders = ', '.join(['?'] * len(df.columns))
+            insert_sql = f'INSERT INTO "{table_name}" VALUES ({placeholders})'
+        else:
+            placeholders = ', '.join(['%s'] * len(df.columns))
+            insert_sql = f"INSERT INTO `{table_name}` VALUES ({placeholders})"
+        use_load_data = use_load_data and db_type == 'mysql'
+        
+        cursor = connection.cursor()
+        chunks = (total + chunk_size - 1) // chunk_size
+        inserted = 0
+        for index, start in enumerate(range(0, total, chunk_size), start=1):
+            chunk = rows[start:start + chunk_size]
+            try:
+                if use_load_data:
+                    try:
+                        cls._load_data_chunk(cursor, chunk, table_name)
+                    except Exception as load_error:
+                        print(f"[WARNING] LOAD DATA LOCAL INFILE unavailable, using executemany: {load_error}")
+                        connection.rollback()
+                        use_load_data = False
+                if not use_load_data:
+                    cursor.executemany(insert_sql, chunk)
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                raise Exception(
+                    f"Chunk {index}/{chunks} failed after {inserted} rows were committed: {e}"
+                )
+            
+            inserted += len(chunk)
+            cls.emit_realtime_event('import_progress', table_name, {
+                'chunk': index,
+                'chunks': chunks,
+                'rows_done': inserted,
+                'rows_total': total,
+                'percentage': round(inserted * 100.0 / total, 1)
+            })
+        
+        return inserted
+    
+    @classmethod
+    def import_dataframe(cls, connection, df: pd.DataFrame, table_name: str, db_type: str,
+                         chunk_size: int = None, use_load_data: bool = False) -> Dict[str, int]:
         """
         Import pandas DataFrame to database
         
+        Args:
+            chunk_size: Rows per committed chunk for MySQL inserts
+            use_load_data: Try LOAD DATA LOCAL INFILE for MySQL inserts
+        
         Returns:
             Dictionary with import statistics
         """
@@ -291,13 +608,11 @@ class DatabaseManagerFlask:
             if table_exists:
                 # Table exists - append data
                 if db_type == 'mysql':
-                    # For MySQL, use parameterized INSERT
-                    for _, row in df.iterrows():
-                        placeholders = ', '.join(['%s'] * len(row))
-                        insert_sql = f"INSERT INTO `{table_name}` VALUES ({placeholders})"
-                        values = tuple(None if pd.isna(val) else val for val in row.values)
-                        cursor.execute(insert_sql, values)
-                        stats['new_records'] += 1
+                    # For MySQL, use batched parameterized INSERTs
+                    stats['new_records'] += cls.bulk_insert_dataframe(
+                        connection, df, table_name, db_type,
+                        chunk_size=chunk_size, use_load_data=use_load_data
+                    )
                 else:
                     # For SQLite, use pandas to_sql
                     df.to_sql(table_name, connection, if_exists='append', index=False)
@@ -322,12 +637,10 @@ class DatabaseManagerFlask:
                     cursor.execute(create_sql)
                     
                     # Insert data
-                    for _, row in df.iterrows():
-                        placeholders = ', '.join(['%s'] * len(row))
-                        insert_sql = f"INSERT INTO `{table_name}` VALUES ({placeholders})"
-                        values = tuple(None if pd.isna(val) else val for val in row.values)
-                        cursor.execute(insert_sql, values)
-                        stats['new_records'] += 1
+                    stats['new_records'] += cls.bulk_insert_dataframe(
+                        connection, df, table_name, db_type,
+                        chunk_size=chunk_size, use_load_data=use_load_data
+                    )
                 else:
                     # For SQLite, use pandas to_sql with explicit connection handling
                     try:
@@ -358,6 +671,18 @@ class DatabaseManagerFlask:
             
             connection.commit()
             
+            # Keep the cached row count in step without recounting
+            stats_key = cls.table_stats.connection_key(connection)
+            if table_exists:
+                row_count = cls.table_stats.adjust(stats_key, table_name, stats['new_records'])
+            else:
+                cls.schema_changed(connection)
+                row_count = stats['new_records'] if stats_key is not None else None
+                if stats_key is not None:
+                    cls.table_stats.set(stats_key, table_name, row_count)
+            for index in cls.row_indexes(stats_key):
+                index.mark_stale(table_name)
+            
             # Emit real-time updates for different operations
             if cls._socketio:
                 if stats['new_records'] > 0:
@@ -385,11 +710,14 @@ class DatabaseManagerFlask:
                 })
                 
                 # Update statistics
-                cls._socketio.emit('stats_updated', {
+                stats_event = {
                     'tables_affected': [table_name],
                     'total_changes': stats['new_records'] + stats['updated_records'],
                     'timestamp': pd.Timestamp.now().isoformat()
-                })
+                }
+                if row_count is not None:
+                    stats_event['row_counts'] = {table_name: row_count}
+                cls._socketio.emit('stats_updated', stats_event)
                 
             return stats
             
@@ -398,8 +726,15 @@ class DatabaseManagerFlask:
             raise Exception(f"Import failed: {e}")
     
     @classmethod
-    def emit_realtime_event(cls, event_type: str, table_name: str, data: Dict[str, Any] = None):
-        """Emit real-time Socket.IO events for database operations"""
+    def emit_realtime_event(cls, event_type: str, table_name: str, data: Dict[str, Any] = None,
+                            row_counts: Dict[str, int] = None):
+        """
+        Emit real-time Socket.IO events for database operations
+        
+        Args:
+            row_counts: Known new row counts, passed on with stats_updated so
+                        the dashboard can update without asking for them
+        """
         if cls._socketio:
             event_data = {
                 'table': table_name,
@@ -417,11 +752,14 @@ class DatabaseManagerFlask:
             cls._socketio.emit('database_updated', event_data)
             
             # Emit stats update
-            cls._socketio.emit('stats_updated', {
+            stats_event = {
                 'tables_affected': [table_name],
                 'action': event_type,
                 'timestamp': pd.Timestamp.now().isoformat()
-            })
+            }
+            if row_counts:
+                stats_event['row_counts'] = row_counts
+            cls._socketio.emit('stats_updated', stats_event)
     
     @classmethod
     def delete_records(cls, connection, table_name: str, where_clause: str = None, db_type: str = 'sqlite') -> Dict[str, int]:
@@ -472,18 +810,38 @@ class DatabaseManagerFlask:
                         (table_name, data_json, None)
                     )
             
-            # Get count before deletion
-            if db_type == 'sqlite':
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            # Get count before deletion, from the stats cache when it is exact
+            stats_key = cls.table_stats.connection_key(connection)
+            cached = cls.table_stats.get(stats_key, table_name) if stats_key is not None else None
+            if cached is not None and not cached['estimated']:
+                count_before = cached['rows']
             else:
-                cursor.execute(f"SELECT COUNT(*) FROM `{table_name}`")
-            count_before = cursor.fetchone()[0]
+                count_before = count_rows(cursor, db_type, table_name)
             
             # 3. Execute delete
             cursor.execute(delete_query)
             stats['deleted_records'] = cursor.rowcount
             connection.commit()
             
+            row_counts = {}
+            if stats_key is not None:
+                row_counts[table_name] = count_before - stats['deleted_records']
+                cls.table_stats.set(stats_key, table_name, row_counts[table_name])
+                if all_deleted_data:
+                    recycle_count = cls.table_stats.adjust(stats_key, 'RecycleBin', 1)
+                    if recycle_count is not None:
+                        row_counts['RecycleBin'] = recycle_count
+            
+            # Drop the deleted rows from the identifier and full-text indexes by primary key
+            if stats['deleted_records'] > 0:
+                for index in cls.row_indexes(stats_key):
+                    pk_column = index.pk_column(table_name)
+                    if pk_column in columns:
+                        pk_position = columns.index(pk_column)
+                        index.remove_rows(table_name, [row[pk_position] for row in rows])
+                    else:
+                        index.mark_stale(table_name)
+            
             # Emit real-time event
             if stats['deleted_records'] > 0:
                 cls.emit_realtime_event('deleted', table_name, {
@@ -491,7 +849,7 @@ class DatabaseManagerFlask:
                     'count_before': count_before,
                     'count_after': count_before - stats['deleted_records'],
                     'moved_to_recycle_bin': len(rows)
-                })
+                }, row_counts=row_counts)
             
             return stats
             
@@ -517,6 +875,9 @@ class DatabaseManagerFlask:
             cursor.execute(query)
             stats['updated_records'] = cursor.rowcount
             connection.commit()
+            if stats['updated_records'] > 0:
+                for index in cls.row_indexes(cls.table_stats.connection_key(connection)):
+                    index.mark_stale(table_name)
             
             # Emit real-time event
             if stats['updated_records'] > 0:
@@ -618,8 +979,15 @@ class DatabaseManagerFlask:
             
             connection.commit()
             
+            cls.schema_changed(connection, table_name)
+            stats_key = cls.table_stats.connection_key(connection)
+            recycle_count = None
+            if row_count > 0 or table_schema:
+                recycle_count = cls.table_stats.adjust(stats_key, 'RecycleBin', 1)
+            
             # Emit real-time event
-            cls.emit_realtime_event('table_deleted', table_name, {'rows_archived': row_count})
+            cls.emit_realtime_event('table_deleted', table_name, {'rows_archived': row_count},
+                                    row_counts={'RecycleBin': recycle_count} if recycle_count is not None else None)
             
             return True
         except Exception as e:
@@ -630,12 +998,19 @@ class DatabaseManagerFlask:
     @classmethod
     def close_all(cls):
         """Close all database connections"""
-        for conn in cls._connections.values():
-            try:
-                conn.close()
-            except:
-                pass
-        cls._connections.clear()
+        with cls._pools_lock:
+            for pool in cls._sqlite_pools.values():
+                try:
+                    pool.close()
+                except:
+                    pass
+            cls._sqlite_pools.clear()
+            for pool in cls._mariadb_pools.values():
+                try:
+                    pool.close()
+                except:
+                    pass
+            cls._mariadb_pools.clear()
         cls._connection_types.clear()
 
     @classmethod
@@ -691,16 +1066,11 @@ def init_db(app):
         if exception:
             print(f"Exception during request: {exception}")
         
-        # Close request-scoped connection to return it to the pool
-        if 'db_conn' in g:
-            try:
-                # For SQLite, it might be better to keep it open or let internal pooling handle it
-                # For MariaDB (SQLAlchemy/mariadb), closing the connection returns it to the pool
-                conn = g.pop('db_conn', None)
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"[DEBUG] Error closing connection during teardown: {e}")
+        # Return this thread's pooled connections (SQLite and MariaDB)
+        try:
+            DatabaseManagerFlask.release_thread_connections()
+        except Exception as e:
+            print(f"[DEBUG] Error releasing pooled connections during teardown: {e}")
     
     # Ensure upload folder exists
     with app.app_context():
@@ -4,16 +4,30 @@ Handles dynamic column mapping, data validation, and secure data import
 """
 
 import pandas as pd
+import os
 import sqlite3
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 import logging
 from .security import DatabaseSecurity
+from .db_manager_flask import DatabaseManagerFlask
 
 logger = logging.getLogger(__name__)
 
+# Placeholder for a resolved FK column that a given row did not resolve
+_MISSING = object()
+
+
+class ImportCancelled(Exception):
+    """Raised inside an import when its cancel_event is set"""
+
 class ExcelImportManager:
-    def __init__(self, db_connection, connection_type="sqlite", user_id=None):
+    # Maximum number of values bound into one IN (...) lookup
+    LOOKUP_CHUNK_SIZE = 500
+    # Rows per executemany batch in import_generic_table_data
+    IMPORT_BATCH_SIZE = 1000
+    
+    def __init__(self, db_connection, connection_type="sqlite", user_id=None, db_path=None):
         self.db_connection = db_connection
         self.connection_type = connection_type
         self.cursor = db_connection.cursor()
@@ -41,13 +55,12 @@ class ExcelImportManager:
         self.security = None
         if connection_type == "sqlite" and user_id:
             try:
-                # Get db_path from the connection if possible, or use a default
-                if hasattr(db_connection, 'db_path'):
+                # Get db_path from the caller or the connection if possible, or use a default
+                if db_path is None and hasattr(db_connection, 'db_path'):
                     db_path = db_connection.db_path
-                else:
+                elif db_path is None:
                     # For SQLite connections, we need to get the path differently
-                    # This is a workaround - in a real implementation, we'd pass the db_path explicitly
-                    import os
+                    # This is a workaround - callers outside a request should pass db_path
                     from flask import session
                     db_path = session.get('db_path', 'CAN2Database_v2 - Copy.db')
                 
@@ -56,6 +69,26 @@ class ExcelImportManager:
                 logger.error(f"Failed to initialize security: {e}")
                 self.security = None
         
+        # Table/FK metadata, read once per import instead of per row
+        self._schema_cache = {}
+        self._schema_version = None
+        
+        # Set-based FK lookups and get-or-create caches for the current import
+        self.reset_lookup_cache()
+        
+        # Tables get-or-create inserted into since the last commit
+        self._written_tables = set()
+        
+        # Rows the last import_excel_file call could not import (see _rejected_frame)
+        self.rejected_rows = pd.DataFrame()
+        
+        # Optional hooks for background imports: progress_callback receives a
+        # progress dict, and setting cancel_event stops the import at the next
+        # progress report (the sheet in progress is rolled back)
+        self.progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.cancel_event = None
+        self._progress = None
+        
     def close(self): 
         if hasattr(self, 'cursor'):
             self.cursor.close()
@@ -63,12 +96,14 @@ class ExcelImportManager:
     def add_excluded_table(self, table_name: str, reason: str = ""):
         """Add a table to the exclusion list"""
         self.excluded_tables.add(table_name)
+        self._schema_cache.pop('fk_rules', None)
         logger.info(f"Added table '{table_name}' to exclusion list. Reason: {reason}")
     
     def remove_excluded_table(self, table_name: str):
         """Remove a table from the exclusion list"""
         if table_name in self.excluded_tables:
             self.excluded_tables.remove(table_name)
+            self._schema_cache.pop('fk_rules', None)
             logger.info(f"Removed table '{table_name}' from exclusion list")
     
     def get_excluded_tables(self) -> set:
@@ -78,6 +113,7 @@ class ExcelImportManager:
     def set_excluded_tables(self, tables: set):
         """Set the complete list of excluded tables"""
         self.excluded_tables = set(tables)
+        self._schema_cache.pop('fk_rules', None)
         logger.info(f"Set excluded tables to: {', '.join(tables)}")
     
     def print_excluded_tables(self):
@@ -137,6 +173,111 @@ class ExcelImportManager:
         print(f"  📋 Total tables: {len(all_tables)}")
         print()
     
+    def invalidate_schema_cache(self):
+        """Drop cached table and foreign key metadata (call after running DDL)"""
+        self._schema_cache.clear()
+    
+    def refresh_schema_cache(self):
+        """Invalidate the schema cache if the database schema changed since it was read.
+        
+        SQLite bumps PRAGMA schema_version on every DDL statement, so a single
+        pragma per import tells us whether cached metadata is still valid.
+        MySQL/MariaDB caches live for one import and are invalidated explicitly.
+        """
+        if self.connection_type in ('mysql', 'mariadb'):
+            return
+        try:
+            self.cursor.execute("PRAGMA schema_version")
+            version = self.cursor.fetchone()[0]
+        except Exception:
+            version = None
+        if version is None or version != self._schema_version:
+            self._schema_cache.clear()
+            self._schema_version = version
+    
+    def _cached_schema(self, key, loader):
+        if key not in self._schema_cache:
+            self._schema_cache[key] = loader()
+        return self._schema_cache[key]
+    
+    def get_table_names(self) -> List[str]:
+        """All user tables in the database (cached)"""
+        def load():
+            if self.connection_type in ('mysql', 'mariadb'):
+                self.cursor.execute("SHOW TABLES")
+            else:
+                self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+            names = []
+            for row in self.cursor.fetchall():
+                name = row[0]
+                names.append(name.decode('utf-8') if isinstance(name, bytes) else name)
+            return names
+        return self._cached_schema('tables', load)
+    
+    def get_table_info(self, table_name: str) -> List[Dict[str, Any]]:
+        """Column metadata for a table (cached).
+        
+        Returns a list of dicts with cid, name, type, notnull, default and pk,
+        in table order, for both SQLite and MySQL/MariaDB.
+        """
+        def load():
+            info = []
+            if self.connection_type in ('mysql', 'mariadb'):
+                # DESCRIBE returns (Field, Type, Null, Key, Default, Extra)
+                self.cursor.execute(f"DESCRIBE `{table_name}`")
+                for cid, col in enumerate(self.cursor.fetchall()):
+                    info.append({
+                        'cid': cid,
+                        'name': col[0],
+                        'type': col[1],
+                        'notnull': str(col[2]).upper() != 'YES',
+                        'default': col[4],
+                        'pk': str(col[3]).upper() == 'PRI'
+                    })
+            else:
+                # PRAGMA table_info returns (cid, name, type, notnull, dflt_value, pk)
+                self.cursor.execute(f'PRAGMA table_info("{table_name}")')
+                for col in self.cursor.fetchall():
+                    info.append({
+                        'cid': col[0],
+                        'name': col[1],
+                        'type': col[2],
+                        'notnull': col[3] == 1,
+                        'default': col[4],
+                        'pk': col[5] >= 1
+                    })
+            return info
+        return self._cached_schema(('table_info', table_name), load)
+    
+    def get_table_columns(self, table_name: str) -> List[str]:
+        """Column names of a table (cached)"""
+        return [col['name'] for col in self.get_table_info(table_name)]
+    
+    def get_primary_key_columns(self, table_name: str) -> List[str]:
+        """Primary key column names of a table (cached)"""
+        return [col['name'] for col in self.get_table_info(table_name) if col['pk']]
+    
+    def get_foreign_key_list(self, table_name: str) -> List[Dict[str, str]]:
+        """Outgoing foreign keys of a table as dicts with from_col, target_table and to_col (cached)"""
+        def load():
+            fks = []
+            if self.connection_type in ('mysql', 'mariadb'):
+                self.cursor.execute("""
+                    SELECT COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+                    FROM information_schema.KEY_COLUMN_USAGE
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+                    AND REFERENCED_TABLE_NAME IS NOT NULL
+                """, (table_name,))
+                for from_col, target_table, to_col in self.cursor.fetchall():
+                    fks.append({'from_col': from_col, 'target_table': target_table, 'to_col': to_col})
+            else:
+                # PRAGMA foreign_key_list returns (id, seq, table, from, to, on_update, on_delete, match)
+                self.cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
+                for fk in self.cursor.fetchall():
+                    fks.append({'from_col': fk[3], 'target_table': fk[2], 'to_col': fk[4]})
+            return fks
+        return self._cached_schema(('fk_list', table_name), load)
+    
     def validate_and_map_columns(self, df: pd.DataFrame) -> Dict[str, List[str]]:
         """Dynamically map Excel columns to database tables.
         Returns: {table_name: [list of matched db column names]}
@@ -144,6 +285,7 @@ class ExcelImportManager:
         """
         
         # Get all table schemas from database
+        self.refresh_schema_cache()
         table_schemas = self.get_database_schema()
         
         # Normalize Excel column names 
@@ -162,14 +304,11 @@ class ExcelImportManager:
             excluded_columns = set()
             try:
                 # Get FK columns
-                self.cursor.execute(f"PRAGMA foreign_key_list({table_name})")
-                fk_columns = {row[3] for row in self.cursor.fetchall()}  # from column is at index 3
+                fk_columns = {fk['from_col'] for fk in self.get_foreign_key_list(table_name)}
                 excluded_columns.update(fk_columns)
                 
                 # Get primary key columns
-                self.cursor.execute(f"PRAGMA table_info({table_name})")
-                table_info = self.cursor.fetchall()
-                pk_columns = {col[1] for col in table_info if col[5] == 1}  # pk flag is at index 5
+                pk_columns = set(self.get_primary_key_columns(table_name))
                 excluded_columns.update(pk_columns)
                 
                 print(f"[DEBUG] Excluded columns for {table_name}: FK={fk_columns}, PK={pk_columns}")
@@ -286,53 +425,20 @@ class ExcelImportManager:
         """Get all table schemas from database dynamically (supports SQLite and MySQL/MariaDB)"""
         schemas = {}
         
-        if self.connection_type in ('mysql', 'mariadb'):
-            # MySQL/MariaDB path
-            self.cursor.execute("SHOW TABLES")
-            tables = self.cursor.fetchall()
-            
-            for row in tables:
-                table_name = row[0]
-                if table_name in self.excluded_tables:
-                    logger.info(f"Excluding table '{table_name}' from Excel import")
-                    continue
-                
-                self.cursor.execute(f"DESCRIBE `{table_name}`")
-                columns = self.cursor.fetchall()
-                
-                table_columns = []
-                for col in columns:
-                    col_name = col[0]
-                    if (col_name != 'id' and
-                        col_name != 'created_at' and col_name != 'updated_at' and col_name != 'created_by' and
-                        col_name != 'is_encrypted' and col_name != 'access_level'):
-                        table_columns.append(col_name)
-                
-                if table_columns:
-                    schemas[table_name] = table_columns
-        else:
-            # SQLite path
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-            tables = self.cursor.fetchall()
+        for table_name in self.get_table_names():
+            if table_name in self.excluded_tables:
+                logger.info(f"Excluding table '{table_name}' from Excel import")
+                continue
             
-            for (table_name,) in tables:
-                if table_name in self.excluded_tables:
-                    logger.info(f"Excluding table '{table_name}' from Excel import")
-                    continue
-                    
-                self.cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = self.cursor.fetchall()
-                
-                table_columns = []
-                for col in columns:
-                    col_name = col[1]
-                    if (col_name != 'id' and
-                        col_name != 'created_at' and col_name != 'updated_at' and col_name != 'created_by' and
-                        col_name != 'is_encrypted' and col_name != 'access_level'):
-                        table_columns.append(col_name)
-                
-                if table_columns:
-                    schemas[table_name] = table_columns
+            table_columns = []
+            for col_name in self.get_table_columns(table_name):
+                if (col_name != 'id' and
+                    col_name != 'created_at' and col_name != 'updated_at' and col_name != 'created_by' and
+                    col_name != 'is_encrypted' and col_name != 'access_level'):
+                    table_columns.append(col_name)
+            
+            if table_columns:
+                schemas[table_name] = table_columns
         
         return schemas
     
@@ -427,51 +533,8 @@ class ExcelImportManager:
     
     def get_or_create_location(self, province: str, district: str = None, village: str = None, site_name: str = None) -> int:
         """Get or create location record"""
-        if not province:
-            province = 'Laos'  # Default province
-            
-        # Check if location exists
-        self.cursor.execute("""
-            SELECT location_id FROM locations 
-            WHERE country = 'Laos' AND province = ? 
-            AND (district = ? OR district IS NULL) 
-            AND (village = ? OR village IS NULL)
-            AND (site_name = ? OR site_name IS NULL)
-        """, (province, district, village, site_name))
-        
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
-        
-        # Create new location
-        self.cursor.execute("""
-            INSERT INTO locations (country, province, district, village, site_name, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, ('Laos', province, district, village, site_name, datetime.now(), datetime.now()))
-        
-        return self.cursor.lastrowid
-    
-    def get_or_create_taxonomy(self, scientific_name: str) -> int:
-        """Get existing taxonomy ID or create new one"""
-        if not scientific_name:
-            return None
-        
-        # Check if taxonomy exists
-        self.cursor.execute("SELECT taxonomy_id FROM taxonomy WHERE scientific_name = ?", (scientific_name,))
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
-        
-        # Extract species from scientific_name (take the part after the last space)
-        species = scientific_name.split()[-1] if ' ' in scientific_name else scientific_name
-        
-        # Create new taxonomy with required fields
-        self.cursor.execute("""
-            INSERT INTO taxonomy (species, scientific_name, created_at, updated_at)
-            VALUES (?, ?, ?, ?)
-        """, (species, scientific_name, datetime.now(), datetime.now()))
-        
-        return self.cursor.lastrowid
+        key = self._location_key(province, district, village, site_name)
+        return self.get_or_create_locations([key])[key]
     
     def get_or_create_environmental_sample(self, source_id: str = None, pool_id: str = None, 
                                          province: str = None, district: str = None, 
@@ -500,43 +563,47 @@ class ExcelImportManager:
             INSERT INTO environmental_samples (source_id, pool_id, location_id, created_at, updated_at)
             VALUES (?, ?, ?, ?, ?)
         """, (source_id, pool_id, location_id, datetime.now(), datetime.now()))
+        self._written_tables.add('environmental_samples')
         
         return self.cursor.lastrowid
     
     def discover_dynamic_fk_rules(self):
-        """Discover ALL FK relationships from the current database automatically"""
+        """Discover ALL FK relationships from the current database automatically.
+        
+        The rules are computed once and cached with the rest of the schema
+        metadata, so resolving foreign keys row by row does not re-read the
+        schema for every row.
+        """
+        return self._cached_schema('fk_rules', self._discover_dynamic_fk_rules)
+    
+    def _discover_dynamic_fk_rules(self):
         fk_rules = {}
         
         try:
             # Get all tables
-            self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-            tables = [row[0] for row in self.cursor.fetchall()]
+            tables = self.get_table_names()
             
             for table in tables:
                 # Skip excluded tables
                 if table in self.excluded_tables:
                     continue
                     
-                self.cursor.execute(f"PRAGMA foreign_key_list({table})")
-                fks = self.cursor.fetchall()
+                fks = self.get_foreign_key_list(table)
                 
                 if fks:
                     table_fk_rules = {}
                     
                     for fk in fks:
-                        # fk format: (id, seq, table, from_col, to_col, on_update, on_delete, match)
-                        fk_id, seq, target_table, from_col, to_col, on_update, on_delete, match = fk
+                        target_table, from_col, to_col = fk['target_table'], fk['from_col'], fk['to_col']
                         
                         # DYNAMICALLY discover match columns from target table schema
-                        self.cursor.execute(f"PRAGMA table_info({target_table})")
-                        target_columns = [col[1] for col in self.cursor.fetchall()]
+                        target_columns = self.get_table_columns(target_table)
                         
                         # Smart matching based on column names and common patterns
                         match_cols = []
                         
                         # Primary key column
-                        self.cursor.execute(f"PRAGMA table_info({target_table})")
-                        pk_cols = [col[1] for col in self.cursor.fetchall() if col[5] == 1]  # col[5] is pk flag
+                        pk_cols = self.get_primary_key_columns(target_table)
                         
                         # Add primary key as match column
                         if pk_cols:
@@ -649,50 +716,23 @@ class ExcelImportManager:
         """Get required/important columns for a table from database schema"""
         required_columns = []
         
-        if self.connection_type in ('mysql', 'mariadb'):
-            # MySQL/MariaDB: DESCRIBE returns (Field, Type, Null, Key, Default, Extra)
-            self.cursor.execute(f"DESCRIBE `{table_name}`")
-            columns = self.cursor.fetchall()
-            
-            for col in columns:
-                col_name = col[0]
-                is_nullable = col[2].upper() == 'YES'
-                is_pk = col[3].upper() == 'PRI'
-                
-                if col_name in ['id', 'host_id', 'screening_id', 'storage_id', 
-                              'taxonomy_id', 'location_id', 'team_id', 'project_id',
-                              'created_at', 'updated_at', 'created_by']:
-                    continue
-                
-                if col_name == 'sample_id' and not is_pk:
-                    if not is_nullable:
-                        required_columns.append(col_name)
-                    continue
-                
-                if not is_nullable and not is_pk:
-                    required_columns.append(col_name)
-        else:
-            # SQLite: PRAGMA table_info returns (cid, name, type, notnull, dflt_value, pk)
-            self.cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = self.cursor.fetchall()
-            
-            for col in columns:
-                col_name = col[1]
-                not_null = col[3] == 1
-                primary_key = col[5] == 1
-                
-                if col_name in ['id', 'host_id', 'screening_id', 'storage_id', 
-                              'taxonomy_id', 'location_id', 'team_id', 'project_id',
-                              'created_at', 'updated_at', 'created_by']:
-                    continue
-                
-                if col_name == 'sample_id' and not primary_key:
-                    if not_null:
-                        required_columns.append(col_name)
-                    continue
-                
-                if not_null and not primary_key:
+        for col in self.get_table_info(table_name):
+            col_name = col['name']
+            not_null = col['notnull']
+            primary_key = col['pk']
+            
+            if col_name in ['id', 'host_id', 'screening_id', 'storage_id', 
+                          'taxonomy_id', 'location_id', 'team_id', 'project_id',
+                          'created_at', 'updated_at', 'created_by']:
+                continue
+            
+            if col_name == 'sample_id' and not primary_key:
+                if not_null:
                     required_columns.append(col_name)
+                continue
+            
+            if not_null and not primary_key:
+                required_columns.append(col_name)
         
         return required_columns
     
@@ -756,52 +796,193 @@ class ExcelImportManager:
         """Get existing taxonomy ID or create new one"""
         if not scientific_name:
             return None
-        
-        # Check if taxonomy exists
-        self.cursor.execute("SELECT taxonomy_id FROM taxonomy WHERE scientific_name = ?", (scientific_name,))
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
-        
-        # Extract species from scientific_name (take the part after the last space)
-        species = scientific_name.split()[-1] if ' ' in scientific_name else scientific_name
-        
-        # Create new taxonomy with required fields
-        self.cursor.execute("""
-            INSERT INTO taxonomy (species, scientific_name, created_at, updated_at)
-            VALUES (?, ?, ?, ?)
-        """, (species, scientific_name, datetime.now(), datetime.now()))
-        
-        return self.cursor.lastrowid
+        return self.get_or_create_taxa([scientific_name]).get(scientific_name)
     
     def get_or_create_team(self, team_name: str) -> int:
         """Get existing team ID or create new one"""
         if not team_name:
             return None
+        return self.get_or_create_teams([team_name]).get(team_name)
+    
+    def _column_values(self, df: pd.DataFrame, column_map: Dict[str, str], db_column: str) -> List[Any]:
+        """Values of a mapped column for every row, None where the sheet lacks the column"""
+        excel_col = column_map.get(db_column, db_column)
+        return df[excel_col].tolist() if excel_col in df.columns else [None] * len(df)
+    
+    def _report_progress(self, status: str, processed: int):
+        """Send progress to progress_callback, raising ImportCancelled if cancel_event is set"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ImportCancelled("Import cancelled")
+        if self._progress is None:
+            return
+        self._progress['status'] = status
+        self._progress['processed'] = max(self._progress['processed'], min(processed, self._progress['total']))
+        if self.progress_callback:
+            self.progress_callback(dict(self._progress, stats=dict(self._progress['stats'])))
+    
+    def _report_table_progress(self, table_name: str, done: int, count: int):
+        """Progress within the table being imported, scaled into its share of the current sheet"""
+        if self._progress is None:
+            self._report_progress('', 0)
+            return
+        base, sheet_rows, table_index, table_count = self._progress['span']
+        fraction = (table_index + (done / count if count else 1)) / max(table_count, 1)
+        self._report_progress(f"Importing {table_name} ({self._progress['sheet']})", base + int(sheet_rows * fraction))
+    
+    def reset_lookup_cache(self):
+        """Forget resolved FK values and get-or-create results (call when starting a new import)"""
+        self._fk_lookups = {}
+        self._fk_plans = {}
+        self._session_index = {}
+        self._location_ids = {}
+        self._taxonomy_ids = {}
+        self._team_ids = {}
+    
+    def _chunks(self, values: List[Any]):
+        for start in range(0, len(values), self.LOOKUP_CHUNK_SIZE):
+            yield values[start:start + self.LOOKUP_CHUNK_SIZE]
+    
+    def _fold(self, value) -> str:
+        """Comparison key for values matched in Python instead of SQL (MySQL compares case-insensitively)"""
+        if self.connection_type in ('mysql', 'mariadb'):
+            return str(value).lower()
+        return str(value)
+    
+    @staticmethod
+    def _location_key(province=None, district=None, village=None, site_name=None) -> tuple:
+        """Normalized (province, district, village, site_name) used to cache locations"""
+        parts = tuple(None if value is None or (not isinstance(value, str) and pd.isna(value)) else value
+                      for value in (province, district, village, site_name))
+        if not parts[0]:
+            parts = ('Laos',) + parts[1:]  # Default province
+        return parts
+    
+    def _location_matches(self, existing: tuple, key: tuple) -> bool:
+        """Same rule as the location lookup: a NULL column on the existing row matches anything"""
+        if self._fold(existing[0]) != self._fold(key[0]):
+            return False
+        for have, want in zip(existing[1:], key[1:]):
+            if have is not None and (want is None or self._fold(have) != self._fold(want)):
+                return False
+        return True
+    
+    def _match_existing_locations(self, keys: List[tuple]):
+        """Resolve location keys against the table with one IN query per chunk of provinces"""
+        provinces = list(dict.fromkeys(key[0] for key in keys))
+        candidates = {}
+        for chunk in self._chunks(provinces):
+            placeholders = ", ".join(["?"] * len(chunk))
+            self.cursor.execute(f"""
+                SELECT location_id, province, district, village, site_name FROM locations
+                WHERE country = 'Laos' AND province IN ({placeholders})
+                ORDER BY location_id
+            """, chunk)
+            for location_id, *existing in self.cursor.fetchall():
+                candidates.setdefault(self._fold(existing[0]), []).append((location_id, tuple(existing)))
+        
+        for key in keys:
+            for location_id, existing in candidates.get(self._fold(key[0]), []):
+                if self._location_matches(existing, key):
+                    self._location_ids[key] = location_id
+                    break
+    
+    def get_or_create_locations(self, locations) -> Dict[tuple, int]:
+        """Get or create many locations at once.
         
-        # Check if team exists
-        self.cursor.execute("SELECT team_id FROM teams WHERE team_name = ?", (team_name,))
-        result = self.cursor.fetchone()
-        if result:
-            return result[0]
+        Args:
+            locations: Iterable of (province, district, village, site_name) tuples
+            
+        Returns:
+            Dictionary mapping each normalized location key to its location_id
+        """
+        keys = list(dict.fromkeys(self._location_key(*location) for location in locations))
+        missing = [key for key in keys if key not in self._location_ids]
+        if missing:
+            self._match_existing_locations(missing)
+            
+            # Create in first-seen order, skipping keys an earlier new location
+            # already satisfies, exactly as one-by-one get-or-create would
+            to_create = []
+            for key in missing:
+                if key in self._location_ids:
+                    continue
+                if not any(self._location_matches(created, key) for created in to_create):
+                    to_create.append(key)
+            
+            if to_create:
+                now = datetime.now()
+                self.cursor.executemany("""
+                    INSERT INTO locations (country, province, district, village, site_name, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [('Laos',) + key + (now, now) for key in to_create])
+                self._written_tables.add('locations')
+                self._match_existing_locations([key for key in missing if key not in self._location_ids])
+        
+        return {key: self._location_ids.get(key) for key in keys}
+    
+    def _get_or_create_by_name(self, table: str, pk_column: str, name_column: str, names,
+                               cache: Dict[str, int], new_row) -> Dict[str, int]:
+        """Shared get-or-create for lookup tables keyed by one name column"""
+        names = [name for name in dict.fromkeys(names)
+                 if name and not (isinstance(name, float) and pd.isna(name))]
+        missing = [name for name in names if name not in cache]
+        
+        if missing:
+            self._match_existing_names(table, pk_column, name_column, missing, cache)
+            to_create = [name for name in missing if name not in cache]
+            if to_create:
+                now = datetime.now()
+                columns = new_row(to_create[0], now)
+                self.cursor.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+                    [tuple(new_row(name, now).values()) for name in to_create]
+                )
+                self._written_tables.add(table)
+                self._match_existing_names(table, pk_column, name_column, to_create, cache)
         
-        # Create new team entry
-        self.cursor.execute("""
-            INSERT INTO teams (team_name, created_at, updated_at)
-            VALUES (?, ?, ?)
-        """, (team_name, datetime.now(), datetime.now()))
+        return {name: cache.get(name) for name in names}
+    
+    def _match_existing_names(self, table: str, pk_column: str, name_column: str, names: List[Any], cache: Dict[str, int]):
+        """Resolve names against a lookup table with one IN query per chunk"""
+        for chunk in self._chunks(names):
+            placeholders = ", ".join(["?"] * len(chunk))
+            self.cursor.execute(
+                f"SELECT {name_column}, {pk_column} FROM {table} WHERE {name_column} IN ({placeholders}) ORDER BY {pk_column}",
+                chunk
+            )
+            found = {}
+            for name, row_id in self.cursor.fetchall():
+                found.setdefault(self._fold(name), row_id)
+            for name in chunk:
+                if self._fold(name) in found:
+                    cache[name] = found[self._fold(name)]
+    
+    @staticmethod
+    def _species_from_name(scientific_name: str) -> str:
+        # Extract species from scientific_name (take the part after the last space)
+        return scientific_name.split()[-1] if ' ' in scientific_name else scientific_name
+    
+    def get_or_create_taxa(self, scientific_names) -> Dict[str, int]:
+        """Get or create many taxonomy records at once, keyed by scientific name"""
+        def new_row(scientific_name, now):
+            return {'species': self._species_from_name(scientific_name), 'scientific_name': scientific_name,
+                    'created_at': now, 'updated_at': now}
+        
+        return self._get_or_create_by_name('taxonomy', 'taxonomy_id', 'scientific_name', scientific_names,
+                                           self._taxonomy_ids, new_row)
+    
+    def get_or_create_teams(self, team_names) -> Dict[str, int]:
+        """Get or create many teams at once, keyed by team name"""
+        def new_row(team_name, now):
+            return {'team_name': team_name, 'created_at': now, 'updated_at': now}
         
-        return self.cursor.lastrowid
+        return self._get_or_create_by_name('teams', 'team_id', 'team_name', team_names,
+                                           self._team_ids, new_row)
     
     def build_dynamic_insert(self, table_name: str, columns: List[str], additional_columns: List[str] = None) -> tuple:
         """Build dynamic INSERT statement with proper column mapping"""
         # Get table schema to ensure columns exist
-        if self.connection_type in ('mysql', 'mariadb'):
-            self.cursor.execute(f"DESCRIBE `{table_name}`")
-            schema_columns = [col[0] for col in self.cursor.fetchall()]
-        else:
-            self.cursor.execute(f"PRAGMA table_info({table_name})")
-            schema_columns = [col[1] for col in self.cursor.fetchall()]
+        schema_columns = self.get_table_columns(table_name)
         
         # Filter columns to only those that exist in the table
         valid_columns = [col for col in columns if col in schema_columns]
@@ -831,6 +1012,18 @@ class ExcelImportManager:
         # Create column name to Excel column mapping
         column_map = {col: col for col in columns}
         
+        # Get or create every location, taxon and team in a few set-based queries;
+        # the per-row get_or_create_* calls below are then answered from the cache
+        provinces = self._column_values(df, column_map, 'province')
+        districts = self._column_values(df, column_map, 'district')
+        villages = self._column_values(df, column_map, 'village')
+        self.get_or_create_locations(
+            (province, district, village) if (province or district or village) else ('Unknown', None, None)
+            for province, district, village in zip(provinces, districts, villages)
+        )
+        self.get_or_create_taxa(self._column_values(df, column_map, 'scientific_name'))
+        self.get_or_create_teams(self._column_values(df, column_map, 'team_name'))
+        
         for _, row in df.iterrows():
             # Get location_id dynamically
             location_id = None
@@ -1130,6 +1323,13 @@ class ExcelImportManager:
         # Create column name to Excel column mapping
         column_map = {col: col for col in columns}
         
+        provinces = self._column_values(df, column_map, 'province')
+        districts = self._column_values(df, column_map, 'district')
+        villages = self._column_values(df, column_map, 'village')
+        self.get_or_create_locations(
+            location for location in zip(provinces, districts, villages) if any(location)
+        )
+        
         for _, row in df.iterrows():
             province = row.get(column_map.get('province', 'province'))
             district = row.get(column_map.get('district', 'district'))
@@ -1150,6 +1350,8 @@ class ExcelImportManager:
         # Create column name to Excel column mapping
         column_map = {col: col for col in columns}
         
+        self.get_or_create_teams(self._column_values(df, column_map, 'team_name')[:len(sample_ids)])
+        
         for i, (_, row) in enumerate(df.iterrows()):
             if i >= len(sample_ids):
                 continue
@@ -1189,7 +1391,14 @@ class ExcelImportManager:
     def import_generic_table_data(self, table_name: str, df: pd.DataFrame, columns: List[str], 
                                 foreign_key_data: Dict = None, import_mode: str = 'skip', sheet_name: str = '',
                                 custom_mappings: Dict = None, excluded_columns: List = None, session_ids: Dict = None) -> Dict[str, Any]:
-        """Generic method to import data into any table"""
+        """Generic method to import data into any table
+        
+        Works column-wise: rows are selected and values coerced per column,
+        existing records are found with one anti-join per business-key
+        pattern, and inserts/updates go out with executemany in batches of
+        IMPORT_BATCH_SIZE. Rows that fail are returned in ``rejected_rows``
+        (see _rejected_frame) instead of being dropped silently.
+        """
         if len(df) > 0:
             pass
         
@@ -1254,14 +1463,15 @@ class ExcelImportManager:
         
         
         # Get table schema to understand required columns and relationships
-        self.cursor.execute(f"PRAGMA table_info({table_name})")
-        table_schema = self.cursor.fetchall()
+        table_schema = self.get_table_info(table_name)
         
         # Build column info dictionary
         column_info = {}
         primary_key = None
         for col in table_schema:
-            col_id, col_name, col_type, not_null, default, pk = col
+            col_id, col_name, col_type, not_null, default, pk = (
+                col['cid'], col['name'], col['type'], col['notnull'], col['default'], col['pk']
+            )
             
             if pk:
                 primary_key = col_name
@@ -1274,298 +1484,582 @@ class ExcelImportManager:
                 'primary_key': pk
             }
         
-        # Process each row in the DataFrame
-        for row_idx, row in df.iterrows():
-            # Skip rows that don't have meaningful data in key columns
-            has_meaningful_data = False
-            for col in columns:
-                excel_col = column_map.get(col)
-                if excel_col:
-                    value = row.get(excel_col)
-                    if pd.notna(value) and str(value).strip():
-                        has_meaningful_data = True
-                        break
-            
-            if not has_meaningful_data:
-                continue
-            
-            # Additional validation for hosts table - collectors must be valid names
-            if table_name == 'hosts':
-                collectors_col = self.find_excel_column_for_db_column('collectors', list(df.columns))
-                if collectors_col:
-                    collectors_value = row.get(collectors_col)
-                    if pd.notna(collectors_value):
-                        # Collectors should be text containing names, not numbers
-                        if not (isinstance(collectors_value, str) and 
-                               any(char.isalpha() for char in str(collectors_value)) and 
-                               not str(collectors_value).replace('.', '').replace(' ', '').replace(',', '').isdigit()):
-                            continue
-            # Resolve foreign keys for this specific row
-            resolved_fks = self._resolve_foreign_keys_dynamic(table_name, row, available_excel_columns, session_ids) or {}
-            
-            # Infer host_type if importing into hosts table and it's not provided
-            if table_name == 'hosts':
+        rejected = []  # (position in df, reason)
+        
+        # Skip rows that don't have meaningful data in key columns
+        selected = pd.Series(False, index=df.index)
+        for col in columns:
+            excel_col = column_map.get(col)
+            if excel_col in df.columns:
+                selected |= self._has_value(df[excel_col])
+        
+        # Additional validation for hosts table - collectors must be valid names
+        if table_name == 'hosts':
+            collectors_col = self.find_excel_column_for_db_column('collectors', list(df.columns))
+            if collectors_col:
+                collectors = df[collectors_col]
+                valid = collectors.isna() | collectors.map(self._is_valid_collectors).astype(bool)
+                for position in (selected & ~valid).to_numpy().nonzero()[0]:
+                    rejected.append((position, f"Invalid collectors value: {collectors.iloc[position]}"))
+                selected &= valid
+        
+        positions = selected.to_numpy().nonzero()[0]
+        import_frame = df.iloc[positions]
+        records = import_frame.to_dict('records')
+        
+        # Resolve foreign keys for the whole sheet with set-based lookups
+        self.prepare_fk_resolution(table_name, records, available_excel_columns, session_ids)
+        resolved_rows = [
+            self._resolve_foreign_keys_dynamic(table_name, row, available_excel_columns, session_ids) or {}
+            for row in records
+        ]
+        
+        # Infer host_type if importing into hosts table and it's not provided
+        if table_name == 'hosts':
+            sheet_name_lower = sheet_name.lower()
+            host_type = None
+            if 'bat' in sheet_name_lower:
+                host_type = 'Bat'
+            elif 'rodent' in sheet_name_lower:
+                host_type = 'Rodent'
+            elif 'market' in sheet_name_lower:
+                host_type = 'Market'
+            if host_type:
                 host_type_col = self.find_excel_column_for_db_column('host_type', list(df.columns))
-                if not host_type_col or pd.isna(row.get(host_type_col)):
-                    # Infer from sheet name
-                    sheet_name_lower = sheet_name.lower()
-                    if 'bat' in sheet_name_lower:
-                        resolved_fks['host_type'] = 'Bat'
-                    elif 'rodent' in sheet_name_lower:
-                        resolved_fks['host_type'] = 'Rodent'
-                    elif 'market' in sheet_name_lower:
-                        resolved_fks['host_type'] = 'Market'
-
-            # Improved duplicate detection using business keys instead of auto-incrementing PKs
-            existing_record = None
-            
-            # Debug why duplicate check might fail or return existing even if new
-            
-            # Define business key columns for each table to detect duplicates
-            business_keys = {
-                'hosts': ['bag_id', 'bag_code', 'field_no', 'field_id', 'scientific_name', 'source_id'], # Prioritize bag IDs for hosts
-                'samples': ['sample_id', 'sample_code', 'saliva_id', 'anal_id', 'urine_id', 'ecto_id', 'blood_id', 'tissue_id', 'rna_plate'], 
-                'screening_results': ['cdna_date', 'pancorona', 'sample_id'],
-                'storage_locations': ['freezer_name', 'location', 'sample_id'],
-                'morphometrics': ['host_id']  # Each host can only have one morphometrics record
-            }
-            
-            if table_name in business_keys:
-                # Build duplicate check query using business keys
-                key_cols = business_keys[table_name]
-                conditions = []
-                values = []
-                valid_key_cols = 0  # Initialize counter
-                
-                for key_col in key_cols:
-                    # Check if key_col is in resolved_fks (for FK columns)
-                    if key_col in resolved_fks:
-                        conditions.append(f"{key_col} = ?")
-                        values.append(resolved_fks[key_col])
-                        valid_key_cols += 1
-                    # Check if key_col is in available columns
-                    elif key_col in columns:
-                        excel_col = column_map.get(key_col)
-                        if excel_col:
-                            value = row.get(excel_col)
-                            if pd.notna(value):
-                                # Validate key column data before adding to query
-                                is_valid = True
-                                if key_col == 'collectors':
-                                    if not (isinstance(value, str) and any(char.isalpha() for char in str(value)) and not str(value).replace('.', '').replace(' ', '').replace(',', '').isdigit()):
-                                        is_valid = False
-                                elif key_col == 'collection_date':
-                                    if not (isinstance(value, str) and ('-' in str(value) or '/' in str(value)) or isinstance(value, (int, float)) and value > 1900):
-                                        is_valid = False
-                                elif not str(value).strip():
-                                    is_valid = False
-                                    
-                                if is_valid:
-                                    conditions.append(f"{key_col} = ?")
-                                    values.append(value)
-                                    valid_key_cols += 1
-                
-                if conditions:
-                    # Use correct primary key column for each table
-                    pk_column = 'id'
-                    if table_name == 'locations':
-                        pk_column = 'location_id'
-                    elif table_name == 'taxonomy':
-                        pk_column = 'taxonomy_id'
-                    elif table_name == 'environmental_samples':
-                        pk_column = 'env_sample_id'
-                    elif table_name == 'samples':
-                        pk_column = 'sample_id'
-                    elif table_name == 'hosts':
-                        pk_column = 'host_id'
-                    elif table_name == 'projects':
-                        pk_column = 'project_id'
-                    elif table_name == 'departments':
-                        pk_column = 'dept_id'
-                    elif table_name == 'employees':
-                        pk_column = 'emp_id'
-                    elif table_name == 'morphometrics':
-                        pk_column = 'morpho_id'
-                    
-                    duplicate_query = f"SELECT {pk_column} FROM {table_name} WHERE {' AND '.join(conditions)}"
-                    try:
-                        existing_record = self.cursor.execute(duplicate_query, values).fetchone()
-                    except Exception as e:
-                        logger.warning(f"Duplicate check failed for {table_name}: {e}")
-            
-            if existing_record:
-                if import_mode == 'update':
-                    # Update existing record logic
-                    if primary_key:
-                        pk_value = existing_record[0]  # id from existing record
-                        
-                        update_columns = [col for col in columns if col != primary_key]
-                        if update_columns:
-                            # Add resolved columns to update_columns if missing
-                            for fk_col in resolved_fks:
-                                if fk_col != primary_key and fk_col not in update_columns:
-                                    update_columns.append(fk_col)
-                                    
-                            final_update_columns = []
-                            values = []
-                            
-                            for col in update_columns:
-                                # Priority 1: Resolved FKs (always include if present)
-                                if col in resolved_fks:
-                                    final_update_columns.append(col)
-                                    values.append(resolved_fks[col])
-                                    continue
-                                    
-                                # Priority 2: Excel data (skip if NULL/empty)
-                                excel_value = row.get(column_map.get(col, col))
-                                
-                                # Skip if NULL/empty/whitespace-only to avoid overwriting existing data
-                                if pd.isna(excel_value) or excel_value is None or (isinstance(excel_value, str) and not excel_value.strip()):
-                                    continue
-                                    
-                                final_update_columns.append(col)
-                                if hasattr(excel_value, 'item'):  # numpy scalar types
-                                    values.append(excel_value.item())
-                                else:
-                                    values.append(excel_value)
-                            
-                            if final_update_columns:
-                                # Check if updated_at column exists in table
-                                set_clause = ", ".join([f'"{col}" = ?' for col in final_update_columns])
-                                if 'updated_at' in column_info:
-                                    update_sql = f"UPDATE {table_name} SET {set_clause}, updated_at = ? WHERE {primary_key} = ?"
-                                    values.extend([datetime.now(), pk_value])
-                                else:
-                                    update_sql = f"UPDATE {table_name} SET {set_clause} WHERE {primary_key} = ?"
-                                    values.append(pk_value)
-                                
-                                try:
-                                    self.cursor.execute(update_sql, values)
-                                    records_updated += 1
-                                except Exception as e:
-                                    logger.error(f"Failed to update {table_name} record: {e}")
-                            else:
-                                pass
-                elif import_mode == 'skip':
-                    records_updated += 1
+                for resolved, value in zip(resolved_rows, self._frame_values(import_frame, host_type_col)):
+                    if value is None:
+                        resolved['host_type'] = host_type
+        
+        # Column-wise INSERT values: mapped columns, then resolved FK columns, then system columns
+        insert_values = {}
+        for col in columns:
+            # Special handling for FK columns that were added to dataframe
+            source_col = col if col in ['host_id', 'sample_id'] and col in df.columns else column_map.get(col, col)
+            values = self._frame_values(import_frame, source_col)
+            if col == 'notes' and self.security:
+                values = [self.security.encrypt_data(notes) if notes else notes for notes in values]
+            insert_values[col] = values
+        
+        fk_columns = []
+        for resolved in resolved_rows:
+            for fk_col in resolved:
+                if fk_col not in insert_values and fk_col not in fk_columns:
+                    fk_columns.append(fk_col)
+        for fk_col in fk_columns:
+            insert_values[fk_col] = [_MISSING] * len(records)
+        for row_no, resolved in enumerate(resolved_rows):
+            for col, value in resolved.items():
+                # Check if this column was resolved via foreign keys
+                insert_values[col][row_no] = value
+        
+        # Add required system columns
+        now = datetime.now()
+        system_values = {}
+        if 'created_at' in column_info:
+            system_values['created_at'] = now
+        if 'updated_at' in column_info:
+            system_values['updated_at'] = now
+        if 'created_by' in column_info and self.user_id:
+            system_values['created_by'] = self.user_id
+        if 'is_encrypted' in column_info:
+            system_values['is_encrypted'] = 0  # Default to not encrypted
+        if 'access_level' in column_info:
+            system_values['access_level'] = 'researcher'  # Default access level
+        
+        # Improved duplicate detection using business keys instead of auto-incrementing PKs
+        key_values = self._business_key_values(table_name, columns, column_map, import_frame, resolved_rows)
+        pk_column = 'morpho_id' if table_name == 'morphometrics' else self._fk_target_pk(table_name)
+        
+        # Insert new rows in sheet order. A row whose business key matches an
+        # existing record is skipped or updated instead. A row that may repeat
+        # one inserted earlier from this sheet is checked with the same SQL
+        # lookup as a record already in the table, after the pending inserts
+        # are written, so the table ends up as a row-by-row import left it.
+        row_ids = [None] * len(records)
+        duplicates = []  # (row_no, pk of the matching record)
+        existing = self._find_existing_records(table_name, pk_column, key_values, list(range(len(records))))
+        earlier_rows = {}
+        inserted_rows = []
+        pending = []
+        for row_no in range(len(records)):
+            keys = key_values[row_no]
+            if keys and row_no in existing:
+                duplicates.append((row_no, existing[row_no]))
+                continue
+            if keys and self._match_earlier_insert(earlier_rows, keys, inserted_rows, insert_values) is not None:
+                self._insert_rows(table_name, pending, insert_values, fk_columns, column_info, system_values,
+                                  row_ids, rejected, positions, len(records))
+                pending = []
+                repeated = self._find_existing_records(table_name, pk_column, key_values, [row_no])
+                if row_no in repeated:
+                    duplicates.append((row_no, repeated[row_no]))
                     continue
-            else:
-                insert_columns = list(columns)  # Start with mapped columns
-                
-                # Add resolved foreign key columns if not already present
-                for fk_col in resolved_fks:
-                    if fk_col not in insert_columns:
-                        insert_columns.append(fk_col)
-                        
-                foreign_values = {}
-                
-                # Add required system columns
-                system_cols = []
-                if 'created_at' in column_info:
-                    system_cols.append('created_at')
-                if 'updated_at' in column_info:
-                    system_cols.append('updated_at')
-                if 'created_by' in column_info and self.user_id:
-                    system_cols.append('created_by')
-                if 'is_encrypted' in column_info:
-                    system_cols.append('is_encrypted')
-                if 'access_level' in column_info:
-                    system_cols.append('access_level')
-                
-                insert_columns.extend(system_cols)
-                
-                # Build INSERT statement
-                placeholders = ", ".join(["?" for _ in insert_columns])
-                columns_str = ", ".join([f'"{c}"' for c in insert_columns])
-                insert_sql = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})"
+            pending.append(row_no)
+            inserted_rows.append(row_no)
+            self._index_earlier_insert(earlier_rows, row_no, insert_values)
+        self._insert_rows(table_name, pending, insert_values, fk_columns, column_info, system_values,
+                          row_ids, rejected, positions, len(records))
+        
+        # Track created records in sheet order
+        created_rows = [row_no for row_no in range(len(records)) if row_ids[row_no] is not None]
+        records_created = len(created_rows)
+        created_ids = [row_ids[row_no] for row_no in created_rows]
+        
+        # Track created record for session FK resolution
+        if session_ids is None:
+            session_ids = {}
+        if created_rows:
+            session_records = session_ids.setdefault(table_name, [])
+            
+            # Comprehensive matching fields for all FK relationships
+            all_match_fields = [
+                'bag_id', 'bag_code', 'source_id', 'field_id', 'field_no',
+                'sample_id', 'sample_code', 'saliva_id', 'anal_id', 'urine_id', 
+                'ecto_id', 'blood_id', 'tissue_id', 'rna_plate',
+                'scientific_name', 'species', 'genus', 'family', 'order_name',
+                'province', 'district', 'village', 'site_name',
+                'pool_id', 'bathost_id', 'rodenthost_id', 'marketsampleandhost_id',
+                'batswab_id', 'battissue_id', 'rodentswab_id'
+            ]
+            match_values = {match_col: self._frame_values(import_frame, column_map[match_col])
+                            for match_col in all_match_fields if match_col in column_map}
+            
+            for row_no in created_rows:
+                # Create record dict with key identifying fields for FK matching
+                record_data = {'id': row_ids[row_no]}
+                for match_col, values in match_values.items():
+                    if values[row_no] is not None:
+                        record_data[match_col] = str(records[row_no][column_map[match_col]])
+                session_records.append(record_data)
+            print(f"[DEBUG] Tracked {len(created_rows)} {table_name} records for session FK resolution")
+        
+        # Existing records: skip, or update with the non-empty cells of the row
+        if import_mode == 'skip':
+            records_updated += len(duplicates)
+        elif import_mode == 'update' and primary_key:
+            update_columns = [col for col in columns if col != primary_key]
+            if update_columns:
+                updates = []
+                for row_no, pk_value in duplicates:
+                    update = self._update_values(records[row_no], update_columns, primary_key, resolved_rows[row_no],
+                                                 column_map)
+                    if update:
+                        updates.append((row_no, pk_value, update))
                 
-                values = []
-                for col in insert_columns:
-                    # Check if this column was resolved via foreign keys
-                    if col in resolved_fks:
-                        values.append(resolved_fks[col])
-                        continue
-                        
-                    # Handle other columns
-                    if col == 'created_at' or col == 'updated_at':
-                        values.append(datetime.now())
-                    elif col == 'created_by':
-                        values.append(self.user_id)
-                    elif col == 'is_encrypted':
-                        values.append(0)  # Default to not encrypted
-                    elif col == 'access_level':
-                        values.append('researcher')  # Default access level
-                    elif col in foreign_values:
-                        values.append(foreign_values[col])
-                        values.append(foreign_values[col])
-                    elif col == 'notes' and self.security:
-                        notes = row.get(column_map.get(col, col))
-                        if notes:
-                            notes = self.security.encrypt_data(notes)
-                        values.append(notes)
+                for (set_columns, has_updated_at), batch in self._group_update_rows(updates, column_info):
+                    set_clause = ", ".join([f'"{col}" = ?' for col in set_columns])
+                    if has_updated_at:
+                        update_sql = f"UPDATE {table_name} SET {set_clause}, updated_at = ? WHERE {primary_key} = ?"
+                        rows = [tuple(update.values()) + (now, pk_value) for _, pk_value, update in batch]
                     else:
-                        excel_col = column_map.get(col, col)
-                        excel_value = row.get(excel_col)
-                        
-                        # Special handling for FK columns that were added to dataframe
-                        if col in ['host_id', 'sample_id'] and col in df.columns:
-                            # Use dataframe direct access for FK columns
-                            excel_value = df.loc[row.name if hasattr(row, 'name') else row_idx, col]
-                            excel_value = df.loc[row.name if hasattr(row, 'name') else row_idx, col]
-                        
-                        # Handle pandas data types and NaN values properly
-                        if pd.isna(excel_value) or excel_value is None:
-                            values.append(None)
-                        elif hasattr(excel_value, 'item'):  # numpy scalar types
-                            values.append(excel_value.item())
-                        else:
-                            values.append(excel_value)
-                
-                try:
-                    self.cursor.execute(insert_sql, values)
-                    records_created += 1
-                    record_id = self.cursor.lastrowid
-                    created_ids.append(record_id)
-                    
-                    # Track created record for session FK resolution
-                    if session_ids is None:
-                        session_ids = {}
-                    if table_name not in session_ids:
-                        session_ids[table_name] = []
-                    
-                    # Create record dict with key identifying fields for FK matching
-                    record_data = {'id': record_id}
+                        update_sql = f"UPDATE {table_name} SET {set_clause} WHERE {primary_key} = ?"
+                        rows = [tuple(update.values()) + (pk_value,) for _, pk_value, update in batch]
                     
-                    # Comprehensive matching fields for all FK relationships
-                    all_match_fields = [
-                        'bag_id', 'bag_code', 'source_id', 'field_id', 'field_no',
-                        'sample_id', 'sample_code', 'saliva_id', 'anal_id', 'urine_id', 
-                        'ecto_id', 'blood_id', 'tissue_id', 'rna_plate',
-                        'scientific_name', 'species', 'genus', 'family', 'order_name',
-                        'province', 'district', 'village', 'site_name',
-                        'pool_id', 'bathost_id', 'rodenthost_id', 'marketsampleandhost_id',
-                        'batswab_id', 'battissue_id', 'rodentswab_id'
-                    ]
-                    
-                    for match_col in all_match_fields:
-                        if match_col in column_map:
-                            excel_value = row.get(column_map[match_col])
-                            if pd.notna(excel_value):
-                                record_data[match_col] = str(excel_value)
-                    
-                    session_ids[table_name].append(record_data)
-                    print(f"[DEBUG] Tracked {table_name} record {record_id} for session FK resolution")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to create {table_name} record: {e}")
+                    for (row_no, _, _), error in zip(batch, self._execute_batch(update_sql, rows)):
+                        if error:
+                            logger.error(f"Failed to update {table_name} record: {error}")
+                            rejected.append((positions[row_no], error))
+                        else:
+                            records_updated += 1
+                    self._report_table_progress(table_name, max(row_no for row_no, _, _ in batch) + 1, len(records))
+        
+        if rejected:
+            print(f"[DEBUG] Rejected {len(rejected)} rows for {table_name}")
         
         return {
             'records_created': records_created,
             'records_updated': records_updated,
             'total_processed': len(df),
-            'created_ids': created_ids
+            'created_ids': created_ids,
+            'rejected_rows': self._rejected_frame(df, rejected, table_name, sheet_name)
         }
     
+    @staticmethod
+    def _has_value(series: pd.Series) -> pd.Series:
+        """Cells that are neither NaN nor blank"""
+        return series.notna() & (series.astype(str).str.strip() != '')
+    
+    @staticmethod
+    def _is_valid_collectors(value) -> bool:
+        # Collectors should be text containing names, not numbers
+        return (isinstance(value, str) and
+                any(char.isalpha() for char in value) and
+                not value.replace('.', '').replace(' ', '').replace(',', '').isdigit())
+    
+    def _is_valid_key_value(self, key_col: str, value) -> bool:
+        """Validate key column data before using it for duplicate detection"""
+        if key_col == 'collectors':
+            return self._is_valid_collectors(value)
+        if key_col == 'collection_date':
+            return bool(isinstance(value, str) and ('-' in value or '/' in value) or
+                        isinstance(value, (int, float)) and value > 1900)
+        return bool(str(value).strip())
+    
+    @staticmethod
+    def _frame_values(frame: pd.DataFrame, excel_col) -> List[Any]:
+        """Column values as Python objects with NaN as None (all None if the column is absent)"""
+        if excel_col is None or excel_col not in frame.columns:
+            return [None] * len(frame)
+        series = frame[excel_col]
+        if isinstance(series, pd.DataFrame):  # duplicated header
+            series = series.iloc[:, 0]
+        values = series.to_numpy(dtype=object, copy=True)
+        values[series.isna().to_numpy()] = None
+        return [value.item() if hasattr(value, 'item') else value for value in values]
+    
+    def _business_key_values(self, table_name: str, columns: List[str], column_map: Dict[str, str],
+                             import_frame: pd.DataFrame, resolved_rows: List[Dict]) -> List[Dict[str, Any]]:
+        """Per row, the business key columns and values used to detect an existing record"""
+        # Define business key columns for each table to detect duplicates
+        business_keys = {
+            'hosts': ['bag_id', 'bag_code', 'field_no', 'field_id', 'scientific_name', 'source_id'], # Prioritize bag IDs for hosts
+            'samples': ['sample_id', 'sample_code', 'saliva_id', 'anal_id', 'urine_id', 'ecto_id', 'blood_id', 'tissue_id', 'rna_plate'], 
+            'screening_results': ['cdna_date', 'pancorona', 'sample_id'],
+            'storage_locations': ['freezer_name', 'location', 'sample_id'],
+            'morphometrics': ['host_id']  # Each host can only have one morphometrics record
+        }
+        
+        key_values = [{} for _ in resolved_rows]
+        for key_col in business_keys.get(table_name, []):
+            excel_col = column_map.get(key_col) if key_col in columns else None
+            values = self._frame_values(import_frame, excel_col) if excel_col else None
+            for row_no, resolved in enumerate(resolved_rows):
+                # Check if key_col is in resolved_fks (for FK columns)
+                if key_col in resolved:
+                    key_values[row_no][key_col] = resolved[key_col]
+                elif values is not None:
+                    value = values[row_no]
+                    if value is not None and self._is_valid_key_value(key_col, value):
+                        key_values[row_no][key_col] = value
+        return key_values
+    
+    def _find_existing_records(self, table_name: str, pk_column: str, key_values: List[Dict[str, Any]],
+                               row_nos: List[int]) -> Dict[int, Any]:
+        """Anti-join the rows' business keys against the table.
+        
+        Rows are grouped by which key columns they carry, and each group is
+        joined against the table in chunks, so the comparison semantics are
+        those of ``key_col = ?`` without one query per row.
+        
+        Returns:
+            Dictionary mapping row number to the pk of its first matching record
+        """
+        patterns = {}
+        for row_no in row_nos:
+            if key_values[row_no]:
+                patterns.setdefault(tuple(key_values[row_no]), []).append(row_no)
+        
+        existing = {}
+        for pattern, pattern_rows in patterns.items():
+            aliases = [f"k{i}" for i in range(len(pattern))]
+            conditions = " AND ".join(f"t.{key_col} = k.{alias}" for key_col, alias in zip(pattern, aliases))
+            width = len(pattern) + 1
+            if self.connection_type in ('mysql', 'mariadb'):
+                chunk_size = min(self.LOOKUP_CHUNK_SIZE, 65535 // width)
+            else:
+                chunk_size = max(1, min(self.LOOKUP_CHUNK_SIZE, 999 // width))
+            
+            try:
+                for start in range(0, len(pattern_rows), chunk_size):
+                    chunk = pattern_rows[start:start + chunk_size]
+                    params = [value for row_no in chunk for value in (row_no, *key_values[row_no].values())]
+                    if self.connection_type in ('mysql', 'mariadb'):
+                        first = "SELECT ? AS row_no, " + ", ".join(f"? AS {alias}" for alias in aliases)
+                        rest = " UNION ALL SELECT " + ", ".join(["?"] * width)
+                        self.cursor.execute(f"""
+                            SELECT k.row_no, MIN(t.{pk_column}) FROM ({first}{rest * (len(chunk) - 1)}) k
+                            JOIN {table_name} t ON {conditions} GROUP BY k.row_no
+                        """, params)
+                    else:
+                        # Bare t.pk comes from the MIN(rowid) row: the record a plain lookup finds first
+                        row_sql = "(" + ", ".join(["?"] * width) + ")"
+                        self.cursor.execute(f"""
+                            WITH k(row_no, {', '.join(aliases)}) AS (VALUES {', '.join([row_sql] * len(chunk))})
+                            SELECT k.row_no, t.{pk_column}, MIN(t.rowid) FROM k
+                            JOIN {table_name} t ON {conditions} GROUP BY k.row_no
+                        """, params)
+                    for match in self.cursor.fetchall():
+                        existing[int(match[0])] = match[1]
+            except Exception as e:
+                # Fall back to one lookup per row (e.g. tables without rowid)
+                logger.debug(f"Batched duplicate check failed for {table_name}, checking row by row: {e}")
+                duplicate_query = f"SELECT {pk_column} FROM {table_name} WHERE {' AND '.join(f'{key_col} = ?' for key_col in pattern)}"
+                for row_no in pattern_rows:
+                    try:
+                        existing_record = self.cursor.execute(duplicate_query, list(key_values[row_no].values())).fetchone()
+                        if existing_record:
+                            existing[row_no] = existing_record[0]
+                    except Exception as e:
+                        logger.warning(f"Duplicate check failed for {table_name}: {e}")
+        return existing
+    
+    @staticmethod
+    def _loose_key(value) -> str:
+        """Comparison key at least as loose as SQL ``=`` on stored values (case, padding, 5 vs '5.0')"""
+        text = str(value).strip().lower()
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        return str(int(number)) if number.is_integer() else repr(number)
+    
+    def _earlier_key(self, pattern: tuple, row_no: int, insert_values: Dict[str, List[Any]]) -> Optional[tuple]:
+        stored = []
+        for key_col in pattern:
+            value = insert_values[key_col][row_no] if key_col in insert_values else None
+            if value is None or value is _MISSING:
+                return None
+            stored.append(self._loose_key(value))
+        return tuple(stored)
+    
+    def _match_earlier_insert(self, index: Dict[tuple, Dict], keys: Dict[str, Any], earlier_rows: List[int],
+                              insert_values: Dict[str, List[Any]]) -> Optional[int]:
+        """Earliest row inserted from this sheet that these business keys may match.
+        
+        Only a candidate: whether the row really is a duplicate is left to the
+        SQL lookup, which compares the values as stored.
+        """
+        pattern = tuple(keys)
+        if pattern not in index:
+            index[pattern] = {}
+            for row_no in earlier_rows:
+                self._index_earlier_insert({pattern: index[pattern]}, row_no, insert_values)
+        return index[pattern].get(tuple(self._loose_key(value) for value in keys.values()))
+    
+    def _index_earlier_insert(self, index: Dict[tuple, Dict], row_no: int, insert_values: Dict[str, List[Any]]):
+        for pattern, rows in index.items():
+            key = self._earlier_key(pattern, row_no, insert_values)
+            if key is not None:
+                rows.setdefault(key, row_no)
+    
+    def _insert_rows(self, table_name: str, row_nos: List[int], insert_values: Dict[str, List[Any]],
+                     fk_columns: List[str], column_info: Dict[str, Dict], system_values: Dict[str, Any],
+                     row_ids: List[Any], rejected: List[tuple], positions, total: int):
+        """Insert rows in batches, recording each new ID in row_ids or the error in rejected"""
+        for insert_columns, batch_rows in self._group_insert_rows(row_nos, insert_values, fk_columns, column_info):
+            rows = [tuple(None if insert_values[col][row_no] is _MISSING else insert_values[col][row_no]
+                          for col in insert_columns) + tuple(system_values.values())
+                    for row_no in batch_rows]
+            ids, errors = self._insert_batch(
+                table_name, insert_columns + list(system_values), rows,
+                progress=lambda done: self._report_table_progress(table_name, batch_rows[done - 1] + 1, total)
+            )
+            for row_no, record_id, error in zip(batch_rows, ids, errors):
+                if error:
+                    logger.error(f"Failed to create {table_name} record: {error}")
+                    rejected.append((positions[row_no], error))
+                else:
+                    row_ids[row_no] = record_id
+    
+    def _group_insert_rows(self, row_nos: List[int], insert_values: Dict[str, List[Any]], fk_columns: List[str],
+                           column_info: Dict[str, Dict]):
+        """Split rows into consecutive runs that share one INSERT column list.
+        
+        A resolved FK column a row did not resolve is sent as NULL when that is
+        also the column default; otherwise the row omits it, like before.
+        """
+        base_columns = [col for col in insert_values if col not in fk_columns]
+        nullable = {col for col in fk_columns if col in column_info and column_info[col]['default'] is None}
+        run_columns, run_rows = None, []
+        for row_no in row_nos:
+            row_columns = base_columns + [col for col in fk_columns
+                                          if col in nullable or insert_values[col][row_no] is not _MISSING]
+            if row_columns != run_columns and run_rows:
+                yield run_columns, run_rows
+                run_rows = []
+            run_columns = row_columns
+            run_rows.append(row_no)
+        if run_rows:
+            yield run_columns, run_rows
+    
+    def _rowid_alias(self, table_name: str) -> Optional[str]:
+        """The INTEGER PRIMARY KEY column of a SQLite table, which is its rowid"""
+        pk_cols = [col for col in self.get_table_info(table_name) if col['pk']]
+        if len(pk_cols) == 1 and str(pk_cols[0]['type']).upper() == 'INTEGER':
+            return pk_cols[0]['name']
+        return None
+    
+    def _auto_increment_step(self) -> int:
+        def load():
+            self.cursor.execute("SELECT @@auto_increment_increment")
+            return int(self.cursor.fetchone()[0])
+        return self._cached_schema('auto_increment_increment', load)
+    
+    def _try_batch(self, operation):
+        """Run a batch statement atomically; on error undo what it did and return None"""
+        if self.connection_type in ('mysql', 'mariadb'):
+            try:
+                return operation()
+            except Exception as e:
+                logger.debug(f"Batch failed, retrying row by row: {e}")
+                return None
+        
+        if not self.db_connection.in_transaction:
+            self.cursor.execute("BEGIN")
+        self.cursor.execute("SAVEPOINT import_batch")
+        try:
+            result = operation()
+        except Exception as e:
+            logger.debug(f"Batch failed, retrying row by row: {e}")
+            self.cursor.execute("ROLLBACK TO import_batch")
+            self.cursor.execute("RELEASE import_batch")
+            return None
+        self.cursor.execute("RELEASE import_batch")
+        return result
+    
+    def _insert_many(self, table_name: str, insert_columns: List[str], insert_sql: str, batch: List[tuple]) -> List[Any]:
+        """Insert a batch and return the new row IDs (what lastrowid gives for a single insert)"""
+        if self.connection_type in ('mysql', 'mariadb'):
+            # One multi-row INSERT: LAST_INSERT_ID() is the first of a consecutive range
+            columns_str = ", ".join([f'"{c}"' for c in insert_columns])
+            row_sql = "(" + ", ".join(["?" for _ in insert_columns]) + ")"
+            self.cursor.execute(f"INSERT INTO {table_name} ({columns_str}) VALUES {', '.join([row_sql] * len(batch))}",
+                                [value for row in batch for value in row])
+            first_id = self.cursor.lastrowid
+            if not first_id:
+                return [first_id] * len(batch)
+            step = self._auto_increment_step()
+            return [first_id + i * step for i in range(len(batch))]
+        
+        rowid_alias = self._rowid_alias(table_name)
+        if rowid_alias in insert_columns:
+            # Explicit row IDs: usable only if every row supplies one
+            explicit = [row[insert_columns.index(rowid_alias)] for row in batch]
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and float(value).is_integer()
+                       for value in explicit):
+                raise ValueError("rows without an explicit row id")
+            self.cursor.executemany(insert_sql, batch)
+            return [int(value) for value in explicit]
+        
+        self.cursor.executemany(insert_sql, batch)
+        last_id = self.cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first_id = last_id - len(batch) + 1
+        # New rowids are consecutive while we hold the write lock; verify before trusting them
+        count = self.cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE rowid BETWEEN ? AND ?",
+                                    (first_id, last_id)).fetchone()[0]
+        if count != len(batch):
+            raise sqlite3.DatabaseError("inserted rowids are not consecutive")
+        return list(range(first_id, last_id + 1))
+    
+    def _insert_batch(self, table_name: str, insert_columns: List[str], rows: List[tuple],
+                      progress: Optional[Callable[[int], None]] = None) -> tuple:
+        """Insert rows with executemany in batches.
+        
+        A batch that fails is undone and retried row by row, so only the
+        offending rows are lost. progress, if given, is called with the number
+        of rows done after each batch.
+        
+        Returns:
+            Tuple of (row IDs, error messages), aligned with rows
+        """
+        placeholders = ", ".join(["?" for _ in insert_columns])
+        columns_str = ", ".join([f'"{c}"' for c in insert_columns])
+        insert_sql = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})"
+        
+        batch_size = self.IMPORT_BATCH_SIZE
+        if self.connection_type in ('mysql', 'mariadb'):
+            batch_size = max(1, min(batch_size, 65535 // max(1, len(insert_columns))))
+        
+        ids, errors = [], []
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            batch_ids = self._try_batch(lambda: self._insert_many(table_name, insert_columns, insert_sql, batch))
+            if batch_ids is not None:
+                ids.extend(batch_ids)
+                errors.extend([None] * len(batch))
+            else:
+                for values in batch:
+                    try:
+                        self.cursor.execute(insert_sql, values)
+                        ids.append(self.cursor.lastrowid)
+                        errors.append(None)
+                    except Exception as e:
+                        ids.append(None)
+                        errors.append(str(e))
+            if progress:
+                progress(len(ids))
+        return ids, errors
+    
+    def _execute_batch(self, sql: str, rows: List[tuple]) -> List[Optional[str]]:
+        """executemany in batches, retrying a failed batch row by row; returns an error (or None) per row"""
+        errors = []
+        for start in range(0, len(rows), self.IMPORT_BATCH_SIZE):
+            batch = rows[start:start + self.IMPORT_BATCH_SIZE]
+            if self._try_batch(lambda: self.cursor.executemany(sql, batch) or True):
+                errors.extend([None] * len(batch))
+                continue
+            
+            for values in batch:
+                try:
+                    self.cursor.execute(sql, values)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(str(e))
+        return errors
+    
+    def _update_values(self, record: Dict[str, Any], update_columns: List[str], primary_key: str,
+                       resolved: Dict[str, Any], column_map: Dict[str, str]) -> Dict[str, Any]:
+        """Columns to SET for one existing record: resolved FKs plus the row's non-empty cells"""
+        update_columns = list(update_columns)
+        # Add resolved columns to update_columns if missing
+        for fk_col in resolved:
+            if fk_col != primary_key and fk_col not in update_columns:
+                update_columns.append(fk_col)
+        
+        values = {}
+        for col in update_columns:
+            # Priority 1: Resolved FKs (always include if present)
+            if col in resolved:
+                values[col] = resolved[col]
+                continue
+            
+            # Priority 2: Excel data (skip if NULL/empty)
+            excel_value = record.get(column_map.get(col, col))
+            
+            # Skip if NULL/empty/whitespace-only to avoid overwriting existing data
+            if excel_value is None or pd.isna(excel_value) or (isinstance(excel_value, str) and not excel_value.strip()):
+                continue
+            values[col] = excel_value.item() if hasattr(excel_value, 'item') else excel_value
+        return values
+    
+    @staticmethod
+    def _group_update_rows(updates: List[tuple], column_info: Dict[str, Dict]):
+        """Group updates by SET column list for executemany.
+        
+        Rows are cut into segments that never update the same record twice,
+        so applying a segment's groups in any order matches row order.
+        """
+        has_updated_at = 'updated_at' in column_info
+        
+        def flush(segment):
+            groups = {}
+            for update in segment:
+                groups.setdefault(tuple(update[2]), []).append(update)
+            for set_columns, batch in groups.items():
+                yield (set_columns, has_updated_at), batch
+        
+        segment, targets = [], set()
+        for update in updates:
+            if update[1] in targets:
+                yield from flush(segment)
+                segment, targets = [], set()
+            segment.append(update)
+            targets.add(update[1])
+        yield from flush(segment)
+    
+    @staticmethod
+    def _rejected_frame(df: pd.DataFrame, rejected: List[tuple], table_name: str, sheet_name: str) -> pd.DataFrame:
+        """Rejected rows as a DataFrame: sheet, Excel row number, table and reason, then the original cells"""
+        if not rejected:
+            return pd.DataFrame()
+        rejected = sorted(rejected, key=lambda item: item[0])
+        frame = df.iloc[[position for position, _ in rejected]].copy()
+        frame.insert(0, 'import_error', [reason for _, reason in rejected], allow_duplicates=True)
+        frame.insert(0, 'import_table', table_name, allow_duplicates=True)
+        frame.insert(0, 'excel_row', [int(position) + 2 for position, _ in rejected], allow_duplicates=True)  # row 1 is the header
+        frame.insert(0, 'sheet', sheet_name, allow_duplicates=True)
+        return frame.reset_index(drop=True)
+    
     def import_storage_data(self, df: pd.DataFrame, columns: List[str], sample_ids: List[int]):
         """Import storage data using dynamic column mapping"""
         # Create column name to Excel column mapping
@@ -1599,18 +2093,37 @@ class ExcelImportManager:
             # Execute dynamic insert
             self.cursor.execute(insert_sql, values)
     
-    def import_excel_file(self, file_path: str, import_mode: str = 'skip', custom_mappings: Dict = None, excluded_columns: Dict = None) -> Dict[str, Any]:
-        """Main method to import Excel file with multi-sheet data"""
+    def import_excel_file(self, file_path: str, import_mode: str = 'skip', custom_mappings: Dict = None, excluded_columns: Dict = None,
+                          sheet_names: List[str] = None) -> Dict[str, Any]:
+        """Main method to import Excel file with multi-sheet data
+        
+        A CSV file is imported as one sheet named after the file. With
+        sheet_names only those sheets of the workbook are imported.
+        """
+        overall_validation_results = {}
+        overall_modified_tables = {}
         try:
             print(f"[DEBUG] Starting multi-sheet import with mode: {import_mode}")
+            self.refresh_schema_cache()
             
             # Read all sheets from Excel file
-            all_sheets = pd.read_excel(file_path, sheet_name=None)
+            if file_path.lower().endswith('.csv'):
+                all_sheets = {os.path.splitext(os.path.basename(file_path))[0]: pd.read_csv(file_path)}
+            else:
+                all_sheets = pd.read_excel(file_path, sheet_name=list(sheet_names) if sheet_names else None)
             print(f"[DEBUG] Found {len(all_sheets)} sheets: {list(all_sheets.keys())}")
             
+            self._progress = {
+                'status': 'Reading file...',
+                'sheet': None,
+                'processed': 0,
+                'total': sum(len(sheet_df) for sheet_df in all_sheets.values()),
+                'stats': {'new_records': 0, 'existing_records': 0, 'updated_records': 0, 'rejected_records': 0},
+                'span': (0, 0, 0, 1),
+            }
+            rows_done = 0
+            
             # Track overall results
-            overall_validation_results = {}
-            overall_modified_tables = {}
             total_rows_processed = 0
             total_hosts_created = 0
             total_samples_created = 0
@@ -1622,12 +2135,16 @@ class ExcelImportManager:
             
             # Session tracking for FK resolution within this import
             session_ids = {}
+            self.reset_lookup_cache()
+            rejected_frames = []
             
             sheet_results = {}
             
             # Process each sheet
             for sheet_name, df in all_sheets.items():
                 print(f"[DEBUG] ===== STARTING SHEET: {sheet_name} =====")
+                self._progress['sheet'] = sheet_name
+                self._report_progress(f"Reading sheet {sheet_name}", rows_done)
                 print(f"[DEBUG] Accumulated IDs before sheet: hosts={len(all_host_ids)}, samples={len(all_sample_ids)}")
                 
                 # Skip empty sheets
@@ -1741,7 +2258,8 @@ class ExcelImportManager:
                     pass
                 
                 # Now process tables - linking will be handled at the row level
-                for table_name, columns in sorted_tables:
+                for table_index, (table_name, columns) in enumerate(sorted_tables):
+                    self._progress['span'] = (rows_done, len(df), table_index, len(sorted_tables))
                     try:
                         # Row-level linking is now handled within import_generic_table_data
                         # based on shared identifiers in the data
@@ -1775,8 +2293,19 @@ class ExcelImportManager:
                             'total_before': self.get_existing_table_count(table_name) - result['total_processed']
                         }
                         
-                        print(f"[DEBUG] Generic import for '{table_name}': {result}")
+                        if len(result['rejected_rows']):
+                            rejected_frames.append(result['rejected_rows'])
+                        
+                        stats = self._progress['stats']
+                        stats['new_records'] += result['records_created']
+                        stats['updated_records' if import_mode == 'update' else 'existing_records'] += result['records_updated']
+                        stats['rejected_records'] += len(result['rejected_rows'])
+                        
+                        print(f"[DEBUG] Generic import for '{table_name}': "
+                              f"{ {key: value for key, value in result.items() if key != 'rejected_rows'} }")
                         
+                    except ImportCancelled:
+                        raise
                     except Exception as e:
                         print(f"[ERROR] Failed to import table '{table_name}': {e}")
                         modified_tables[table_name] = {
@@ -1786,8 +2315,16 @@ class ExcelImportManager:
                             'total_before': self.get_existing_table_count(table_name)
                         }
                 
+                # Last chance to cancel before this sheet is committed
+                self._report_progress(f"Committing sheet {sheet_name}", rows_done + len(df))
+                
                 # Commit transaction for this sheet
                 self.db_connection.commit()
+                for table_name in set(modified_tables) | self._written_tables:
+                    DatabaseManagerFlask.rows_changed(self.db_connection, table_name)
+                self._written_tables.clear()
+                rows_done += len(df)
+                self._report_progress(f"Imported sheet {sheet_name}", rows_done)
                 
                 # Aggregate results for this sheet
                 sheet_rows_processed = len(df)
@@ -1831,6 +2368,9 @@ class ExcelImportManager:
                         overall_modified_tables[table]['modified'] = overall_modified_tables[table]['modified'] or stats['modified']
                         overall_modified_tables[table]['total_after'] = stats['total_after']
             
+            self.rejected_rows = pd.concat(rejected_frames, ignore_index=True) if rejected_frames else pd.DataFrame()
+            self._progress = None
+            
             return {
                 'success': True,
                 'message': f'Successfully imported {total_rows_processed} rows across {len(sheet_results)} sheets',
@@ -1848,11 +2388,26 @@ class ExcelImportManager:
                 'total_projects_created': total_projects_created,
                 'sheet_results': sheet_results,
                 'overall_validation_results': overall_validation_results,
-                'overall_modified_tables': overall_modified_tables
+                'overall_modified_tables': overall_modified_tables,
+                'rejected_count': len(self.rejected_rows)
             }
             
+        except ImportCancelled:
+            # Sheets committed before the cancel stay imported
+            self.db_connection.rollback()
+            self.reset_lookup_cache()
+            self._progress = None
+            return {
+                'success': False,
+                'cancelled': True,
+                'error': 'Import cancelled',
+                'overall_validation_results': overall_validation_results,
+                'overall_modified_tables': overall_modified_tables
+            }
         except Exception as e:
             self.db_connection.rollback()
+            self.reset_lookup_cache()
+            self._progress = None
             return {
                 'success': False,
                 'error': f'Import failed: {str(e)}',
@@ -1863,6 +2418,7 @@ class ExcelImportManager:
     def preview_excel_file(self, file_path: str) -> Dict[str, Any]:
         """Preview Excel file structure and data for all sheets"""
         try:
+            self.refresh_schema_cache()
             # Read all sheets from Excel file
             all_sheets = pd.read_excel(file_path, sheet_name=None)
             
@@ -1902,162 +2458,299 @@ class ExcelImportManager:
                 'success': False,
                 'error': f'Preview failed: {str(e)}'
             }
-    def _resolve_foreign_keys_dynamic(self, table_name: str, row: pd.Series, available_excel_columns: List[str], session_ids: Dict = None) -> Dict[str, Any]:
-        """Resolve foreign keys for a specific row based on shared identifiers - DYNAMIC"""
-        resolved_fks = {}
+    @staticmethod
+    def _fk_target_pk(target_table: str) -> str:
+        """Primary key column used when resolving a foreign key into target_table"""
+        return {
+            'locations': 'location_id',
+            'taxonomy': 'taxonomy_id',
+            'environmental_samples': 'env_sample_id',
+            'samples': 'sample_id',
+            'hosts': 'host_id',
+            'projects': 'project_id',
+            'departments': 'dept_id',
+            'employees': 'emp_id',
+        }.get(target_table, 'id')
+    
+    @staticmethod
+    def _lookup_keys(value) -> List[str]:
+        """Keys a match value is looked up under: as text, and without a trailing .0 for whole numbers"""
+        keys = [str(value)]
+        if isinstance(value, float) and value.is_integer():
+            keys.append(str(int(value)))
+        return keys
+    
+    def _fk_resolution_plan(self, table_name: str, available_excel_columns: List[str]) -> List[tuple]:
+        """FK columns of a table with their usable (db_match_col, excel_col) pairs, worked out once per sheet"""
+        cache_key = (table_name, tuple(available_excel_columns))
+        if cache_key in self._fk_plans:
+            return self._fk_plans[cache_key]
         
-        # Use dynamic FK discovery - works with ANY database!
+        plan = []
         fk_rules = self.discover_dynamic_fk_rules()
+        for fk_col, rule in fk_rules.get(table_name, {}).items():
+            target_table = rule['target_table']
+            try:
+                target_columns = self.get_table_columns(target_table)
+            except Exception:
+                continue
+            
+            match_cols = []
+            for db_match_col in rule['match_cols']:
+                # Check if this match column exists in the target table schema
+                if db_match_col not in target_columns:
+                    continue
+                # Find the Excel column that maps to this database match column
+                excel_match_col = self.find_excel_column_for_db_column(db_match_col, available_excel_columns)
+                if excel_match_col:
+                    match_cols.append((db_match_col, excel_match_col))
+            
+            if match_cols:
+                plan.append((fk_col, target_table, self._fk_target_pk(target_table), match_cols))
         
-        if table_name in fk_rules:
-            for fk_col, rule in fk_rules[table_name].items():
-                target_table = rule['target_table']
-                match_cols = rule['match_cols']
+        self._fk_plans[cache_key] = plan
+        return plan
+    
+    def _load_fk_lookup(self, target_table: str, db_match_col: str, pk_column: str, values) -> Dict[str, Any]:
+        """Fetch the target IDs for many match values with one IN query per chunk"""
+        lookup = self._fk_lookups.setdefault((target_table, db_match_col), {'ids': {}, 'queried': set()})
+        wanted = [value for value in dict.fromkeys(values) if value not in lookup['queried']]
+        for chunk in self._chunks(wanted):
+            placeholders = ", ".join(["?"] * len(chunk))
+            self.cursor.execute(
+                f"SELECT {db_match_col}, {pk_column} FROM {target_table} WHERE {db_match_col} IN ({placeholders})",
+                chunk
+            )
+            for match_value, target_id in self.cursor.fetchall():
+                for key in self._lookup_keys(match_value):
+                    lookup['ids'].setdefault(self._fold(key), target_id)
+            lookup['queried'].update(chunk)
+        return lookup
+    
+    def _lookup_fk(self, target_table: str, db_match_col: str, pk_column: str, match_value) -> Optional[Any]:
+        """Target ID for a match value, from the preloaded lookup or a single on-demand query"""
+        lookup = self._fk_lookups.get((target_table, db_match_col))
+        if lookup is None or str(match_value) not in lookup['queried']:
+            lookup = self._load_fk_lookup(target_table, db_match_col, pk_column, [str(match_value)])
+        for key in self._lookup_keys(match_value):
+            target_id = lookup['ids'].get(self._fold(key))
+            if target_id is not None:
+                return target_id
+        return None
+    
+    def _forget_fk_lookup(self, target_table: str, db_match_col: str, match_value):
+        """Make the next lookup of a value query again, after a row for it may have been created"""
+        lookup = self._fk_lookups.get((target_table, db_match_col))
+        if lookup:
+            lookup['queried'].discard(str(match_value))
+    
+    def _session_lookup(self, session_ids: Dict, target_table: str) -> Dict[tuple, Any]:
+        """Hash index over session_ids[target_table], extended as records are appended"""
+        records = session_ids.get(target_table) or []
+        index = self._session_index.get(target_table)
+        if index is None or index['records'] is not records:
+            index = {'records': records, 'size': 0, 'ids': {}}
+            self._session_index[target_table] = index
+        for record in records[index['size']:]:
+            for match_col, match_value in record.items():
+                if match_col != 'id':
+                    index['ids'].setdefault((match_col, match_value), record['id'])
+        index['size'] = len(records)
+        return index['ids']
+    
+    def _row_location(self, row: Dict[str, Any], available_excel_columns: List[str]) -> tuple:
+        """(province, district, village, site_name) taken from a row"""
+        location = {}
+        for loc_col in ['province', 'district', 'village', 'site_name']:
+            location[loc_col] = None
+            excel_loc_col = self.find_excel_column_for_db_column(loc_col, available_excel_columns)
+            if excel_loc_col:
+                loc_value = row.get(excel_loc_col)
+                if pd.notna(loc_value) and str(loc_value).strip():
+                    location[loc_col] = str(loc_value)
+        return location['province'], location['district'], location['village'], location['site_name']
+    
+    def _row_scientific_name(self, row: Dict[str, Any], available_excel_columns: List[str], db_match_col: str, match_value) -> Optional[str]:
+        sci_name = str(match_value) if db_match_col == 'scientific_name' else None
+        if not sci_name:
+            excel_sci_col = self.find_excel_column_for_db_column('scientific_name', available_excel_columns)
+            if excel_sci_col:
+                sci_value = row.get(excel_sci_col)
+                if pd.notna(sci_value) and str(sci_value).strip():
+                    sci_name = str(sci_value)
+        return sci_name
+    
+    def prepare_fk_resolution(self, table_name: str, rows: List[Dict[str, Any]], available_excel_columns: List[str], session_ids: Dict = None):
+        """Resolve the foreign keys of a whole sheet up front.
+        
+        Collects the distinct match values of every FK column across the rows
+        and fetches their target IDs with one IN query per chunk, then walks
+        the rows once without writing to find the locations and taxa that
+        would be auto-created and inserts those in bulk. Afterwards
+        _resolve_foreign_keys_dynamic answers each row from memory.
+        """
+        plan = self._fk_resolution_plan(table_name, available_excel_columns)
+        if not plan or not rows:
+            return
+        
+        for fk_col, target_table, pk_column, match_cols in plan:
+            for db_match_col, excel_match_col in match_cols:
+                values = set()
+                for row in rows:
+                    match_value = row.get(excel_match_col)
+                    if pd.notna(match_value) and str(match_value).strip():
+                        values.add(str(match_value))
+                try:
+                    self._load_fk_lookup(target_table, db_match_col, pk_column, values)
+                except Exception as e:
+                    logger.warning(f"FK preload failed for {target_table}.{db_match_col}: {e}")
+        
+        # Match the sheet's locations and taxa against existing records, so the
+        # walk below can tell which ones really have to be created
+        targets = {target_table for _, target_table, _, _ in plan}
+        if 'locations' in targets:
+            keys = {self._location_key(*self._row_location(row, available_excel_columns)) for row in rows}
+            self._match_existing_locations([key for key in keys if key not in self._location_ids])
+        if 'taxonomy' in targets:
+            excel_sci_col = self.find_excel_column_for_db_column('scientific_name', available_excel_columns)
+            if excel_sci_col:
+                names = {str(row.get(excel_sci_col)) for row in rows
+                         if pd.notna(row.get(excel_sci_col)) and str(row.get(excel_sci_col)).strip()}
+                self._match_existing_names('taxonomy', 'taxonomy_id', 'scientific_name',
+                                           [name for name in names if name not in self._taxonomy_ids], self._taxonomy_ids)
+        
+        planned = {'locations': {}, 'taxonomy': {}, 'lookups': set()}
+        for row in rows:
+            self._resolve_foreign_keys_dynamic(table_name, row, available_excel_columns, session_ids, planned=planned)
+        
+        if planned['locations']:
+            self.get_or_create_locations(planned['locations'])
+        if planned['taxonomy']:
+            self.get_or_create_taxa(planned['taxonomy'])
+        
+        # Pick up the records created above so later rows resolve to them
+        for target_table, db_match_col, match_value in planned['lookups']:
+            self._forget_fk_lookup(target_table, db_match_col, match_value)
+        reload = {}
+        for target_table, db_match_col, match_value in planned['lookups']:
+            reload.setdefault((target_table, db_match_col), set()).add(str(match_value))
+        for (target_table, db_match_col), values in reload.items():
+            try:
+                self._load_fk_lookup(target_table, db_match_col, self._fk_target_pk(target_table), values)
+            except Exception as e:
+                logger.warning(f"FK preload failed for {target_table}.{db_match_col}: {e}")
+        
+        print(f"[DEBUG] Prepared FK resolution for {table_name}: {len(rows)} rows, "
+              f"{len(planned['locations'])} locations and {len(planned['taxonomy'])} taxa to auto-create")
+    
+    def _resolve_foreign_keys_dynamic(self, table_name: str, row: Dict[str, Any], available_excel_columns: List[str], session_ids: Dict = None,
+                                      planned: Dict = None) -> Dict[str, Any]:
+        """Resolve foreign keys for a specific row based on shared identifiers - DYNAMIC
+        
+        Lookups come from the maps filled by prepare_fk_resolution; values it
+        has not seen are queried on demand. With ``planned`` the row is only
+        walked to record the locations and taxa it would auto-create.
+        """
+        resolved_fks = {}
+        
+        # Use dynamic FK discovery - works with ANY database!
+        for fk_col, target_table, pk_column, match_cols in self._fk_resolution_plan(table_name, available_excel_columns):
+            # Try each possible match column in order of preference
+            for db_match_col, excel_match_col in match_cols:
+                match_value = row.get(excel_match_col)
+                if not (pd.notna(match_value) and str(match_value).strip()):
+                    continue
                 
-                # Try each possible match column in order of preference
-                for db_match_col in match_cols:
-                    # Check if this match column exists in the target table schema
-                    try:
-                        self.cursor.execute(f"PRAGMA table_info({target_table})")
-                        target_schema = [c[1] for c in self.cursor.fetchall()]
-                        if db_match_col not in target_schema:
-                            continue
-                    except:
-                        continue
-
-                    # Find the Excel column that maps to this database match column
-                    excel_match_col = self.find_excel_column_for_db_column(db_match_col, available_excel_columns)
-                    if excel_match_col:
-                        match_value = row.get(excel_match_col)
-                        if pd.notna(match_value) and str(match_value).strip():
-                            # First check session IDs (records created in this import session)
-                            if session_ids and target_table in session_ids:
-                                for session_record in session_ids[target_table]:
-                                    if session_record.get(db_match_col) == str(match_value):
-                                        resolved_fks[fk_col] = session_record['id']
-                                        print(f"[DEBUG] Resolved {fk_col}={session_record['id']} for {table_name} using SESSION {db_match_col}={match_value}")
-                                        break
-                                if fk_col in resolved_fks:
-                                    break
-                            
-                            # If not found in session, check existing database records
-                            # Use correct primary key column name for each table
-                            pk_column = 'id'
-                            if target_table == 'locations':
-                                pk_column = 'location_id'
-                            elif target_table == 'taxonomy':
-                                pk_column = 'taxonomy_id'
-                            elif target_table == 'environmental_samples':
-                                pk_column = 'env_sample_id'
-                            elif target_table == 'samples':
-                                pk_column = 'sample_id'
-                            elif target_table == 'hosts':
-                                pk_column = 'host_id'
-                            elif target_table == 'projects':
-                                pk_column = 'project_id'
-                            elif target_table == 'departments':
-                                pk_column = 'dept_id'
-                            elif target_table == 'employees':
-                                pk_column = 'emp_id'
+                # First check session IDs (records created in this import session)
+                if session_ids and target_table in session_ids:
+                    session_id = self._session_lookup(session_ids, target_table).get((db_match_col, str(match_value)))
+                    if session_id is not None:
+                        resolved_fks[fk_col] = session_id
+                        if planned is None:
+                            print(f"[DEBUG] Resolved {fk_col}={session_id} for {table_name} using SESSION {db_match_col}={match_value}")
+                        break
+                
+                # If not found in session, check existing database records
+                try:
+                    target_id = self._lookup_fk(target_table, db_match_col, pk_column, match_value)
+                    if target_id is not None:
+                        resolved_fks[fk_col] = target_id
+                        if planned is None:
+                            print(f"[DEBUG] Resolved {fk_col}={target_id} for {table_name} using DB {db_match_col}={match_value}")
+                        break # Success, move to next FK
+                    
+                    if planned is not None and (target_table, db_match_col, str(match_value)) in planned['lookups']:
+                        break # An earlier row already creates this record
+                    
+                    # Auto-create missing records for supported target tables
+                    if target_table == 'locations' and db_match_col in ['province', 'district', 'village', 'site_name']:
+                        province, district, village, site_name = self._row_location(row, available_excel_columns)
+                        if planned is not None:
+                            key = self._location_key(province, district, village, site_name)
+                            if (key not in self._location_ids and
+                                    not any(self._location_matches(created, key) for created in planned['locations'])):
+                                # Later rows will find the new location by any of its columns
+                                planned['locations'][key] = None
+                                planned['lookups'].add((target_table, 'country', 'Laos'))
+                                for loc_col, loc_value in zip(['province', 'district', 'village', 'site_name'], key):
+                                    if loc_value is not None:
+                                        planned['lookups'].add((target_table, loc_col, str(loc_value)))
+                            break
+                        
+                        # Create location record
+                        location_id = self.get_or_create_location(province, district, village, site_name)
+                        self._forget_fk_lookup(target_table, db_match_col, match_value)
+                        if location_id:
+                            resolved_fks[fk_col] = location_id
+                            print(f"[DEBUG] Created and resolved {fk_col}={location_id} for {table_name} using new location {province}/{district}/{village}/{site_name}")
+                            break
+                    
+                    elif target_table == 'taxonomy' and db_match_col in ['scientific_name', 'species']:
+                        sci_name = self._row_scientific_name(row, available_excel_columns, db_match_col, match_value)
+                        if sci_name:
+                            if planned is not None:
+                                if sci_name not in self._taxonomy_ids and sci_name not in planned['taxonomy']:
+                                    planned['taxonomy'][sci_name] = None
+                                    planned['lookups'].add((target_table, 'scientific_name', sci_name))
+                                    planned['lookups'].add((target_table, 'species', self._species_from_name(sci_name)))
+                                break
                             
-                            query = f"SELECT {pk_column} FROM {target_table} WHERE {db_match_col} = ?"
-                            try:
-                                self.cursor.execute(query, (str(match_value),))
-                                res = self.cursor.fetchone()
-                                if res:
-                                    resolved_fks[fk_col] = res[0]
-                                    print(f"[DEBUG] Resolved {fk_col}={res[0]} for {table_name} using DB {db_match_col}={match_value}")
-                                    break # Success, move to next FK
-                                else:
-                                    # Auto-create missing records for supported target tables
-                                    if target_table == 'locations' and db_match_col in ['province', 'district', 'village', 'site_name']:
-                                        # Extract location data from row
-                                        province = None
-                                        district = None  
-                                        village = None
-                                        site_name = None
-                                        
-                                        for loc_col in ['province', 'district', 'village', 'site_name']:
-                                            excel_loc_col = self.find_excel_column_for_db_column(loc_col, available_excel_columns)
-                                            if excel_loc_col:
-                                                loc_value = row.get(excel_loc_col)
-                                                if pd.notna(loc_value) and str(loc_value).strip():
-                                                    if loc_col == 'province':
-                                                        province = str(loc_value)
-                                                    elif loc_col == 'district':
-                                                        district = str(loc_value)
-                                                    elif loc_col == 'village':
-                                                        village = str(loc_value)
-                                                    elif loc_col == 'site_name':
-                                                        site_name = str(loc_value)
-                                        
-                                        # Create location record
-                                        location_id = self.get_or_create_location(province, district, village, site_name)
-                                        if location_id:
-                                            resolved_fks[fk_col] = location_id
-                                            print(f"[DEBUG] Created and resolved {fk_col}={location_id} for {table_name} using new location {province}/{district}/{village}/{site_name}")
-                                            break
-                                    
-                                    elif target_table == 'taxonomy' and db_match_col in ['scientific_name', 'species']:
-                                        # Extract taxonomy data from row
-                                        sci_name = str(match_value) if db_match_col == 'scientific_name' else None
-                                        if not sci_name:
-                                            excel_sci_col = self.find_excel_column_for_db_column('scientific_name', available_excel_columns)
-                                            if excel_sci_col:
-                                                sci_value = row.get(excel_sci_col)
-                                                if pd.notna(sci_value) and str(sci_value).strip():
-                                                    sci_name = str(sci_value)
-                                        
-                                        if sci_name:
-                                            # Create taxonomy record
-                                            taxonomy_id = self.get_or_create_taxonomy(sci_name)
-                                            if taxonomy_id:
-                                                resolved_fks[fk_col] = taxonomy_id
-                                                print(f"[DEBUG] Created and resolved {fk_col}={taxonomy_id} for {table_name} using new taxonomy {sci_name}")
-                                            break
-                                    
-                                    elif target_table == 'environmental_samples' and db_match_col in ['source_id', 'pool_id']:
-                                        # Extract environmental sample data from row
-                                        env_source_id = str(match_value) if db_match_col == 'source_id' else None
-                                        env_pool_id = None
-                                        
-                                        # Try to get pool_id from row
-                                        if not env_pool_id:
-                                            excel_pool_col = self.find_excel_column_for_db_column('pool_id', available_excel_columns)
-                                            if excel_pool_col:
-                                                pool_value = row.get(excel_pool_col)
-                                                if pd.notna(pool_value) and str(pool_value).strip():
-                                                    env_pool_id = str(pool_value)
-                                        
-                                        # Get location data for environmental sample
-                                        province = None
-                                        district = None
-                                        village = None
-                                        site_name = None
-                                        
-                                        for loc_col in ['province', 'district', 'village', 'site_name']:
-                                            excel_loc_col = self.find_excel_column_for_db_column(loc_col, available_excel_columns)
-                                            if excel_loc_col:
-                                                loc_value = row.get(excel_loc_col)
-                                                if pd.notna(loc_value) and str(loc_value).strip():
-                                                    if loc_col == 'province':
-                                                        province = str(loc_value)
-                                                    elif loc_col == 'district':
-                                                        district = str(loc_value)
-                                                    elif loc_col == 'village':
-                                                        village = str(loc_value)
-                                                    elif loc_col == 'site_name':
-                                                        site_name = str(loc_value)
-                                        
-                                        if env_source_id or env_pool_id:
-                                            # Create environmental sample record
-                                            env_sample_id = self.get_or_create_environmental_sample(env_source_id, env_pool_id, province, district, village, site_name)
-                                            if env_sample_id:
-                                                resolved_fks[fk_col] = env_sample_id
-                                                print(f"[DEBUG] Created and resolved {fk_col}={env_sample_id} for {table_name} using new environmental sample {env_source_id}/{env_pool_id}")
-                                                break
-                                    
-                            except Exception as e:
-                                print(f"[DEBUG] FK resolution failed for {table_name}.{fk_col} using {db_match_col}: {e}")
-        
-        return resolved_fks
\ No newline at end of file
+                            # Create taxonomy record
+                            taxonomy_id = self.get_or_create_taxonomy(sci_name)
+                            self._forget_fk_lookup(target_table, db_match_col, match_value)
+                            if taxonomy_id:
+                                resolved_fks[fk_col] = taxonomy_id
+                                print(f"[DEBUG] Created and resolved {fk_col}={taxonomy_id} for {table_name} using new taxonomy {sci_name}")
+                            break
+                    
+                    elif target_table == 'environmental_samples' and db_match_col in ['source_id', 'pool_id']:
+                        if planned is not None:
+                            break
+                        
+                        # Extract environmental sample data from row
+                        env_source_id = str(match_value) if db_match_col == 'source_id' else None
+                        env_pool_id = None
+                        
+                        # Try to get pool_id from row
+                        excel_pool_col = self.find_excel_column_for_db_column('pool_id', available_excel_columns)
+                        if excel_pool_col:
+                            pool_value = row.get(excel_pool_col)
+                            if pd.notna(pool_value) and str(pool_value).strip():
+                                env_pool_id = str(pool_value)
+                        
+                        # Get location data for environmental sample
+                        province, district, village, site_name = self._row_location(row, available_excel_columns)
+                        
+                        if env_source_id or env_pool_id:
+                            # Create environmental sample record
+                            env_sample_id = self.get_or_create_environmental_sample(env_source_id, env_pool_id, province, district, village, site_name)
+                            self._forget_fk_lookup(target_table, db_match_col, match_value)
+                            if env_sample_id:
+                                resolved_fks[fk_col] = env_sample_id
+                                print(f"[DEBUG] Created and resolved {fk_col}={env_sample_id} for {table_name} using new environmental sample {env_source_id}/{env_pool_id}")
+                                break
+                    
+                except Exception as e:
+                    print(f"[DEBUG] FK resolution failed for {table_name}.{fk_col} using {db_match_col}: {e}")
+        
+        return resolved_fks
@@ -0,0 +1,364 @@
+"""
+Streaming export of query results
+
+Rows are read from an open cursor in batches and written straight to the
+response as CSV, NDJSON, JSON, FASTA, XLSX, Parquet or Arrow, so exporting a
+whole table (e.g. sequences with full sequence text) never holds the result in
+memory. CSV, NDJSON, JSON and FASTA can be gzip-compressed on the fly.
+"""
+import csv
+import io
+import json
+import math
+import numbers
+import re
+import zipfile
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from database.result_cache import normalize_value
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# format -> (file extension, mimetype, can be gzipped)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv', True),
+    'ndjson': ('ndjson', 'application/x-ndjson', True),
+    'json': ('json', 'application/json', True),
+    'fasta': ('fasta', 'text/x-fasta', True),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', False),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', False),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.stream', False),
+}
+
+FETCH_BATCH = 5000
+# Bytes gathered before a chunk is handed to the response
+WRITE_CHUNK = 256 * 1024
+
+
+def iter_batches(cursor, batch_size: int = FETCH_BATCH) -> Iterator[List[tuple]]:
+    """Yield lists of rows from an executed cursor until it is exhausted"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def fasta_columns(columns: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(header column, sequence column) picked by name the way the FASTA export always has"""
+    seq_cols = [c for c in columns if any(x in c.lower() for x in ['sequence', 'seq', 'dna', 'rna', 'protein'])]
+    if not seq_cols:
+        return None, None
+    header_cols = [c for c in columns if any(x in c.lower() for x in ['id', 'sample', 'name', 'header'])]
+    return (header_cols[0] if header_cols else columns[0]), seq_cols[0]
+
+
+def _buffered(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Encode text pieces and regroup them into chunks of about WRITE_CHUNK bytes"""
+    pending, size = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= WRITE_CHUNK:
+            yield b''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """gzip-compress a byte stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _csv_text(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([['' if val is None else normalize_value(val) for val in row] for row in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_text(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, map(normalize_value, row)))) + '\n' for row in rows)
+
+
+def _json_text(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+    """A JSON array of row objects, like DataFrame.to_json(orient='records')"""
+    yield '['
+    separator = ''
+    for rows in batches:
+        yield separator + ','.join(json.dumps(dict(zip(columns, map(normalize_value, row)))) for row in rows)
+        separator = ','
+    yield ']\n'
+
+
+def _fasta_text(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+    header_col, seq_col = fasta_columns(columns)
+    header_index, seq_index = columns.index(header_col), columns.index(seq_col)
+    for rows in batches:
+        records = []
+        for row in rows:
+            # Filter out any newline characters within sequence
+            sequence = str(row[seq_index]).strip().replace('\n', '').replace('\r', '')
+            if sequence and sequence.lower() != 'none':
+                records.append(f">{row[header_index]}\n{sequence}\n")
+        yield ''.join(records)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained as they are written"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Parts of a one-sheet workbook besides the sheet itself
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow (openpyxl refuses them as well)
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_column(index: int) -> str:
+    """Spreadsheet column letters of a 0-based column index (0 -> A, 26 -> AA)"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number: int, letters: List[str], values) -> str:
+    cells = []
+    for letter, val in zip(letters, values):
+        ref = f'{letter}{number}'
+        if val is None:
+            continue
+        if isinstance(val, bool):
+            cells.append(f'<c r="{ref}" t="b"><v>{int(val)}</v></c>')
+        elif isinstance(val, numbers.Integral):
+            cells.append(f'<c r="{ref}"><v>{int(val)}</v></c>')
+        elif isinstance(val, numbers.Real):
+            # NaN and infinities have no cell value; they are left empty
+            if math.isfinite(val):
+                cells.append(f'<c r="{ref}"><v>{float(val)!r}</v></c>')
+        else:
+            text = _XML_ILLEGAL.sub('', str(normalize_value(val)))
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+def _xlsx_bytes(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """
+    A one-sheet XLSX streamed as it is written.
+
+    The zip is written to an unseekable sink, so each entry carries its sizes
+    in a trailing data descriptor and the sheet XML is compressed and drained
+    after every batch; only the central directory comes at the end.
+    """
+    letters = [_xlsx_column(index) for index in range(len(columns))]
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _XLSX_PARTS.items():
+            archive.writestr(name, xml)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((_XLSX_SHEET_HEAD + _xlsx_row(1, letters, columns)).encode('utf-8'))
+            yield sink.drain()
+            number = 1
+            for rows in batches:
+                xml = []
+                for row in rows:
+                    number += 1
+                    xml.append(_xlsx_row(number, letters, row))
+                sheet.write(''.join(xml).encode('utf-8'))
+                data = sink.drain()
+                if data:
+                    yield data
+            sheet.write(_XLSX_SHEET_TAIL.encode('utf-8'))
+    yield sink.drain()
+
+
+def _arrow_schema(columns: List[str], rows: List[tuple]):
+    """Schema inferred from the first batch; all-NULL and mixed-type columns become strings"""
+    fields = []
+    for index, name in enumerate(columns):
+        values = [row[index] for row in rows]
+        try:
+            arrow_type = pa.array(values).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrow_type = pa.string()
+        if pa.types.is_null(arrow_type):
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def _arrow_batch(schema, rows: List[tuple]):
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        try:
+            arrays.append(pa.array(values, type=field.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            if not pa.types.is_string(field.type):
+                raise
+            arrays.append(pa.array([None if val is None else str(normalize_value(val)) for val in values], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _arrow_bytes(columns: List[str], batches: Iterable[List[tuple]], file_format: str) -> Iterator[bytes]:
+    """Parquet (one row group per batch) or an Arrow IPC stream, drained after every batch"""
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for rows in batches:
+            if writer is None:
+                schema = _arrow_schema(columns, rows)
+                writer = pq.ParquetWriter(sink, schema) if file_format == 'parquet' else pa.ipc.new_stream(sink, schema)
+            batch = _arrow_batch(schema, rows)
+            if file_format == 'parquet':
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            data = sink.drain()
+            if data:
+                yield data
+        if writer is None:
+            schema = pa.schema([pa.field(name, pa.string()) for name in columns])
+            writer = pq.ParquetWriter(sink, schema) if file_format == 'parquet' else pa.ipc.new_stream(sink, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+def stream_export(columns: List[str], batches: Iterable[List[tuple]], file_format: str,
+                  compress: bool = False) -> Iterator[bytes]:
+    """
+    Serialize batches of rows in the given export format.
+
+    Args:
+        columns: Column names, in row order
+        batches: Iterable of row lists, e.g. iter_batches(cursor)
+        file_format: A key of EXPORT_FORMATS
+        compress: gzip the output (CSV, NDJSON, JSON and FASTA only)
+
+    Returns:
+        Generator of byte chunks
+    """
+    if file_format == 'csv':
+        body = _buffered(_csv_text(columns, batches))
+    elif file_format == 'ndjson':
+        body = _buffered(_ndjson_text(columns, batches))
+    elif file_format == 'json':
+        body = _buffered(_json_text(columns, batches))
+    elif file_format == 'fasta':
+        body = _buffered(_fasta_text(columns, batches))
+    elif file_format == 'xlsx':
+        body = _xlsx_bytes(columns, batches)
+    elif file_format in ('parquet', 'arrow'):
+        if not PYARROW_AVAILABLE:
+            raise ValueError(f"{file_format} export requires pyarrow")
+        body = _arrow_bytes(columns, batches, file_format)
+    else:
+        raise ValueError(f"Unsupported export format: {file_format}")
+
+    if compress and EXPORT_FORMATS[file_format][2]:
+        return gzip_stream(body)
+    return body
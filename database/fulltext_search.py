@@ -0,0 +1,401 @@
+"""
+Full-text search across tables
+
+Keyword questions in the chat used to run LIKE '%kw%' over guessed columns of
+every table, unranked. Here the text columns are indexed once and searched
+with relevance ranking:
+
+- SQLite: an FTS5 index (trigram tokenizer, so substrings still match like
+  LIKE did) in a sidecar file next to the identifier index, kept current by
+  the same write-path hooks, ranked with BM25.
+- MariaDB/MySQL: a FULLTEXT index on each table's text columns, maintained
+  by InnoDB itself, ranked with MATCH ... AGAINST. Adding one rebuilds and
+  locks the user's table, so they are only created by an explicit rebuild
+  (POST /admin/identifier-index/rebuild); until then the chat keeps using
+  LIKE on those tables.
+
+Both return the best matching rows per table. Scores are only comparable
+within a table (BM25 and MATCH ... AGAINST weigh terms by the table's own
+statistics), so tables are not ordered by them. Keywords an index cannot
+match (too short for its tokens) are reported by dropped_keywords(), so the
+caller can still LIKE-search for them.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from database.identifier_index import (INDEX_BATCH, SidecarIndex, SidecarIndexRegistry, normalize, pk_key)
+from database.schema_graph import SYSTEM_TABLES, SchemaGraph
+
+# Column name fragments of searchable text columns; the same ones the LIKE
+# search has always used, plus free-text notes
+FULLTEXT_HINTS = ('name', 'code', 'id', 'type', 'status', 'result', 'location', 'date', 'sample', 'host',
+                  'virus', 'test', 'screen', 'note', 'remark', 'comment', 'description')
+
+MYSQL_TEXT_TYPES = {'char', 'varchar', 'tinytext', 'text', 'mediumtext', 'longtext'}
+
+
+def fulltext_columns(columns: List[str]) -> List[str]:
+    """Columns of a table that are searched (the first 3 if none looks like text)"""
+    matched = [col for col in columns if any(hint in col.lower() for hint in FULLTEXT_HINTS)]
+    return matched or columns[:3]
+
+
+class SQLiteFullText(SidecarIndex):
+    """FTS5 index of the text columns of a SQLite database, one FTS table per source table"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS doc_rows (
+            id INTEGER PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            pk TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS doc_rows_row ON doc_rows (table_name, pk);
+        CREATE TABLE IF NOT EXISTS fts_tables (
+            table_name TEXT PRIMARY KEY,
+            fts_name TEXT NOT NULL
+        );
+    '''
+
+    def __init__(self, path: str, db_type: str):
+        super().__init__(path, db_type)
+        # trigram (SQLite 3.34+) matches substrings; older builds fall back to prefix matching
+        self.tokenizer = 'trigram'
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE temp.tokenizer_probe USING fts5(body, tokenize='trigram')")
+            self._conn.execute("DROP TABLE temp.tokenizer_probe")
+        except sqlite3.OperationalError:
+            self.tokenizer = 'unicode61'
+
+    def indexed_columns(self, columns: List[str]) -> List[str]:
+        return fulltext_columns(columns)
+
+    def _fts_table(self, table: str, create: bool = False) -> Optional[str]:
+        """Name of the FTS table holding a source table's rows"""
+        row = self._conn.execute("SELECT fts_name FROM fts_tables WHERE table_name = ?", (table,)).fetchone()
+        if row is not None or not create:
+            return row[0] if row else None
+        fts_name = 'fts_' + hashlib.sha1(table.encode('utf-8')).hexdigest()[:16]
+        self._conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5(body, tokenize='{self.tokenizer}')")
+        self._conn.execute("INSERT INTO fts_tables (table_name, fts_name) VALUES (?, ?)", (table, fts_name))
+        return fts_name
+
+    def _add_rows(self, table: str, columns: List[str], rows: List[tuple]) -> int:
+        fts_name = self._fts_table(table, create=True)
+        next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM doc_rows").fetchone()[0] + 1
+        doc_rows, docs = [], []
+        for row in rows:
+            pk = pk_key(row[0])
+            body = '\n'.join(text for text in map(normalize, row[1:]) if text is not None)
+            if pk is None or not body:
+                continue
+            doc_rows.append((next_id, table, pk))
+            docs.append((next_id, body))
+            next_id += 1
+        self._conn.executemany("INSERT INTO doc_rows (id, table_name, pk) VALUES (?, ?, ?)", doc_rows)
+        self._conn.executemany(f"INSERT INTO {fts_name} (rowid, body) VALUES (?, ?)", docs)
+        return len(docs)
+
+    def _remove_rows(self, table: str, keys: List[str]):
+        fts_name = self._fts_table(table)
+        if fts_name is None:
+            return
+        for start in range(0, len(keys), INDEX_BATCH):
+            chunk = keys[start:start + INDEX_BATCH]
+            ids = [(row[0],) for row in self._conn.execute(
+                f"SELECT id FROM doc_rows WHERE table_name = ? AND pk IN ({', '.join(['?'] * len(chunk))})",
+                [table] + chunk
+            )]
+            self._conn.executemany(f"DELETE FROM {fts_name} WHERE rowid = ?", ids)
+            self._conn.executemany("DELETE FROM doc_rows WHERE id = ?", ids)
+
+    def _clear(self, table: Optional[str] = None):
+        if table is None:
+            fts_names = [row[0] for row in self._conn.execute("SELECT fts_name FROM fts_tables")]
+            self._conn.execute("DELETE FROM doc_rows")
+            self._conn.execute("DELETE FROM fts_tables")
+        else:
+            fts_name = self._fts_table(table)
+            fts_names = [fts_name] if fts_name else []
+            self._conn.execute("DELETE FROM doc_rows WHERE table_name = ?", (table,))
+            self._conn.execute("DELETE FROM fts_tables WHERE table_name = ?", (table,))
+        for fts_name in fts_names:
+            self._conn.execute(f"DROP TABLE IF EXISTS {fts_name}")
+
+    def _matchable(self, keyword: Optional[str]) -> bool:
+        # A trigram index has no token shorter than 3 characters
+        return keyword is not None and not (self.tokenizer == 'trigram' and len(keyword) < 3)
+
+    def dropped_keywords(self, keywords: Iterable[str]) -> List[str]:
+        """Keywords match_expression leaves out, which the index cannot find"""
+        return [keyword for keyword in keywords
+                if normalize(keyword) is not None and not self._matchable(normalize(keyword))]
+
+    def match_expression(self, keywords: Iterable[str]) -> Optional[str]:
+        """FTS5 query matching any of the keywords"""
+        terms = []
+        for keyword in keywords:
+            keyword = normalize(keyword)
+            if not self._matchable(keyword):
+                continue
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            terms.append(phrase if self.tokenizer == 'trigram' else phrase + '*')
+        return ' OR '.join(terms) or None
+
+    def covered_tables(self, graph: SchemaGraph) -> set:
+        """Tables a search answers for (the rest still need a scan)"""
+        return set(self.indexable_tables(graph))
+
+    def search(self, cursor, graph: SchemaGraph, keywords: Iterable[str], per_table: int = 10) -> List[Dict[str, Any]]:
+        """
+        Rows matching any keyword, best first.
+
+        Returns:
+            [{'table', 'columns', 'rows', 'scores', 'match_type': 'fulltext'}],
+            rows best first (higher is better; scores only compare within a table)
+        """
+        expression = self.match_expression(keywords)
+        if expression is None:
+            return []
+        with self._lock:
+            fts_tables = self._conn.execute("SELECT table_name, fts_name FROM fts_tables").fetchall()
+
+        results = []
+        for table, fts_name in fts_tables:
+            if table not in graph.columns:
+                continue
+            with self._lock:
+                ranked = self._conn.execute(
+                    f"SELECT r.pk, -bm25({fts_name}) FROM {fts_name} JOIN doc_rows r ON r.id = {fts_name}.rowid "
+                    f"WHERE {fts_name} MATCH ? ORDER BY rank LIMIT ?",
+                    (expression, per_table)
+                ).fetchall()
+            if not ranked:
+                continue
+            pk_sql = self._pk_sql(self._pk_column(graph, table))
+            pks = [pk for pk, _ in ranked]
+            cursor.execute(
+                f"SELECT {pk_sql}, * FROM {self._quote(table)} WHERE {pk_sql} IN ({', '.join(['?'] * len(pks))})", pks
+            )
+            by_pk = {pk_key(row[0]): tuple(row[1:]) for row in cursor.fetchall()}
+            rows = [(by_pk[pk], score) for pk, score in ranked if pk in by_pk]
+            if rows:
+                results.append({
+                    'table': table,
+                    'columns': graph.columns[table],
+                    'rows': [row for row, _ in rows],
+                    'scores': [round(score, 6) for _, score in rows],
+                    'match_type': 'fulltext',
+                })
+        return results
+
+    def check(self, cursor, graph: SchemaGraph) -> Dict[str, Any]:
+        """Indexed vs. actual searchable rows per table"""
+        report = {'consistent': True, 'tables': {}}
+        for table in self.indexable_tables(graph):
+            columns = self.indexed_columns(graph.columns.get(table, []))
+            self._select_rows(cursor, graph, table, columns)
+            expected = set()
+            while True:
+                rows = cursor.fetchmany(INDEX_BATCH)
+                if not rows:
+                    break
+                expected.update(pk_key(row[0]) for row in rows
+                                if any(normalize(value) is not None for value in row[1:]))
+            with self._lock:
+                actual = {row[0] for row in self._conn.execute(
+                    "SELECT pk FROM doc_rows WHERE table_name = ?", (table,)
+                )}
+            missing, extra = len(expected - actual), len(actual - expected)
+            report['tables'][table] = {'missing': missing, 'extra': extra}
+            if missing or extra:
+                report['consistent'] = False
+        return report
+
+
+class MariaDBFullText:
+    """
+    FULLTEXT indexes on the text columns of a MariaDB/MySQL database.
+
+    InnoDB keeps the index current on every write, so the write-path hooks
+    (mark_stale, remove_rows) have nothing to do here.
+    """
+
+    INDEX_NAME = 'haoxai_fulltext'
+
+    def __init__(self, path: str = None, db_type: str = 'mysql'):
+        self.db_type = db_type
+        # table -> columns of its FULLTEXT index; None once known to have none
+        self._columns: Dict[str, Optional[List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _text_columns(self, cursor) -> Dict[str, List[str]]:
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """)
+        text_columns: Dict[str, List[str]] = {}
+        for table, column, data_type in cursor.fetchall():
+            if str(data_type).lower() in MYSQL_TEXT_TYPES:
+                text_columns.setdefault(table, []).append(column)
+        return text_columns
+
+    def _existing_indexes(self, cursor) -> Dict[str, List[str]]:
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND INDEX_NAME = %s
+            ORDER BY TABLE_NAME, SEQ_IN_INDEX
+        """, (self.INDEX_NAME,))
+        existing: Dict[str, List[str]] = {}
+        for table, column in cursor.fetchall():
+            existing.setdefault(table, []).append(column)
+        return existing
+
+    def _wanted(self, graph: SchemaGraph, tables: Optional[Iterable[str]]) -> List[str]:
+        return [table for table in (graph.tables if tables is None else tables)
+                if table in graph.columns and table.lower() not in SYSTEM_TABLES]
+
+    def ensure_current(self, cursor, graph: SchemaGraph, tables: Iterable[str] = None):
+        """
+        Look up which tables already have a FULLTEXT index. Indexes are never
+        created here (this runs inside read requests); see create_indexes().
+        """
+        with self._lock:
+            wanted = [table for table in self._wanted(graph, tables) if table not in self._columns]
+        if not wanted:
+            return
+        existing = self._existing_indexes(cursor)
+        with self._lock:
+            for table in wanted:
+                self._columns[table] = existing.get(table)
+
+    def create_indexes(self, cursor, graph: SchemaGraph, tables: Iterable[str] = None) -> List[str]:
+        """
+        Add the FULLTEXT index to tables that have searchable text columns but
+        no index. This is DDL on the user's tables (InnoDB rebuilds the table),
+        so it is only run by an explicit admin rebuild.
+
+        Returns:
+            Tables an index was created on
+        """
+        existing = self._existing_indexes(cursor)
+        text_columns = self._text_columns(cursor)
+        created = []
+        for table in self._wanted(graph, tables):
+            columns = existing.get(table)
+            if columns is None:
+                candidates = set(text_columns.get(table, []))
+                columns = [col for col in fulltext_columns(graph.columns[table]) if col in candidates] or None
+                if columns:
+                    try:
+                        cursor.execute(
+                            f"ALTER TABLE `{table}` ADD FULLTEXT INDEX `{self.INDEX_NAME}` "
+                            f"({', '.join(f'`{col}`' for col in columns)})"
+                        )
+                        created.append(table)
+                    except Exception as e:
+                        print(f"[WARNING] Could not create FULLTEXT index on {table}: {e}")
+                        columns = None
+            with self._lock:
+                self._columns[table] = columns
+        return created
+
+    def covered_tables(self, graph: SchemaGraph) -> set:
+        with self._lock:
+            return {table for table, columns in self._columns.items() if columns and table in graph.columns}
+
+    def mark_stale(self, table: str):
+        pass
+
+    def remove_rows(self, table: str, pks: Iterable[Any]) -> bool:
+        return True
+
+    def pk_column(self, table: str) -> Optional[str]:
+        return None
+
+    def drop_table(self, table: str):
+        with self._lock:
+            self._columns.pop(table, None)
+
+    @staticmethod
+    def _words(keyword: str) -> List[str]:
+        # Operators of the boolean syntax can't be escaped, so they are dropped
+        return [word for word in re.split(r'[\s+\-<>()~*"@]+', str(keyword)) if word]
+
+    @classmethod
+    def dropped_keywords(cls, keywords: Iterable[str]) -> List[str]:
+        """Keywords with a word boolean_query leaves out (shorter than the 3 character minimum token)"""
+        return [keyword for keyword in keywords if any(len(word) < 3 for word in cls._words(keyword))]
+
+    @classmethod
+    def boolean_query(cls, keywords: Iterable[str]) -> Optional[str]:
+        """BOOLEAN MODE query matching any keyword as a word prefix"""
+        terms = [word + '*' for keyword in keywords for word in cls._words(keyword) if len(word) >= 3]
+        return ' '.join(dict.fromkeys(terms)) or None
+
+    def search(self, cursor, graph: SchemaGraph, keywords: Iterable[str], per_table: int = 10) -> List[Dict[str, Any]]:
+        """Rows matching any keyword, best first (see SQLiteFullText.search)"""
+        query = self.boolean_query(keywords)
+        if query is None:
+            return []
+        results = []
+        with self._lock:
+            indexed = [(table, columns) for table, columns in self._columns.items() if columns]
+        for table, columns in indexed:
+            if table not in graph.columns:
+                continue
+            match = f"MATCH({', '.join(f'`{col}`' for col in columns)}) AGAINST (%s IN BOOLEAN MODE)"
+            cursor.execute(
+                f"SELECT *, {match} AS _score FROM `{table}` WHERE {match} ORDER BY _score DESC LIMIT {int(per_table)}",
+                (query, query)
+            )
+            rows = cursor.fetchall()
+            if rows:
+                results.append({
+                    'table': table,
+                    'columns': graph.columns[table],
+                    'rows': [tuple(row[:-1]) for row in rows],
+                    'scores': [round(float(row[-1]), 4) for row in rows],
+                    'match_type': 'fulltext',
+                })
+        return results
+
+    def rebuild(self, cursor, graph: SchemaGraph) -> Dict[str, int]:
+        """Drop and recreate every FULLTEXT index; returns indexed columns per table"""
+        for table in self._existing_indexes(cursor):
+            cursor.execute(f"ALTER TABLE `{table}` DROP INDEX `{self.INDEX_NAME}`")
+        with self._lock:
+            self._columns.clear()
+        self.create_indexes(cursor, graph)
+        with self._lock:
+            return {table: len(columns) for table, columns in self._columns.items() if columns}
+
+    def check(self, cursor, graph: SchemaGraph) -> Dict[str, Any]:
+        """Tables whose text columns have no FULLTEXT index"""
+        existing = self._existing_indexes(cursor)
+        text_columns = self._text_columns(cursor)
+        report = {'consistent': True, 'tables': {}}
+        for table in graph.tables:
+            if table.lower() in SYSTEM_TABLES:
+                continue
+            searchable = [col for col in fulltext_columns(graph.columns.get(table, []))
+                          if col in set(text_columns.get(table, []))]
+            if searchable:
+                report['tables'][table] = {'indexed': table in existing}
+                if table not in existing:
+                    report['consistent'] = False
+        return report
+
+
+def open_fulltext_index(path: str, db_type: str):
+    if db_type == 'sqlite':
+        return SQLiteFullText(path, db_type)
+    return MariaDBFullText(path, db_type)
+
+
+fulltext_indexes = SidecarIndexRegistry(open_fulltext_index, 'fts')
@@ -0,0 +1,518 @@
+"""
+Inverted identifier index
+
+Maps identifier strings (source_id, saliva_id, field_id, bag_code, names,
+...) to the (table, column, primary key) rows that hold them, so looking a
+value up across every table is a B-tree search instead of one OR-chained
+full scan per table. The index is a sidecar SQLite file per database, so it
+works the same for SQLite and MariaDB/MySQL and adds nothing to the user's
+schema.
+
+Tables are indexed in bulk on first use. The application's write paths call
+DatabaseManagerFlask.rows_changed (or remove deleted rows directly), which
+logs the change in the index file, so every worker process sharing it sees
+it; tables changed since they were indexed are re-indexed before the next
+lookup, and so are the tables their triggers write to. A (row count, max key)
+signature, checked once per table when a process first uses the index,
+catches rows added or deleted while the application was not running.
+Lookups re-check the rows they fetch against the searched value in SQL
+(fetch_rows), so an entry that went stale never returns a row that no longer
+holds the value.
+
+Index files live in INDEX_DIR (data/indexes in the application directory,
+the persistent data volume in Docker), so they survive restarts and
+temp-directory cleanup.
+
+Usage:
+    python -m database.identifier_index rebuild <sqlite db path>
+    python -m database.identifier_index check <sqlite db path>
+"""
+import abc
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from database.schema_graph import SYSTEM_TABLES, SchemaGraph
+
+# Column name fragments that mark a column as holding identifiers; the chat's
+# cross-table value search has always looked at these columns
+IDENTIFIER_HINTS = ('id', 'code', 'name', 'sample', 'host', 'location', 'type')
+
+# Tables the security system writes on every login and audited action, outside
+# the data write paths; they are small, so searches scan them instead
+SCANNED_TABLE_PREFIXES = ('security_',)
+
+INDEX_BATCH = 5000
+
+# Maximum primary keys per fetch_rows query
+FETCH_CHUNK = 500
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'indexes')
+
+
+def identifier_columns(columns: List[str]) -> List[str]:
+    """Columns of a table that are indexed (the first 3 if none looks like an identifier)"""
+    matched = [col for col in columns if any(hint in col.lower() for hint in IDENTIFIER_HINTS)]
+    return matched or columns[:3]
+
+
+def normalize(value) -> Optional[str]:
+    """Index key of a value; None for values that are not indexed"""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    text = str(value).strip()
+    return text or None
+
+
+def pk_key(value) -> Optional[str]:
+    """Stored form of a primary key: unlike normalize(), 'A1 ' and 'A1' stay apart"""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+class SidecarIndex(abc.ABC):
+    """
+    An index of one database kept in a SQLite file next to it, re-built per
+    table when the table changes. Subclasses define what is stored per row.
+
+    Args:
+        path: Index file
+        db_type: 'sqlite' or 'mysql', the type of the indexed database
+    """
+
+    # DDL of the subclass's own tables
+    SCHEMA = ''
+
+    def __init__(self, path: str, db_type: str):
+        self.path = path
+        self.db_type = db_type
+        # Tables whose signature has been checked by this process
+        self._verified = set()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript('''
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS indexed_tables (
+                table_name TEXT PRIMARY KEY,
+                pk_column TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                max_pk TEXT,
+                indexed_at REAL NOT NULL,
+                -- Last index_changes id the table was indexed after
+                indexed_change INTEGER NOT NULL DEFAULT 0
+            );
+            -- Writes logged by every process sharing the file; stale = 0 only re-indexes trigger targets
+            CREATE TABLE IF NOT EXISTS index_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                stale INTEGER NOT NULL
+            );
+        ''' + self.SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -- hooks for subclasses ----------------------------------------------
+
+    @abc.abstractmethod
+    def indexed_columns(self, columns: List[str]) -> List[str]:
+        """Columns of a table whose values are indexed"""
+
+    @abc.abstractmethod
+    def _add_rows(self, table: str, columns: List[str], rows: List[tuple]) -> int:
+        """Index rows of (pk, *values); returns the number of entries written"""
+
+    @abc.abstractmethod
+    def _remove_rows(self, table: str, keys: List[str]):
+        """Delete the entries of rows by primary key"""
+
+    @abc.abstractmethod
+    def _clear(self, table: Optional[str] = None):
+        """Delete the entries of one table, or all entries"""
+
+    # -- source database helpers -------------------------------------------
+
+    def _quote(self, name: str) -> str:
+        return f'"{name}"' if self.db_type == 'sqlite' else f'`{name}`'
+
+    def _pk_column(self, graph: SchemaGraph, table: str) -> Optional[str]:
+        pk = graph.primary_key(table)
+        if pk is None and self.db_type == 'sqlite':
+            return 'rowid'
+        return pk
+
+    def _pk_sql(self, pk_column: str) -> str:
+        return 'rowid' if pk_column == 'rowid' else self._quote(pk_column)
+
+    def indexable_tables(self, graph: SchemaGraph) -> List[str]:
+        return [table for table in graph.tables
+                if table.lower() not in SYSTEM_TABLES and not table.lower().startswith(SCANNED_TABLE_PREFIXES)
+                and self._pk_column(graph, table)]
+
+    def _signature(self, cursor, graph: SchemaGraph, table: str) -> Tuple[int, Optional[str]]:
+        pk_sql = self._pk_sql(self._pk_column(graph, table))
+        cursor.execute(f"SELECT COUNT(*), MAX({pk_sql}) FROM {self._quote(table)}")
+        count, max_pk = cursor.fetchone()
+        return int(count), pk_key(max_pk)
+
+    def _select_rows(self, cursor, graph: SchemaGraph, table: str, columns: List[str]):
+        """Execute SELECT pk, *columns on the table; rows are read with fetchmany"""
+        pk_sql = self._pk_sql(self._pk_column(graph, table))
+        select_columns = ', '.join(self._quote(col) for col in columns)
+        cursor.execute(f"SELECT {pk_sql}, {select_columns} FROM {self._quote(table)}")
+
+    # -- maintenance --------------------------------------------------------
+
+    def index_table(self, cursor, graph: SchemaGraph, table: str) -> int:
+        """(Re)index every row of one table; returns the number of entries written"""
+        pk_column = self._pk_column(graph, table)
+        columns = self.indexed_columns(graph.columns.get(table, []))
+        if not pk_column or not columns:
+            return 0
+
+        with self._lock:
+            last_change = self._last_change()
+        count, max_pk = self._signature(cursor, graph, table)
+        self._select_rows(cursor, graph, table, columns)
+
+        written = 0
+        with self._lock:
+            self._clear(table)
+            while True:
+                rows = cursor.fetchmany(INDEX_BATCH)
+                if not rows:
+                    break
+                written += self._add_rows(table, columns, rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indexed_tables "
+                "(table_name, pk_column, row_count, max_pk, indexed_at, indexed_change) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (table, pk_column, count, max_pk, time.time(), last_change)
+            )
+            self._conn.commit()
+            self._verified.add(table)
+        return written
+
+    def drop_table(self, table: str):
+        with self._lock:
+            self._clear(table)
+            self._conn.execute("DELETE FROM indexed_tables WHERE table_name = ?", (table,))
+            self._conn.commit()
+            self._verified.discard(table)
+
+    def mark_stale(self, table: str):
+        """Re-index a table (and the tables its triggers write to) before the next lookup"""
+        self._log_change(table, True)
+
+    def _log_change(self, table: str, stale: bool):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO index_changes (table_name, stale) VALUES (?, ?)", (table, int(stale))
+            )
+            self._conn.commit()
+
+    def _last_change(self) -> int:
+        return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM index_changes").fetchone()[0]
+
+    def _stale_tables(self, graph: SchemaGraph, indexed_change: Dict[str, int]) -> set:
+        """
+        Indexed tables with a change logged after they were indexed: the
+        table itself, or a table whose triggers write to it. Changes every
+        table has been indexed past are pruned.
+        """
+        seen = min(indexed_change.values(), default=0)
+        stale = set()
+        for table, table_stale, change in self._conn.execute(
+                "SELECT table_name, stale, id FROM index_changes WHERE id > ?", (seen,)):
+            if table_stale and change > indexed_change.get(table, change):
+                stale.add(table)
+            # Rows written by triggers never pass through the write paths
+            stale.update(target for target in graph.trigger_targets.get(table, ())
+                         if change > indexed_change.get(target, change))
+        self._conn.execute("DELETE FROM index_changes WHERE id <= ?", (seen,))
+        self._conn.commit()
+        return stale
+
+    def pk_column(self, table: str) -> Optional[str]:
+        """Primary key column a table was indexed by, if it is indexed"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pk_column FROM indexed_tables WHERE table_name = ?", (table,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def remove_rows(self, table: str, pks: Iterable[Any]) -> bool:
+        """
+        Drop the entries of deleted rows. Returns False if the table is not
+        indexed or a key is missing, in which case the table is marked stale.
+        """
+        keys = [pk_key(pk) for pk in pks]
+        if not keys or any(key is None for key in keys):
+            self.mark_stale(table)
+            return False
+        with self._lock:
+            self._remove_rows(table, keys)
+            # The deletion moves the table signature; keep it in step so it isn't re-indexed needlessly
+            self._conn.execute(
+                "UPDATE indexed_tables SET row_count = MAX(0, row_count - ?) WHERE table_name = ?",
+                (len(keys), table)
+            )
+            self._conn.commit()
+        self._log_change(table, False)
+        return True
+
+    def ensure_current(self, cursor, graph: SchemaGraph, tables: Iterable[str] = None):
+        """Index tables that are new or stale, and those whose signature changed while no process had them open"""
+        tables = None if tables is None else set(tables)
+        wanted = [table for table in self.indexable_tables(graph) if tables is None or table in tables]
+        with self._lock:
+            indexed, indexed_change = {}, {}
+            for table, row_count, max_pk, change in self._conn.execute(
+                    "SELECT table_name, row_count, max_pk, indexed_change FROM indexed_tables"):
+                indexed[table] = (row_count, max_pk)
+                indexed_change[table] = change
+            stale = self._stale_tables(graph, indexed_change)
+        if tables is None:
+            for table in set(indexed) - set(wanted):
+                self.drop_table(table)
+
+        for table in wanted:
+            if table in stale or table not in indexed:
+                self.index_table(cursor, graph, table)
+            elif table not in self._verified:
+                if self._signature(cursor, graph, table) != indexed[table]:
+                    self.index_table(cursor, graph, table)
+                else:
+                    with self._lock:
+                        self._verified.add(table)
+
+    def rebuild(self, cursor, graph: SchemaGraph) -> Dict[str, int]:
+        """Re-index every table from scratch; returns entries written per table"""
+        with self._lock:
+            self._clear()
+            self._conn.execute("DELETE FROM indexed_tables")
+            self._conn.commit()
+        return {table: self.index_table(cursor, graph, table) for table in self.indexable_tables(graph)}
+
+    def fetch_rows(self, cursor, graph: SchemaGraph, table: str, pks: List[str], limit: int = 10,
+                   values: Iterable[Any] = None, columns: Iterable[str] = None) -> List[tuple]:
+        """
+        Up to limit rows of a table by primary key, in table order.
+
+        With values, only rows where one of columns (by default the indexed
+        ones) still equals one of the values are returned, compared in SQL
+        like the scan the index replaces, so a stale entry can't return a row
+        that changed.
+        """
+        pks = list(dict.fromkeys(pks))
+        if not pks:
+            return []
+        pk_sql = self._pk_sql(self._pk_column(graph, table))
+        p = '?' if self.db_type == 'sqlite' else '%s'
+        match_sql, match_params = '', []
+        if values is not None:
+            values = list(values)
+            columns = list(columns or self.indexed_columns(graph.columns.get(table, [])))
+            if not values or not columns:
+                return []
+            match_sql = ' AND (' + ' OR '.join(f"{self._quote(col)} = {p}" for col in columns for _ in values) + ')'
+            match_params = [value for _ in columns for value in values]
+
+        rows = []
+        for start in range(0, len(pks), FETCH_CHUNK):
+            chunk = pks[start:start + FETCH_CHUNK]
+            cursor.execute(
+                f"SELECT * FROM {self._quote(table)} WHERE {pk_sql} IN ({', '.join([p] * len(chunk))}){match_sql} "
+                f"LIMIT {int(limit) - len(rows)}",
+                chunk + match_params
+            )
+            rows.extend(cursor.fetchall())
+            if len(rows) >= limit:
+                break
+        return rows
+
+
+class IdentifierIndex(SidecarIndex):
+    """Identifier value -> (table, column, primary key) entries of one database"""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            ident TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            pk TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_ident ON entries (ident);
+        CREATE INDEX IF NOT EXISTS entries_row ON entries (table_name, pk);
+    '''
+
+    def indexed_columns(self, columns: List[str]) -> List[str]:
+        return identifier_columns(columns)
+
+    @staticmethod
+    def _entries(table: str, columns: List[str], rows: List[tuple]) -> List[Tuple[str, str, str, str]]:
+        entries = []
+        for row in rows:
+            pk = pk_key(row[0])
+            if pk is None:
+                continue
+            for column, value in zip(columns, row[1:]):
+                ident = normalize(value)
+                if ident is not None:
+                    entries.append((ident, table, column, pk))
+        return entries
+
+    def _add_rows(self, table: str, columns: List[str], rows: List[tuple]) -> int:
+        entries = self._entries(table, columns, rows)
+        self._conn.executemany(
+            "INSERT INTO entries (ident, table_name, column_name, pk) VALUES (?, ?, ?, ?)", entries
+        )
+        return len(entries)
+
+    def _remove_rows(self, table: str, keys: List[str]):
+        self._conn.executemany(
+            "DELETE FROM entries WHERE table_name = ? AND pk = ?", [(table, key) for key in keys]
+        )
+
+    def _clear(self, table: Optional[str] = None):
+        if table is None:
+            self._conn.execute("DELETE FROM entries")
+        else:
+            self._conn.execute("DELETE FROM entries WHERE table_name = ?", (table,))
+
+    # -- queries ------------------------------------------------------------
+
+    def lookup(self, value, tables: Iterable[str] = None, columns: Iterable[str] = None) -> List[Tuple[str, str, str]]:
+        """(table, column, pk) of every indexed cell equal to value"""
+        ident = normalize(value)
+        if ident is None:
+            return []
+        sql = "SELECT table_name, column_name, pk FROM entries WHERE ident = ?"
+        params = [ident]
+        if self.db_type != 'sqlite':
+            # MariaDB/MySQL compares with a case-insensitive collation by default
+            sql = "SELECT table_name, column_name, pk FROM entries WHERE ident = ? COLLATE NOCASE"
+        if tables is not None:
+            tables = list(tables)
+            sql += f" AND table_name IN ({', '.join(['?'] * len(tables))})"
+            params.extend(tables)
+        if columns is not None:
+            columns = list(columns)
+            sql += f" AND column_name IN ({', '.join(['?'] * len(columns))})"
+            params.extend(columns)
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(sql, params)]
+
+    def check(self, cursor, graph: SchemaGraph) -> Dict[str, Any]:
+        """
+        Compare the index with the database, table by table.
+
+        Returns:
+            {'consistent': bool, 'tables': {table: {'missing', 'extra'}}} counting
+            entries the index lacks and entries it holds that no longer exist
+        """
+        report = {'consistent': True, 'tables': {}}
+        for table in self.indexable_tables(graph):
+            columns = self.indexed_columns(graph.columns.get(table, []))
+            expected = set()
+            self._select_rows(cursor, graph, table, columns)
+            while True:
+                rows = cursor.fetchmany(INDEX_BATCH)
+                if not rows:
+                    break
+                expected.update((ident, column, pk) for ident, _, column, pk in self._entries(table, columns, rows))
+            with self._lock:
+                actual = set(self._conn.execute(
+                    "SELECT ident, column_name, pk FROM entries WHERE table_name = ?", (table,)
+                ))
+            missing, extra = len(expected - actual), len(actual - expected)
+            report['tables'][table] = {'missing': missing, 'extra': extra}
+            if missing or extra:
+                report['consistent'] = False
+        return report
+
+
+class SidecarIndexRegistry:
+    """
+    Open indexes keyed like DatabaseManagerFlask.stats_key.
+
+    Args:
+        factory: Callable(path, db_type) opening the index of one database
+        suffix: File name suffix of the index files
+        index_dir: Directory for the index files (INDEX_DIR by default)
+    """
+
+    def __init__(self, factory: Callable[[str, str], Any], suffix: str, index_dir: Optional[str] = None):
+        self.factory = factory
+        self.suffix = suffix
+        self.index_dir = index_dir or INDEX_DIR
+        self._indexes: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, key: Tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.index_dir, f'{key[0]}_{digest}.{self.suffix}.db')
+
+    def get(self, key: Tuple):
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                os.makedirs(self.index_dir, exist_ok=True)
+                index = self.factory(self.path_for(key), key[0])
+                self._indexes[key] = index
+            return index
+
+    def existing(self, key: Optional[Tuple]):
+        """The index of a database if one has been built, without creating it"""
+        if key is None:
+            return None
+        with self._lock:
+            index = self._indexes.get(key)
+        if index is None and os.path.exists(self.path_for(key)):
+            index = self.get(key)
+        return index
+
+
+identifier_indexes = SidecarIndexRegistry(IdentifierIndex, 'idx')
+
+
+def _main():
+    parser = argparse.ArgumentParser(description='Rebuild or check the identifier index of a SQLite database')
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('db_path')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db_path)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        graph = SchemaGraph.build(cursor, 'sqlite')
+        index = identifier_indexes.get(('sqlite', db_path))
+        if args.command == 'rebuild':
+            started = time.perf_counter()
+            written = index.rebuild(cursor, graph)
+            print(f"Indexed {sum(written.values())} identifiers from {len(written)} tables "
+                  f"in {time.perf_counter() - started:.2f}s -> {index.path}")
+        else:
+            report = index.check(cursor, graph)
+            for table, counts in report['tables'].items():
+                print(f"{table:40} missing={counts['missing']:<8} extra={counts['extra']}")
+            print('consistent' if report['consistent'] else 'INCONSISTENT - run rebuild')
+            raise SystemExit(0 if report['consistent'] else 1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,156 @@
+"""
+Background Excel import jobs
+
+Uploaded files are imported by ExcelImportManager.import_excel_file on a small
+worker pool instead of in the request thread. Each job has its own progress
+state and cancel flag, and progress is pushed to the job's SocketIO room
+(``import_job_<id>``), so several users can import at once without sharing
+or overwriting each other's status.
+"""
+import os
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Any, Dict
+
+from database.background_jobs import BackgroundJob, BackgroundJobManager
+from database.db_manager_flask import DatabaseManagerFlask
+from database.excel_import import ExcelImportManager
+
+
+class ImportJob(BackgroundJob):
+    """One uploaded file waiting for, or going through, import"""
+
+    ROOM_PREFIX = 'import_job'
+
+    def __init__(self, job_id: str, owner: Any, file_path: str, filename: str):
+        super().__init__(
+            job_id, owner,
+            filename=filename,
+            progress=0,
+            processed=0,
+            total=0,
+            stats={'new_records': 0, 'existing_records': 0, 'updated_records': 0, 'rejected_records': 0},
+            cancelled=False,
+        )
+        self.file_path = file_path
+        self.filename = filename
+        self.created_at = time.time()
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.rejected_path = None
+
+    def _apply(self, changes: Dict[str, Any]):
+        self._state.update(changes)
+        total = self._state['total']
+        if not self._state['completed'] and total:
+            # Stay below 100% until the job has actually finished
+            self._state['progress'] = min(99.0, round(100.0 * self._state['processed'] / total, 1))
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return dict(self._state, stats=dict(self._state['stats']))
+
+
+class ImportJobManager(BackgroundJobManager):
+    """
+    Runs import jobs on a bounded thread pool and tracks them by job ID.
+
+    Args:
+        max_workers: Imports that run at the same time; further jobs wait in the queue
+        ttl: Seconds a finished job (and its rejected rows file) is kept
+        emit_interval: Minimum seconds between progress events for one job
+    """
+
+    EVENT = 'import_progress'
+    THREAD_NAME_PREFIX = 'excel-import'
+
+    def submit(self, owner: Any, file_path: str, filename: str, db_path, connection_type: str,
+               user_id=None, **import_options) -> ImportJob:
+        """
+        Queue an import of an uploaded file; the file is deleted when the job ends.
+
+        Args:
+            owner: Only this owner can see, join or cancel the job
+            file_path: Saved upload to import
+            filename: Original file name, for display
+            db_path: SQLite path or MySQL/MariaDB connection parameters
+            connection_type: 'sqlite' or 'mysql'
+            user_id: User the import runs as (for field encryption and auditing)
+            import_options: Passed to ExcelImportManager.import_excel_file
+        """
+        self.expire()
+        job = self._add(ImportJob(uuid.uuid4().hex, owner, file_path, filename))
+        job.future = self._pool().submit(self._run, job, db_path, connection_type, user_id, import_options)
+        return job
+
+    def cancel(self, job_id: str, owner: Any) -> bool:
+        """
+        Cancel a job. A queued job never starts; a running one stops at its next
+        progress report and rolls back the sheet it was importing.
+        """
+        job = self.get(job_id, owner)
+        if job is None or job.completed:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, status='Import cancelled', cancelled=True, success=False)
+        return True
+
+    def _on_expired(self, job: ImportJob):
+        self._remove_file(job.rejected_path)
+
+    def _progress(self, job: ImportJob, progress: Dict[str, Any]):
+        snapshot = job.update(status=progress['status'], processed=progress['processed'],
+                              total=progress['total'], stats=progress['stats'])
+        self._emit(job, snapshot)
+
+    def _finish(self, job: ImportJob, **changes):
+        job.finished_at = time.time()
+        snapshot = job.update(completed=True, progress=100, **changes)
+        self._emit(job, snapshot, force=True)
+        self._remove_file(job.file_path)
+
+    def _run(self, job: ImportJob, db_path, connection_type: str, user_id, import_options: Dict[str, Any]):
+        if job.cancel_event.is_set():
+            self._finish(job, status='Import cancelled', cancelled=True, success=False)
+            return
+
+        self._emit(job, job.update(status='Starting import...'), force=True)
+        try:
+            if connection_type == 'sqlite':
+                # The single writer: concurrent imports queue up instead of failing on "database is locked"
+                connection = DatabaseManagerFlask.sqlite_writer(db_path)
+            else:
+                connection = nullcontext(DatabaseManagerFlask.get_connection(db_path, connection_type))
+            with connection as conn:
+                import_manager = ExcelImportManager(conn, connection_type, user_id=user_id,
+                                                    db_path=db_path if connection_type == 'sqlite' else None)
+                import_manager.progress_callback = lambda progress: self._progress(job, progress)
+                import_manager.cancel_event = job.cancel_event
+                try:
+                    result = import_manager.import_excel_file(job.file_path, **import_options)
+                finally:
+                    import_manager.close()
+
+            if len(import_manager.rejected_rows):
+                job.rejected_path = os.path.join(os.path.dirname(job.file_path), f'import_rejected_{job.job_id}.csv')
+                import_manager.rejected_rows.to_csv(job.rejected_path, index=False)
+
+            summary = {key: result.get(key) for key in (
+                'success', 'message', 'error', 'rows_processed', 'total_sheets', 'total_sheets_processed',
+                'overall_modified_tables', 'rejected_count'
+            ) if key in result}
+            if result.get('cancelled'):
+                self._finish(job, status='Import cancelled', cancelled=True, success=False, result=summary)
+            elif result.get('success'):
+                self._finish(job, status='Import completed successfully', success=True, result=summary)
+            else:
+                self._finish(job, status=result.get('error', 'Import failed'), success=False, result=summary)
+        except Exception as e:
+            self._finish(job, status=f'Import failed: {str(e)}', success=False)
+        finally:
+            DatabaseManagerFlask.release_thread_connections()
+
+
+import_jobs = ImportJobManager()
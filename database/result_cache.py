@@ -0,0 +1,200 @@
+"""
+Server-side cache for SELECT results
+
+Each cached result owns a dedicated connection and an open cursor. Rows are
+pulled from the cursor only as pages are requested and are spooled to a temp
+file as NDJSON, so later pages, streamed responses and exports all read from
+the same cursor without running the query again and without holding the
+whole result in memory or in the Flask session.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def normalize_value(val):
+    """Convert a DB value into something JSON can carry"""
+    if val is None or isinstance(val, (str, int, float, bool)):
+        return val
+    if isinstance(val, (bytes, bytearray)):
+        try:
+            return val.decode('utf-8')
+        except UnicodeDecodeError:
+            return str(val)
+    if hasattr(val, 'isoformat'):
+        return val.isoformat()
+    return str(val)
+
+
+class QueryResult:
+    """A live result cursor with an on-disk spool of the rows read so far"""
+
+    FETCH_BATCH = 1000
+
+    def __init__(self, result_id: str, query: str, owner: Any, conn, cursor, spool_dir: str):
+        self.result_id = result_id
+        self.query = query
+        self.owner = owner
+        self.columns = [desc[0] for desc in cursor.description]
+        self.created_at = time.time()
+        self.last_access = time.monotonic()
+        self.exhausted = False
+
+        self._conn = conn
+        self._cursor = cursor
+        self._lock = threading.RLock()
+        fd, self._spool_path = tempfile.mkstemp(prefix=f'result_{result_id}_', suffix='.ndjson', dir=spool_dir)
+        self._spool = os.fdopen(fd, 'w+b')
+        # Byte offset of every spooled row, so any page can be read with one seek
+        self._offsets = array('q')
+
+    @property
+    def spooled_rows(self) -> int:
+        return len(self._offsets)
+
+    def _pull(self, count: int) -> int:
+        """Read up to count more rows from the cursor into the spool"""
+        if self.exhausted or count <= 0:
+            return 0
+        rows = self._cursor.fetchmany(count)
+        if len(rows) < count:
+            self._finish_cursor()
+        if not rows:
+            return 0
+        self._spool.seek(0, os.SEEK_END)
+        pos = self._spool.tell()
+        for row in rows:
+            line = json.dumps([normalize_value(v) for v in row], separators=(',', ':')).encode('utf-8') + b'\n'
+            self._offsets.append(pos)
+            self._spool.write(line)
+            pos += len(line)
+        return len(rows)
+
+    def _finish_cursor(self):
+        self.exhausted = True
+        for closer in (self._cursor, self._conn):
+            try:
+                closer.close()
+            except Exception:
+                pass
+        self._cursor = None
+        self._conn = None
+
+    def _read_spooled(self, start: int, stop: int) -> List[list]:
+        if start >= stop:
+            return []
+        self._spool.flush()
+        self._spool.seek(self._offsets[start])
+        return [json.loads(self._spool.readline()) for _ in range(stop - start)]
+
+    def fetch_page(self, offset: int, limit: int) -> Dict[str, Any]:
+        """
+        Return rows [offset, offset + limit) as dicts.
+
+        Returns:
+            Dictionary with rows, the next offset (None when there are no more
+            rows) and whether the cursor has been fully read
+        """
+        with self._lock:
+            self.last_access = time.monotonic()
+            wanted = offset + limit + 1  # one extra row tells us whether there is a next page
+            while self.spooled_rows < wanted and not self.exhausted:
+                self._pull(max(self.FETCH_BATCH, wanted - self.spooled_rows))
+            stop = min(offset + limit, self.spooled_rows)
+            rows = self._read_spooled(min(offset, stop), stop)
+            has_more = self.spooled_rows > stop
+            return {
+                'rows': [dict(zip(self.columns, row)) for row in rows],
+                'next_offset': stop if has_more else None,
+                'complete': self.exhausted,
+            }
+
+    def iter_rows(self, start: int = 0) -> Iterator[list]:
+        """Yield every row from start onward: spooled rows first, then the rest of the cursor"""
+        position = start
+        while True:
+            with self._lock:
+                self.last_access = time.monotonic()
+                if position >= self.spooled_rows:
+                    if self.exhausted or not self._pull(self.FETCH_BATCH):
+                        return
+                stop = min(position + self.FETCH_BATCH, self.spooled_rows)
+                batch = self._read_spooled(position, stop)
+            for row in batch:
+                yield row
+            position = stop
+
+    def close(self):
+        with self._lock:
+            if not self.exhausted:
+                self._finish_cursor()
+            try:
+                self._spool.close()
+                os.remove(self._spool_path)
+            except OSError:
+                pass
+
+
+class QueryResultCache:
+    """
+    LRU of live query results keyed by result ID.
+
+    Args:
+        max_results: Results kept open at once; the least recently used is closed first
+        ttl: Seconds a result may sit unused before it is closed
+        spool_dir: Directory for the NDJSON spool files
+    """
+
+    def __init__(self, max_results: int = 32, ttl: float = 900.0, spool_dir: Optional[str] = None):
+        self.max_results = max_results
+        self.ttl = ttl
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), 'haoxai_results')
+        self._results: 'OrderedDict[str, QueryResult]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, query: str, owner: Any, conn, cursor) -> QueryResult:
+        """Register an executed cursor (with a description) as a new cached result"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        result = QueryResult(uuid.uuid4().hex, query, owner, conn, cursor, self.spool_dir)
+        with self._lock:
+            self._results[result.result_id] = result
+        self.expire()
+        return result
+
+    def get(self, result_id: str, owner: Any) -> Optional[QueryResult]:
+        """Look up a result; results are only visible to the owner that created them"""
+        self.expire()
+        with self._lock:
+            result = self._results.get(result_id)
+            if result is None or result.owner != owner:
+                return None
+            self._results.move_to_end(result_id)
+            return result
+
+    def discard(self, result_id: str):
+        with self._lock:
+            result = self._results.pop(result_id, None)
+        if result:
+            result.close()
+
+    def expire(self):
+        """Close results past their TTL and trim the cache to max_results"""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            for result_id, result in list(self._results.items()):
+                if now - result.last_access > self.ttl:
+                    stale.append(self._results.pop(result_id))
+            while len(self._results) > self.max_results:
+                stale.append(self._results.popitem(last=False)[1])
+        for result in stale:
+            result.close()
+
+
+result_cache = QueryResultCache()
@@ -0,0 +1,406 @@
+"""
+Batch sample enrichment for uploaded sheets
+
+The chat's Excel auto-fill used to build a full FK profile per sample ID, one
+ID at a time, and stopped after 50 IDs. SampleEnricher resolves every ID of a
+sheet with IN queries, follows the FK graph from the samples table for all of
+them at once (one IN query per related table and level, joined back with
+pandas merges), and fills the sheet's empty cells column by column.
+
+Sheets above ENRICH_SYNC_ROWS IDs run as background jobs (enrichment_jobs)
+with progress pushed to the job's SocketIO room (``enrich_job_<id>``); the
+enriched workbook is written to a temp file and downloaded when done.
+"""
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from database.background_jobs import BackgroundJob, BackgroundJobManager
+from database.db_manager_flask import DatabaseManagerFlask
+from database.export_stream import stream_export
+from database.identifier_index import normalize
+from database.schema_graph import SYSTEM_TABLES, SchemaGraph
+
+# Sheets with more sample IDs than this are enriched in a background job
+ENRICH_SYNC_ROWS = 1000
+
+IN_CHUNK = 500
+
+# Columns that hold a sample's string IDs in screening_results, tried in order
+SCREENING_ID_COLUMNS = ['tested_sample_id', 'tube_id', 'sample_tube_id', 'field_id', 'source_id']
+# Columns of samples an ID is looked up in, tried in order
+SAMPLE_ID_COLUMNS = ['sample_id', 'tissue_id', 'source_id', 'host_id', 'intestine_id', 'plasma_id']
+
+# Columns of storage tables that hold the tube ID a sample was searched by
+STORAGE_ID_COLUMNS = ['sample_tube_id', 'tube_id', 'tissue_id', 'tested_sample_id', 'sample_code', 'tube_code',
+                      'tissue_code', 'sample_identifier', 'storage_tube_id', 'container_id', 'specimen_id']
+
+# (table, field prefix, row kept per sample, fields left out) in the order the
+# single-sample auto-fill merged them; later sections win for unprefixed names
+PROFILE_SECTIONS = [
+    ('samples', 'sample', 'first', ()),
+    ('hosts', 'host', 'first', ()),
+    ('taxonomy', 'taxonomy', 'first', ()),
+    ('locations', 'location', 'first', ()),
+    ('screening_results', 'screening', 'last', ('screening_id', 'sample_id')),
+    ('storage_locations', 'storage', 'first', ('table_source', 'sample_id')),
+]
+
+# Other names a sheet column may go by
+FIELD_VARIATIONS = {
+    'scientific_name': ['species', 'scientific_name', 'taxon_name', 'organism'],
+    'pan_corona': ['pan_corona', 'corona', 'coronavirus'],
+    'province': ['province', 'state', 'region', 'location'],
+    'rack_position': ['rack_position', 'position', 'location', 'storage'],
+}
+
+
+def _blank_to_na(frame: pd.DataFrame) -> pd.DataFrame:
+    """Treat empty values (None, '', 0) as missing, like the per-sample `if value` checks did"""
+    return frame.astype(object).where(frame.notna() & (frame != '') & (frame != 0), None)
+
+
+def _first_present(frame: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Per row, the value of the first of columns that is not missing"""
+    if not columns:
+        return pd.Series([None] * len(frame), index=frame.index, dtype=object)
+    return frame[columns].bfill(axis=1).iloc[:, 0]
+
+
+class SampleEnricher:
+    """
+    Set-wise lookups of sample IDs and their related records.
+
+    Args:
+        cursor: Cursor on the database
+        db_type: 'sqlite' or 'mysql'
+        graph: SchemaGraph of the database
+        max_depth: FK hops followed from the samples table
+    """
+
+    def __init__(self, cursor, db_type: str, graph: SchemaGraph, max_depth: int = 4):
+        self.cursor = cursor
+        self.db_type = db_type
+        self.graph = graph
+        self.max_depth = max_depth
+
+    def _quote(self, name: str) -> str:
+        return f'"{name}"' if self.db_type == 'sqlite' else f'`{name}`'
+
+    def fetch_in(self, table: str, column: str, values: List[Any]) -> pd.DataFrame:
+        """Rows of table whose column is one of values (IN queries of IN_CHUNK values)"""
+        columns = self.graph.columns.get(table, [])
+        p = '?' if self.db_type == 'sqlite' else '%s'
+        rows = []
+        for start in range(0, len(values), IN_CHUNK):
+            chunk = values[start:start + IN_CHUNK]
+            self.cursor.execute(
+                f"SELECT * FROM {self._quote(table)} WHERE {self._quote(column)} IN ({', '.join([p] * len(chunk))})",
+                chunk
+            )
+            rows.extend(self.cursor.fetchall())
+        return pd.DataFrame([tuple(row) for row in rows], columns=columns, dtype=object)
+
+    def _first_match(self, table: str, id_columns: List[str], keys: List[str], value_column: str) -> Dict[str, Any]:
+        """key -> value_column of the first row matching it, trying id_columns in order"""
+        found = {}
+        for column in id_columns:
+            remaining = [key for key in keys if key not in found]
+            if not remaining or column not in self.graph.columns.get(table, []):
+                continue
+            rows = self.fetch_in(table, column, remaining)
+            for key, value in zip(rows[column].map(normalize), rows[value_column]):
+                found.setdefault(key, value)
+        return found
+
+    def resolve(self, sample_ids: List[str]) -> pd.DataFrame:
+        """
+        samples rows for sample IDs, one per distinct ID (column '_key'). IDs are
+        first mapped to numeric sample IDs through screening_results, as the
+        chat's single-sample lookup does, then looked up in samples.
+        """
+        keys = list(dict.fromkeys(key for key in map(normalize, sample_ids) if key is not None))
+        lookup_key = dict(zip(keys, keys))
+        if 'screening_results' in self.graph.columns and 'sample_id' in self.graph.columns['screening_results']:
+            numeric = self._first_match('screening_results', SCREENING_ID_COLUMNS, keys, 'sample_id')
+            lookup_key.update({key: normalize(value) for key, value in numeric.items() if normalize(value)})
+
+        if 'samples' not in self.graph.columns:
+            return pd.DataFrame(columns=['_key'])
+        lookups = list(dict.fromkeys(lookup_key.values()))
+        found: Dict[str, tuple] = {}
+        for column in SAMPLE_ID_COLUMNS:
+            remaining = [key for key in lookups if key not in found]
+            if not remaining or column not in self.graph.columns['samples']:
+                continue
+            rows = self.fetch_in('samples', column, remaining)
+            for key, row in zip(rows[column].map(normalize), rows.itertuples(index=False, name=None)):
+                found.setdefault(key, row)
+
+        records = [(key,) + found[lookup_key[key]] for key in keys if lookup_key[key] in found]
+        return pd.DataFrame(records, columns=['_key'] + self.graph.columns['samples'], dtype=object)
+
+    def related(self, samples: pd.DataFrame, progress: Callable[[str], None] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Rows related to each sample, following FKs both ways breadth-first from
+        samples, each table once. Returns {table: rows with a '_key' column}.
+        At most 10 rows per key and sample are kept, and each table is expanded
+        from up to 3 rows per sample, as in the single-sample profile.
+        """
+        discovered = {'samples': samples}
+        frontier = {'samples': samples}
+        visited = {'samples'}
+        for depth in range(self.max_depth):
+            next_frontier = {}
+            for table, rows in frontier.items():
+                expand = rows.groupby('_key', sort=False).head(3)
+                for fk in self.graph.relationships(table, skip_system=True):
+                    related_table = fk['table']
+                    if related_table in visited or related_table.lower() in SYSTEM_TABLES:
+                        continue
+                    own_column, related_column = (fk['from'], fk['to']) if fk['direction'] == 'forward' else (fk['to'], fk['from'])
+                    if own_column not in expand.columns or related_column not in self.graph.columns.get(related_table, []):
+                        continue
+                    keys = expand[['_key', own_column]].copy()
+                    keys['_join'] = keys[own_column].map(normalize)
+                    keys = keys.dropna(subset=['_join'])[['_key', '_join']].drop_duplicates()
+                    if keys.empty:
+                        continue
+                    if progress:
+                        progress(f"Looking up {related_table}")
+                    fetched = self.fetch_in(related_table, related_column, list(keys['_join'].unique()))
+                    if fetched.empty:
+                        continue
+                    fetched['_join'] = fetched[related_column].map(normalize)
+                    merged = keys.merge(fetched, on='_join').drop(columns='_join')
+                    merged = merged.groupby(['_key', related_column], sort=False).head(10)
+                    next_frontier[related_table] = pd.concat([next_frontier[related_table], merged]) \
+                        if related_table in next_frontier else merged
+            visited.update(next_frontier)
+            discovered.update(next_frontier)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return discovered
+
+    def storage(self, keys: List[str]) -> pd.DataFrame:
+        """
+        storage_locations rows for the searched IDs themselves (column '_key'),
+        matched on the first tube ID column that finds them. Storage rows are
+        keyed by tube ID rather than by an FK to samples.
+        """
+        columns = self.graph.columns.get('storage_locations', [])
+        found = []
+        remaining = list(keys)
+        for column in STORAGE_ID_COLUMNS:
+            if not remaining or column not in columns:
+                continue
+            rows = self.fetch_in('storage_locations', column, remaining)
+            if rows.empty:
+                continue
+            rows.insert(0, '_key', rows[column].map(normalize))
+            found.append(rows.groupby('_key', sort=False).head(10))
+            matched = set(rows['_key'])
+            remaining = [key for key in remaining if key not in matched]
+        return pd.concat(found, ignore_index=True) if found else pd.DataFrame(columns=['_key'] + columns)
+
+    @staticmethod
+    def available_fields(keys: List[str], discovered: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """
+        One row per sample key with every field the auto-fill can use, named
+        like the per-sample version: plain column names, '<prefix>_<column>'
+        and the special 'species' / 'province' / 'rack_position' fields.
+        """
+        available = pd.DataFrame(index=pd.Index(keys, name='_key'))
+        plain: Dict[str, pd.Series] = {}
+        for table, prefix, keep, skipped in PROFILE_SECTIONS:
+            rows = discovered.get(table)
+            if rows is None or rows.empty:
+                continue
+            rows = rows.drop_duplicates('_key', keep=keep).set_index('_key').reindex(available.index)
+            rows = _blank_to_na(rows.drop(columns=[col for col in skipped if col in rows.columns]))
+            for column in rows.columns:
+                values = rows[column]
+                plain[column] = values.combine_first(plain[column]) if column in plain else values
+                available[f'{prefix}_{column}'] = values
+            if table == 'taxonomy' and 'scientific_name' in rows.columns:
+                plain['species'] = rows['scientific_name'].combine_first(plain['species']) \
+                    if 'species' in plain else rows['scientific_name']
+        for column, values in plain.items():
+            available[column] = values
+        return available
+
+    @staticmethod
+    def candidate_fields(column: str, fields: List[str]) -> List[str]:
+        """
+        Fields a sheet column is filled from, best first: exact name,
+        case-insensitive name, special mappings, names containing the column
+        name (ending with, starting with, containing), then known variations.
+        """
+        clean = column.strip().lower()
+        candidates = [clean] if clean in fields else []
+        candidates += [field for field in fields if field.lower() == clean and field != clean]
+        if clean == 'scientific_name':
+            candidates += ['scientific_name', 'species']
+        elif clean in ('pan_corona', 'province'):
+            candidates.append(clean)
+        elif clean == 'rack_position':
+            candidates += ['_rack_spot', 'rack', 'spot_position']
+        partial = []
+        for field in fields:
+            lower = field.lower()
+            if clean in lower:
+                score = 90 if lower.endswith(clean) else 80 if lower.startswith(clean) else 70
+                partial.append((score, field))
+        candidates += [field for _, field in sorted(partial, reverse=True)]
+        candidates += FIELD_VARIATIONS.get(clean, [])
+        return list(dict.fromkeys(field for field in candidates if field in fields or field == '_rack_spot'))
+
+    def fill(self, sheet: pd.DataFrame, id_column: str, progress: Callable[[str], None] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Fill the empty cells of a sheet from the database.
+
+        Args:
+            sheet: Uploaded sheet
+            id_column: Column of the sheet holding sample IDs
+            progress: Called with a status message between steps
+
+        Returns:
+            (enriched sheet, stats) where stats counts IDs, matched samples and filled cells
+        """
+        sheet = sheet[sheet[id_column].notna()].reset_index(drop=True)
+        ids = sheet[id_column].map(normalize)
+        if progress:
+            progress(f"Resolving {ids.nunique()} sample IDs")
+        samples = self.resolve(list(ids.dropna()))
+        discovered = self.related(samples, progress)
+        if 'storage_locations' not in discovered and 'storage_locations' in self.graph.columns:
+            if progress:
+                progress("Looking up storage_locations")
+            discovered['storage_locations'] = self.storage(list(samples['_key']))
+        available = self.available_fields(list(samples['_key']), discovered)
+        if 'rack' in available.columns and 'spot_position' in available.columns:
+            both = available['rack'].notna() & available['spot_position'].notna()
+            available['_rack_spot'] = (available['rack'].astype(str) + '_' + available['spot_position'].astype(str)).where(both, None)
+
+        # One row of available fields per sheet row
+        per_row = available.reindex(ids.values).reset_index(drop=True)
+        fields = [field for field in available.columns if field != '_rack_spot']
+        filled = 0
+        enriched = sheet.copy()
+        for column in sheet.columns:
+            if column == id_column or pd.isna(column) or str(column).strip() == '':
+                continue
+            candidates = [field for field in self.candidate_fields(str(column), fields) if field in per_row.columns]
+            if not candidates:
+                continue
+            if progress:
+                progress(f"Filling {column}")
+            values = _first_present(per_row, candidates)
+            missing = enriched[column].isna() | (enriched[column].astype(str).str.strip() == '')
+            fill_mask = missing & values.notna()
+            if fill_mask.any():
+                enriched[column] = enriched[column].astype(object)
+                enriched.loc[fill_mask, column] = values[fill_mask]
+                filled += int(fill_mask.sum())
+
+        stats = {
+            'sample_count': len(sheet),
+            'distinct_ids': int(ids.nunique()),
+            'matched_samples': int(ids.isin(available.index).sum()),
+            'filled_cells': filled,
+        }
+        return enriched, stats
+
+
+def find_sample_id_column(sheet: pd.DataFrame) -> Optional[str]:
+    """The first column whose name suggests IDs and whose first values look like sample IDs"""
+    for col in sheet.columns:
+        col_lower = str(col).lower().strip()
+        if any(id_word in col_lower for id_word in ['sample', 'id', 'code', 'identifier']):
+            for val in sheet[col].dropna().head(5):
+                val_str = str(val).strip()
+                if any(c.isalpha() for c in val_str) and any(c.isdigit() for c in val_str) and len(val_str) > 3:
+                    return col
+    return None
+
+
+def enrich_sheet(sheet: pd.DataFrame, id_column: str, db_path, db_type: str,
+                 progress: Callable[[str], None] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Enrich a sheet against a database (see SampleEnricher.fill)"""
+    cursor = DatabaseManagerFlask.get_connection(db_path, db_type).cursor()
+    graph = DatabaseManagerFlask.schema_graph(db_path, db_type, cursor)
+    return SampleEnricher(cursor, db_type, graph).fill(sheet, id_column, progress)
+
+
+def write_workbook(sheet: pd.DataFrame, path: str):
+    """Write a sheet as XLSX through the streaming exporter (openpyxl write-only)"""
+    values = sheet.astype(object).where(sheet.notna(), None)
+    rows = list(values.itertuples(index=False, name=None))
+    with open(path, 'wb') as f:
+        for chunk in stream_export([str(col) for col in sheet.columns], [rows], 'xlsx'):
+            f.write(chunk)
+
+
+class EnrichmentJob(BackgroundJob):
+    """One uploaded sheet being enriched in the background"""
+
+    ROOM_PREFIX = 'enrich_job'
+
+    def __init__(self, job_id: str, owner: Any, filename: str):
+        super().__init__(job_id, owner, filename=filename, step=0)
+        self.filename = filename
+        self.result_path = None
+
+
+class EnrichmentJobManager(BackgroundJobManager):
+    """
+    Runs sheet enrichment jobs on a bounded thread pool, like ImportJobManager.
+
+    Args:
+        max_workers: Jobs that run at the same time
+        ttl: Seconds a finished job (and its workbook) is kept
+        emit_interval: Minimum seconds between progress events for one job
+    """
+
+    EVENT = 'enrich_progress'
+    THREAD_NAME_PREFIX = 'excel-enrich'
+
+    def submit(self, owner: Any, sheet: pd.DataFrame, id_column: str, filename: str, db_path, db_type: str) -> EnrichmentJob:
+        self.expire()
+        job = self._add(EnrichmentJob(uuid.uuid4().hex, owner, filename))
+        self._pool().submit(self._run, job, sheet, id_column, db_path, db_type)
+        return job
+
+    def _on_expired(self, job: EnrichmentJob):
+        self._remove_file(job.result_path)
+
+    def _run(self, job: EnrichmentJob, sheet: pd.DataFrame, id_column: str, db_path, db_type: str):
+        def progress(status):
+            self._emit(job, job.update(status=status, step=job.snapshot()['step'] + 1))
+
+        try:
+            enriched, stats = enrich_sheet(sheet, id_column, db_path, db_type, progress)
+            progress('Writing workbook')
+            fd, path = tempfile.mkstemp(prefix=f'enriched_{job.job_id[:8]}_', suffix='.xlsx')
+            os.close(fd)
+            write_workbook(enriched, path)
+            job.result_path = path
+            preview = enriched.head(5).astype(object).where(enriched.head(5).notna(), None)
+            result = dict(stats, preview={'headers': [str(col) for col in enriched.columns],
+                                          'rows': preview.to_dict(orient='records')})
+            job.finished_at = time.time()
+            self._emit(job, job.update(status='Enrichment complete', completed=True, success=True, result=result),
+                       force=True)
+        except Exception as e:
+            job.finished_at = time.time()
+            self._emit(job, job.update(status=f'Enrichment failed: {e}', completed=True, success=False), force=True)
+        finally:
+            DatabaseManagerFlask.release_thread_connections()
+
+
+enrichment_jobs = EnrichmentJobManager()
@@ -27,6 +27,11 @@ class SampleManager:
         """Get a thread-safe database connection"""
         return DatabaseManager.get_connection(self.db_connection, self.connection_type)
     
+    def _rows_changed(self, table_name: str):
+        """Let the cached row counts and search indexes know a table was written"""
+        from database.db_manager_flask import DatabaseManagerFlask
+        DatabaseManagerFlask.rows_changed_in(self.db_connection, self.connection_type, table_name)
+    
     def _initialize_sample_tables(self):
         """Initialize sample management tables if they don't exist"""
         conn = self._get_connection()
@@ -132,6 +137,7 @@ class SampleManager:
         try:
             cursor.execute(query, (sample_id, virus_type, notes))
             conn.commit()
+            self._rows_changed('sample_viruses')
             record_id = cursor.lastrowid
             print(f"[SAMPLE] Registered new sample-virus: {sample_id} -> {virus_type}")
             
@@ -155,6 +161,7 @@ class SampleManager:
                 '''
                 cursor.execute(update_query, (sample_id, virus_type, notes, sample_id, virus_type))
                 conn.commit()
+                self._rows_changed('sample_viruses')
                 
                 # Get the existing record ID
                 select_query = f"SELECT id FROM sample_viruses WHERE sample_id = {placeholder} AND virus_type = {placeholder}"
@@ -232,6 +239,7 @@ class SampleManager:
         
         cursor.execute(upsert_query, (sample_id, total_sequences, total_consensus, virus_types_json))
         conn.commit()
+        self._rows_changed('sample_summary')
     
     def get_sample_viruses(self, sample_id: str) -> List[Dict[str, Any]]:
         """
@@ -407,6 +415,7 @@ class SampleManager:
             cursor.execute(query, (sample_id,))
         
         conn.commit()
+        self._rows_changed('sample_viruses')
         
         # Update sample summary
         self._update_sample_summary(sample_id)
@@ -433,6 +442,20 @@ class SampleManager:
         
         placeholder = '?' if self.connection_type == 'sqlite' else '%s'
         
+        # Look the ID up in the identifier index; the OR scan is only for when it can't be used
+        from database.db_manager_flask import DatabaseManagerFlask
+        try:
+            graph = DatabaseManagerFlask.schema_graph(self.db_connection, self.connection_type, cursor)
+            index = DatabaseManagerFlask.identifier_index(self.db_connection, self.connection_type)
+            index.ensure_current(cursor, graph, ['samples'])
+            if index.pk_column('samples'):
+                hits = index.lookup(id_string, tables=['samples'], columns=id_cols)
+                rows = index.fetch_rows(cursor, graph, 'samples', [pk for _, _, pk in hits], limit=1,
+                                        values=[id_string], columns={column for _, column, _ in hits})
+                return dict(zip(graph.columns['samples'], rows[0])) if rows else None
+        except Exception as e:
+            print(f"[DEBUG] Identifier index lookup for '{id_string}' failed, scanning samples: {e}")
+        
         # Build a big OR query
         where_parts = [f"{col} = {placeholder}" for col in id_cols]
         query = f"SELECT * FROM samples WHERE {' OR '.join(where_parts)} LIMIT 1"
@@ -0,0 +1,190 @@
+"""
+Cached schema and foreign key graph
+
+The chat engine follows foreign keys in both directions when it profiles a
+record. Reading them from PRAGMA foreign_key_list / information_schema on
+every hop means one PRAGMA per table per node, so a single profile can run
+thousands of metadata queries. The graph below is read once per database and
+shared until a DDL change (DatabaseManagerFlask.schema_changed) drops it.
+"""
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Tables the FK traversal and the identifier / full-text indexes leave out
+SYSTEM_TABLES = {'sqlite_sequence', 'sqlite_stat1', 'recyclebin', 'blast_cache'}
+
+# Tables a trigger body writes to
+_TRIGGER_WRITE = re.compile(
+    r'\b(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+|\s+IGNORE)?\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[`"\[]?(\w+)',
+    re.IGNORECASE
+)
+
+
+class SchemaGraph:
+    """
+    Columns, keys and FK adjacency of every table in one database.
+
+    forward[table] lists the FKs declared on table ({'table': referenced table,
+    'from': column in table, 'to': referenced column, 'id', 'seq'}), and
+    reverse[table] lists the FKs of other tables that point at it ({'table':
+    referencing table, 'from': column there, 'to': column in table}), both in
+    the order the database reports them. trigger_targets[table] holds the
+    tables the triggers on table write to.
+    """
+
+    def __init__(self):
+        self.tables: List[str] = []
+        self.columns: Dict[str, List[str]] = {}
+        self.primary_keys: Dict[str, List[str]] = {}
+        self.indexed_columns: Dict[str, set] = {}
+        self.forward: Dict[str, List[Dict[str, Any]]] = {}
+        self.reverse: Dict[str, List[Dict[str, Any]]] = {}
+        self.trigger_targets: Dict[str, set] = {}
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, cursor, db_type: str) -> 'SchemaGraph':
+        graph = cls()
+        if db_type == 'sqlite':
+            graph._build_sqlite(cursor)
+        else:
+            graph._build_mysql(cursor)
+        for table in graph.tables:
+            for fk in graph.forward.get(table, []):
+                graph.reverse.setdefault(fk['table'], []).append({
+                    'table': table, 'from': fk['from'], 'to': fk['to']
+                })
+        return graph
+
+    def _build_sqlite(self, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        self.tables = [row[0] for row in cursor.fetchall()]
+        for table in self.tables:
+            cursor.execute(f'PRAGMA table_info("{table}")')
+            info = cursor.fetchall()
+            self.columns[table] = [col[1] for col in info]
+            self.primary_keys[table] = [col[1] for col in sorted((c for c in info if c[5]), key=lambda c: c[5])]
+
+            indexed = set(self.primary_keys[table])
+            cursor.execute(f'PRAGMA index_list("{table}")')
+            for index in cursor.fetchall():
+                cursor.execute(f'PRAGMA index_info("{index[1]}")')
+                index_columns = cursor.fetchall()
+                if index_columns:
+                    # Only the leading column can serve an equality lookup on its own
+                    indexed.add(index_columns[0][2])
+            self.indexed_columns[table] = indexed
+
+            cursor.execute(f'PRAGMA foreign_key_list("{table}")')
+            # PRAGMA returns: id, seq, table, from, to, on_update, on_delete, match
+            self.forward[table] = [
+                {'table': fk[2], 'from': fk[3], 'to': fk[4], 'id': fk[0], 'seq': fk[1]}
+                for fk in cursor.fetchall()
+            ]
+
+        cursor.execute("SELECT tbl_name, sql FROM sqlite_master WHERE type='trigger'")
+        for table, sql in cursor.fetchall():
+            # Only the body after BEGIN; the header names the trigger's own event and table
+            body = re.split(r'\bBEGIN\b', sql or '', maxsplit=1, flags=re.IGNORECASE)[-1]
+            self._add_trigger_targets(table, body)
+
+    def _build_mysql(self, cursor):
+        cursor.execute("SHOW TABLES")
+        self.tables = [row[0] for row in cursor.fetchall()]
+        for table in self.tables:
+            self.columns[table], self.primary_keys[table], self.indexed_columns[table] = [], [], set()
+            self.forward[table] = []
+
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME, COLUMN_KEY
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """)
+        for table, column, column_key in cursor.fetchall():
+            if table not in self.columns:
+                continue
+            self.columns[table].append(column)
+            if column_key == 'PRI':
+                self.primary_keys[table].append(column)
+
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND SEQ_IN_INDEX = 1 AND INDEX_TYPE <> 'FULLTEXT'
+        """)
+        for table, column in cursor.fetchall():
+            if table in self.indexed_columns:
+                self.indexed_columns[table].add(column)
+
+        cursor.execute("""
+            SELECT TABLE_NAME, REFERENCED_TABLE_NAME, COLUMN_NAME, REFERENCED_COLUMN_NAME
+            FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND REFERENCED_TABLE_NAME IS NOT NULL
+        """)
+        for table, referenced_table, column, referenced_column in cursor.fetchall():
+            if table in self.forward:
+                self.forward[table].append({'table': referenced_table, 'from': column, 'to': referenced_column})
+
+        cursor.execute("""
+            SELECT EVENT_OBJECT_TABLE, ACTION_STATEMENT
+            FROM information_schema.TRIGGERS
+            WHERE TRIGGER_SCHEMA = DATABASE()
+        """)
+        for table, body in cursor.fetchall():
+            self._add_trigger_targets(table, body)
+
+    def _add_trigger_targets(self, table: str, body: str):
+        targets = {target for target in _TRIGGER_WRITE.findall(body or '') if target in self.columns}
+        if targets:
+            self.trigger_targets.setdefault(table, set()).update(targets)
+
+    def primary_key(self, table: str) -> Optional[str]:
+        keys = self.primary_keys.get(table)
+        return keys[0] if keys else None
+
+    def relationships(self, table: str, skip_system: bool = False) -> List[Dict[str, Any]]:
+        """Forward then backward FKs of a table, with a 'direction' key"""
+        relationships = [dict(fk, direction='forward') for fk in self.forward.get(table, [])]
+        for fk in self.reverse.get(table, []):
+            if fk['table'] == table or (skip_system and fk['table'].lower() in SYSTEM_TABLES):
+                continue
+            relationships.append(dict(fk, direction='backward'))
+        return relationships
+
+
+class SchemaGraphCache:
+    """
+    One SchemaGraph per database, keyed like DatabaseManagerFlask.stats_key.
+
+    Args:
+        ttl: Seconds before a graph is rebuilt even without a DDL event, to
+             pick up schema changes made outside the application
+    """
+
+    def __init__(self, ttl: float = 600.0):
+        self.ttl = ttl
+        self._graphs: Dict[Tuple, SchemaGraph] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple, cursor, db_type: str) -> SchemaGraph:
+        graph = self._graphs.get(key)
+        if graph is None or time.time() - graph.built_at > self.ttl:
+            graph = SchemaGraph.build(cursor, db_type)
+            with self._lock:
+                self._graphs[key] = graph
+        return graph
+
+    def invalidate(self, key: Optional[Tuple] = None):
+        """Drop the graph of one database, or of all databases"""
+        with self._lock:
+            if key is None:
+                self._graphs.clear()
+            else:
+                self._graphs.pop(key, None)
+
+
+schema_graphs = SchemaGraphCache()
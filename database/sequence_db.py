@@ -32,6 +32,11 @@ class SequenceDBManager:
         """Get a thread-safe database connection"""
         return DatabaseManager.get_connection(self.db_connection, self.connection_type)
     
+    def _rows_changed(self, table_name: str):
+        """Let the cached row counts and search indexes know a table was written"""
+        from database.db_manager_flask import DatabaseManagerFlask
+        DatabaseManagerFlask.rows_changed_in(self.db_connection, self.connection_type, table_name)
+    
     def _initialize_tables(self):
         """Create tables if they don't exist"""
         # Always auto-validate and fix schema before proceeding
@@ -413,6 +418,7 @@ class SequenceDBManager:
         try:
             cursor.execute(query, values)
             conn.commit()
+            self._rows_changed('sequences')
             sequence_id = cursor.lastrowid
             
             # Register sample-virus relationship if sample_id and virus_type are present
@@ -512,6 +518,7 @@ class SequenceDBManager:
         try:
             cursor.execute(query, values)
             conn.commit()
+            self._rows_changed('consensus_sequences')
             consensus_id = cursor.lastrowid
             
             # Register sample-virus relationship if sample_id and virus_type are present
@@ -597,6 +604,7 @@ class SequenceDBManager:
         try:
             cursor.execute(query, values)
             conn.commit()
+            self._rows_changed('blast_results')
             blast_result_id = cursor.lastrowid
             
             # Insert BLAST hits
@@ -639,6 +647,7 @@ class SequenceDBManager:
                 cursor.execute(hit_query, hit_values)
             
             conn.commit()
+            self._rows_changed('blast_hits')
             print(f"[BLAST] Saved {len(hits)} hits for consensus ID {consensus_id}")
             
             return blast_result_id
@@ -765,6 +774,7 @@ class SequenceDBManager:
         try:
             # Use unified delete_records to ensure Recycle Bin integration
             DatabaseManager.delete_records(conn, 'sequences', f"id = {sequence_id}")
+            self._rows_changed('sequences')
             print(f"[INFO] Deleted sequence ID {sequence_id} and moved to RecycleBin")
             return True
         except Exception as e:
@@ -782,6 +792,7 @@ class SequenceDBManager:
         try:
             # Use unified delete_records to ensure Recycle Bin integration
             DatabaseManager.delete_records(conn, 'consensus_sequences', f"id = {consensus_id}")
+            self._rows_changed('consensus_sequences')
             print(f"[INFO] Deleted consensus ID {consensus_id} and moved to RecycleBin")
             return True
         except Exception as e:
@@ -0,0 +1,118 @@
+"""
+Cached table row counts
+
+COUNT(*) on large InnoDB tables takes seconds, so views that only show row
+counts (the dashboard, schema summaries, security stats) read them from this
+cache instead of counting on every page load. Counts expire after a TTL and
+are adjusted in place by the write paths in DatabaseManagerFlask. When a
+MariaDB/MySQL count is missing or stale, the information_schema.TABLES
+estimate is used until the exact count has been refreshed in the background.
+"""
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def count_rows(cursor, db_type: str, table_name: str) -> int:
+    """Exact row count of one table"""
+    if db_type == 'sqlite':
+        cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+    else:
+        cursor.execute(f'SELECT COUNT(*) FROM `{table_name}`')
+    return int(cursor.fetchone()[0])
+
+
+def estimate_rows(cursor, db_type: str, tables: Iterable[str]) -> Dict[str, int]:
+    """
+    Row estimates that cost no table scan: information_schema.TABLES on
+    MariaDB/MySQL (InnoDB's sampled TABLE_ROWS). SQLite keeps no such
+    statistic for plain tables, so this returns nothing there.
+    """
+    tables = list(tables)
+    if db_type == 'sqlite' or not tables:
+        return {}
+    placeholders = ', '.join(['%s'] * len(tables))
+    cursor.execute(
+        f"SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+        f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})",
+        tables
+    )
+    return {name: int(rows or 0) for name, rows in cursor.fetchall()}
+
+
+class TableStatsCache:
+    """
+    Row counts keyed by (database, table).
+
+    Args:
+        ttl: Seconds an exact count is trusted before it is counted again
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._counts: Dict[Tuple, Dict[str, Dict[str, Any]]] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def connection_key(connection) -> Optional[Tuple]:
+        """Identify the database a connection points at, or None if it can't be told"""
+        pool = getattr(connection, '_pool', None)
+        if pool is not None and getattr(pool, 'db_path', None):
+            return ('sqlite', pool.db_path)
+        if pool is not None and getattr(pool, 'key', None):
+            return ('mysql',) + tuple(pool.key)
+        if isinstance(connection, sqlite3.Connection):
+            try:
+                row = connection.execute("PRAGMA database_list").fetchone()
+            except sqlite3.Error:
+                return None
+            return ('sqlite', row[2]) if row and row[2] else None
+        return None
+
+    def get(self, key: Tuple, table_name: str) -> Optional[Dict[str, Any]]:
+        """The cached entry ({'rows', 'estimated'}) if it has not expired"""
+        with self._lock:
+            entry = self._counts.get(key, {}).get(table_name)
+            if entry is None or time.monotonic() - entry['at'] > self.ttl:
+                return None
+            return {'rows': entry['rows'], 'estimated': entry['estimated']}
+
+    def set(self, key: Tuple, table_name: str, rows: int, estimated: bool = False):
+        with self._lock:
+            self._counts.setdefault(key, {})[table_name] = {
+                'rows': max(0, int(rows)), 'estimated': estimated, 'at': time.monotonic()
+            }
+
+    def adjust(self, key: Optional[Tuple], table_name: str, delta: int) -> Optional[int]:
+        """Apply a known change in row count; returns the new count if the table is cached"""
+        if key is None or not delta:
+            return None
+        with self._lock:
+            entry = self._counts.get(key, {}).get(table_name)
+            if entry is None:
+                return None
+            entry['rows'] = max(0, entry['rows'] + delta)
+            return entry['rows']
+
+    def invalidate(self, key: Optional[Tuple], table_name: str = None):
+        """Forget one table's count, or every count for the database"""
+        if key is None:
+            return
+        with self._lock:
+            if table_name is None:
+                self._counts.pop(key, None)
+            else:
+                self._counts.get(key, {}).pop(table_name, None)
+
+    def claim_refresh(self, key: Tuple, tables: Iterable[str]) -> List[str]:
+        """Mark tables as being recounted; returns those nobody else is already recounting"""
+        with self._lock:
+            claimed = [table for table in tables if (key, table) not in self._refreshing]
+            self._refreshing.update((key, table) for table in claimed)
+            return claimed
+
+    def release_refresh(self, key: Tuple, tables: Iterable[str]):
+        with self._lock:
+            self._refreshing.difference_update((key, table) for table in tables)
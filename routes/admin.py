@@ -3,7 +3,7 @@ Admin Routes for HaoXai
 Provides admin dashboard and management interfaces
 """
 
-from flask import Blueprint, render_template, request, session, redirect, url_for
+from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify
 from functools import wraps
 
 admin_bp = Blueprint("admin", __name__)
@@ -46,4 +46,64 @@ def system_settings():
     """System settings interface"""
     from flask import current_app
     version = current_app.config.get('VERSION', '1.0.0')
-    return render_template("admin/settings.html", version=version)
\ No newline at end of file
+    return render_template("admin/settings.html", version=version)
+
+@admin_bp.route("/pool-stats")
+@admin_required
+def pool_stats():
+    """Connection pool saturation, checkout and wait-time metrics"""
+    from database.db_manager_flask import DatabaseManagerFlask
+    return jsonify({'success': True, 'pools': DatabaseManagerFlask.pool_stats()})
+
+@admin_bp.route("/engine-stats")
+@admin_required
+def engine_stats():
+    """Chat model registry cache hits and model load times"""
+    from routes.chat import engine_registry
+    return jsonify({'success': True, 'engine_registry': engine_registry.stats()})
+
+def _row_index_context():
+    """Identifier and full-text indexes, schema graph and cursor of the session's database"""
+    from database.db_manager_flask import DatabaseManagerFlask
+    db_type = session.get('db_type')
+    db_path = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
+    if not db_type or not db_path:
+        raise ValueError("No database connected")
+    conn = DatabaseManagerFlask.get_connection(db_path, db_type)
+    cursor = conn.cursor()
+    graph = DatabaseManagerFlask.schema_graph(db_path, db_type, cursor)
+    indexes = {
+        'identifier_index': DatabaseManagerFlask.identifier_index(db_path, db_type),
+        'fulltext_index': DatabaseManagerFlask.fulltext_index(db_path, db_type),
+    }
+    return indexes, graph, conn
+
+@admin_bp.route("/identifier-index/rebuild", methods=["POST"])
+@admin_required
+def rebuild_identifier_index():
+    """
+    Re-index every table of the connected database (identifier and full-text
+    indexes). On MariaDB/MySQL this (re)creates the FULLTEXT indexes on the
+    user's tables, which is the only place they are created.
+    """
+    from database.db_manager_flask import DatabaseManagerFlask
+    try:
+        indexes, graph, conn = _row_index_context()
+        cursor = conn.cursor()
+        rebuilt = {name: index.rebuild(cursor, graph) for name, index in indexes.items()}
+        # FULLTEXT indexes are DDL on the user's tables
+        DatabaseManagerFlask.schema_changed(conn)
+        return jsonify({'success': True, **rebuilt})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@admin_bp.route("/identifier-index/check")
+@admin_required
+def check_identifier_index():
+    """Compare the identifier and full-text indexes with the connected database"""
+    try:
+        indexes, graph, conn = _row_index_context()
+        cursor = conn.cursor()
+        return jsonify({'success': True, **{name: index.check(cursor, graph) for name, index in indexes.items()}})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
@@ -132,6 +132,10 @@ def connect():
                     else:
                         print(f"[DEBUG] Database {db_path} already has security features")
                     
+                    # Load the chat models in the background so the first question doesn't wait
+                    from routes.chat import engine_registry
+                    engine_registry.warm_up(db_path, 'sqlite')
+                    
                     return jsonify({
                         'success': True,
                         'message': 'Connected to SQLite database',
@@ -194,6 +198,10 @@ def connect():
                     else:
                         print(f"[DEBUG] MySQL database {db_params['database']} already has security features")
                     
+                    # Load the chat models in the background so the first question doesn't wait
+                    from routes.chat import engine_registry
+                    engine_registry.warm_up(db_params, 'mysql')
+                    
                     return jsonify({
                         'success': True,
                         'message': 'Connected to MySQL database',
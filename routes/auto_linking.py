@@ -180,6 +180,7 @@ def create_link_table():
         
         cursor.execute(create_sql)
         conn.commit()
+        DatabaseManagerFlask.schema_changed(conn)
         
         return jsonify({
             'success': True,
@@ -543,6 +544,7 @@ def execute_linking():
                 errors.append(f"Row {source_id}→{target_id}: {str(e)}")
         
         conn.commit()
+        DatabaseManagerFlask.rows_changed(conn, link_table)
         
         # Create triggers if requested
         trigger_created = False
@@ -555,6 +557,8 @@ def execute_linking():
                     bidirectional_trigger, trigger_notes, source_fk, target_fk
                 )
                 print(f"[DEBUG] Triggers created: {trigger_created}")
+                if trigger_created:
+                    DatabaseManagerFlask.schema_changed(conn)
             except Exception as e:
                 # Handle privilege error gracefully
                 err_str = str(e)
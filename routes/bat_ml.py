@@ -9,11 +9,9 @@ import pickle
 import numpy as np
 import pandas as pd
 import sqlite3
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score
-from sklearn.preprocessing import LabelEncoder
-import re
+
+from utils.bat_trainer import (TrainingDataError, bat_training_jobs, clean_numeric, current_artifact_info,
+                               data_fingerprint, load_bat_artifact, prepare_training_data, save_bat_artifact)
 
 bat_ml_bp = Blueprint('bat_ml', __name__, url_prefix='/bat-ml')
 
@@ -107,92 +105,15 @@ def get_taxonomic_classification(genus, species):
     
     return classification
 
-def clean_numeric(value):
-    """
-    Strict numeric parsing for bat measurements.
-    """
-    if pd.isna(value):
-        return np.nan
-    
-    if isinstance(value, (int, float)):
-        return float(value)
-    
-    # Convert to string and clean
-    s = str(value).strip().lower()
-    if not s or s in ['-', 'none', 'nan', 'unknown', '--', 'null']:
-        return np.nan
-        
+def save_bat_models(bat_models, fingerprint=None):
+    """Save trained bat models to disk as a new artifact version"""
     try:
-        # Check for simple numeric strings first
-        if re.match(r'^-?\d+(\.\d+)?$', s):
-            return float(s)
-            
-        # Handle ranges (43.1-43.5) by taking average
-        if '-' in s:
-            parts = s.split('-')
-            if len(parts) == 2:
-                # If it looks like box info (e.g. 43-14) or IDs, skip the "smart" decimal conversion
-                # which was causing fake weights like 43.14. 
-                # REAL ranges are usually close (e.g. 43.1-43.5). 
-                # If they differ by > 20%, it's probably an ID, not a measurement.
-                p1 = re.sub(r'[^-0-9.]', '', parts[0])
-                p2 = re.sub(r'[^-0-9.]', '', parts[1])
-                if p1 and p2:
-                    v1, v2 = float(p1), float(p2)
-                    if abs(v1 - v2) < (max(v1, v2) * 0.2): # Within 20%
-                        return (v1 + v2) / 2
-            return np.nan # Assume junk if not a close range
-            
-        # Clean common garbage characters
-        s_clean = re.sub(r'[^-0-9.]', '', s)
-        if s_clean:
-            return float(s_clean)
-    except:
-        pass
-        
-    return np.nan
-
-def save_bat_models(bat_models):
-    """Save trained bat models to disk"""
-    try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        models_dir = os.path.join(os.path.dirname(current_dir), 'models')
-        os.makedirs(models_dir, exist_ok=True)
-        
-        # Save each model component
-        with open(os.path.join(models_dir, 'bat_genus_model.pkl'), 'wb') as f:
-            pickle.dump(bat_models['genus_model'], f)
-        
-        with open(os.path.join(models_dir, 'bat_species_model.pkl'), 'wb') as f:
-            pickle.dump(bat_models['species_model'], f)
-        
-        with open(os.path.join(models_dir, 'bat_genus_encoder.pkl'), 'wb') as f:
-            pickle.dump(bat_models['genus_encoder'], f)
-        
-        with open(os.path.join(models_dir, 'bat_species_encoder.pkl'), 'wb') as f:
-            pickle.dump(bat_models['species_encoder'], f)
-        
-        with open(os.path.join(models_dir, 'bat_feature_encoders.pkl'), 'wb') as f:
-            pickle.dump(bat_models['feature_encoders'], f)
-        
-        # Save metadata
-        metadata = {
-            'features': bat_models['features'],
-            'genus_accuracy': bat_models['genus_accuracy'],
-            'species_accuracy': bat_models['species_accuracy'],
-            'genus_classes': bat_models['genus_classes'],
-            'species_classes': bat_models['species_classes'],
-            'sample_count': bat_models['sample_count']
-        }
-        
-        with open(os.path.join(models_dir, 'bat_model_metadata.pkl'), 'wb') as f:
-            pickle.dump(metadata, f)
-        
-        print(f"DEBUG: Bat models saved to {models_dir}")
+        info = save_bat_artifact(bat_models, fingerprint)
+        print(f"DEBUG: Bat models saved as version {info['version']}")
         
         # Update global cache
         global BAT_MODEL_CACHE
-        BAT_MODEL_CACHE = bat_models
+        BAT_MODEL_CACHE = dict(bat_models, version=info['version'], fingerprint=fingerprint)
         
         return True
         
@@ -210,6 +131,17 @@ def load_bat_models():
             # print("DEBUG: Returning bat models from memory cache")
             return BAT_MODEL_CACHE
             
+        # Current versioned artifact first, memory-mapped
+        try:
+            bat_models = load_bat_artifact()
+        except Exception as e:
+            print(f"DEBUG: Failed to load bat model artifact: {e}. Trying legacy pickles...")
+            bat_models = None
+        if bat_models:
+            print(f"DEBUG: Bat models loaded from artifact version {bat_models['version']}")
+            BAT_MODEL_CACHE = bat_models
+            return bat_models
+        
         # Use absolute path for reliability
         current_dir = os.path.dirname(os.path.abspath(__file__))
         models_dir = os.path.join(os.path.dirname(current_dir), 'models')
@@ -350,165 +282,39 @@ def train_bat_model():
                 'message': 'Please select a custom training file (.xlsx) first.'
             })
         
-        # Standardize column names
-        df.columns = [str(col).strip() for col in df.columns]
-        
-        # Map BATHOST specific columns to expected model features
-        column_mapping = {
-            'forearm_mm': 'FA',
-            'tibia_mm': 'TIB',
-            'weight_g': 'W',
-            'sex': 'Sex',
-            'status': 'Status',
-            'Genus': 'genus',
-            'Species': 'species'
-        }
-        
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        
-        # 1. CLEANING CATEGORICAL DATA (Fix "Sphaerias " vs "Sphaerias")
-        for col in ['genus', 'species', 'Sex', 'Status']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.strip().str.title()
-                # Remove rows with placeholder text
-                df = df[~df[col].isin(['-', 'None', 'Nan', 'Unknown', 'nan', ''])]
-        
-        # 2. CLEANING NUMERIC DATA (Fix "43-14" -> nan, handle ranges correctly)
-        for col in ['FA', 'TIB', 'W']:
-            if col in df.columns:
-                df[col] = df[col].apply(clean_numeric)
-        
-        # 3. FILTERING
-        initial_count = len(df)
-        required_cols = ['genus', 'species', 'FA', 'TIB', 'W', 'Sex', 'Status']
-        
-        # Check if required columns actually exist
-        missing = [c for c in required_cols if c not in df.columns]
-        if missing:
-             # Last resort case-insensitive search
-             for m in missing:
-                 for col in df.columns:
-                     if col.lower() == m.lower():
-                         df = df.rename(columns={col: m})
-                         break
-        
-        # FINAL CHECK for required columns (especially for uploaded files)
-        re_missing = [c for c in required_cols if c not in df.columns]
-        if re_missing:
+        try:
+            clean_df = prepare_training_data(df)
+        except TrainingDataError as e:
             return jsonify({
                 'success': False,
-                'message': f'Uploaded file is missing required columns: {", ".join(re_missing)}'
+                'message': str(e)
             })
-
-        # Verify required columns exist before dropping NA
-        existing_required = [c for c in required_cols if c in df.columns]
-        clean_df = df.dropna(subset=existing_required).copy()
-        
-        # CREATE BINOMIAL TARGET early for filtering (ensures uniqueness across genera)
-        clean_df['binomial'] = clean_df['genus'] + "_" + clean_df['species']
-        
-        # REMOVE OUTLIERS (Strict filtering for accuracy)
-        if 'W' in clean_df.columns:
-            clean_df = clean_df[(clean_df['W'] > 0) & (clean_df['W'] < 300)]
-        if 'TIB' in clean_df.columns:
-            clean_df = clean_df[(clean_df['TIB'] > 0) & (clean_df['TIB'] < 300)]
-        if 'FA' in clean_df.columns:
-            clean_df = clean_df[(clean_df['FA'] > 0) & (clean_df['FA'] < 300)]
-
-        # ITERATIVE RARE CLASS FILTERING
-        # We MUST filter on 'binomial' to ensure species models have enough samples
-        # for EVERY unique genus-species combination.
-        for _ in range(2):
-            binomial_counts = clean_df['binomial'].value_counts()
-            valid_binomials = binomial_counts[binomial_counts >= 3].index
-            clean_df = clean_df[clean_df['binomial'].isin(valid_binomials)]
-            
-            genus_counts = clean_df['genus'].value_counts()
-            valid_genus = genus_counts[genus_counts >= 3].index
-            clean_df = clean_df[clean_df['genus'].isin(valid_genus)]
-        
-        print(f"DEBUG: Clean dataset: {len(clean_df)} records (from {initial_count} initial)")
-        print(f"DEBUG: Unique Genus: {clean_df['genus'].nunique()}, Unique Binomials: {clean_df['binomial'].nunique()}")
         
-        if len(clean_df) < 50:
+        # Training is deterministic, so the same data would give the same models
+        fingerprint = data_fingerprint(clean_df)
+        current = current_artifact_info()
+        existing_models = load_bat_models() if current and current.get('fingerprint') == fingerprint else None
+        if existing_models:
+            session['bat_models_loaded'] = True
             return jsonify({
-                'success': False,
-                'message': f'Insufficient clean data ({len(clean_df)} rows). Please check your Excel format.'
+                'success': True,
+                'message': 'Training data unchanged; using the models already trained on it',
+                'genus_accuracy': round(existing_models['genus_accuracy'] * 100, 2),
+                'species_accuracy': round(existing_models['species_accuracy'] * 100, 2),
+                'sample_count': existing_models['sample_count'],
+                'genus_classes': len(existing_models['genus_classes']),
+                'species_classes': len(existing_models['species_classes']),
+                'pre_trained': True
             })
         
-        # 4. ENCODING
-        feature_encoders = {}
-        for col in ['Sex', 'Status']:
-            le = LabelEncoder()
-            clean_df[col] = le.fit_transform(clean_df[col].astype(str))
-            feature_encoders[col] = le
-            
-        # Target encoders
-        genus_le = LabelEncoder()
-        binomial_le = LabelEncoder() # Use binomial for species model
-        y_genus = genus_le.fit_transform(clean_df['genus'])
-        y_binomial = binomial_le.fit_transform(clean_df['binomial'])
-        
-        # Hierarchical Encoding: Include Genus in Species features
-        clean_df['genus_enc'] = y_genus
-        
-        X_genus = clean_df[['FA', 'TIB', 'W', 'Sex', 'Status']]
-        X_species = clean_df[['FA', 'TIB', 'W', 'Sex', 'Status', 'genus_enc']]
-        
-        # 5. MODELING (Switching back to high-capacity RandomForest for reliability)
-        # 5. MODELING (High-capacity RandomForest for reliability)
-        print("DEBUG: Training Genus model (RandomForest)...")
-        # Training Genus model
-        genus_model = RandomForestClassifier(n_estimators=300, random_state=42, class_weight='balanced')
-        
-        X_train, X_test, y_g_train, y_g_test = train_test_split(
-            X_genus, y_genus, test_size=0.2, random_state=42, stratify=y_genus
-        )
-        genus_model.fit(X_train, y_g_train)
-        genus_acc = accuracy_score(y_g_test, genus_model.predict(X_test))
-        print(f"DEBUG: Genus Accuracy: {genus_acc:.4f}")
-        
-        print("DEBUG: Training Species model (RandomForest)...")
-        species_model = RandomForestClassifier(n_estimators=500, max_depth=None, random_state=42, class_weight='balanced')
-        
-        X_train_sp, X_test_sp, y_sp_train, y_sp_test = train_test_split(
-            X_species, y_binomial, test_size=0.2, random_state=42, stratify=y_binomial
-        )
-        species_model.fit(X_train_sp, y_sp_train)
-        species_acc = accuracy_score(y_sp_test, species_model.predict(X_test_sp))
-        print(f"DEBUG: Species Accuracy: {species_acc:.4f}")
-        
-        # 6. ASSEMBLE MODEL OBJECT
-        bat_models = {
-            'genus_model': genus_model,
-            'species_model': species_model,
-            'genus_encoder': genus_le,
-            'species_encoder': binomial_le, # Stores binomials
-            'feature_encoders': feature_encoders,
-            'features': ['FA', 'TIB', 'W', 'Sex', 'Status'],
-            'genus_accuracy': float(genus_acc),
-            'species_accuracy': float(species_acc),
-            'genus_classes': genus_le.classes_.tolist(),
-            'species_classes': binomial_le.classes_.tolist(),
-            'sample_count': int(len(clean_df))
-        }
-        
-        # Save models to disk for persistence
-        save_success = save_bat_models(bat_models)
-        if save_success:
-            print("DEBUG: Models saved successfully to disk")
-        
+        # Fit in the background; progress arrives in the job's room
+        job = bat_training_jobs.submit(session.get('user_id'), clean_df, fingerprint, on_trained=save_bat_models)
         return jsonify({
             'success': True,
-            'message': 'Bat identification models trained successfully!',
-            'genus_accuracy': round(genus_acc * 100, 2),
-            'species_accuracy': round(species_acc * 100, 2),
-            'sample_count': len(clean_df),
-            'genus_classes': len(genus_le.classes_),
-            'species_classes': len(binomial_le.classes_),
-            'pre_trained': False
+            'message': f'Training started on {len(clean_df)} clean records',
+            'job_id': job.job_id,
+            'room': job.room,
+            'sample_count': len(clean_df)
         })
         
     except Exception as e:
@@ -517,6 +323,14 @@ def train_bat_model():
             'message': f'Training failed: {str(e)}'
         })
 
+@bat_ml_bp.route('/train-jobs/<job_id>', methods=['GET'])
+def bat_training_job_status(job_id):
+    """Current progress of a training job, for clients that missed the SocketIO events"""
+    job = bat_training_jobs.get(job_id, session.get('user_id'))
+    if job is None:
+        return jsonify({'success': False, 'message': 'Training job not found'}), 404
+    return jsonify({'success': True, 'job': job.snapshot()})
+
 def convert_numpy_types(obj):
     """Convert numpy types to JSON serializable types"""
     if isinstance(obj, np.integer):
@@ -729,9 +543,149 @@ def prepare_features(data, feature_encoders):
         # Return a safe fallback vector if everything fails
         return np.array([[0.0, 0.0, 0.0, 0, 0]])
 
+# Column names a batch sheet may use for each input feature, tried in order
+BATCH_FEATURE_COLUMNS = {
+    'Sex': ['Sex', 'sex'],
+    'Status': ['Status', 'status'],
+    'FA': ['FA', 'fa', 'FA (mm)', 'forearm_mm'],
+    'TIB': ['TIB', 'tib', 'TIB (mm)', 'tibia_mm'],
+    'W': ['W', 'w', 'W (g)', 'weight_g'],
+}
+
+MISSING_INDICATORS = ['--', '', '-', 'NA', 'N/A', 'null', 'None']
+
+def read_batch_file(uploaded_file):
+    """Read an uploaded CSV/Excel batch sheet into a DataFrame"""
+    filename = uploaded_file.filename.lower()
+    if filename.endswith('.csv'):
+        return pd.read_csv(uploaded_file, dtype=str, keep_default_na=False)
+    return pd.read_excel(uploaded_file, dtype=str, keep_default_na=False)
+
+def batch_feature_frame(records):
+    """
+    Input strings of a batch, one row per record with columns Sex, Status,
+    FA, TIB and W. records is a list of JSON records or an uploaded sheet;
+    missing cells become empty strings.
+    """
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+    df = df.rename(columns=lambda col: str(col).strip())
+    frame = pd.DataFrame(index=df.index)
+    for feature, aliases in BATCH_FEATURE_COLUMNS.items():
+        values = pd.Series('', index=df.index, dtype=object)
+        for alias in aliases:
+            if alias in df.columns:
+                column = df[alias].where(df[alias].notna(), '').astype(str)
+                values = values.where(values != '', column)
+        frame[feature] = values
+    return frame.reset_index(drop=True)
+
+def batch_validation_errors(frame):
+    """
+    Per-row error message for measurements that are missing or given as
+    ranges (missing for rows that can be predicted), same rules as /predict-bat
+    """
+    measurements = ['FA', 'TIB', 'W']
+    stripped = {col: frame[col].str.strip() for col in measurements}
+    missing = (stripped['FA'] == '') | (stripped['TIB'] == '') | (stripped['W'] == '')
+    problematic = {col: stripped[col].isin(MISSING_INDICATORS) | frame[col].str.contains('-', regex=False)
+                   for col in measurements}
+    has_range = frame['FA'].str.contains('-', regex=False) | frame['TIB'].str.contains('-', regex=False) | \
+        frame['W'].str.contains('-', regex=False)
+    field = np.select([problematic['FA'], problematic['TIB']], ['FA (forearm)', 'TIB (tibia)'], 'W (weight)')
+    issue = np.where(has_range, 'contains range', 'missing')
+    any_problem = problematic['FA'] | problematic['TIB'] | problematic['W']
+    errors = pd.Series(None, index=frame.index, dtype=object)
+    errors[any_problem] = pd.Series(field, index=frame.index)[any_problem] + ' ' + \
+        pd.Series(issue, index=frame.index)[any_problem]
+    errors[missing] = 'Missing required measurement fields'
+    return errors
+
+def _numeric_column(values):
+    """Vectorized clean_numeric: plain numbers are parsed at once, the rest one by one"""
+    stripped = values.str.strip()
+    plain = stripped.str.fullmatch(r'-?\d+(\.\d+)?')
+    numbers = pd.to_numeric(stripped.where(plain), errors='coerce')
+    if (~plain).any():
+        numbers[~plain] = values[~plain].map(clean_numeric)
+    return numbers.fillna(0.0).to_numpy(dtype=float)
+
+def _encoded_column(values, encoder):
+    """Vectorized LabelEncoder lookup; unknown labels map to the first class, as in prepare_features"""
+    lookup = {label: code for code, label in enumerate(encoder.classes_)}
+    return values.str.strip().str.title().map(lookup).fillna(0).to_numpy(dtype=float)
+
+def prepare_feature_matrix(frame, feature_encoders):
+    """
+    Feature matrix for a batch, in the training order ['FA', 'TIB', 'W', 'Sex', 'Status'].
+    Row for row the same values prepare_features builds for a single record.
+    """
+    return np.column_stack([
+        _numeric_column(frame['FA']),
+        _numeric_column(frame['TIB']),
+        _numeric_column(frame['W']),
+        _encoded_column(frame['Sex'], feature_encoders['Sex']),
+        _encoded_column(frame['Status'], feature_encoders['Status']),
+    ])
+
+def predict_bat_matrix(bat_models, X_base):
+    """
+    Genus and species predictions for every row of a feature matrix, with
+    one predict_proba call per model. Returns one 'predictions' dict per row.
+    """
+    genus_model = bat_models['genus_model']
+    species_model = bat_models['species_model']
+    genus_names = np.asarray(bat_models['genus_encoder'].classes_)
+    binomial_names = np.asarray(bat_models['species_encoder'].classes_)
+
+    # 1. Predict Genus first
+    genus_proba = genus_model.predict_proba(X_base)
+    genus_col = genus_proba.argmax(axis=1)
+    genus_pred_encoded = genus_model.classes_[genus_col]
+
+    # 2. Predict Species (Base + Genus_Enc)
+    X_species = np.column_stack([X_base, genus_pred_encoded])
+    species_proba = species_model.predict_proba(X_species)
+    species_col = species_proba.argmax(axis=1)
+
+    rows = np.arange(len(X_base))
+    genus_conf = (genus_proba[rows, genus_col] * 100).tolist()
+    species_conf = (species_proba[rows, species_col] * 100).tolist()
+    top_genus_idx = np.argsort(genus_proba, axis=1)[:, -3:][:, ::-1]
+    top_species_idx = np.argsort(species_proba, axis=1)[:, -3:][:, ::-1]
+    top_genus_names = genus_names[genus_model.classes_[top_genus_idx]].tolist()
+    top_genus_conf = (np.take_along_axis(genus_proba, top_genus_idx, axis=1) * 100).tolist()
+    top_binomials = binomial_names[species_model.classes_[top_species_idx]].tolist()
+    top_species_conf = (np.take_along_axis(species_proba, top_species_idx, axis=1) * 100).tolist()
+    genus_preds = genus_names[genus_pred_encoded].tolist()
+    binomial_preds = binomial_names[species_model.classes_[species_col]].tolist()
+
+    predictions = []
+    for i in range(len(X_base)):
+        # Decode binomial (Genus_Species)
+        species_pred = binomial_preds[i].split('_')[1] if '_' in binomial_preds[i] else binomial_preds[i]
+        predictions.append({
+            'genus': str(genus_preds[i]),
+            'species': str(species_pred),
+            'genus_confidence': genus_conf[i],
+            'species_confidence': species_conf[i],
+            'top_genus_predictions': [
+                {'name': name, 'confidence': conf}
+                for name, conf in zip(top_genus_names[i], top_genus_conf[i])
+            ],
+            'top_species_predictions': [
+                {'name': b_name.split('_')[1] if '_' in b_name else b_name, 'confidence': conf}
+                for b_name, conf in zip(top_binomials[i], top_species_conf[i])
+            ],
+            'classification': get_taxonomic_classification(genus_preds[i], species_pred)
+        })
+    return predictions
+
 @bat_ml_bp.route('/predict-bat-batch', methods=['POST'])
 def predict_bat_batch():
-    """Predict bat genus and species for multiple records"""
+    """
+    Predict bat genus and species for multiple records.
+    Accepts a JSON array of records or an uploaded CSV/Excel sheet ('file').
+    """
     try:
         print(f"DEBUG: Bat batch prediction request received")
         
@@ -743,155 +697,57 @@ def predict_bat_batch():
                 'message': 'No trained bat models found. Please train the model first.'
             })
         
-        genus_model = bat_models['genus_model']
-        species_model = bat_models['species_model']
-        le_genus = bat_models['genus_encoder']
-        le_species = bat_models['species_encoder']
-        feature_encoders = bat_models['feature_encoders']
+        # Get batch data from the uploaded sheet or the JSON body
+        uploaded_file = request.files.get('file')
+        if uploaded_file and uploaded_file.filename:
+            batch_data = read_batch_file(uploaded_file)
+        else:
+            batch_data = request.get_json(silent=True)
+            if not batch_data or not isinstance(batch_data, list):
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid batch data format. Expected array of records.'
+                })
         
-        # Get batch data from request
-        batch_data = request.get_json()
-        if not batch_data or not isinstance(batch_data, list):
-            return jsonify({
-                'success': False,
-                'message': 'Invalid batch data format. Expected array of records.'
-            })
+        frame = batch_feature_frame(batch_data)
+        errors = batch_validation_errors(frame)
+        valid = errors.isna().to_numpy()
+        input_records = frame.to_dict(orient='records')
+        
+        # Clean, encode and predict every valid row at once
+        predictions = []
+        if valid.any():
+            X_base = prepare_feature_matrix(frame[valid], bat_models['feature_encoders'])
+            predictions = predict_bat_matrix(bat_models, X_base)
+        
+        model_info = {
+            'genus_accuracy': float(bat_models['genus_accuracy'] * 100),
+            'species_accuracy': float(bat_models['species_accuracy'] * 100),
+            'training_samples': int(bat_models['sample_count'])
+        }
         
         results = []
-        
-        for record in batch_data:
-            try:
-                # Extract and validate input data
-                sex = str(record.get('Sex', ''))
-                status = str(record.get('Status', ''))
-                fa = str(record.get('FA', ''))
-                tib = str(record.get('TIB', ''))
-                weight = str(record.get('W', ''))
-                
-                input_data = {'Sex': sex, 'Status': status, 'FA': fa, 'TIB': tib, 'W': weight}
-                
-                # Validate required fields - only require measurements, sex/status can be missing
-                if not all([fa.strip(), tib.strip(), weight.strip()]):
-                    results.append({
-                        'success': False,
-                        'message': 'Missing required measurement fields',
-                        'input_data': input_data
-                    })
-                    continue
-                
-                # Check for missing values or ranges in measurements only
-                missing_indicators = ['--', '', '-', 'NA', 'N/A', 'null', 'None']
-                
-                def is_problematic_value(value):
-                    value = value.strip()
-                    # Check for missing values
-                    if value in missing_indicators:
-                        return True
-                    # Check for ranges (any dash in measurement)
-                    if '-' in value and value.count('-') >= 1:
-                        return True
-                    return False
-                
-                if (is_problematic_value(fa) or is_problematic_value(tib) or is_problematic_value(weight)):
-                    # Determine which field has the issue
-                    if is_problematic_value(fa):
-                        field = "FA (forearm)"
-                    elif is_problematic_value(tib):
-                        field = "TIB (tibia)"
-                    else:
-                        field = "W (weight)"
-                    
-                    # Check if it's a range or missing
-                    if '-' in fa and fa.count('-') >= 1:
-                        issue = "contains range"
-                    elif '-' in tib and tib.count('-') >= 1:
-                        issue = "contains range"
-                    elif '-' in weight and weight.count('-') >= 1:
-                        issue = "contains range"
-                    else:
-                        issue = "missing"
-                    
-                    results.append({
-                        'success': False,
-                        'message': f'{field} {issue}',
-                        'input_data': input_data
-                    })
-                    continue
-                
-                # 1. Prepare base features
-                X_base = prepare_features(input_data, feature_encoders)
-                
-                # 2. Predict Genus first
-                genus_pred_encoded = genus_model.predict(X_base)[0]
-                genus_proba = genus_model.predict_proba(X_base)[0]
-                genus_pred = le_genus.inverse_transform([genus_pred_encoded])[0]
-                
-                # 3. Predict Species (Base + Genus_Enc)
-                X_species = np.append(X_base, [[genus_pred_encoded]], axis=1)
-                species_pred_encoded = species_model.predict(X_species)[0]
-                species_proba = species_model.predict_proba(X_species)[0]
-                
-                # Decode binomial
-                binomial_pred = le_species.inverse_transform([species_pred_encoded])[0]
-                species_pred = binomial_pred.split('_')[1] if '_' in binomial_pred else binomial_pred
-                
-                # Get top genus predictions
-                top_genus_idx = np.argsort(genus_proba)[-3:][::-1]
-                top_genus = [
-                    {
-                        'name': le_genus.inverse_transform([idx])[0],
-                        'confidence': float(genus_proba[idx] * 100)
-                    }
-                    for idx in top_genus_idx
-                ]
-                
-                # Get top species predictions (binomials -> species)
-                top_species_idx = np.argsort(species_proba)[-3:][::-1]
-                top_species = []
-                for idx in top_species_idx:
-                    b_name = le_species.inverse_transform([idx])[0]
-                    s_name = b_name.split('_')[1] if '_' in b_name else b_name
-                    top_species.append({
-                        'name': s_name,
-                        'confidence': float(species_proba[idx] * 100)
-                    })
-                
-                # Get taxonomic classification
-                classification = get_taxonomic_classification(genus_pred, species_pred)
-                
-                result = {
+        prediction_iter = iter(predictions)
+        for input_data, is_valid, error in zip(input_records, valid, errors):
+            if is_valid:
+                results.append({
                     'success': True,
-                    'predictions': {
-                        'genus': str(genus_pred),
-                        'species': str(species_pred),
-                        'genus_confidence': float(genus_proba[genus_pred_encoded] * 100),
-                        'species_confidence': float(species_proba[species_pred_encoded] * 100),
-                        'top_genus_predictions': top_genus,
-                        'top_species_predictions': top_species,
-                        'classification': classification
-                    },
+                    'predictions': next(prediction_iter),
                     'input_features': input_data,
-                    'model_info': {
-                        'genus_accuracy': float(bat_models['genus_accuracy'] * 100),
-                        'species_accuracy': float(bat_models['species_accuracy'] * 100),
-                        'training_samples': int(bat_models['sample_count'])
-                    }
-                }
-                
-                results.append(convert_numpy_types(result))
-                
-            except Exception as e:
+                    'model_info': model_info
+                })
+            else:
                 results.append({
                     'success': False,
-                    'message': f'Prediction failed: {str(e)}',
-                    'input_data': record
+                    'message': error,
+                    'input_data': input_data
                 })
         
         return jsonify({
             'success': True,
             'results': results,
-            'total_records': len(batch_data),
-            'successful_predictions': len([r for r in results if r.get('success', False)])
+            'total_records': len(results),
+            'successful_predictions': int(valid.sum())
         })
         
     except Exception as e:
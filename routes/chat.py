@@ -5,6 +5,7 @@ Natural language queries about virology data
 import sqlite3
 import os
 import json
+import time
 import re
 import pandas as pd
 import io
@@ -17,6 +18,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 from ml_trainer import DatabaseTrainer
 from master_sql_trainer import MasterSQLTrainer
 from master_python_trainer import MasterPythonTrainer
+from model_registry import ModelRegistry
+from utils.training_jobs import training_jobs
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/chat')
 
@@ -127,6 +130,65 @@ def get_intelligence_engine():
     
     return IntelligenceEngine(db_config, db_type)
 
+def load_engine_models(db_config, db_type='sqlite'):
+    """Load the statistical and master models IntelligenceEngine uses (slow: unpickles every model)"""
+    models = {
+        'trainer': None,
+        'models_loaded': False,
+        'master_sql_trainer': None,
+        'master_python_trainer': None,
+        'master_models_loaded': False,
+    }
+    
+    # Initialize Statistical trainer
+    try:
+        models['trainer'] = DatabaseTrainer(db_config, db_type)
+        models['models_loaded'] = models['trainer'].load_models()
+        if models['models_loaded']:
+            print("✅ Statistical models loaded successfully")
+        else:
+            print("ℹ️ No trained models available - using rule-based approach")
+    except Exception as e:
+        print(f"⚠️ Error loading Statistical models: {e}")
+        models['trainer'] = None
+    
+    # Initialize Master SQL trainer
+    try:
+        models['master_sql_trainer'] = MasterSQLTrainer(db_config, db_type)
+        sql_loaded = models['master_sql_trainer'].load_master_sql_models()
+        if sql_loaded:
+            print("✅ Master SQL models loaded successfully")
+            models['master_models_loaded'] = True
+        else:
+            print("ℹ️ No Master SQL models available")
+    except Exception as e:
+        print(f"⚠️ Error loading Master SQL models: {e}")
+        models['master_sql_trainer'] = None
+    
+    # Initialize Master Python trainer
+    try:
+        models['master_python_trainer'] = MasterPythonTrainer(db_config, db_type)
+        python_loaded = models['master_python_trainer'].load_master_python_models()
+        if python_loaded:
+            print("✅ Master Python models loaded successfully")
+            models['master_models_loaded'] = True
+        else:
+            print("ℹ️ No Master Python models available")
+    except Exception as e:
+        print(f"⚠️ Error loading Master Python models: {e}")
+        models['master_python_trainer'] = None
+    
+    if models['master_models_loaded']:
+        print("🚀 Master Engine models loaded successfully!")
+    elif models['models_loaded']:
+        print("🧠 Enhanced Statistical models loaded successfully!")
+    else:
+        print("ℹ️ Using basic rule-based approach")
+    return models
+
+# Loaded models are shared by every IntelligenceEngine for the same database
+engine_registry = ModelRegistry(load_engine_models)
+
 class IntelligenceEngine:
     """Local Research Intelligence - FREE, dynamically queries any connected database with Statistical enhancement"""
     
@@ -134,62 +196,37 @@ class IntelligenceEngine:
         self.db_config = db_config
         self.db_type = db_type
         self.schema_cache = None
-        self.trainer = None
-        self.models_loaded = False
-        self.master_sql_trainer = None
-        self.master_python_trainer = None
-        self.master_models_loaded = False
         
-        # Initialize Statistical trainer
-        try:
-            self.trainer = DatabaseTrainer(db_config, db_type)
-            self.models_loaded = self.trainer.load_models()
-            if self.models_loaded:
-                print("✅ Statistical models loaded successfully")
-            else:
-                print("ℹ️ No trained models available - using rule-based approach")
-        except Exception as e:
-            print(f"⚠️ Error loading Statistical models: {e}")
-            self.trainer = None
-        
-        # Initialize Master SQL trainer
-        try:
-            self.master_sql_trainer = MasterSQLTrainer(db_config, db_type)
-            sql_loaded = self.master_sql_trainer.load_master_sql_models()
-            if sql_loaded:
-                print("✅ Master SQL models loaded successfully")
-                self.master_models_loaded = True
-            else:
-                print("ℹ️ No Master SQL models available")
-        except Exception as e:
-            print(f"⚠️ Error loading Master SQL models: {e}")
-            self.master_sql_trainer = None
-        
-        # Initialize Master Python trainer
-        try:
-            self.master_python_trainer = MasterPythonTrainer(db_config, db_type)
-            python_loaded = self.master_python_trainer.load_master_python_models()
-            if python_loaded:
-                print("✅ Master Python models loaded successfully")
-                self.master_models_loaded = True
-            else:
-                print("ℹ️ No Master Python models available")
-        except Exception as e:
-            print(f"⚠️ Error loading Master Python models: {e}")
-            self.master_python_trainer = None
-        
-        if self.master_models_loaded:
-            print("🚀 Master Engine models loaded successfully!")
-        elif self.models_loaded:
-            print("🧠 Enhanced Statistical models loaded successfully!")
-        else:
-            print("ℹ️ Using basic rule-based approach")
+        # Models come from the process-wide registry; only the first request per database loads them
+        models = engine_registry.get(db_config, db_type)
+        self.trainer = models['trainer']
+        self.models_loaded = models['models_loaded']
+        self.master_sql_trainer = models['master_sql_trainer']
+        self.master_python_trainer = models['master_python_trainer']
+        self.master_models_loaded = models['master_models_loaded']
     
     def get_connection(self):
         """Get database connection"""
         from database.db_manager_flask import DatabaseManagerFlask
         return DatabaseManagerFlask.get_connection(self.db_config, self.db_type)
     
+    def _schema_graph(self, cursor):
+        """Columns, keys and FK graph of the connected database, cached across requests"""
+        from database.db_manager_flask import DatabaseManagerFlask
+        return DatabaseManagerFlask.schema_graph(self.db_config, self.db_type, cursor)
+    
+    def _table_columns(self, cursor, table_name):
+        """Column names of a table in SELECT * order"""
+        columns = self._schema_graph(cursor).columns.get(table_name)
+        if columns is not None:
+            return columns
+        # Not in the cached graph (e.g. created since it was built)
+        if self.db_type == 'sqlite':
+            cursor.execute(f'PRAGMA table_info("{table_name}")')
+            return [c[1] for c in cursor.fetchall()]
+        cursor.execute(f'DESCRIBE `{table_name}`')
+        return [c[0] for c in cursor.fetchall()]
+    
     def _find_numeric_sample_id(self, cursor, string_sample_id):
         """Find numeric sample_id by searching screening_results for string IDs"""
         try:
@@ -222,155 +259,133 @@ class IntelligenceEngine:
             print(f"DEBUG: Error finding numeric sample_id for {string_sample_id}: {e}")
             return None
     
-    def _build_recursive_fk_profile(self, cursor, table_name, record_id, id_column):
-        """Build profile using recursive FK traversal across multiple tables"""
+    def _build_recursive_fk_profile(self, cursor, table_name, record_id, id_column,
+                                    max_depth=4, row_budget=500, time_budget=2.0):
+        """
+        Build profile by following FK relationships breadth-first across multiple tables.
+        
+        Every level is fetched with one WHERE col IN (...) query per related
+        (table, column) instead of one query per record. Each table is expanded
+        once, from up to 3 of its records. When row_budget rows have been read
+        or time_budget seconds have passed, the profile gathered so far is
+        returned with 'partial' set.
+        """
         profile = {
             'main_record': {},
             'discovered_data': {},
             'fk_paths': [],
-            'summary': []
+            'summary': [],
+            'partial': False
         }
         
         try:
             print(f"DEBUG: Building recursive FK profile for {table_name}.{id_column} = {record_id}")
+            deadline = time.monotonic() + time_budget
             
-            # Initialize recursive traversal state
-            self.visited_tables = set()
-            self.discovered_paths = []
-            self.max_depth = 4  # Prevent infinite loops
-            
-            # Start recursive traversal
-            result = self._recursive_traverse(cursor, table_name, record_id, id_column, depth=0)
-            
-            if result:
-                profile['main_record'] = result['record']
-                profile['discovered_data'] = result['related_data']
-                profile['fk_paths'] = self.discovered_paths
-                profile['summary'] = self._build_recursive_summary(result['related_data'])
-            
-        except Exception as e:
-            print(f"DEBUG: Error in recursive traversal: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        return profile
-    
-    def _recursive_traverse(self, cursor, table_name, record_id, id_column, depth):
-        """Recursively traverse FK relationships"""
-        if depth >= self.max_depth or table_name in self.visited_tables:
-            print(f"DEBUG: Max depth reached or table {table_name} already visited at depth {depth}")
-            return None
-        
-        self.visited_tables.add(table_name)
-        print(f"DEBUG: Traversing {table_name} at depth {depth} with ID {record_id}")
-        
-        result = {
-            'record': {},
-            'related_data': {},
-            'relationships': {}
-        }
-        
-        try:
-            # Get the main record
             main_record = self._get_record_by_id(cursor, table_name, id_column, record_id)
             if not main_record:
                 print(f"DEBUG: No record found for {table_name}.{id_column} = {record_id}")
-                return result
-            
-            result['record'] = main_record
-            print(f"DEBUG: Found main record in {table_name}")
+                return profile
+            profile['main_record'] = main_record
             
-            # Get all FK relationships for this table
-            fk_relationships = self._get_foreign_key_relationships(table_name, cursor)
-            print(f"DEBUG: Found {len(fk_relationships)} FK relationships for {table_name}")
+            rows_read = 1
+            visited_tables = {table_name}
+            frontier = [(table_name, main_record)]
+            seen_rows = {}
             
-            # Follow each FK relationship
-            for fk in fk_relationships:
-                relationship_data = self._follow_fk_relationship(cursor, main_record, fk, depth)
-                if relationship_data:
-                    table_key = f"{fk['to_table']}_data" if fk['type'] == 'forward' else f"{fk['from_table']}_data"
-                    result['related_data'][table_key] = relationship_data
-                    result['relationships'][table_key] = {
-                        'type': fk['type'],
-                        'path': f"{table_name}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']}",
-                        'data': relationship_data
-                    }
+            for depth in range(max_depth):
+                if not frontier:
+                    break
+                
+                # 1. Collect the keys every node at this depth needs, per (table, column)
+                lookups = []   # (fk, related table, column, value)
+                wanted = {}    # (related table, column) -> set of values
+                for node_table, record in frontier:
+                    for fk in self._get_foreign_key_relationships(node_table, cursor):
+                        if fk['type'] == 'forward':
+                            related_table, column, value = fk['to_table'], fk['to_column'], record.get(fk['from_column'])
+                        else:
+                            related_table, column, value = fk['from_table'], fk['from_column'], record.get(fk['to_column'])
+                        if not value:
+                            continue
+                        lookups.append((fk, related_table, column, value))
+                        wanted.setdefault((related_table, column), set()).add(value)
+                
+                # 2. One IN query per (table, column)
+                fetched = {}
+                for (related_table, column), values in wanted.items():
+                    if rows_read >= row_budget or time.monotonic() > deadline:
+                        profile['partial'] = True
+                        break
+                    # At most 10 rows per key, as the per-record queries returned
+                    rows = self._fetch_rows_in(cursor, related_table, column, list(values),
+                                               row_budget - rows_read, per_value=10)
+                    rows_read += len(rows)
+                    by_value = {}
+                    for row in rows:
+                        by_value.setdefault(str(row.get(column)), []).append(row)
+                    fetched[(related_table, column)] = by_value
+                
+                # 3. Hand the rows back to the nodes that asked for them
+                next_frontier = []
+                for fk, related_table, column, value in lookups:
+                    if (related_table, column) not in fetched:
+                        continue
+                    rows = fetched[(related_table, column)].get(str(value), [])[:10]
+                    if not rows:
+                        continue
+                    
+                    table_key = f"{related_table}_data"
+                    seen = seen_rows.setdefault(table_key, set())
+                    new_rows = [row for row in rows if tuple(row.values()) not in seen]
+                    seen.update(tuple(row.values()) for row in new_rows)
+                    profile['discovered_data'].setdefault(table_key, []).extend(new_rows)
                     
-                    # Record the FK path
                     path = f"{'→' if fk['type'] == 'forward' else '←'} {fk['from_table']}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']}"
-                    self.discovered_paths.append(path)
+                    profile['fk_paths'].append(path)
                     
-                    # Recursively traverse related tables
-                    if isinstance(relationship_data, list) and relationship_data:
-                        for related_record in relationship_data[:3]:  # Limit to prevent explosion
-                            related_id = self._extract_record_id(related_record, fk['to_table'] if fk['type'] == 'forward' else fk['from_table'])
-                            if related_id:
-                                # Use the correct ID column for the next table
-                                next_id_column = self._get_primary_key_column(cursor, fk['to_table'] if fk['type'] == 'forward' else fk['from_table'])
-                                recursive_result = self._recursive_traverse(
-                                    cursor, 
-                                    fk['to_table'] if fk['type'] == 'forward' else fk['from_table'], 
-                                    related_id, 
-                                    next_id_column, 
-                                    depth + 1
-                                )
-                                if recursive_result:
-                                    # Merge recursive results
-                                    self._merge_recursive_results(result, recursive_result, table_key)
+                    if related_table not in visited_tables:
+                        visited_tables.add(related_table)
+                        next_frontier.extend((related_table, row) for row in rows[:3])  # Limit to prevent explosion
+                
+                if profile['partial']:
+                    print(f"DEBUG: FK profile budget reached at depth {depth} ({rows_read} rows)")
+                    break
+                frontier = next_frontier
             
-            print(f"DEBUG: Completed traversal of {table_name} at depth {depth}")
+            profile['summary'] = self._build_recursive_summary(profile['discovered_data'])
             
         except Exception as e:
-            print(f"DEBUG: Error traversing {table_name}: {e}")
+            print(f"DEBUG: Error in recursive traversal: {e}")
             import traceback
             traceback.print_exc()
         
-        return result
+        return profile
     
-    def _follow_fk_relationship(self, cursor, main_record, fk, depth):
-        """Follow a single FK relationship"""
+    def _fetch_rows_in(self, cursor, table_name, column, values, limit, per_value=10, chunk_size=500):
+        """Rows of table_name whose column is one of values, as dicts (at most limit rows, per_value per value)"""
+        q = '"' if self.db_type == 'sqlite' else '`'
+        p = '?' if self.db_type == 'sqlite' else '%s'
+        columns = self._table_columns(cursor, table_name)
+        records = []
+        
         try:
-            q = '"' if self.db_type == 'sqlite' else '`'
-            p = '?' if self.db_type == 'sqlite' else '%s'
-            
-            if fk['type'] == 'forward':
-                # Forward: current_table → related_table
-                fk_value = main_record.get(fk['from_column'])
-                if not fk_value:
-                    return None
-                
-                print(f"DEBUG: Following forward FK: {fk['from_table']}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']} (value: {fk_value})")
-                
-                cursor.execute(f"SELECT * FROM {q}{fk['to_table']}{q} WHERE {q}{fk['to_column']}{q} = {p} LIMIT 10", (fk_value,))
-                rows = cursor.fetchall()
-                
-            elif fk['type'] == 'reverse':
-                # Reverse: related_table → current_table
-                pk_value = main_record.get(fk['to_column'])
-                if not pk_value:
-                    return None
-                
-                print(f"DEBUG: Following reverse FK: {fk['from_table']}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']} (value: {pk_value})")
-                
-                cursor.execute(f"SELECT * FROM {q}{fk['from_table']}{q} WHERE {q}{fk['from_column']}{q} = {p} LIMIT 10", (pk_value,))
-                rows = cursor.fetchall()
-            
-            if rows:
-                # Get column names dynamically
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{fk["to_table"] if fk["type"] == "forward" else fk["from_table"]}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{fk["to_table"] if fk["type"] == "forward" else fk["from_table"]}`')
-                    columns = [c[0] for c in cursor.fetchall()]
-                
-                return [dict(zip(columns, row)) for row in rows]
-            
-            return []
-            
+            for start in range(0, len(values), chunk_size):
+                chunk = values[start:start + chunk_size]
+                placeholders = ', '.join([p] * len(chunk))
+                cursor.execute(f"""
+                    SELECT * FROM (
+                        SELECT t.*, ROW_NUMBER() OVER (PARTITION BY t.{q}{column}{q}) AS _row_no
+                        FROM {q}{table_name}{q} t WHERE t.{q}{column}{q} IN ({placeholders})
+                    ) ranked WHERE _row_no <= {int(per_value)} LIMIT {int(limit) - len(records)}
+                """, chunk)
+                records.extend(dict(zip(columns, row)) for row in cursor.fetchall())
+                if len(records) >= limit:
+                    break
         except Exception as e:
-            print(f"DEBUG: Error following FK {fk['from_table']}.{fk['from_column']} → {fk['to_table']}.{fk['to_column']}: {e}")
-            return []
+            print(f"DEBUG: Error fetching {table_name}.{column} IN (...): {e}")
+        
+        return records
     
     def _extract_record_id(self, record, table_name):
         """Extract the primary ID from a record"""
@@ -390,29 +405,15 @@ class IntelligenceEngine:
     def _get_primary_key_column(self, cursor, table_name):
         """Get the primary key column name for a table"""
         try:
-            if self.db_type == 'sqlite':
-                cursor.execute(f'PRAGMA table_info("{table_name}")')
-                columns = cursor.fetchall()
-                for col in columns:
-                    if col[5] == 1:  # PK flag
-                        return col[1]
-            else:  # MySQL/MariaDB
-                cursor.execute(f'DESCRIBE `{table_name}`')
-                columns = cursor.fetchall()
-                for col in columns:
-                    if col[3] == 'PRI':  # Primary Key
-                        return col[0]
+            pk = self._schema_graph(cursor).primary_key(table_name)
+            if pk:
+                return pk
             
             # Fallback to common primary key names
             common_pks = ['id', 'sample_id', 'location_id', 'host_id', 'taxonomy_id', 'screening_id', 'storage_id']
             
             # Check if any common PK exists in the table
-            if self.db_type == 'sqlite':
-                cursor.execute(f'PRAGMA table_info("{table_name}")')
-                columns = [c[1] for c in cursor.fetchall()]
-            else:
-                cursor.execute(f'DESCRIBE `{table_name}`')
-                columns = [c[0] for c in cursor.fetchall()]
+            columns = self._table_columns(cursor, table_name)
             
             for pk in common_pks:
                 if pk in columns:
@@ -425,17 +426,6 @@ class IntelligenceEngine:
             print(f"DEBUG: Error getting PK column for {table_name}: {e}")
             return 'id'  # Fallback
     
-    def _merge_recursive_results(self, current_result, recursive_result, table_key):
-        """Merge recursive results into current result"""
-        if recursive_result and recursive_result.get('related_data'):
-            for related_table, related_data in recursive_result['related_data'].items():
-                if related_table not in current_result['related_data']:
-                    current_result['related_data'][related_table] = related_data
-                else:
-                    # Merge data if table already exists
-                    if isinstance(current_result['related_data'][related_table], list) and isinstance(related_data, list):
-                        current_result['related_data'][related_table].extend(related_data)
-    
     def _build_recursive_summary(self, related_data):
         """Build summary from recursively discovered relationships"""
         summary_parts = []
@@ -484,7 +474,8 @@ class IntelligenceEngine:
             'fk_debug_info': {
                 'paths_used': recursive_profile.get('fk_paths', []),
                 'summary': recursive_profile.get('summary', []),
-                'discovered_data': discovered_data
+                'discovered_data': discovered_data,
+                'partial': recursive_profile.get('partial', False)
             }
         }
     
@@ -560,12 +551,7 @@ class IntelligenceEngine:
                 row = cursor.fetchone()
                 if row:
                     # Get column names dynamically
-                    if self.db_type == 'sqlite':
-                        cursor.execute(f'PRAGMA table_info("{table_name}")')
-                        columns = [c[1] for c in cursor.fetchall()]
-                    else:
-                        cursor.execute(f'DESCRIBE `{table_name}`')
-                        columns = [c[0] for c in cursor.fetchall()]
+                    columns = self._table_columns(cursor, table_name)
                     record = dict(zip(columns, row))
                     print(f"DEBUG: Found record in {table_name} via {col_to_try}: {record_id}")
                     return record
@@ -592,12 +578,7 @@ class IntelligenceEngine:
             row = cursor.fetchone()
             if row:
                 # Get column names dynamically
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{fk["to_table"]}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{fk["to_table"]}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, fk["to_table"])
                 return dict(zip(columns, row))
         
         except Exception as e:
@@ -621,12 +602,7 @@ class IntelligenceEngine:
             rows = cursor.fetchall()
             if rows:
                 # Get column names dynamically
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{fk["from_table"]}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{fk["from_table"]}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, fk["from_table"])
                 return [dict(zip(columns, row)) for row in rows]
         
         except Exception as e:
@@ -1778,12 +1754,7 @@ class IntelligenceEngine:
             row = cursor.fetchone()
             if row:
                 # Get column names dynamically
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{table_name}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{table_name}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, table_name)
                 return dict(zip(columns, row))
         except Exception as e:
             print(f"Error getting record {table_name}.{id_column} = {record_id}: {e}")
@@ -1806,12 +1777,7 @@ class IntelligenceEngine:
             row = cursor.fetchone()
             if row:
                 # Get column names dynamically
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{fk["to_table"]}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{fk["to_table"]}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, fk["to_table"])
                 return dict(zip(columns, row))
         
         except Exception as e:
@@ -1835,12 +1801,7 @@ class IntelligenceEngine:
             rows = cursor.fetchall()
             if rows:
                 # Get column names dynamically
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{fk["from_table"]}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{fk["from_table"]}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, fk["from_table"])
                 return [dict(zip(columns, row)) for row in rows]
         
         except Exception as e:
@@ -2505,61 +2466,39 @@ class IntelligenceEngine:
         occurrences = []
         
         try:
-            # Get all tables
-            if self.db_type == 'sqlite':
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                all_tables = [t[0] for t in cursor.fetchall()]
-            else:
-                cursor.execute("SHOW TABLES")
-                all_tables = [t[0] for t in cursor.fetchall()]
+            graph = self._schema_graph(cursor)
             
-            for table_name in all_tables:
+            # Indexed tables are answered from the identifier index, the rest are scanned
+            index, hits = None, {}
+            try:
+                index = self._identifier_index(cursor, graph)
+                for table_name, column, pk in index.lookup(search_value):
+                    hits.setdefault(table_name, []).append(pk)
+                indexed_tables = set(index.indexable_tables(graph))
+            except Exception as e:
+                print(f"Identifier index unavailable, scanning tables: {e}")
+                indexed_tables = set()
+            
+            for table_name in graph.tables:
                 if table_name.lower() in ['sqlite_sequence', 'sqlite_stat1', 'recyclebin']:
                     continue
                 
                 try:
-                    # Get table structure
-                    if self.db_type == 'sqlite':
-                        cursor.execute(f'PRAGMA table_info("{table_name}")')
-                        columns = [c[1] for c in cursor.fetchall()]
+                    columns = graph.columns.get(table_name, [])
+                    if table_name in indexed_tables:
+                        rows = index.fetch_rows(cursor, graph, table_name, hits.get(table_name, []),
+                                                values=[search_value])
                     else:
-                        cursor.execute(f'DESCRIBE `{table_name}`')
-                        columns = [c[0] for c in cursor.fetchall()]
-                    
-                    # Search for the value in all text columns
-                    text_columns = []
-                    for col in columns:
-                        col_lower = col.lower()
-                        if any(keyword in col_lower for keyword in ['id', 'code', 'name', 'sample', 'host', 'location', 'type']):
-                            text_columns.append(col)
-                    
-                    if not text_columns:
-                        text_columns = columns[:3]  # Use first 3 columns as fallback
+                        rows = self._scan_table_for_value(cursor, table_name, columns, search_value)
                     
-                    # Build search query
-                    conditions = []
-                    params = []
-                    q = '"' if self.db_type == 'sqlite' else '`'
-                    p = '?' if self.db_type == 'sqlite' else '%s'
-                    
-                    for col in text_columns:
-                        conditions.append(f"{q}{col}{q} = {p}")
-                        params.append(search_value)
-                    
-                    if conditions:
-                        sql = f"SELECT * FROM {q}{table_name}{q} WHERE " + " OR ".join(conditions) + " LIMIT 10"
-                        cursor.execute(sql, params)
-                        rows = cursor.fetchall()
-                        
-                        if rows:
-                            for row in rows:
-                                row_data = dict(zip(columns, row))
-                                occurrences.append({
-                                    'table': table_name,
-                                    'data': row_data,
-                                    'columns': columns
-                                })
-                                print(f"DEBUG: Found {search_value} in {table_name}")
+                    for row in rows:
+                        row_data = dict(zip(columns, row))
+                        occurrences.append({
+                            'table': table_name,
+                            'data': row_data,
+                            'columns': columns
+                        })
+                        print(f"DEBUG: Found {search_value} in {table_name}")
                 
                 except Exception as e:
                     print(f"Error searching table {table_name}: {e}")
@@ -2570,6 +2509,34 @@ class IntelligenceEngine:
         
         return occurrences
     
+    def _identifier_index(self, cursor, graph, tables=None):
+        """Identifier index of the connected database, brought up to date for tables (all by default)"""
+        from database.db_manager_flask import DatabaseManagerFlask
+        index = DatabaseManagerFlask.identifier_index(self.db_config, self.db_type)
+        index.ensure_current(cursor, graph, tables)
+        return index
+    
+    def _fulltext_index(self, cursor, graph):
+        """Full-text index of the connected database, brought up to date"""
+        from database.db_manager_flask import DatabaseManagerFlask
+        index = DatabaseManagerFlask.fulltext_index(self.db_config, self.db_type)
+        index.ensure_current(cursor, graph)
+        return index
+    
+    def _scan_table_for_value(self, cursor, table_name, columns, search_value):
+        """Up to 10 rows of a table with search_value in an identifier-like column, by full scan"""
+        from database.identifier_index import identifier_columns
+        text_columns = identifier_columns(columns)
+        if not text_columns:
+            return []
+        
+        q = '"' if self.db_type == 'sqlite' else '`'
+        p = '?' if self.db_type == 'sqlite' else '%s'
+        conditions = [f"{q}{col}{q} = {p}" for col in text_columns]
+        sql = f"SELECT * FROM {q}{table_name}{q} WHERE " + " OR ".join(conditions) + " LIMIT 10"
+        cursor.execute(sql, [search_value] * len(conditions))
+        return cursor.fetchall()
+    
     def _build_complete_fk_chain(self, cursor, starting_points, original_value):
         """Build complete FK chain starting from all occurrences"""
         visited = set()
@@ -2684,12 +2651,7 @@ class IntelligenceEngine:
                 
                 if rows:
                     # Get column names
-                    if self.db_type == 'sqlite':
-                        cursor.execute(f'PRAGMA table_info("{to_table}")')
-                        columns = [c[1] for c in cursor.fetchall()]
-                    else:
-                        cursor.execute(f'DESCRIBE `{to_table}`')
-                        columns = [c[0] for c in cursor.fetchall()]
+                    columns = self._table_columns(cursor, to_table)
                     
                     return [dict(zip(columns, row)) for row in rows]
             
@@ -2713,12 +2675,7 @@ class IntelligenceEngine:
             
             if rows:
                 # Get column names
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{to_table}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{to_table}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, to_table)
                 
                 return [dict(zip(columns, row)) for row in rows]
             
@@ -2911,76 +2868,13 @@ class IntelligenceEngine:
         relationships = []
         
         try:
-            if self.db_type == 'sqlite':
-                # Forward relationships (table references other tables)
-                cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
-                forward_fks = cursor.fetchall()
-                
-                for fk in forward_fks:
-                    relationships.append({
-                        'table': fk[2],      # Referenced table
-                        'from': fk[3],       # Column in current table
-                        'to': fk[4],         # Column in referenced table
-                        'direction': 'forward'
-                    })
-                
-                # Backward relationships (other tables reference this table)
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                all_tables = [t[0] for t in cursor.fetchall()]
-                
-                for other_table in all_tables:
-                    if other_table != table_name and other_table.lower() not in ['sqlite_sequence', 'sqlite_stat1', 'recyclebin']:
-                        cursor.execute(f'PRAGMA foreign_key_list("{other_table}")')
-                        other_fks = cursor.fetchall()
-                        for fk in other_fks:
-                            if fk[2] == table_name:  # References our table
-                                relationships.append({
-                                    'table': other_table,  # Table that references us
-                                    'from': fk[3],         # Column in other table
-                                    'to': fk[4],           # Column in our table
-                                    'direction': 'backward'
-                                })
-            else:
-                # MySQL/MariaDB implementation
-                # Forward relationships
-                cursor.execute("""
-                    SELECT 
-                        REFERENCED_TABLE_NAME, 
-                        COLUMN_NAME, 
-                        REFERENCED_COLUMN_NAME
-                    FROM information_schema.KEY_COLUMN_USAGE
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND TABLE_NAME = %s 
-                    AND REFERENCED_TABLE_NAME IS NOT NULL
-                """, (table_name,))
-                
-                for row in cursor.fetchall():
-                    relationships.append({
-                        'table': row[0],
-                        'from': row[1],
-                        'to': row[2],
-                        'direction': 'forward'
-                    })
-                
-                # Backward relationships
-                cursor.execute("""
-                    SELECT 
-                        TABLE_NAME, 
-                        COLUMN_NAME, 
-                        REFERENCED_COLUMN_NAME
-                    FROM information_schema.KEY_COLUMN_USAGE
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND REFERENCED_TABLE_NAME = %s
-                """, (table_name,))
-                
-                for row in cursor.fetchall():
-                    relationships.append({
-                        'table': row[0],
-                        'from': row[1],
-                        'to': row[2],
-                        'direction': 'backward'
-                    })
-                    
+            for fk in self._schema_graph(cursor).relationships(table_name, skip_system=True):
+                relationships.append({
+                    'table': fk['table'],        # Referenced table (forward) or table that references us (backward)
+                    'from': fk['from'],          # FK column
+                    'to': fk['to'],              # Referenced column
+                    'direction': fk['direction']
+                })
         except Exception as e:
             print(f"Error getting FK relationships for {table_name}: {e}")
         
@@ -2993,12 +2887,7 @@ class IntelligenceEngine:
             p = '?' if self.db_type == 'sqlite' else '%s'
             
             # Find the ID column
-            if self.db_type == 'sqlite':
-                cursor.execute(f'PRAGMA table_info("{table_name}")')
-                columns = [c[1] for c in cursor.fetchall()]
-            else:
-                cursor.execute(f'DESCRIBE `{table_name}`')
-                columns = [c[0] for c in cursor.fetchall()]
+            columns = self._table_columns(cursor, table_name)
             
             # Try different ID columns
             id_columns = ['id', 'sample_id', 'sample_code', 'Id', 'Sample_Id', 'Sample_Code']
@@ -3040,12 +2929,7 @@ class IntelligenceEngine:
             rows = cursor.fetchall()
             
             if rows:
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'PRAGMA table_info("{table_name}")')
-                    columns = [c[1] for c in cursor.fetchall()]
-                else:
-                    cursor.execute(f'DESCRIBE `{table_name}`')
-                    columns = [c[0] for c in cursor.fetchall()]
+                columns = self._table_columns(cursor, table_name)
                 
                 return [dict(zip(columns, row)) for row in rows]
             
@@ -3126,76 +3010,28 @@ class IntelligenceEngine:
         """Get foreign key relationships for a table"""
         relationships = []
         try:
-            if self.db_type == 'sqlite':
-                cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
-                fks = cursor.fetchall()
-                # PRAGMA returns: id, seq, table, from, to, on_update, on_delete, match
-                for fk in fks:
-                    relationships.append({
-                        'id': fk[0],
-                        'seq': fk[1],
-                        'type': 'forward',   # Forward relationship
-                        'from_table': table_name,     # Current table
-                        'to_table': fk[2],            # The referenced table
-                        'from_column': fk[3],         # Column in current table
-                        'to_column': fk[4]            # Column in referenced table
-                    })
-                
-                # Also check for tables that reference this table (reverse FKs)
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-                all_tables = [t[0] for t in cursor.fetchall()]
-                
-                for other_table in all_tables:
-                    if other_table != table_name:
-                        cursor.execute(f'PRAGMA foreign_key_list("{other_table}")')
-                        other_fks = cursor.fetchall()
-                        for fk in other_fks:
-                            if fk[2] == table_name:  # References our main table
-                                relationships.append({
-                                    'type': 'reverse',  # Reverse relationship
-                                    'from_table': other_table,    # The table that references us
-                                    'to_table': table_name,        # Our main table
-                                    'from_column': fk[3],         # Column in other table
-                                    'to_column': fk[4]            # Column in our table
-                                })
-            else:  # MariaDB/MySQL
-                # Forward FKs
-                cursor.execute("""
-                    SELECT 
-                        REFERENCED_TABLE_NAME, 
-                        COLUMN_NAME, 
-                        REFERENCED_COLUMN_NAME
-                    FROM information_schema.KEY_COLUMN_USAGE
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND TABLE_NAME = %s 
-                    AND REFERENCED_TABLE_NAME IS NOT NULL
-                """, (table_name,))
-                for row in cursor.fetchall():
-                    relationships.append({
-                        'type': 'forward',   # Forward relationship
-                        'from_table': table_name,     # Current table
-                        'to_table': row[0],            # Referenced table
-                        'from_column': row[1],         # Column in current table
-                        'to_column': row[2]            # Column in referenced table
-                    })
-                
-                # Reverse FKs
-                cursor.execute("""
-                    SELECT 
-                        TABLE_NAME, 
-                        COLUMN_NAME, 
-                        REFERENCED_COLUMN_NAME
-                    FROM information_schema.KEY_COLUMN_USAGE
-                    WHERE TABLE_SCHEMA = DATABASE() 
-                    AND REFERENCED_TABLE_NAME = %s
-                """, (table_name,))
-                for row in cursor.fetchall():
+            graph = self._schema_graph(cursor)
+            for fk in graph.forward.get(table_name, []):
+                relationship = {
+                    'type': 'forward',   # Forward relationship
+                    'from_table': table_name,     # Current table
+                    'to_table': fk['table'],      # The referenced table
+                    'from_column': fk['from'],    # Column in current table
+                    'to_column': fk['to']         # Column in referenced table
+                }
+                if 'id' in fk:
+                    relationship.update(id=fk['id'], seq=fk['seq'])
+                relationships.append(relationship)
+            
+            # Also the tables that reference this table (reverse FKs)
+            for fk in graph.reverse.get(table_name, []):
+                if fk['table'] != table_name:
                     relationships.append({
                         'type': 'reverse',  # Reverse relationship
-                        'from_table': row[0],            # Table that references us
-                        'to_table': table_name,        # Our main table
-                        'from_column': row[1],         # Column in other table
-                        'to_column': row[2]            # Column in our table
+                        'from_table': fk['table'],    # The table that references us
+                        'to_table': table_name,       # Our main table
+                        'from_column': fk['from'],    # Column in other table
+                        'to_column': fk['to']         # Column in our table
                     })
         except Exception as e:
             print(f"Error getting FKs for {table_name}: {e}")
@@ -4040,6 +3876,37 @@ I can help you automatically fill Excel files with sample data from the database
             # Check if this looks like a SourceId search (contains special characters)
             has_sourceid_pattern = any(any(c in keyword for c in '<>:-') for keyword in keywords)
             
+            # Exact SourceId matches come from the identifier index where the table is indexed
+            sourceid_index, sourceid_hits = None, {}
+            if has_sourceid_pattern:
+                try:
+                    graph = self._schema_graph(cursor)
+                    sourceid_tables = [t for t in graph.tables if 'source_id' in graph.columns.get(t, [])]
+                    sourceid_index = self._identifier_index(cursor, graph, sourceid_tables)
+                    for keyword in keywords:
+                        if any(c in keyword for c in '<>:-'):
+                            for table_name, column, pk in sourceid_index.lookup(keyword, columns=['source_id']):
+                                sourceid_hits.setdefault(table_name, []).append(pk)
+                except Exception as e:
+                    print(f"Identifier index unavailable, scanning for SourceId: {e}")
+                    sourceid_index = None
+            
+            # Other keywords are answered by the full-text index, ranked. Uncovered tables use
+            # LIKE, and so do covered ones for keywords too short for the index to match
+            text_keywords = [keyword for keyword in keywords if not any(c in keyword for c in '<>:-')]
+            fulltext_results, fulltext_tables, short_keywords = [], set(), []
+            if text_keywords:
+                try:
+                    graph = self._schema_graph(cursor)
+                    fulltext = self._fulltext_index(cursor, graph)
+                    fulltext_results = fulltext.search(cursor, graph, text_keywords)
+                    fulltext_tables = fulltext.covered_tables(graph)
+                    short_keywords = fulltext.dropped_keywords(text_keywords)
+                    print(f"Full-text search found matches in {len(fulltext_results)} tables")
+                except Exception as e:
+                    print(f"Full-text search unavailable, using LIKE: {e}")
+                    fulltext_results, fulltext_tables, short_keywords = [], set(), []
+            
             for table_name, table_info in schema.items():
                 if table_name.lower() in ['sqlite_sequence', 'sqlite_stat1', 'recyclebin']:
                     continue
@@ -4078,8 +3945,13 @@ I can help you automatically fill Excel files with sample data from the database
                             sql = f"SELECT * FROM {q}{table_name}{q} WHERE " + " OR ".join(conditions) + " LIMIT 10"
                             
                             try:
-                                cursor.execute(sql, params)
-                                rows = cursor.fetchall()
+                                if sourceid_index is not None and sourceid_index.pk_column(table_name):
+                                    rows = sourceid_index.fetch_rows(cursor, self._schema_graph(cursor), table_name,
+                                                                     sourceid_hits.get(table_name, []),
+                                                                     values=params, columns=['source_id'])
+                                else:
+                                    cursor.execute(sql, params)
+                                    rows = cursor.fetchall()
                                 
                                 if rows:
                                     all_results.append({
@@ -4094,6 +3966,12 @@ I can help you automatically fill Excel files with sample data from the database
                                 print(f"Exact SourceId search error in {table_name}: {e}")
                                 continue
                     
+                    like_keywords = keywords
+                    if table_name in fulltext_tables:
+                        if not short_keywords:
+                            continue
+                        like_keywords = short_keywords
+                    
                     # Fallback to fuzzy matching for other searches
                     text_columns = []
                     for col in columns:
@@ -4109,7 +3987,7 @@ I can help you automatically fill Excel files with sample data from the database
                     conditions = []
                     params = []
                     
-                    for keyword in keywords:
+                    for keyword in like_keywords:
                         # Skip exact SourceId patterns here (already handled above)
                         if not any(c in keyword for c in '<>:-'):
                             for col in text_columns:
@@ -4146,8 +4024,12 @@ I can help you automatically fill Excel files with sample data from the database
             
             conn.close()
             
-            # Sort results: exact matches first, then fuzzy
-            all_results.sort(key=lambda x: (0 if x['match_type'] == 'exact_sourceid' else 1, x['table']))
+            all_results.extend(fulltext_results)
+            
+            # Sort results: exact matches first, then full-text matches, then fuzzy; by table within each.
+            # Full-text scores only rank rows within their own table, so they don't order the tables
+            match_order = {'exact_sourceid': 0, 'fulltext': 1}
+            all_results.sort(key=lambda x: (match_order.get(x['match_type'], 2), x['table']))
             
             return all_results if all_results else None
             
@@ -4222,7 +4104,7 @@ I can help you automatically fill Excel files with sample data from the database
             
             # Add separator if there are also fuzzy matches
             if fuzzy_matches:
-                response_parts.append(f"\n🔍 **Similar matches (fuzzy search):**")
+                response_parts.append("\n🔍 **Similar matches:**")
         
         # Process fuzzy matches
         for result in fuzzy_matches:
@@ -4261,6 +4143,8 @@ I can help you automatically fill Excel files with sample data from the database
         # If no exact matches, show the old format
         if not exact_matches:
             response_parts = [f"🔍 Found matches using dynamic search for: {', '.join(keywords[:3])}"]
+            if any(result['match_type'] == 'fulltext' for result in results):
+                response_parts.append("_Best matches first within each table_")
             
             # Show other results first
             for table_name, rows, columns in other_results:
@@ -4631,6 +4515,8 @@ def ask_question():
 @chat_bp.route('/upload_excel', methods=['POST'])
 def upload_excel():
     """Handle Excel file upload for auto-filling missing data"""
+    from database.sample_enrichment import ENRICH_SYNC_ROWS, enrich_sheet, enrichment_jobs, find_sample_id_column
+    
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -4643,33 +4529,12 @@ def upload_excel():
     
     try:
         # Read Excel file
-        df = pd.read_excel(file)
+        df = pd.read_csv(file) if file.filename.endswith('.csv') else pd.read_excel(file)
         print(f"DEBUG: Excel file read successfully. Columns: {list(df.columns)}")
         print(f"DEBUG: Excel file has {len(df)} rows")
         
         # Find sample ID column dynamically
-        sample_id_column = None
-        
-        # Look for any column that might contain sample IDs
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            # Check if column name suggests it contains IDs
-            if any(id_word in col_lower for id_word in ['sample', 'id', 'code', 'identifier']):
-                # Check if this column actually contains data that looks like sample IDs
-                sample_data = df[col].dropna().head(5)
-                if len(sample_data) > 0:
-                    # Check if values look like sample IDs (contain letters and numbers)
-                    for val in sample_data:
-                        val_str = str(val).strip()
-                        if (any(c.isalpha() for c in val_str) and 
-                            any(c.isdigit() for c in val_str) and
-                            len(val_str) > 3):  # Reasonable sample ID length
-                            sample_id_column = col
-                            print(f"DEBUG: Dynamically found sample ID column: {col}")
-                            print(f"DEBUG: Sample values: {list(sample_data)}")
-                            break
-                if sample_id_column:
-                    break
+        sample_id_column = find_sample_id_column(df)
         
         if not sample_id_column:
             print(f"DEBUG: No sample ID column found. Available columns: {list(df.columns)}")
@@ -4678,276 +4543,42 @@ def upload_excel():
                 'message': f'I can help you upload Excel files! Your file should have a column named "SampleId", "Sample ID", or similar. Available columns: {list(df.columns)}'
             })
         
-        # Extract sample IDs
-        sample_ids = [str(sid).strip() for sid in df[sample_id_column].dropna()]
-        print(f"DEBUG: Found {len(sample_ids)} sample IDs: {sample_ids[:5]}...")
+        sample_count = int(df[sample_id_column].notna().sum())
+        print(f"DEBUG: Found {sample_count} sample IDs in column {sample_id_column}")
         
-        if not sample_ids:
+        if not sample_count:
             return jsonify({'error': 'No sample IDs found in the file'}), 400
         
-        # Process each sample and enrich data using simple, reliable approach
-        smart_ai = get_intelligence_engine()
-        enriched_data = []
-        
-        # Get all columns from the original Excel file (except sample ID column)
-        excel_columns = [col for col in df.columns if col != sample_id_column]
-        print(f"DEBUG: Excel columns to process: {excel_columns}")
+        db_type = session.get('db_type', 'sqlite')
+        if db_type == 'sqlite':
+            db_config = session.get('db_path') or current_app.config.get('DATABASE_PATH')
+        else:
+            db_config = session.get('db_params')
         
-        for sample_id in sample_ids[:50]:  # Process up to 50 samples
-            try:
-                print(f"DEBUG: ===== Processing sample ID: {sample_id} =====")
-                
-                # Start with sample ID
-                row_data = {'SampleId': sample_id}
-                
-                # Use the proven _build_sample_profile approach
-                print(f"DEBUG: Building sample profile for {sample_id}...")
-                
-                conn = smart_ai.get_connection()
-                cursor = conn.cursor()
-                
-                # Build comprehensive sample profile
-                profile = smart_ai._build_sample_profile(cursor, sample_id)
-                
-                conn.close()
-                
-                # Debug: Show what was found in the profile
-                print(f"DEBUG: Profile results for {sample_id}:")
-                print(f"  - Sample info: {'✓' if profile['sample_info'] else '✗'}")
-                if profile['sample_info']:
-                    print(f"    Fields: {list(profile['sample_info'].keys())}")
-                print(f"  - Host info: {'✓' if profile['host_info'] else '✗'}")
-                if profile['host_info']:
-                    print(f"    Fields: {list(profile['host_info'].keys())}")
-                print(f"  - Taxonomy info: {'✓' if profile.get('taxonomy_info') else '✗'}")
-                if profile.get('taxonomy_info'):
-                    print(f"    Fields: {list(profile['taxonomy_info'].keys())}")
-                print(f"  - Location info: {'✓' if profile['location_info'] else '✗'}")
-                if profile['location_info']:
-                    print(f"    Fields: {list(profile['location_info'].keys())}")
-                print(f"  - Screening results: {len(profile['screening_results'])}")
-                print(f"  - Sequencing data: {len(profile['sequencing_data'])}")
-                print(f"  - Storage info: {'✓' if profile['storage_info'] else '✗'}")
-                if profile['storage_info']:
-                    print(f"    Fields: {list(profile['storage_info'].keys())}")
-                
-                # Check if we found any data at all
-                has_any_data = (
-                    profile['sample_info'] or 
-                    profile['host_info'] or 
-                    profile.get('taxonomy_info') or 
-                    profile['location_info'] or 
-                    profile['screening_results'] or 
-                    profile['sequencing_data'] or 
-                    profile['storage_info']
-                )
-                
-                if not has_any_data:
-                    print(f"DEBUG: ❌ NO DATA FOUND for {sample_id}")
-                    print(f"DEBUG: This sample may not exist in the database")
-                    # Still add the row with just SampleId so it shows up in results
-                    enriched_data.append(row_data)
-                    continue
-                
-                # Create a simple data dictionary from the profile
-                available_data = {}
-                
-                # Add all data from profile with clear field names
-                if profile['sample_info']:
-                    for key, value in profile['sample_info'].items():
-                        if value:
-                            available_data[key] = value
-                            available_data[f'sample_{key}'] = value
-                
-                if profile['host_info']:
-                    for key, value in profile['host_info'].items():
-                        if value:
-                            available_data[key] = value
-                            available_data[f'host_{key}'] = value
-                
-                if profile.get('taxonomy_info'):
-                    for key, value in profile['taxonomy_info'].items():
-                        if value:
-                            available_data[key] = value
-                            available_data[f'taxonomy_{key}'] = value
-                            # Special handling for scientific_name
-                            if key == 'scientific_name':
-                                available_data['species'] = value
-                
-                if profile['location_info']:
-                    for key, value in profile['location_info'].items():
-                        if value:
-                            available_data[key] = value
-                            available_data[f'location_{key}'] = value
-                            # Special handling for province
-                            if key == 'province':
-                                available_data['province'] = value
-                
-                if profile['screening_results']:
-                    for i, screening in enumerate(profile['screening_results']):
-                        for key, value in screening.items():
-                            if value and key not in ['screening_id', 'sample_id']:
-                                # Create field name with test type
-                                field_name = key
-                                available_data[field_name] = value
-                                available_data[f'screening_{key}'] = value
-                
-                if profile['storage_info']:
-                    for key, value in profile['storage_info'].items():
-                        if value and key not in ['table_source', 'sample_id']:
-                            available_data[key] = value
-                            available_data[f'storage_{key}'] = value
-                            # Special handling for rack_position
-                            if key == 'rack_position':
-                                available_data['rack_position'] = value
-                
-                print(f"DEBUG: Available data fields: {list(available_data.keys())}")
-                
-                # Match Excel columns to available data with enhanced accuracy
-                matches_found = 0
-                for excel_col in excel_columns:
-                    # Skip empty columns
-                    if pd.isna(excel_col) or str(excel_col).strip() == '':
-                        continue
-                    
-                    excel_col_original = str(excel_col).strip()
-                    excel_col_clean = excel_col_original.lower()
-                    
-                    print(f"DEBUG: Looking for: '{excel_col_original}'")
-                    
-                    # Enhanced field matching with priority order
-                    found_value = None
-                    found_source = None
-                    
-                    # Priority 1: Exact field name match
-                    if excel_col_clean in available_data:
-                        found_value = available_data[excel_col_clean]
-                        found_source = f"exact: {excel_col_clean}"
-                    
-                    # Priority 2: Case-insensitive exact match
-                    if not found_value:
-                        for key, value in available_data.items():
-                            if key.lower() == excel_col_clean and value:
-                                found_value = value
-                                found_source = f"case-insensitive: {key}"
-                                break
-                    
-                    # Priority 3: Special field mappings with high accuracy
-                    if not found_value:
-                        if excel_col_clean == 'scientific_name':
-                            # Look for scientific_name first, then species as fallback
-                            if 'scientific_name' in available_data:
-                                found_value = available_data['scientific_name']
-                                found_source = "special: scientific_name"
-                            elif 'species' in available_data:
-                                found_value = available_data['species']
-                                found_source = "special: species (fallback for scientific_name)"
-                        elif excel_col_clean == 'pan_corona':
-                            # Look for pan_corona specifically
-                            if 'pan_corona' in available_data:
-                                found_value = available_data['pan_corona']
-                                found_source = "special: pan_corona"
-                        elif excel_col_clean == 'province':
-                            if 'province' in available_data:
-                                found_value = available_data['province']
-                                found_source = "special: province"
-                        elif excel_col_clean == 'rack_position':
-                            # Combine rack and spot_position for rack_position
-                            if 'rack' in available_data and 'spot_position' in available_data:
-                                rack = available_data['rack']
-                                spot = available_data['spot_position']
-                                if rack and spot:
-                                    found_value = f"{rack}_{spot}"
-                                    found_source = "combined: rack + spot_position"
-                                elif rack:
-                                    found_value = rack
-                                    found_source = "partial: rack only"
-                            elif 'rack' in available_data:
-                                found_value = available_data['rack']
-                                found_source = "special: rack"
-                            elif 'spot_position' in available_data:
-                                found_value = available_data['spot_position']
-                                found_source = "special: spot_position"
-                    
-                    # Priority 4: Partial matching for field names containing the column name
-                    if not found_value:
-                        matches = []
-                        for key, value in available_data.items():
-                            if value and excel_col_clean in key.lower():
-                                # Calculate match score based on how close the names are
-                                key_lower = key.lower()
-                                if key_lower == excel_col_clean:
-                                    score = 100  # Perfect match (should have been caught above)
-                                elif key_lower.endswith(excel_col_clean):
-                                    score = 90  # Ends with column name
-                                elif key_lower.startswith(excel_col_clean):
-                                    score = 80  # Starts with column name
-                                elif excel_col_clean in key_lower:
-                                    score = 70  # Contains column name
-                                else:
-                                    score = 0
-                                
-                                if score > 0:
-                                    matches.append((score, key, value))
-                        
-                        # Sort by score and take the best match
-                        if matches:
-                            matches.sort(reverse=True)
-                            best_score, best_key, best_value = matches[0]
-                            found_value = best_value
-                            found_source = f"partial (score {best_score}): {best_key}"
-                    
-                    # Priority 5: Fuzzy matching for common field variations
-                    if not found_value:
-                        # Common field name variations
-                        field_variations = {
-                            'scientific_name': ['species', 'scientific_name', 'taxon_name', 'organism'],
-                            'pan_corona': ['pan_corona', 'corona', 'coronavirus'],
-                            'province': ['province', 'state', 'region', 'location'],
-                            'rack_position': ['rack_position', 'position', 'location', 'storage']
-                        }
-                        
-                        if excel_col_clean in field_variations:
-                            for variation in field_variations[excel_col_clean]:
-                                if variation in available_data:
-                                    found_value = available_data[variation]
-                                    found_source = f"fuzzy: {variation} (variation of {excel_col_clean})"
-                                    break
-                    
-                    if found_value:
-                        row_data[excel_col_original] = found_value
-                        matches_found += 1
-                        print(f"DEBUG: ✓ Found: {excel_col_original} = {found_value} ({found_source})")
-                    else:
-                        print(f"DEBUG: ❌ Not found: {excel_col_original}")
-                        # Show available fields for debugging
-                        available_fields = [k for k in available_data.keys() if excel_col_clean in k.lower()]
-                        if available_fields:
-                            print(f"DEBUG:    Similar fields available: {available_fields[:3]}")
-                
-                print(f"DEBUG: Sample {sample_id}: {matches_found}/{len(excel_columns)} columns matched")
-                enriched_data.append(row_data)
-                
-            except Exception as e:
-                print(f"DEBUG: Error processing sample {sample_id}: {str(e)}")
-                # Include error but still add the sample ID
-                row_data = {'SampleId': sample_id}
-                # Add any Excel columns that were processed before the error
-                for excel_col in excel_columns:
-                    if excel_col not in row_data and not pd.isna(excel_col):
-                        row_data[excel_col] = 'Error: ' + str(e)
-                enriched_data.append(row_data)
+        # Large sheets are enriched in the background; progress arrives in the job's room
+        if sample_count > ENRICH_SYNC_ROWS:
+            job = enrichment_jobs.submit(session.get('user_id'), df, sample_id_column, file.filename, db_config, db_type)
+            return jsonify({
+                'success': True,
+                'message': f'Found {sample_count} sample IDs. Filling the sheet in the background...',
+                'sample_count': sample_count,
+                'job_id': job.job_id,
+                'room': job.room
+            })
         
-        print(f"DEBUG: Processing complete. Enriched {len(enriched_data)} samples")
+        enriched, stats = enrich_sheet(df, sample_id_column, db_config, db_type)
+        enriched_data = enriched.astype(object).where(enriched.notna(), None).to_dict(orient='records')
+        print(f"DEBUG: Processing complete. {stats}")
         
         return jsonify({
             'success': True,
-            'message': f'Excel uploaded successfully! Found {len(sample_ids)} sample IDs and enriched {len(enriched_data)} with database data. Preview below shows first 5 rows - click "Download Results" to get the complete filled Excel file.',
-            'sample_count': len(sample_ids),
-            'enriched_count': len([d for d in enriched_data if 'Error' not in str(d)]),
+            'message': f'Excel uploaded successfully! Found {sample_count} sample IDs, matched {stats["matched_samples"]} in the database and filled {stats["filled_cells"]} empty cells. Preview below shows first 5 rows - click "Download Results" to get the complete filled Excel file.',
+            'sample_count': sample_count,
+            'enriched_count': stats['matched_samples'],
+            'filled_cells': stats['filled_cells'],
             'data': enriched_data,
             'preview': {
-                'headers': list(enriched_data[0].keys()) if enriched_data else [],
+                'headers': [str(col) for col in enriched.columns],
                 'rows': enriched_data[:5]  # First 5 rows for preview
             }
         })
@@ -4956,6 +4587,26 @@ def upload_excel():
         print(f"DEBUG: Excel upload error: {str(e)}")
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
+@chat_bp.route('/enrich-jobs/<job_id>')
+def enrich_job_status(job_id):
+    """Current progress of a sheet enrichment job, for clients that missed the SocketIO events"""
+    from database.sample_enrichment import enrichment_jobs
+    job = enrichment_jobs.get(job_id, session.get('user_id'))
+    if job is None:
+        return jsonify({'success': False, 'message': 'Enrichment job not found'}), 404
+    return jsonify({'success': True, 'job': job.snapshot()})
+
+@chat_bp.route('/enrich-jobs/<job_id>/download')
+def download_enrich_job(job_id):
+    """Download the workbook of a finished enrichment job"""
+    from database.sample_enrichment import enrichment_jobs
+    job = enrichment_jobs.get(job_id, session.get('user_id'))
+    if job is None or not job.result_path or not os.path.exists(job.result_path):
+        return jsonify({'success': False, 'message': 'Enriched workbook not found'}), 404
+    return send_file(job.result_path, as_attachment=True,
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                     download_name=f"enriched_{os.path.splitext(job.filename)[0]}.xlsx")
+
 @chat_bp.route('/upload_samples', methods=['POST'])
 def upload_sample_list():
     """Handle Excel file upload for sample list processing"""
@@ -5151,7 +4802,8 @@ def get_training_status():
         return jsonify({
             'success': True,
             'model_info': model_info,
-            'training_status': training_status
+            'training_status': training_status,
+            'engine_registry': engine_registry.stats()
         })
         
     except Exception as e:
@@ -5164,7 +4816,7 @@ def get_training_status():
 def start_training():
     """Start Statistical model training"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         force_retrain = data.get('force_retrain', False)
         
         db_type = session.get('db_type', 'sqlite')
@@ -5193,26 +4845,27 @@ def start_training():
                     'models_available': model_info['models_available']
                 }), 400
         
-        # Start training (this might take time)
-        print("Starting Statistical model training...")
-        success = trainer.train_all_models()
+        # Train in a worker process; progress arrives in the job's room
+        trainers = [name for name in data.get('trainers', ['statistical'])
+                    if name in ('statistical', 'master_sql', 'master_python')] or ['statistical']
         
-        if success:
-            # Get updated model info
-            model_info = trainer.get_model_info()
-            training_status = trainer.get_training_status()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Models trained successfully!',
-                'model_info': model_info,
-                'training_status': training_status
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Training failed. Check database connection and try again.'
-            }), 500
+        def swap_in_new_models(result):
+            # Swap the new models into the shared engine registry
+            engine_registry.reload(db_config, db_type, background=True)
+        
+        job = training_jobs.submit(
+            session.get('user_id'), 'chat_models',
+            {'db_config': db_config, 'db_type': db_type, 'trainers': trainers},
+            training_jobs.dedupe_key('chat_models', db_config, db_type, *trainers),
+            on_success=swap_in_new_models
+        )
+        
+        return jsonify({
+            'success': True,
+            'message': 'Training started',
+            'job_id': job.job_id,
+            'room': job.room
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -5220,6 +4873,21 @@ def start_training():
             'error': f'Training error: {str(e)}'
         }), 500
 
+@chat_bp.route('/training/jobs/<job_id>', methods=['GET'])
+def training_job_status(job_id):
+    """Current progress of a training job, for clients that missed the SocketIO events"""
+    job = training_jobs.get(job_id, session.get('user_id'))
+    if job is None:
+        return jsonify({'success': False, 'error': 'Training job not found'}), 404
+    return jsonify({'success': True, 'job': job.snapshot()})
+
+@chat_bp.route('/training/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    """Cancel a queued or running training job"""
+    if not training_jobs.cancel(job_id, session.get('user_id')):
+        return jsonify({'success': False, 'error': 'Training job not found or already finished'}), 404
+    return jsonify({'success': True, 'message': 'Training cancellation requested'})
+
 @chat_bp.route('/training/predict', methods=['POST'])
 def test_prediction():
     """Test trained models with a sample question"""
@@ -5409,6 +5077,9 @@ def delete_models():
             if os.path.exists(metadata_path):
                 os.remove(metadata_path)
         
+        if deleted:
+            engine_registry.reload(db_config, db_type, background=True)
+        
         return jsonify({
             'success': True,
             'deleted': deleted,
@@ -5510,6 +5181,7 @@ def rollback_to_version(version_id):
         trainer = DatabaseTrainer(db_config, db_type)
         
         if trainer.rollback_to_version(version_id):
+            engine_registry.reload(db_config, db_type, background=True)
             return jsonify({
                 'success': True,
                 'message': f'Successfully rolled back to version {version_id}'
@@ -1,14 +1,16 @@
 """
 Database operations routes
 """
-from flask import Blueprint, render_template, request, jsonify, session, current_app, Response
+from flask import Blueprint, render_template, request, jsonify, session, current_app, send_file, Response
 from werkzeug.utils import secure_filename
 import pandas as pd
 import os
 import time
 import json
-import threading
+import uuid
 from database.db_manager_flask import DatabaseManagerFlask
+from database.import_jobs import import_jobs
+from database.export_stream import EXPORT_FORMATS, PYARROW_AVAILABLE, fasta_columns, iter_batches, stream_export
 from werkzeug.utils import secure_filename
 import pandas as pd
 import os
@@ -16,15 +18,6 @@ from datetime import datetime
 
 database_bp = Blueprint('database', __name__)
 
-# Global variable for progress tracking
-import_progress = {
-    'status': 'Ready',
-    'progress': 0,
-    'stats': {'new_records': 0, 'existing_records': 0, 'updated_records': 0, 'total_records': 0},
-    'total': 0,
-    'completed': False
-}
-
 
 def to_native(val):
     """Convert numpy/pandas types to native Python types for database compatibility"""
@@ -207,22 +200,11 @@ def detect_file_columns():
 
 @database_bp.route('/import-realtime', methods=['GET', 'POST'])
 def import_data_realtime():
-    """Import data with real-time progress updates"""
+    """Start a background import job; its progress is pushed to the job's SocketIO room"""
     if request.method == 'GET':
         return render_template('database/import_realtime.html')
     
     try:
-        # Reset progress
-        global import_progress
-        import_progress = {
-            'status': 'Starting import...',
-            'progress': 0,
-            'stats': {'new_records': 0, 'existing_records': 0, 'updated_records': 0, 'total_records': 0},
-            'processed': 0,
-            'total': 0,
-            'completed': False
-        }
-        
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No file uploaded'}), 400
         
@@ -233,94 +215,90 @@ def import_data_realtime():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'message': 'Invalid file type'}), 400
         
-        # Start import in background thread
-        import_thread = threading.Thread(
-            target=process_import_realtime,
-            args=(request, current_app._get_current_object())
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'success': False, 'message': 'User not authenticated'}), 401
+        
+        db_type = session.get('db_type', 'sqlite')
+        db_path = session.get('db_params') if db_type in ('mysql', 'mariadb') else session.get('db_path')
+        if not db_path:
+            return jsonify({'success': False, 'message': 'Database not connected'}), 400
+        
+        # Save the upload for the worker; the job deletes it when it ends
+        filename = secure_filename(file.filename)
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], f"import_job_{uuid.uuid4().hex[:8]}_{filename}")
+        file.save(filepath)
+        
+        # A sheet picked in the form imports just that sheet, otherwise every sheet
+        sheet_name = request.form.get('sheet_name', '0')
+        sheet_names = [sheet_name] if sheet_name not in ('', '0') and not filename.endswith('.csv') else None
+        
+        # Column mapping for the selected table, as {table column: file column}
+        custom_mappings = None
+        table_name = request.form.get('table_selection')
+        if table_name and request.form.get('table_option', 'existing') == 'existing':
+            try:
+                if filename.endswith('.csv'):
+                    original_columns = list(pd.read_csv(filepath, nrows=0).columns)
+                else:
+                    original_columns = list(pd.read_excel(filepath, sheet_name=sheet_names[0] if sheet_names else 0, nrows=0).columns)
+            except Exception as e:
+                os.remove(filepath)  # Clean up on error
+                return jsonify({'success': False, 'message': f'Error reading file: {str(e)}'}), 400
+            
+            table_mapping = {}
+            for key in request.form.keys():
+                if key.startswith('column_map_'):
+                    try:
+                        index = int(key.split('_')[-1])
+                        table_col = request.form.get(key)
+                        if table_col and index < len(original_columns):
+                            table_mapping[table_col] = original_columns[index]
+                    except ValueError as e:
+                        print(f"Warning: Invalid column mapping key {key}: {e}")
+            if table_mapping:
+                custom_mappings = {table_name: table_mapping}
+        
+        job = import_jobs.submit(
+            user_id, filepath, file.filename, db_path,
+            'mysql' if db_type in ('mysql', 'mariadb') else 'sqlite',
+            user_id=user_id,
+            import_mode='update' if request.form.get('update_existing') == 'on' else 'skip',
+            custom_mappings=custom_mappings,
+            sheet_names=sheet_names
         )
-        import_thread.daemon = True
-        import_thread.start()
         
-        return jsonify({'success': True, 'message': 'Import started'})
+        return jsonify({'success': True, 'message': 'Import started', 'job_id': job.job_id, 'room': job.room})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Import error: {str(e)}'}), 500
 
 
-@database_bp.route('/import-progress')
-def import_progress_stream():
-    """Server-Sent Events stream for import progress"""
-    def generate():
-        global import_progress
-        
-        while not import_progress.get('completed', False):
-            yield f"data: {json.dumps(import_progress)}\n\n"
-            time.sleep(0.5)  # Update every 500ms
-        
-        # Send final update
-        yield f"data: {json.dumps(import_progress)}\n\n"
-    
-    return Response(generate(), mimetype='text/event-stream')
+@database_bp.route('/import-jobs/<job_id>')
+def import_job_status(job_id):
+    """Current progress of an import job, for clients that missed the SocketIO events"""
+    job = import_jobs.get(job_id, session.get('user_id'))
+    if job is None:
+        return jsonify({'success': False, 'message': 'Import job not found'}), 404
+    return jsonify({'success': True, 'job': job.snapshot()})
 
 
-def process_import_realtime(request_form, app):
-    """Process import with real-time updates"""
-    global import_progress
-    
-    try:
-        with app.app_context():
-            # Get file from request (we need to handle this differently for background thread)
-            # For now, we'll simulate the import process with progress updates
-            
-            import_progress['status'] = 'Reading file...'
-            import_progress['progress'] = 10
-            
-            # Simulate file reading
-            time.sleep(1)
-            
-            import_progress['status'] = 'Processing columns...'
-            import_progress['progress'] = 20
-            
-            # Simulate column processing
-            time.sleep(1)
-            
-            import_progress['status'] = 'Checking for duplicates...'
-            import_progress['progress'] = 40
-            
-            # Simulate duplicate checking
-            total_records = 9241  # This would come from actual file
-            import_progress['total'] = total_records
-            
-            for i in range(total_records):
-                import_progress['processed'] = i + 1
-                import_progress['progress'] = 40 + (i / total_records) * 50
-                
-                # Update stats periodically
-                if i % 1000 == 0:
-                    import_progress['stats']['existing_records'] = i
-                    import_progress['stats']['new_records'] = 0
-                    import_progress['stats']['updated_records'] = 0
-                
-                time.sleep(0.001)  # Simulate processing time
-            
-            import_progress['status'] = 'Finalizing import...'
-            import_progress['progress'] = 95
-            
-            # Final stats
-            import_progress['stats'] = {
-                'existing_records': 9241,
-                'new_records': 0,
-                'updated_records': 0,
-                'total_records': 9241
-            }
-            
-            import_progress['status'] = 'Import completed successfully'
-            import_progress['progress'] = 100
-            import_progress['completed'] = True
-            
-    except Exception as e:
-        import_progress['status'] = f'Import failed: {str(e)}'
-        import_progress['completed'] = True
+@database_bp.route('/import-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_import_job(job_id):
+    """Cancel a queued or running import job"""
+    if not import_jobs.cancel(job_id, session.get('user_id')):
+        return jsonify({'success': False, 'message': 'Import job not found or already finished'}), 404
+    return jsonify({'success': True, 'message': 'Cancelling import'})
+
+
+@database_bp.route('/import-jobs/<job_id>/rejected')
+def download_import_job_rejected(job_id):
+    """Download the rows an import job could not write, with the reason for each"""
+    job = import_jobs.get(job_id, session.get('user_id'))
+    if job is None or not job.rejected_path or not os.path.exists(job.rejected_path):
+        return jsonify({'success': False, 'message': 'Rejected rows file not found'}), 404
+    return send_file(job.rejected_path, mimetype='text/csv', as_attachment=True,
+                     download_name=f"rejected_rows_{job_id[:8]}.csv")
 
 
 @database_bp.route('/import', methods=['GET', 'POST'])
@@ -689,6 +667,7 @@ def import_data():
                                 cursor.execute(update_sql, clean_update_values)
                         
                         conn.commit()
+                        DatabaseManagerFlask.rows_changed(conn, table_name)
                         
                     finally:
                         # Clean up temporary table
@@ -1041,6 +1020,7 @@ def restore_recycle_bin_item(item_id):
                 try:
                     cursor.execute(table_schema)
                     conn.commit()
+                    DatabaseManagerFlask.schema_changed(conn, original_table)
                     print(f"DEBUG: Table '{original_table}' recreated successfully.")
                 except Exception as recreate_err:
                     print(f"ERROR: Failed to recreate table: {recreate_err}")
@@ -1149,6 +1129,7 @@ def restore_recycle_bin_item(item_id):
         # Remove from RecycleBin
         cursor.execute("DELETE FROM RecycleBin WHERE id = ?", (item_id,))
         conn.commit()
+        DatabaseManagerFlask.rows_changed(conn, original_table)
         conn.close()
         
         return jsonify({
@@ -1191,74 +1172,128 @@ def cleanup_recycle_bin():
         return jsonify({'success': False, 'message': f'Error cleaning up RecycleBin: {str(e)}'}), 500
 
 
+def _export_columns(db_path, db_type, query):
+    """Column names of a query, read without fetching its rows"""
+    probe = f"SELECT * FROM ({query.strip().rstrip(';')}) AS export_probe LIMIT 0"
+    try:
+        conn, cursor = DatabaseManagerFlask.open_result_cursor(db_path, db_type, probe)
+    except Exception:
+        # Not a plain SELECT (e.g. PRAGMA); run it as is
+        conn, cursor = DatabaseManagerFlask.open_result_cursor(db_path, db_type, query)
+    try:
+        if cursor.description is None:
+            raise ValueError('Query returns no rows to export')
+        return [desc[0] for desc in cursor.description]
+    finally:
+        conn.close()
+
+
+def _has_fasta_sequences(db_path, db_type, query, seq_col):
+    """
+    Whether the query returns at least one row with a sequence. Queries that
+    can't be wrapped in a subquery are assumed to have some.
+    """
+    q = '`' if db_type == 'mysql' else '"'
+    column = f"{q}{seq_col}{q}"
+    probe = (f"SELECT 1 FROM ({query.strip().rstrip(';')}) AS export_probe "
+             f"WHERE {column} IS NOT NULL AND TRIM({column}) <> '' AND LOWER(TRIM({column})) <> 'none' LIMIT 1")
+    try:
+        conn, cursor = DatabaseManagerFlask.open_result_cursor(db_path, db_type, probe)
+    except Exception:
+        return True
+    try:
+        return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+
 @database_bp.route('/export', methods=['POST'])
 def export_data():
-    """Export query results"""
+    """Check an export request and return the URL that streams it"""
     try:
         data = request.get_json()
         query = data.get('query')
         format_type = data.get('format', 'csv')
+        compress = bool(data.get('compress', False))
         
         if not query:
             return jsonify({'success': False, 'message': 'No query provided'}), 400
+        if format_type not in EXPORT_FORMATS:
+            return jsonify({'success': False, 'message': f'Unsupported export format: {format_type}'}), 400
+        if format_type in ('parquet', 'arrow') and not PYARROW_AVAILABLE:
+            return jsonify({'success': False, 'message': f'{format_type.title()} export requires pyarrow to be installed.'}), 400
         
         # Get database connection
-        db_type = session.get('db_type')
+        db_type = 'mysql' if session.get('db_type') in ('mysql', 'mariadb') else 'sqlite'
         db_path = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
-        conn = DatabaseManagerFlask.get_connection(db_path, db_type)
-        
-        # Execute query
-        df = pd.read_sql_query(query, conn)
-        
-        # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'export_{timestamp}.{format_type}'
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+        if not db_path:
+            return jsonify({'success': False, 'message': 'Database not connected'}), 400
         
-        # Export based on format
-        if format_type == 'csv':
-            df.to_csv(filepath, index=False)
-        elif format_type == 'xlsx':
-            df.to_excel(filepath, index=False)
-        elif format_type == 'json':
-            df.to_json(filepath, orient='records', indent=2)
-        elif format_type == 'fasta':
-            # Detect sequence column
-            seq_cols = [c for c in df.columns if any(x in c.lower() for x in ['sequence', 'seq', 'dna', 'rna', 'protein'])]
-            if not seq_cols:
+        # Surface SQL errors and a missing sequence column now, before the download starts
+        columns = _export_columns(db_path, db_type, query)
+        if format_type == 'fasta':
+            seq_col = fasta_columns(columns)[1]
+            if seq_col is None:
                 return jsonify({'success': False, 'message': 'No sequence column found in results. Please include a column named "sequence" or "seq".'}), 400
-            
-            seq_col = seq_cols[0]
-            
-            # Detect header/ID column
-            header_cols = [c for c in df.columns if any(x in c.lower() for x in ['id', 'sample', 'name', 'header'])]
-            header_col = header_cols[0] if header_cols else df.columns[0]
-            
-            fasta_lines = []
-            for _, row in df.iterrows():
-                header = str(row[header_col])
-                # Filter out any newline characters within sequence
-                sequence = str(row[seq_col]).strip().replace('\n', '').replace('\r', '')
-                if sequence and sequence.lower() != 'none':
-                    fasta_lines.append(f">{header}\n{sequence}")
-            
-            if not fasta_lines:
+            if not _has_fasta_sequences(db_path, db_type, query, seq_col):
                 return jsonify({'success': False, 'message': 'No valid sequences found to export.'}), 400
-                
-            with open(filepath, 'w') as f:
-                f.write('\n'.join(fasta_lines) + '\n')
+        
+        token = uuid.uuid4().hex
+        exports = dict(session.get('pending_exports', {}))
+        while len(exports) >= 10:
+            exports.pop(next(iter(exports)))
+        exports[token] = {'query': query, 'format': format_type, 'compress': compress}
+        session['pending_exports'] = exports
         
         return jsonify({
             'success': True,
-            'message': 'Data exported successfully',
-            'filename': filename,
-            'download_url': f'/database/download/{filename}'
+            'message': 'Export ready, download starting',
+            'download_url': f'/database/export/{token}'
         })
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+@database_bp.route('/export/<token>')
+def stream_export_download(token):
+    """Stream an export prepared by export_data straight from the database cursor"""
+    exports = dict(session.get('pending_exports', {}))
+    export = exports.pop(token, None)
+    if export is None:
+        return jsonify({'success': False, 'message': 'Export not found or already downloaded'}), 404
+    session['pending_exports'] = exports
+    
+    try:
+        db_type = 'mysql' if session.get('db_type') in ('mysql', 'mariadb') else 'sqlite'
+        db_path = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
+        # A dedicated connection outside the pools, held until the download finishes
+        conn, cursor = DatabaseManagerFlask.open_result_cursor(db_path, db_type, export['query'])
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    format_type = export['format']
+    extension, mimetype, can_compress = EXPORT_FORMATS[format_type]
+    compress = export['compress'] and can_compress
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'export_{timestamp}.{extension}' + ('.gz' if compress else '')
+    
+    def generate():
+        try:
+            columns = [desc[0] for desc in cursor.description]
+            yield from stream_export(columns, iter_batches(cursor), format_type, compress=compress)
+        finally:
+            for closer in (cursor, conn):
+                try:
+                    closer.close()
+                except Exception:
+                    pass
+    
+    return Response(generate(), mimetype='application/gzip' if compress else mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+
 @database_bp.route('/tables')
 def get_tables():
     """Get list of tables in current database"""
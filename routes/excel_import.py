@@ -1,8 +1,9 @@
-from flask import Blueprint, jsonify, render_template, request, session, current_app, g
+from flask import Blueprint, jsonify, render_template, request, session, current_app, g, send_file, url_for
 from database.db_manager_flask import DatabaseManagerFlask
 from database.excel_import import ExcelImportManager
 from database.security import DatabaseSecurity
 import os
+import uuid
 from werkzeug.utils import secure_filename
 
 excel_import_bp = Blueprint("excel_import", __name__)
@@ -132,6 +133,14 @@ def execute_import():
             custom_mappings=custom_mappings,
             excluded_columns=excluded_columns
         )
+        
+        # Keep rows that could not be imported as a downloadable CSV
+        if len(import_manager.rejected_rows):
+            token = uuid.uuid4().hex
+            rejected_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"import_rejected_{token}.csv")
+            import_manager.rejected_rows.to_csv(rejected_path, index=False)
+            session['import_rejected_files'] = session.get('import_rejected_files', [])[-9:] + [token]
+            result['rejected_rows_url'] = url_for('excel_import.download_rejected_rows', token=token)
         import_manager.close()
         
         # Clean up temp file
@@ -145,6 +154,19 @@ def execute_import():
     except Exception as e:
         return jsonify({"success": False, "message": f"Import failed: {str(e)}"}), 500
 
+@excel_import_bp.route("/import/rejected/<token>", methods=["GET"])
+def download_rejected_rows(token):
+    """Download the rows an import could not write, with the reason for each"""
+    if token not in session.get('import_rejected_files', []):
+        return jsonify({"success": False, "message": "Rejected rows file not found"}), 404
+    
+    rejected_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"import_rejected_{token}.csv")
+    if not os.path.exists(rejected_path):
+        return jsonify({"success": False, "message": "Rejected rows file has expired"}), 404
+    
+    return send_file(rejected_path, mimetype='text/csv', as_attachment=True,
+                     download_name=f"rejected_rows_{token[:8]}.csv")
+
 @excel_import_bp.route("/tables", methods=["GET"])
 def get_tables():
     """Get available database tables and their columns"""
@@ -51,38 +51,20 @@ def dashboard():
         db_type = session.get('db_type')
         db_path = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
         
-        conn = DatabaseManagerFlask.get_connection(db_path, db_type)
-        cursor = conn.cursor()
-        
         stats = {
             'db_name': session.get('db_name'),
             'db_type': db_type,
             'tables': []
         }
         
-        # Get table information
-        if db_type == 'sqlite':
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-            tables = cursor.fetchall()
-            
-            for (table_name,) in tables:
-                cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
-                count = cursor.fetchone()[0]
-                stats['tables'].append({
-                    'name': table_name,
-                    'rows': count
-                })
-        else:  # MySQL
-            cursor.execute("SHOW TABLES")
-            tables = cursor.fetchall()
-            
-            for (table_name,) in tables:
-                cursor.execute(f'SELECT COUNT(*) FROM `{table_name}`')
-                count = cursor.fetchone()[0]
-                stats['tables'].append({
-                    'name': table_name,
-                    'rows': count
-                })
+        # Row counts come from the table stats cache; MySQL may start with estimates
+        counts = DatabaseManagerFlask.get_table_counts(db_path, db_type)
+        for table_name, count in counts.items():
+            stats['tables'].append({
+                'name': table_name,
+                'rows': count['rows'],
+                'estimated': count['estimated']
+            })
         
         return render_template('main/dashboard.html', stats=stats)
         
@@ -96,6 +78,52 @@ def dashboard():
 
 
 
+@main_bp.route('/main/table-stats')
+@require_db_connection
+@authentication_required
+def table_stats():
+    """Cached row counts for all tables (?refresh=1 recounts them)"""
+    try:
+        db_type = session.get('db_type')
+        db_path = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
+        
+        counts = DatabaseManagerFlask.get_table_counts(
+            db_path, db_type, refresh=request.args.get('refresh') == '1'
+        )
+        tables = [
+            {'name': name, 'rows': count['rows'], 'estimated': count['estimated']}
+            for name, count in counts.items()
+        ]
+        return jsonify({
+            'success': True,
+            'tables': tables,
+            'total_records': sum(table['rows'] for table in tables),
+            'estimated': any(table['estimated'] for table in tables)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@main_bp.route('/main/get-table-count/<table_name>')
+@require_db_connection
+@authentication_required
+def get_table_count(table_name):
+    """Cached row count of one table"""
+    try:
+        db_type = session.get('db_type')
+        db_path = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
+        
+        if table_name not in DatabaseManagerFlask.get_tables(DatabaseManagerFlask.get_connection(db_path, db_type), db_type):
+            return jsonify({'success': False, 'message': f'Table {table_name} not found'}), 404
+        
+        count = DatabaseManagerFlask.get_table_counts(db_path, db_type, tables=[table_name]).get(table_name)
+        if count is None:
+            return jsonify({'success': False, 'message': 'Row count not available yet'}), 503
+        return jsonify({'success': True, 'table': table_name, 'count': count['rows'], 'estimated': count['estimated']})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
 @main_bp.route('/main/schema')
 @require_db_connection
 @authentication_required
@@ -7,15 +7,10 @@ import flask
 import os
 import sys
 import pickle
-import numpy as np
 import pandas as pd
 import sqlite3
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.cluster import KMeans
-from sklearn.ensemble import IsolationForest
-from sklearn.metrics import accuracy_score, mean_squared_error
-from sklearn.preprocessing import LabelEncoder
+
+from utils.training_jobs import training_jobs
 
 ml_bp = Blueprint('ml', __name__, url_prefix='/ml')
 
@@ -67,7 +62,7 @@ def get_database_tables():
 def train_chat_model_auto():
     """Train ML model automatically - no user input required"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         model_type = data.get('model_type', 'classification')
         
         # Connect to database
@@ -78,231 +73,20 @@ def train_chat_model_auto():
                 'message': 'No database connected'
             }), 400
         
-        conn = sqlite3.connect(db_path)
-        
-        # Get all tables
-        tables_query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-        tables_df = pd.read_sql_query(tables_query, conn)
-        tables = tables_df['name'].tolist()
-        
-        if not tables:
-            return jsonify({
-                'success': False,
-                'message': 'No tables found in database'
-            }), 400
-        
-        # Train models on ALL tables in the database
-        models_trained = []
-        failed_tables = []
-        
-        for table in tables:
-            try:
-                # Get table schema and sample data
-                schema_query = f"PRAGMA table_info({table})"
-                schema_df = pd.read_sql_query(schema_query, conn)
-                columns = schema_df['name'].tolist()
-                
-                # Load sample data to determine data types
-                sample_query = f"SELECT * FROM {table} LIMIT 100"
-                df = pd.read_sql_query(sample_query, conn)
-                
-                # Filter suitable features (exclude id, timestamps, and columns with too many unique values)
-                suitable_features = []
-                for col in columns:
-                    if col in ['id', 'created_at', 'updated_at', 'timestamp', 'date']:
-                        continue
-                    
-                    # Check if column has reasonable data for ML
-                    unique_count = df[col].nunique()
-                    null_count = df[col].isnull().sum()
-                    
-                    # Skip columns with too many unique values (likely IDs) or too many nulls
-                    if unique_count > len(df) * 0.8 or null_count > len(df) * 0.5:
-                        continue
-                    
-                    suitable_features.append(col)
-                
-                if len(suitable_features) < 2:
-                    failed_tables.append(f"{table}: Insufficient features")
-                    continue
-                
-                # Basic data preprocessing
-                df_clean = df[suitable_features].dropna()
-                
-                if len(df_clean) < 10:
-                    failed_tables.append(f"{table}: Insufficient clean data")
-                    continue
-                
-                # Auto-select target variable for supervised learning
-                target_variable = None
-                if model_type in ['classification', 'regression']:
-                    # Find a good target variable (categorical for classification, numeric for regression)
-                    for col in suitable_features:
-                        if model_type == 'classification' and df_clean[col].dtype == 'object':
-                            if 2 <= df_clean[col].nunique() <= 10:  # Good for classification
-                                target_variable = col
-                                break
-                        elif model_type == 'regression' and df_clean[col].dtype in ['int64', 'float64']:
-                            target_variable = col
-                            break
-                
-                # Prepare features
-                features = [col for col in suitable_features if col != target_variable]
-                X = df_clean[features]
-                
-                # Handle categorical variables
-                label_encoders = {}
-                for col in X.select_dtypes(include=['object']).columns:
-                    le = LabelEncoder()
-                    X[col] = le.fit_transform(X[col].astype(str))
-                    label_encoders[col] = le
-                
-                # Train model based on type
-                if model_type == 'classification':
-                    if not target_variable:
-                        # Create a synthetic target if none found
-                        target_variable = features[0]
-                        y = (X[target_variable] > X[target_variable].median()).astype(int)
-                    else:
-                        y = df_clean[target_variable]
-                        if y.dtype == 'object':
-                            y_le = LabelEncoder()
-                            # Handle None/NaN values by converting to string first
-                            y_clean = y.astype(str).fillna('Unknown')
-                            y_le.fit(y_clean)
-                            y = y_le.transform(y_clean)
-                            label_encoders['target'] = y_le
-                    
-                    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-                    
-                    model = RandomForestClassifier(n_estimators=100, random_state=42)
-                    model.fit(X_train, y_train)
-                    
-                    y_pred = model.predict(X_test)
-                    accuracy = accuracy_score(y_test, y_pred)
-                    
-                    metrics = {
-                        'accuracy': accuracy,
-                        'samples': len(df_clean),
-                        'features': len(features),
-                        'test_samples': len(X_test),
-                        'target_variable': target_variable
-                    }
-                    
-                elif model_type == 'regression':
-                    if not target_variable:
-                        # Use first numeric feature as target
-                        numeric_features = [col for col in features if X[col].dtype in ['int64', 'float64']]
-                        if numeric_features:
-                            target_variable = numeric_features[0]
-                            features.remove(target_variable)
-                            X = X[features]
-                            y = X[target_variable]
-                        else:
-                            failed_tables.append(f"{table}: No suitable numeric target")
-                            continue
-                    else:
-                        y = df_clean[target_variable]
-                    
-                    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-                    
-                    model = RandomForestRegressor(n_estimators=100, random_state=42)
-                    model.fit(X_train, y_train)
-                    
-                    y_pred = model.predict(X_test)
-                    mse = mean_squared_error(y_test, y_pred)
-                    rmse = np.sqrt(mse)
-                    
-                    metrics = {
-                        'mse': mse,
-                        'rmse': rmse,
-                        'samples': len(df_clean),
-                        'features': len(features),
-                        'test_samples': len(X_test),
-                        'target_variable': target_variable
-                    }
-                    
-                elif model_type == 'clustering':
-                    model = KMeans(n_clusters=min(3, len(X)), random_state=42)
-                    model.fit(X)
-                    
-                    labels = model.labels_
-                    metrics = {
-                        'clusters': len(np.unique(labels)),
-                        'samples': len(df_clean),
-                        'features': len(features),
-                        'inertia': model.inertia_
-                    }
-                    
-                elif model_type == 'anomaly_detection':
-                    model = IsolationForest(contamination=0.1, random_state=42)
-                    model.fit(X)
-                    
-                    predictions = model.predict(X)
-                    anomalies = sum(1 for p in predictions if p == -1)
-                    
-                    metrics = {
-                        'anomalies': anomalies,
-                        'anomaly_rate': anomalies / len(df_clean),
-                        'samples': len(df_clean),
-                        'features': len(features)
-                    }
-                
-                # Store model info (without sklearn objects for JSON serialization)
-                model_info = {
-                    'table': table,
-                    'model_type': model_type,
-                    'features': features,
-                    'target_variable': target_variable,
-                    'label_encoders_count': len(label_encoders),
-                    'metrics': metrics
-                }
-                models_trained.append(model_info)
-                
-                # Store full model data with sklearn objects for pickle (separate from JSON response)
-                full_model_data = {
-                    'table': table,
-                    'model': model,
-                    'model_type': model_type,
-                    'features': features,
-                    'target_variable': target_variable,
-                    'label_encoders': label_encoders,
-                    'metrics': metrics
-                }
-                # Add to session storage list
-                if 'full_ml_models' not in session:
-                    session['full_ml_models'] = []
-                full_models = session.get('full_ml_models', [])
-                full_models.append(pickle.dumps(full_model_data))
-                session['full_ml_models'] = full_models
-                
-            except Exception as e:
-                failed_tables.append(f"{table}: {str(e)}")
-                continue
-        
-        conn.close()
-        
-        if not models_trained:
-            return jsonify({
-                'success': False,
-                'message': f'No models could be trained. Failed tables: {"; ".join(failed_tables)}'
-            }), 400
+        # Train models on ALL tables in a worker process; the models are put
+        # into the session when the finished job is collected
+        job = training_jobs.submit(
+            session.get('user_id'), 'table_models_auto',
+            {'db_path': db_path, 'model_type': model_type},
+            training_jobs.dedupe_key('table_models_auto', db_path, 'sqlite', model_type)
+        )
         
         return jsonify({
             'success': True,
-            'message': f'Trained {len(models_trained)} {model_type} models successfully',
-            'models_trained': len(models_trained),
-            'failed_tables': len(failed_tables),
-            'model_summaries': [
-                {
-                    'table': model['table'],
-                    'accuracy': model['metrics'].get('accuracy', 'N/A'),
-                    'samples': model['metrics']['samples'],
-                    'features': model['metrics']['features']
-                } for model in models_trained
-            ],
-            'details': models_trained
-        })
+            'message': f'Training {model_type} models on all tables',
+            'job_id': job.job_id,
+            'room': job.room
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -310,6 +94,33 @@ def train_chat_model_auto():
             'message': f'Auto-training failed: {str(e)}'
         }), 500
 
+@ml_bp.route('/chat/train-jobs/<job_id>', methods=['GET'])
+def ml_training_job_status(job_id):
+    """
+    Progress of a training job. Once the job has finished, its models are
+    added to this user's session (once per job).
+    """
+    job = training_jobs.get(job_id, session.get('user_id'))
+    if job is None:
+        return jsonify({'success': False, 'message': 'Training job not found'}), 404
+    
+    collected = session.get('collected_training_jobs', [])
+    if job.completed and job.payload and job_id not in collected:
+        if 'full_models' in job.payload:
+            session['full_ml_models'] = session.get('full_ml_models', []) + job.payload['full_models']
+        if 'model_data' in job.payload:
+            session['current_ml_model'] = job.payload['model_data']
+        session['collected_training_jobs'] = collected + [job_id]
+    
+    return jsonify({'success': True, 'job': job.snapshot()})
+
+@ml_bp.route('/chat/train-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_ml_training_job(job_id):
+    """Cancel a queued or running training job"""
+    if not training_jobs.cancel(job_id, session.get('user_id')):
+        return jsonify({'success': False, 'message': 'Training job not found or already finished'}), 404
+    return jsonify({'success': True, 'message': 'Training cancellation requested'})
+
 @ml_bp.route('/chat/predict', methods=['POST'])
 def ml_predict():
     """Make predictions using trained ML models"""
@@ -509,7 +320,7 @@ def get_ml_features():
 def train_chat_model():
     """Train ML model for chat interface"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         model_type = data.get('model_type', 'classification')
         data_source = data.get('data_source', 'samples')
         target_variable = data.get('target_variable')
@@ -530,147 +341,25 @@ def train_chat_model():
                 'message': 'No database connected'
             }), 400
         
-        conn = sqlite3.connect(db_path)
-        
-        # Load data
-        query = f"SELECT {', '.join(features + ([target_variable] if target_variable else []))} FROM {data_source}"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        
-        # Basic data preprocessing
-        df = df.dropna()
-        
-        if len(df) < 10:
-            return jsonify({
-                'success': False,
-                'message': 'Insufficient data for training (need at least 10 samples)'
-            }), 400
-        
-        # Simple model training based on type
-        from sklearn.model_selection import train_test_split
-        from sklearn.metrics import accuracy_score, mean_squared_error
-        from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-        from sklearn.cluster import KMeans
-        from sklearn.preprocessing import LabelEncoder
-        
-        X = df[features]
-        
-        # Handle categorical variables
-        label_encoders = {}
-        for col in X.select_dtypes(include=['object']).columns:
-            le = LabelEncoder()
-            X[col] = le.fit_transform(X[col].astype(str))
-            label_encoders[col] = le
-        
-        if model_type == 'classification':
-            if not target_variable:
-                return jsonify({
-                    'success': False,
-                    'message': 'Target variable required for classification'
-                }), 400
-            
-            y = df[target_variable]
-            if y.dtype == 'object':
-                y_le = LabelEncoder()
-                y = y_le.fit_transform(y.astype(str))
-                label_encoders['target'] = y_le
-            
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
-            
-            model = RandomForestClassifier(n_estimators=100, random_state=42)
-            model.fit(X_train, y_train)
-            
-            y_pred = model.predict(X_test)
-            accuracy = accuracy_score(y_test, y_pred)
-            
-            metrics = {
-                'accuracy': accuracy,
-                'samples': len(df),
-                'features': len(features),
-                'test_samples': len(X_test)
-            }
-            
-        elif model_type == 'regression':
-            if not target_variable:
-                return jsonify({
-                    'success': False,
-                    'message': 'Target variable required for regression'
-                }), 400
-            
-            y = df[target_variable]
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
-            
-            model = RandomForestRegressor(n_estimators=100, random_state=42)
-            model.fit(X_train, y_train)
-            
-            y_pred = model.predict(X_test)
-            mse = mean_squared_error(y_test, y_pred)
-            rmse = np.sqrt(mse)
-            
-            metrics = {
-                'mse': mse,
-                'rmse': rmse,
-                'samples': len(df),
-                'features': len(features),
-                'test_samples': len(X_test)
-            }
-            
-        elif model_type == 'clustering':
-            model = KMeans(n_clusters=3, random_state=42)
-            model.fit(X)
-            
-            labels = model.labels_
-            metrics = {
-                'clusters': len(np.unique(labels)),
-                'samples': len(df),
-                'features': len(features),
-                'inertia': model.inertia_
-            }
-            
-        elif model_type == 'anomaly_detection':
-            # Simple anomaly detection using isolation forest
-            from sklearn.ensemble import IsolationForest
-            
-            model = IsolationForest(contamination=0.1, random_state=42)
-            model.fit(X)
-            
-            predictions = model.predict(X)
-            anomalies = sum(1 for p in predictions if p == -1)
-            
-            metrics = {
-                'anomalies': anomalies,
-                'anomaly_rate': anomalies / len(df),
-                'samples': len(df),
-                'features': len(features)
-            }
-        
-        # Save model (in production, use proper model storage)
-        import pickle
-        model_data = {
-            'model': model,
-            'model_type': model_type,
-            'features': features,
-            'target_variable': target_variable,
-            'label_encoders': label_encoders,
-            'metrics': metrics
-        }
-        
-        # For demo, store in session (in production, use database)
-        session['current_ml_model'] = pickle.dumps(model_data)
+        # Train in a worker process; the model is put into the session when
+        # the finished job is collected from /ml/chat/train-jobs/<job_id>
+        job = training_jobs.submit(
+            session.get('user_id'), 'table_model',
+            {'db_path': db_path, 'model_type': model_type, 'data_source': data_source,
+             'target_variable': target_variable, 'features': features, 'test_size': test_size},
+            training_jobs.dedupe_key('table_model', db_path, 'sqlite', model_type, data_source,
+                                     target_variable, sorted(features), test_size)
+        )
         
         return jsonify({
             'success': True,
-            'message': f'{model_type.title()} model trained successfully',
-            'model': {
-                'type': model_type,
-                'features': features,
-                'target': target_variable
-            },
-            'metrics': metrics
-        })
+            'message': f'Training {model_type} model',
+            'job_id': job.job_id,
+            'room': job.room
+        }), 202
         
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Training failed: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
@@ -1,15 +1,17 @@
 """
 Query execution routes with Python support
 """
-from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, current_app, send_file
+from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, current_app, send_file, Response
 from werkzeug.utils import secure_filename
 from database.db_manager_flask import DatabaseManagerFlask
+from database.result_cache import result_cache, normalize_value
 import pandas as pd
 import re
 import json
 import sys
 import os
 import io
+import csv
 import contextlib
 import traceback
 import base64
@@ -897,6 +899,87 @@ def get_table_columns(table_name):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+READ_QUERY_PATTERN = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+
+def _result_owner():
+    """Identity a cached result belongs to, so one user can't page another's results"""
+    return (session.get('user_id'), getattr(session, 'sid', None))
+
+
+def _page_size(value):
+    """Parse a requested page size, clamped to MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _result_page(result, offset, page_size):
+    """Build the JSON payload for one page of a cached result"""
+    page = result.fetch_page(offset, page_size)
+    next_offset = page['next_offset']
+    row_count = len(page['rows'])
+    
+    if next_offset is not None:
+        message = f'Query executed successfully. Showing rows {offset + 1}-{offset + row_count}; more rows available.'
+    else:
+        message = f'Query executed successfully. {offset + row_count} rows returned.'
+    
+    return {
+        'success': True,
+        'has_results': True,
+        'result_id': result.result_id,
+        'columns': result.columns,
+        'data': page['rows'],
+        'row_count': row_count,
+        'offset': offset,
+        'truncated': next_offset is not None,
+        'next_token': f"{result.result_id}:{next_offset}" if next_offset is not None else None,
+        'message': message
+    }
+
+
+def _stream_ndjson(result, batch_size=500):
+    """Yield a cached result as NDJSON: a header line, one line per row, then a trailer"""
+    columns = result.columns
+    yield json.dumps({'result_id': result.result_id, 'columns': columns}) + '\n'
+    
+    count = 0
+    lines = []
+    for row in result.iter_rows():
+        lines.append(json.dumps(dict(zip(columns, row))))
+        count += 1
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+    
+    yield json.dumps({'done': True, 'row_count': count}) + '\n'
+
+
+def _stream_csv(result, batch_size=1000):
+    """Yield a cached result as CSV text in batches"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.columns)
+    
+    pending = 0
+    for row in result.iter_rows():
+        writer.writerow(['' if val is None else val for val in row])
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
 @query_bp.route('/execute', methods=['POST'])
 def execute():
     """Execute SQL query"""
@@ -994,6 +1077,36 @@ def execute():
                     'affected_rows': stats['deleted_records']
                 })
             
+            # SELECT/WITH queries run on a dedicated cursor held by the result cache,
+            # so only the first page is fetched now and the rest can be paged or streamed
+            if READ_QUERY_PATTERN.match(query):
+                try:
+                    result_conn, result_cursor = DatabaseManagerFlask.open_result_cursor(db_conn, db_type, query)
+                except Exception as read_error:
+                    # Data-modifying CTEs can't run on the read-only cursor connection (SQLite:
+                    # "readonly database", MariaDB: "READ ONLY transaction"); they run below
+                    if 'readonly' not in re.sub(r'[-\s]', '', str(read_error)).lower():
+                        raise
+                    result_cursor = None
+                
+                if result_cursor is not None:
+                    if not result_cursor.description:
+                        result_conn.close()
+                        return jsonify({
+                            'success': True,
+                            'has_results': False,
+                            'message': 'Query executed successfully. 0 row(s) affected.',
+                            'affected_rows': 0
+                        })
+                    
+                    result = result_cache.open(query, _result_owner(), result_conn, result_cursor)
+                    print(f"DEBUG: Opened result cursor {result.result_id}")
+                    
+                    if data.get('stream') or request.args.get('format') == 'ndjson':
+                        return Response(_stream_ndjson(result), mimetype='application/x-ndjson')
+                    
+                    return jsonify(_result_page(result, 0, _page_size(data.get('page_size'))))
+            
             # Normal execution for other queries
             cursor.execute(query)
             print("DEBUG: Query executed successfully")
@@ -1004,34 +1117,23 @@ def execute():
                 'message': f"Query error: {str(query_error)}"
             }), 400
         
-        # Check if it's a SELECT query
+        # Check if it's a row-returning statement (PRAGMA, SHOW, ...)
         if cursor.description:
-            # SELECT query - return results
             columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
+            rows = cursor.fetchmany(MAX_PAGE_SIZE + 1)
+            truncated = len(rows) > MAX_PAGE_SIZE
+            rows = rows[:MAX_PAGE_SIZE]
             
             print(f"DEBUG: Retrieved {len(rows)} rows")
             
-            # Convert to list of dicts
-            results = []
-            for row in rows:
-                row_dict = {}
-                for i, col in enumerate(columns):
-                    val = row[i]
-                    # Handle bytes/bytearray for MySQL binary fields
-                    if isinstance(val, (bytes, bytearray)):
-                        try:
-                            val = val.decode('utf-8')
-                        except:
-                            val = str(val)
-                    row_dict[col] = val if val is not None else None
-                results.append(row_dict)
+            results = [
+                {col: normalize_value(val) for col, val in zip(columns, row)}
+                for row in rows
+            ]
             
-            # Store in session for export
-            session['last_query_results'] = {
-                'columns': columns,
-                'data': results
-            }
+            message = f'Query executed successfully. {len(results)} rows returned.'
+            if truncated:
+                message += f' Output capped at {MAX_PAGE_SIZE} rows.'
             
             return jsonify({
                 'success': True,
@@ -1039,13 +1141,22 @@ def execute():
                 'columns': columns,
                 'data': results,
                 'row_count': len(results),
-                'message': f'Query executed successfully. {len(results)} rows returned.'
+                'truncated': truncated,
+                'message': message
             })
         else:
             # Non-SELECT query (INSERT, UPDATE, DELETE)
             affected_rows = cursor.rowcount
             conn.commit()
             
+            # Cached FK graph, row counts and identifier index can't follow arbitrary SQL
+            ddl_match = re.match(r"\s*(?:CREATE|ALTER|DROP|RENAME)\b(?:\s+TABLE\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?[`\"']?(\w+))?", query, re.IGNORECASE)
+            dml_match = re.search(r"(?:INSERT INTO|UPDATE|DELETE FROM|TRUNCATE TABLE)\s+[`\"']?(\w+)[`\"']?", query, re.IGNORECASE)
+            if ddl_match:
+                DatabaseManagerFlask.schema_changed(conn, ddl_match.group(1))
+            if dml_match:
+                DatabaseManagerFlask.rows_changed(conn, dml_match.group(1))
+            
             # Emit real-time update
             try:
                 if hasattr(current_app, 'socketio') and current_app.socketio:
@@ -1077,6 +1188,47 @@ def execute():
         }), 500
 
 
+@query_bp.route('/fetch-more', methods=['GET'])
+def fetch_more():
+    """Fetch the next page of a cached query result using its next_token"""
+    token = request.args.get('token', '')
+    result_id, _, offset = token.partition(':')
+    try:
+        offset = int(offset)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid fetch token'}), 400
+    
+    result = result_cache.get(result_id, _result_owner())
+    if result is None:
+        return jsonify({'success': False, 'message': 'Result expired. Please run the query again.'}), 410
+    
+    try:
+        return jsonify(_result_page(result, offset, _page_size(request.args.get('page_size'))))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f"Fetch error: {str(e)}"}), 500
+
+
+@query_bp.route('/results/<result_id>/export', methods=['GET'])
+def export_result(result_id):
+    """Stream a cached query result as CSV or NDJSON without re-running the query"""
+    result = result_cache.get(result_id, _result_owner())
+    if result is None:
+        return jsonify({'success': False, 'message': 'Result expired. Please run the query again.'}), 410
+    
+    format_type = request.args.get('format', 'csv')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if format_type == 'ndjson':
+        body, mimetype = _stream_ndjson(result), 'application/x-ndjson'
+    elif format_type == 'csv':
+        body, mimetype = _stream_csv(result), 'text/csv'
+    else:
+        return jsonify({'success': False, 'message': f'Unsupported export format: {format_type}'}), 400
+    
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=export_{timestamp}.{format_type}'
+    })
+
+
 @query_bp.route('/refresh-tables', methods=['POST'])
 def refresh_tables():
     """Force refresh of table list"""
@@ -4,13 +4,10 @@ Sequence analysis routes using Tracy or improved Python consensus
 from flask import Blueprint, request, jsonify, session, render_template, current_app, send_file
 from werkzeug.utils import secure_filename
 import os
-import subprocess
 import json
 import uuid
 import re
-from Bio import SeqIO
 from Bio.Seq import Seq
-from Bio.Align import PairwiseAligner
 from Bio.Blast import NCBIWWW, NCBIXML
 from io import BytesIO
 import datetime
@@ -25,6 +22,10 @@ import time
 from threading import Lock
 from database.sequence_db import SequenceDBManager
 from database.db_manager_flask import DatabaseManagerFlask
+from database.blast_cache import BlastCache, DEFAULT_TTL_DAYS, sequence_hash
+from utils.consensus_assembly import assemble_groups, check_tracy_installed
+from utils.local_blast import get_local_blast
+from utils.trace_store import TRACE_SUFFIX, load_trace
 
 sequence_bp = Blueprint('sequence', __name__)
 
@@ -32,6 +33,10 @@ sequence_bp = Blueprint('sequence', __name__)
 blast_progress_data = {'completed': 0, 'total': 0, 'status': 'idle', 'cancelled': False}
 progress_lock = Lock()
 
+# Files removed from an AB1 session folder once its sequences are done with:
+# the uploaded traces and the parsed trace stores next to them
+SESSION_FILE_SUFFIXES = ('.ab1', '.abi', '.scf', TRACE_SUFFIX)
+
 # Ambiguous base lookup
 AMBIGUOUS_LOOKUP = {
     'A': ['A'], 'T': ['T'], 'G': ['G'], 'C': ['C'],
@@ -131,16 +136,12 @@ def get_filename_direction(filename, pattern_config=None):
     return None
 
 
-def detect_sequence_direction(record, filename, pattern_config=None):
-    """Detect actual sequence direction from AB1 file metadata"""
+def detect_sequence_direction(trace, filename, pattern_config=None):
+    """Detect actual sequence direction from AB1 file metadata (an AB1Trace)"""
     try:
-        # Method 1: Check mobility file tag (some sequencers mark this)
-        if hasattr(record, 'annotations') and 'abif_raw' in record.annotations:
-            abif_raw = record.annotations['abif_raw']
-            
-            # Check PCON2 tag (edited base positions - sometimes has direction info)
-            # Check SMPL tag (sample name - might contain F/R)
-            sample_name = abif_raw.get('SMPL', b'').decode('ascii', errors='ignore') if isinstance(abif_raw.get('SMPL', b''), bytes) else str(abif_raw.get('SMPL', ''))
+        # Method 1: Check the SMPL tag (sample name - might contain F/R)
+        if trace is not None:
+            sample_name = trace.sample_name
             if sample_name:
                 sample_lower = sample_name.lower()
                 if 'forward' in sample_lower or '_f' in sample_lower or '-f' in sample_lower:
@@ -309,6 +310,21 @@ def detect_fr_pattern(filenames):
     }
 
 
+def emit_consensus_group(socketio, socket_id, group_name, result, total):
+    """Send one finished group's consensus to the client that asked for the assembly"""
+    if not socketio or not socket_id:
+        return
+    try:
+        socketio.emit('consensus_group', {
+            'group': group_name,
+            'success': result is not None,
+            'result': result,
+            'total': total
+        }, to=socket_id)
+    except Exception as e:
+        print(f"[WARNING] Failed to emit consensus for group {group_name}: {e}")
+
+
 @sequence_bp.route('/upload', methods=['POST'])
 def upload_sequences():
     """Upload multiple AB1 files and generate consensus (PEARL-style)"""
@@ -474,12 +490,12 @@ def upload_sequences():
                 
                 ab1_groups[base_name].append(filepath)
                 
-                # Read sequence info for display
+                # Read sequence info for display (parses the file into its trace store once)
                 try:
-                    record = SeqIO.read(filepath, 'abi' if not filename.endswith('.scf') else 'scf')
+                    trace = load_trace(filepath)
                     
                     # Detect actual direction from AB1 file
-                    detected_direction = detect_sequence_direction(record, filename, pattern_config)
+                    detected_direction = detect_sequence_direction(trace, filename, pattern_config)
                     filename_direction = get_filename_direction(filename, pattern_config)
                     
                     # Check for mismatch
@@ -493,12 +509,11 @@ def upload_sequences():
                     sequences_info.append({
                         'filename': filename,
                         'group': base_name,
-                        'length': len(record.seq),
-                        'avg_quality': sum(record.letter_annotations.get('phred_quality', [0])) / 
-                                     max(len(record.letter_annotations.get('phred_quality', [1])), 1),
-                        'sequence': str(record.seq),
-                        'quality': list(record.letter_annotations.get('phred_quality', [])),
-                        'base_positions': list(record.annotations.get('abif_raw', {}).get('PLOC2', [])) if hasattr(record, 'annotations') and 'abif_raw' in record.annotations else [],
+                        'length': len(trace),
+                        'avg_quality': float(trace.quality_array.mean()) if len(trace.quality_array) else 0,
+                        'sequence': trace.sequence,
+                        'quality': trace.quality,
+                        'base_positions': trace.base_positions,
                         'detected_direction': detected_direction or 'Unknown',
                         'filename_direction': filename_direction or 'Unknown',
                         'direction_mismatch': direction_mismatch,
@@ -531,21 +546,18 @@ def upload_sequences():
             reference_path = os.path.join(session_folder, reference_filename)
             reference_file.save(reference_path)
         
-        # Generate consensus for each group
+        # Generate consensus for each group, in parallel
         tracy_available = check_tracy_installed()
+        method = "Tracy" if tracy_available else "Python"
         consensus_results = []
+        socketio = getattr(current_app, 'socketio', None)
+        socket_id = request.form.get('socket_id')
         
-        for group_name, group_files in ab1_groups.items():
-            print(f"\n=== Processing group: {group_name} ({len(group_files)} files) ===")
-            
-            if tracy_available:
-                result = run_tracy_assemble(group_files, reference_path, virus_type, session_folder)
-                method = "Tracy"
-            else:
-                result = run_python_assemble(group_files, virus_type)
-                method = "Python"
-            
+        for group_name, result in assemble_groups(list(ab1_groups.items()), virus_type,
+                                                  session.get('trimming_config', {}), tracy_available,
+                                                  reference_path, session_folder):
             if result:
+                group_files = ab1_groups[group_name]
                 result['filename'] = f"{group_name}_consensus"
                 result['group'] = group_name
                 result['file_count'] = len(group_files)
@@ -554,6 +566,11 @@ def upload_sequences():
                              if seq.get('group') == group_name and seq.get('id')]
                 result['source_file_ids'] = source_ids
                 consensus_results.append(result)
+            emit_consensus_group(socketio, socket_id, group_name, result, len(ab1_groups))
+        
+        # Keep the groups' order regardless of which finished first
+        group_order = {group_name: index for index, group_name in enumerate(ab1_groups)}
+        consensus_results.sort(key=lambda result: group_order[result['group']])
         
         # Store session info
         session['ab1_session_id'] = session_id
@@ -741,9 +758,11 @@ def generate_consensus():
         
         # Re-run assembly with new virus type for each group
         tracy_available = check_tracy_installed()
+        method = "Tracy" if tracy_available else "Python"
         consensus_results = []
         skipped_groups = []
         failed_groups = []  # Track groups that failed assembly
+        groups_to_assemble = []
         
         # Get sequences_info from session for source file IDs
         sequences_info = session.get('sequences_info', [])
@@ -787,17 +806,17 @@ def generate_consensus():
                         continue
             
             # Use the filtered list for assembly
-            if tracy_available:
-                result = run_tracy_assemble(filtered_group_files, reference_path, virus_type, session_folder)
-                method = "Tracy"
-            else:
-                result = run_python_assemble(filtered_group_files, virus_type)
-                method = "Python"
-            
+            groups_to_assemble.append((group_name, filtered_group_files))
+        
+        # Assemble the groups in parallel, streaming each result as it is done
+        socketio = getattr(current_app, 'socketio', None)
+        socket_id = data.get('socket_id')
+        for group_name, result in assemble_groups(groups_to_assemble, virus_type, session['trimming_config'],
+                                                  tracy_available, reference_path, session_folder):
             if result:
                 result['filename'] = f"{group_name}_consensus"
                 result['group'] = group_name
-                result['file_count'] = len(group_files)
+                result['file_count'] = len(ab1_groups[group_name])
                 # Get source file IDs from sequences_info
                 source_ids = [seq.get('id') for seq in sequences_info 
                              if seq.get('group') == group_name and seq.get('id')]
@@ -807,6 +826,12 @@ def generate_consensus():
                 # Assembly failed for this group
                 print(f"  ✗ FAILED: Assembly failed for {group_name}")
                 failed_groups.append(group_name)
+            emit_consensus_group(socketio, socket_id, group_name, result, len(groups_to_assemble))
+        
+        # Keep the groups' order regardless of which finished first
+        group_order = {group_name: index for index, (group_name, _) in enumerate(groups_to_assemble)}
+        consensus_results.sort(key=lambda result: group_order[result['group']])
+        failed_groups.sort(key=lambda group_name: group_order[group_name])
         
         if not consensus_results:
             error_parts = []
@@ -853,436 +878,6 @@ def generate_consensus():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-def check_tracy_installed():
-    """Check if Tracy command-line tool is available"""
-    try:
-        result = subprocess.run(['tracy', '--version'], 
-                              capture_output=True, 
-                              timeout=5)
-        return result.returncode == 0
-    except:
-        return False
-
-
-def run_tracy_assemble(ab1_files, reference_path, virus_type, session_folder):
-    """Run Tracy assemble command on multiple AB1 files"""
-    try:
-        output_base = os.path.join(session_folder, 'consensus')
-        logfile = os.path.join(session_folder, 'tracy.log')
-        errfile = os.path.join(session_folder, 'tracy.err')
-        
-        # Build Tracy command
-        cmd = ['tracy', 'assemble', '-o', output_base]
-        
-        # Add reference if provided
-        if reference_path:
-            cmd.extend(['-r', reference_path])
-        
-        # Add AB1 files
-        cmd.extend(ab1_files)
-        
-        # Run Tracy
-        with open(logfile, 'w') as log, open(errfile, 'w') as err:
-            result = subprocess.run(cmd, stdout=log, stderr=err, timeout=120)
-        
-        if result.returncode != 0:
-            # Tracy failed, read error
-            with open(errfile, 'r') as err:
-                error_msg = err.read()
-                print(f"Tracy error: {error_msg}")
-            return None
-        
-        # Read Tracy output
-        fasta_file = output_base + '.fasta'
-        json_file = output_base + '.json'
-        
-        if os.path.exists(fasta_file):
-            # Read consensus from FASTA
-            consensus_record = SeqIO.read(fasta_file, 'fasta')
-            consensus_seq = str(consensus_record.seq)
-            
-            # Apply virus-specific trimming
-            # Get custom trimming patterns from session
-            trimming_config = session.get('trimming_config', {})
-            custom_start = trimming_config.get('custom_start')
-            custom_end = trimming_config.get('custom_end')
-            
-            trimmed_seq = trim_by_virus_pattern(consensus_seq, virus_type, custom_start, custom_end)
-            
-            return {
-                'filename': 'consensus',
-                'original_length': len(consensus_seq),
-                'trimmed_length': len(trimmed_seq),
-                'consensus': trimmed_seq,
-                'method': 'Tracy'
-            }
-        
-        return None
-        
-    except Exception as e:
-        print(f"Tracy assembly error: {str(e)}")
-        return None
-
-
-def run_python_assemble(ab1_files, virus_type):
-    """Python-based consensus using proper pairwise alignment"""
-    try:
-        sequences = []
-        
-        # Read all AB1 files
-        for filepath in ab1_files:
-            try:
-                filename = os.path.basename(filepath)
-                edited_path = filepath + ".edited.fasta"
-                
-                # Check if there's a manually edited version (priority)
-                if os.path.exists(edited_path):
-                    print(f"  Using EDITED sequence for {filename}")
-                    record = SeqIO.read(edited_path, 'fasta')
-                    # For edited sequence, we don't have trace data/quality from original
-                    # So we use dummy high quality
-                    sequences.append({
-                        'sequence': str(record.seq),
-                        'quality': [40] * len(record.seq),
-                        'filename': filename,
-                        'is_edited': True
-                    })
-                else:
-                    record = SeqIO.read(filepath, 'abi' if not filepath.endswith('.scf') else 'scf')
-                    sequences.append({
-                        'sequence': str(record.seq),
-                        'quality': record.letter_annotations.get('phred_quality', []),
-                        'filename': filename,
-                        'is_edited': False
-                    })
-            except:
-                continue
-        
-        if not sequences:
-            return None
-        
-        # If only one sequence, just trim it
-        if len(sequences) == 1:
-            seq = sequences[0]['sequence']
-            qual = sequences[0]['quality']
-            trimmed_seq, _ = trim_sequence_by_quality(seq, qual, threshold=20)
-            
-            # Get custom trimming patterns from session
-            trimming_config = session.get('trimming_config', {})
-            custom_start = trimming_config.get('custom_start')
-            custom_end = trimming_config.get('custom_end')
-            
-            final_seq = trim_by_virus_pattern(trimmed_seq, virus_type, custom_start, custom_end)
-            
-            # Clean any ambiguity codes
-            final_seq = ''.join([base if base in 'ATGCatgc' else '' for base in final_seq])
-            
-            return {
-                'filename': 'consensus',
-                'original_length': len(seq),
-                'trimmed_length': len(final_seq),
-                'consensus': final_seq,
-                'method': 'Python'
-            }
-        
-        # Multiple sequences - use proper pairwise alignment
-        print(f"Assembling {len(sequences)} sequences using Python pairwise alignment")
-        print(f"DEBUG: virus_type parameter = '{virus_type}'")
-        
-        # Trim all sequences first
-        trimmed_sequences = []
-        for seq_data in sequences:
-            seq = seq_data['sequence']
-            qual = seq_data['quality']
-            trimmed_seq, trimmed_qual = trim_sequence_by_quality(seq, qual, threshold=20)
-            if trimmed_seq:
-                trimmed_sequences.append({
-                    'sequence': trimmed_seq,
-                    'quality': trimmed_qual,
-                    'filename': seq_data['filename']
-                })
-        
-        if not trimmed_sequences:
-            return None
-        
-        # Start with the longest sequence as reference
-        reference = max(trimmed_sequences, key=lambda x: len(x['sequence']))
-        consensus_seq = reference['sequence']
-        consensus_qual = reference['quality']
-        
-        print(f"Reference: {reference['filename']} ({len(consensus_seq)} bp)")
-        
-        # Align and merge each additional sequence
-        for seq_data in trimmed_sequences:
-            if seq_data == reference:
-                continue
-            
-            print(f"Aligning: {seq_data['filename']} ({len(seq_data['sequence'])} bp)")
-            
-            # Try both forward and reverse complement
-            seq_fwd = seq_data['sequence']
-            seq_rev = str(Seq(seq_data['sequence']).reverse_complement())
-            qual_fwd = seq_data['quality']
-            qual_rev = list(reversed(seq_data['quality']))
-            
-            # Align forward
-            aligner = PairwiseAligner()
-            aligner.mode = 'global'
-            aligner.match_score = 2
-            aligner.mismatch_score = -1
-            aligner.open_gap_score = -2
-            aligner.extend_gap_score = -0.5
-            
-            try:
-                align_fwd = aligner.align(consensus_seq, seq_fwd)
-                score_fwd = align_fwd.score if align_fwd else 0
-            except (OverflowError, MemoryError) as e:
-                print(f"  Warning: Forward alignment overflow for {seq_data['filename']}, using simple score")
-                # Fallback: use simple match count
-                score_fwd = sum(1 for a, b in zip(consensus_seq, seq_fwd) if a == b)
-                align_fwd = None
-            
-            # Align reverse complement
-            try:
-                align_rev = aligner.align(consensus_seq, seq_rev)
-                score_rev = align_rev.score if align_rev else 0
-            except (OverflowError, MemoryError) as e:
-                print(f"  Warning: Reverse alignment overflow for {seq_data['filename']}, using simple score")
-                # Fallback: use simple match count
-                score_rev = sum(1 for a, b in zip(consensus_seq, seq_rev) if a == b)
-                align_rev = None
-            
-            # Use better alignment
-            if score_rev > score_fwd:
-                print(f"  Using reverse complement (score: {score_rev})")
-                if align_rev:
-                    best_align = next(iter(align_rev))
-                else:
-                    # Fallback to simple concatenation if alignment failed
-                    print(f"  Warning: Using fallback merge for {seq_data['filename']}")
-                    consensus_seq = consensus_seq + seq_rev
-                    consensus_qual.extend(qual_rev)
-                    continue
-                seq_to_use = seq_rev
-                qual_to_use = qual_rev
-            else:
-                print(f"  Using forward (score: {score_fwd})")
-                if align_fwd:
-                    best_align = next(iter(align_fwd))
-                else:
-                    # Fallback to simple concatenation if alignment failed
-                    print(f"  Warning: Using fallback merge for {seq_data['filename']}")
-                    consensus_seq = consensus_seq + seq_fwd
-                    consensus_qual.extend(qual_fwd)
-                    continue
-                seq_to_use = seq_fwd
-                qual_to_use = qual_fwd
-            
-            # Merge aligned sequences
-            aligned_ref = str(best_align[0])
-            aligned_seq = str(best_align[1])
-            
-            # Build consensus from alignment
-            new_consensus = []
-            new_qual = []
-            ref_idx = 0
-            seq_idx = 0
-            
-            for i in range(len(aligned_ref)):
-                ref_base = aligned_ref[i].upper()
-                seq_base = aligned_seq[i].upper()
-                
-                # Clean ambiguity codes - only allow ATGC or gaps
-                if ref_base not in 'ATGC-':
-                    ref_base = 'N'
-                if seq_base not in 'ATGC-':
-                    seq_base = 'N'
-                
-                ref_q = consensus_qual[ref_idx] if ref_idx < len(consensus_qual) and ref_base != '-' else 0
-                seq_q = qual_to_use[seq_idx] if seq_idx < len(qual_to_use) and seq_base != '-' else 0
-                
-                # Choose base with higher quality, skipping N's
-                if ref_base == '-' and seq_base != '-' and seq_base != 'N':
-                    new_consensus.append(seq_base)
-                    new_qual.append(seq_q)
-                elif seq_base == '-' and ref_base != '-' and ref_base != 'N':
-                    new_consensus.append(ref_base)
-                    new_qual.append(ref_q)
-                elif ref_base == 'N' and seq_base != 'N' and seq_base != '-':
-                    new_consensus.append(seq_base)
-                    new_qual.append(seq_q)
-                elif seq_base == 'N' and ref_base != 'N' and ref_base != '-':
-                    new_consensus.append(ref_base)
-                    new_qual.append(ref_q)
-                elif ref_base == seq_base and ref_base != 'N' and ref_base != '-':
-                    new_consensus.append(ref_base)
-                    new_qual.append(max(ref_q, seq_q))
-                elif ref_base != '-' and seq_base != '-' and ref_base != 'N' and seq_base != 'N':
-                    # Mismatch - use higher quality base
-                    if seq_q > ref_q:
-                        new_consensus.append(seq_base)
-                        new_qual.append(seq_q)
-                    else:
-                        new_consensus.append(ref_base)
-                        new_qual.append(ref_q)
-                elif ref_base != '-' and ref_base != 'N':
-                    new_consensus.append(ref_base)
-                    new_qual.append(ref_q)
-                elif seq_base != '-' and seq_base != 'N':
-                    new_consensus.append(seq_base)
-                    new_qual.append(seq_q)
-                # else: skip if both are gaps or N
-                
-                if ref_base != '-':
-                    ref_idx += 1
-                if seq_base != '-':
-                    seq_idx += 1
-            
-            consensus_seq = ''.join(new_consensus)
-            consensus_qual = new_qual
-            
-            print(f"  New consensus length: {len(consensus_seq)} bp")
-        
-        # Apply virus-specific trimming
-        # Get custom trimming patterns from session
-        trimming_config = session.get('trimming_config', {})
-        custom_start = trimming_config.get('custom_start')
-        custom_end = trimming_config.get('custom_end')
-        
-        final_seq = trim_by_virus_pattern(consensus_seq, virus_type, custom_start, custom_end)
-        
-        # Clean any remaining ambiguity codes
-        final_seq = ''.join([base if base in 'ATGCatgc' else '' for base in final_seq])
-        
-        print(f"Final consensus: {len(final_seq)} bp (after virus trimming)")
-        
-        return {
-            'filename': 'consensus',
-            'original_length': len(consensus_seq),
-            'trimmed_length': len(final_seq),
-            'consensus': final_seq,
-            'method': 'Python'
-        }
-        
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Python assembly error: {str(e)}")
-        return None
-
-
-def trim_by_virus_pattern(sequence, virus_type, custom_start=None, custom_end=None):
-    """Apply virus-specific pattern trimming or custom primers (supports IUPAC ambiguity codes)"""
-    import re
-    
-    # IUPAC ambiguity code mapping
-    iupac_codes = {
-        'R': '[AG]', 'Y': '[CT]', 'M': '[AC]', 'K': '[GT]',
-        'S': '[GC]', 'W': '[AT]', 'H': '[ACT]', 'B': '[CGT]',
-        'V': '[ACG]', 'D': '[AGT]', 'N': '[ACGT]',
-        'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T'
-    }
-    
-    def convert_to_regex(pattern):
-        """Convert primer sequence with IUPAC codes to regex pattern"""
-        if not pattern:
-            return None
-        regex = ''
-        for base in pattern.upper():
-            regex += iupac_codes.get(base, base)
-        return regex
-    
-    # Check if trimming is disabled
-    trimming_config = session.get('trimming_config', {'enabled': True})
-    if not trimming_config.get('enabled', True):
-        print(f"  Trimming disabled, returning original sequence")
-        return sequence
-    
-    # Use custom patterns if provided
-    if custom_start or custom_end:
-        start_pattern = custom_start or ''
-        end_pattern = custom_end or ''
-        print(f"  Using custom trimming patterns: '{start_pattern}' ... '{end_pattern}'")
-    else:
-        # Use default patterns for virus type
-        patterns = {
-            "Hanta": ("TGGTCACC", "CATCATTC"),
-            "Corona": ("AAGTGTGA", "ATGATTCT"),
-            "Paramyxo": ("GGAATAAT", "ATGACCT"),
-            "Flavi": ("AGAAGTTG", "CTCTCCAT"),
-            "Other": None
-        }
-        
-        if virus_type not in patterns or patterns[virus_type] is None:
-            print(f"  No default patterns for {virus_type}, skipping trimming")
-            return sequence
-        
-        start_pattern, end_pattern = patterns[virus_type]
-    
-    # Only trim if both patterns are provided
-    if not start_pattern or not end_pattern:
-        print(f"  Missing start or end pattern, skipping trimming")
-        return sequence
-    
-    # Convert patterns to regex (handles IUPAC codes like N, R, Y, etc.)
-    start_regex = convert_to_regex(start_pattern)
-    end_regex = convert_to_regex(end_pattern)
-    
-    try:
-        # Search for patterns using regex
-        start_match = re.search(start_regex, sequence, re.IGNORECASE)
-        end_match = None
-        
-        # Find last occurrence of end pattern
-        for match in re.finditer(end_regex, sequence, re.IGNORECASE):
-            end_match = match
-        
-        if start_match and end_match and start_match.start() < end_match.start():
-            start_index = start_match.start()
-            end_index = end_match.end()
-            trimmed = sequence[start_index:end_index]
-            print(f"  Trimmed by {virus_type} pattern: {len(sequence)} bp -> {len(trimmed)} bp")
-            print(f"    Found start at position {start_index}, end at position {end_index}")
-            if custom_start or custom_end:
-                print(f"    Matched: '{sequence[start_index:start_match.end()]}' ... '{sequence[end_match.start():end_index]}'")
-            return trimmed
-        else:
-            print(f"  Warning: Trimming patterns not found, returning original sequence")
-            if not start_match:
-                print(f"    Start pattern '{start_pattern}' not found")
-                print(f"    Sequence starts with: {sequence[:50]}")
-            if not end_match:
-                print(f"    End pattern '{end_pattern}' not found")
-                print(f"    Sequence ends with: {sequence[-50:]}")
-            return sequence
-    except Exception as e:
-        print(f"  Error during pattern matching: {e}")
-        return sequence
-
-
-def trim_sequence_by_quality(sequence, quality, threshold=20):
-    """Trim sequence ends based on quality threshold"""
-    if not quality or len(quality) != len(sequence):
-        return sequence, []
-    
-    # Find first position with quality >= threshold
-    start = 0
-    for i, q in enumerate(quality):
-        if q >= threshold:
-            start = i
-            break
-    
-    # Find last position with quality >= threshold
-    end = len(sequence)
-    for i in range(len(quality) - 1, -1, -1):
-        if quality[i] >= threshold:
-            end = i + 1
-            break
-    
-    return sequence[start:end], quality[start:end]
-
-
-
 @sequence_bp.route('/export-fasta', methods=['POST'])
 def export_fasta():
     """Export consensus sequences to FASTA format"""
@@ -1544,49 +1139,19 @@ def view_chromatogram(filename):
             forward_file = filepath
         
         def read_ab1_data(file_path):
-            record = SeqIO.read(file_path, 'abi' if not file_path.endswith('.scf') else 'scf')
-            
-            trace_data = {'A': [], 'C': [], 'G': [], 'T': []}
-            if hasattr(record, 'annotations') and 'abif_raw' in record.annotations:
-                abif_raw = record.annotations['abif_raw']
-                
-                # Get the channel order from FWO_ tag (filter wheel order)
-                # This tells us which DATA channel corresponds to which base
-                fwo = abif_raw.get('FWO_', b'GATC').decode('ascii') if isinstance(abif_raw.get('FWO_', b'GATC'), bytes) else str(abif_raw.get('FWO_', 'GATC'))
-                
-                # Read the four data channels
-                data_channels = [
-                    list(abif_raw.get('DATA9', [])),
-                    list(abif_raw.get('DATA10', [])),
-                    list(abif_raw.get('DATA11', [])),
-                    list(abif_raw.get('DATA12', []))
-                ]
-                
-                # Map channels to bases according to FWO order
-                for i, base in enumerate(fwo):
-                    if i < len(data_channels) and base in 'ACGT':
-                        trace_data[base] = data_channels[i]
-            
-            base_positions = []
-            if hasattr(record, 'annotations') and 'abif_raw' in record.annotations:
-                base_positions = list(record.annotations['abif_raw'].get('PLOC2', []))
-            
-            quality = list(record.letter_annotations.get('phred_quality', []))
-            sequence = str(record.seq)
-            
+            trace = load_trace(file_path)
             return {
-                'sequence': sequence,
-                'quality': quality,
-                'trace_data': trace_data,
-                'base_positions': base_positions
+                'sequence': trace.sequence,
+                'quality': trace.quality,
+                'trace_data': trace.trace_data,
+                'base_positions': trace.base_positions
             }
         
         # Detect direction from filename
         detected_direction = get_filename_direction(filename, pattern_config)
         if not detected_direction:
             # Try reading from AB1 metadata
-            record = SeqIO.read(filepath, 'abi' if not filepath.endswith('.scf') else 'scf')
-            detected_direction = detect_sequence_direction(record, filename, pattern_config)
+            detected_direction = detect_sequence_direction(load_trace(filepath), filename, pattern_config)
         
         # Read forward data
         forward_data = read_ab1_data(forward_file if forward_file else filepath)
@@ -1828,23 +1393,44 @@ def save_blast_results_to_db(conn, db_type, blast_results, consensus_results):
                 ))
     
     conn.commit()
+    DatabaseManagerFlask.rows_changed(conn, 'blast_results')
+    DatabaseManagerFlask.rows_changed(conn, 'blast_hits')
     print(f"✓ Saved {len(blast_results)} BLAST results with hits to database")
 
 
 @sequence_bp.route('/blast-consensus', methods=['POST'])
 def blast_consensus():
-    """Run BLAST on all consensus sequences using BioPython NCBIWWW"""
+    """
+    Run BLAST on all consensus sequences.
+    
+    Searches the local reference (BLAST_REFERENCE_FASTA) when one is configured,
+    otherwise NCBI through BioPython NCBIWWW. 'engine' in the request can force
+    'local' or 'ncbi'.
+    """
     try:
         data = request.get_json()
         consensus_results = session.get('consensus_results', [])
         mode = data.get('mode', 'viruses')  # 'viruses' or 'all'
         program_override = data.get('program', 'auto') # 'auto', 'blastn', 'megablast'
+        engine = data.get('engine', 'auto')  # 'auto', 'local' or 'ncbi'
         
         if not consensus_results:
             return jsonify({'success': False, 'message': 'No consensus sequences available'}), 400
         
+        # The local reference is nucleotide only; blastx always goes to NCBI
+        local_blast = None
+        reference_fasta = current_app.config.get('BLAST_REFERENCE_FASTA')
+        if engine != 'ncbi' and program_override != 'blastx' and reference_fasta and os.path.exists(reference_fasta):
+            local_blast = get_local_blast(reference_fasta, current_app.config.get('BLAST_BACKEND', 'auto'))
+        elif engine == 'local' and program_override == 'blastx':
+            return jsonify({'success': False, 'message': 'blastx is not supported locally; use the NCBI engine'}), 400
+        elif engine == 'local':
+            return jsonify({'success': False, 'message': 'No local BLAST reference configured (BLAST_REFERENCE_FASTA)'}), 400
+        
         total = len(consensus_results)
         mode_text = 'viruses only' if mode == 'viruses' else 'all organisms'
+        if local_blast:
+            mode_text = f'local reference {os.path.basename(reference_fasta)}'
         print(f"\n=== Starting BLAST for {total} sequences (Mode: {mode_text}, Program: {program_override}) ===")
         
         blast_results = []
@@ -1855,26 +1441,79 @@ def blast_consensus():
         with progress_lock:
             blast_progress_data = {'completed': 0, 'total': total, 'status': 'running'}
         
-        def blast_batch(batch_results):
-            """Run BLAST for a batch of sequences using BioPython with retry logic"""
+        # What the results depend on besides the sequence: the cache key
+        if local_blast:
+            cache_program = 'blastn' if program_override == 'blastn' else 'megablast'
+            cache_database, entrez_query = local_blast.database_id(), ''
+        else:
+            cache_program = program_override if program_override in ('blastn', 'blastx') else 'megablast'
+            cache_database = 'nr' if program_override == 'blastx' else 'nt'
+            entrez_query = 'viruses[organism]' if mode == 'viruses' else ''
+        
+        # Sequences searched before come from the cache in the user's database
+        blast_cache = None
+        cached_by_hash = {}
+        db_type = session.get('db_type', 'sqlite')
+        cache_db = session.get('db_path') if db_type == 'sqlite' else session.get('db_params')
+        if data.get('use_cache', True) and cache_db:
+            try:
+                blast_cache = BlastCache(DatabaseManagerFlask.get_connection(cache_db, db_type), db_type,
+                                         current_app.config.get('BLAST_CACHE_TTL_DAYS', DEFAULT_TTL_DAYS))
+                cached_by_hash = blast_cache.get_many(
+                    [sequence_hash(res['consensus']) for res in consensus_results if res.get('consensus')],
+                    cache_program, cache_database, entrez_query
+                )
+            except Exception as e:
+                print(f"Warning: BLAST cache unavailable: {e}")
+                blast_cache = None
+        
+        # Search each distinct uncached sequence once; repeats copy its result
+        # to_search holds (sequence hash, consensus result); the hash travels with the search
+        to_search, duplicates, searched_hashes = [], [], set()
+        for res in consensus_results:
+            name = res.get('group', res.get('filename', 'Unknown'))
+            seq_hash = sequence_hash(res['consensus']) if res.get('consensus') else None
+            if seq_hash in cached_by_hash:
+                blast_results.append(dict(cached_by_hash[seq_hash], name=name, cached=True))
+                completed += 1
+            elif seq_hash in searched_hashes:
+                duplicates.append((name, seq_hash))
+            else:
+                if seq_hash:
+                    searched_hashes.add(seq_hash)
+                to_search.append((seq_hash, res))
+        
+        if completed:
+            print(f"  ✓ {completed} sequences answered from the BLAST cache")
+            with progress_lock:
+                blast_progress_data['completed'] = completed
+        
+        def blast_batch(batch):
+            """
+            Run BLAST for a batch of (sequence hash, consensus result) using BioPython
+            with retry logic; returns (sequence hash, BLAST result) pairs
+            """
             # Create a multi-FASTA string for the batch
             fasta_string = ""
-            batch_names = []
-            for res in batch_results:
+            batch_names, batch_hashes, batch_seqs = [], [], []
+            for seq_hash, res in batch:
                 name = res.get('group', res.get('filename', 'Unknown'))
                 seq = res.get('consensus', '')
                 if seq:
                     fasta_string += f">{name}\n{seq}\n"
                     batch_names.append(name)
+                    batch_hashes.append(seq_hash)
+                    batch_seqs.append(seq)
             
             # Check if cancelled before starting
             with progress_lock:
                 if blast_progress_data.get('cancelled', False):
                     print(f"  ⚠ BLAST batch cancelled before starting for: {', '.join(batch_names[:2])}")
-                    return [{'name': name, 'error': 'BLAST cancelled by user'} for name in batch_names]
+                    return [(seq_hash, {'name': name, 'error': 'BLAST cancelled by user'})
+                            for seq_hash, name in zip(batch_hashes, batch_names)]
             
             if not fasta_string:
-                return [{'name': 'Unknown', 'error': 'No sequence data in batch'}]
+                return [(None, {'name': 'Unknown', 'error': 'No sequence data in batch'})]
             
             # Prepare BLAST parameters
             blast_params = {
@@ -1925,8 +1564,7 @@ def blast_consensus():
                         if i >= len(batch_names): break # Should not happen
                         
                         seq_name = batch_names[i]
-                        orig_seq = next((r.get('consensus', '') for r in batch_results if r.get('group', r.get('filename')) == seq_name), '')
-                        seq_len = len(orig_seq)
+                        seq_len = len(batch_seqs[i])
                         
                         hits = []
                         for rank, alignment in enumerate(blast_record.alignments[:10], 1):
@@ -1958,11 +1596,11 @@ def blast_consensus():
                                 'gaps': getattr(hsp, 'gaps', 0)
                             })
                         
-                        results.append({
+                        results.append((batch_hashes[i], {
                             'name': seq_name,
                             'sequence_length': seq_len,
                             'hits': hits
-                        })
+                        }))
                         
                         if len(hits) == 0:
                             print(f"  ⚠ No hits found for {seq_name}")
@@ -1978,16 +1616,43 @@ def blast_consensus():
                     
                     if attempt == max_retries:
                         # Return errors for all sequences in the batch
-                        return [{'name': name, 'error': error_msg} for name in batch_names]
+                        return [(seq_hash, {'name': name, 'error': error_msg})
+                                for seq_hash, name in zip(batch_hashes, batch_names)]
                     continue
         
-        # Split consensus results into batches of 5
-        batch_size = 5
-        batches = [consensus_results[i:i + batch_size] for i in range(0, len(consensus_results), batch_size)]
+        def local_blast_batch(batch):
+            """Search a batch of (sequence hash, consensus result) in the local reference"""
+            batch = [(seq_hash, res) for seq_hash, res in batch if res.get('consensus')]
+            queries = [(res.get('group', res.get('filename', 'Unknown')), res['consensus']) for _, res in batch]
+            hashes = [seq_hash for seq_hash, _ in batch]
+            with progress_lock:
+                if blast_progress_data.get('cancelled', False):
+                    return [(seq_hash, {'name': name, 'error': 'BLAST cancelled by user'})
+                            for seq_hash, (name, _) in zip(hashes, queries)]
+            if not queries:
+                return [(None, {'name': 'Unknown', 'error': 'No sequence data in batch'})]
+            try:
+                # One result per query, in query order
+                results = local_blast.search_many(queries, program=program_override)
+            except Exception as e:
+                print(f"Error in local BLAST batch: {e}")
+                return [(seq_hash, {'name': name, 'error': str(e)}) for seq_hash, (name, _) in zip(hashes, queries)]
+            for res in results:
+                print(f"  ✓ {res['name']}: {len(res.get('hits', []))} hits (local)")
+            return list(zip(hashes, results))
+        
+        if local_blast and to_search:
+            # Build the reference index now rather than in the first batch
+            local_blast.ensure_index()
+            run_batch, batch_size, workers = local_blast_batch, local_blast.workers, 1
+        else:
+            # Batches of 5, 2 in parallel to stay safe but efficient with NCBI
+            run_batch, batch_size, workers = blast_batch, 5, 2
+        batches = [to_search[i:i + batch_size] for i in range(0, len(to_search), batch_size)]
         
-        # Run batches in parallel (using 2 workers to stay safe but efficient)
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            futures = {executor.submit(blast_batch, batch): batch for batch in batches}
+        searched_results = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_batch, batch): batch for batch in batches}
             
             for future in as_completed(futures):
                 try:
@@ -1995,8 +1660,10 @@ def blast_consensus():
                     batch_res_list = future.result()
                     elapsed = time.time() - start_time
                     
-                    for res in batch_res_list:
+                    for seq_hash, res in batch_res_list:
                         blast_results.append(res)
+                        if seq_hash:
+                            searched_results[seq_hash] = res
                         completed += 1
                         
                         # Update global progress
@@ -2010,6 +1677,23 @@ def blast_consensus():
                     # Try to recovered metadata from futures if possible
                     completed += batch_size # Approximate
         
+        for name, seq_hash in duplicates:
+            source = searched_results.get(seq_hash)
+            blast_results.append(dict(source, name=name) if source else {'name': name, 'error': 'No BLAST result'})
+        
+        # Cache the new results (failed and cancelled searches have no hits to cache)
+        if blast_cache:
+            try:
+                stored = blast_cache.put_many(
+                    [(seq_hash, res.get('sequence_length'), res['hits'])
+                     for seq_hash, res in searched_results.items() if 'hits' in res],
+                    cache_program, cache_database, entrez_query
+                )
+                if stored:
+                    print(f"  ✓ Cached {stored} BLAST results")
+            except Exception as e:
+                print(f"Warning: Could not cache BLAST results: {e}")
+        
         # Mark as completed
         with progress_lock:
             blast_progress_data['completed'] = total
@@ -2031,7 +1715,7 @@ def blast_consensus():
                     import shutil
                     removed = 0
                     for filename in os.listdir(session_folder):
-                        if filename.lower().endswith(('.ab1', '.abi', '.scf')):
+                        if filename.lower().endswith(SESSION_FILE_SUFFIXES):
                             try:
                                 os.remove(os.path.join(session_folder, filename))
                                 removed += 1
@@ -2236,6 +1920,7 @@ def save_to_database():
                     VALUES (%s, %s, %s, NOW())
                 """, (project_name, f"Sequences uploaded on {datetime.datetime.now().strftime('%Y-%m-%d')}", uploaded_by))
             fresh_conn.commit()
+            DatabaseManagerFlask.rows_changed_in(db_conn, db_type, 'projects')
             print(f"Created project: {project_name}")
             
             # Emit real-time update for project creation
@@ -2538,7 +2223,7 @@ def background_cleanup(session_id, upload_folder, socketio):
                 # Remove all AB1 files from the session folder
                 ab1_files_removed = 0
                 total_files = len([f for f in os.listdir(session_folder) 
-                                if f.lower().endswith(('.ab1', '.abi', '.scf'))])
+                                if f.lower().endswith(SESSION_FILE_SUFFIXES)])
                 
                 # Send initial progress
                 if socketio:
@@ -2550,7 +2235,7 @@ def background_cleanup(session_id, upload_folder, socketio):
                     })
                 
                 for filename in os.listdir(session_folder):
-                    if filename.lower().endswith(('.ab1', '.abi', '.scf')):
+                    if filename.lower().endswith(SESSION_FILE_SUFFIXES):
                         filepath = os.path.join(session_folder, filename)
                         try:
                             os.remove(filepath)
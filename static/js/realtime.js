@@ -186,7 +186,7 @@ class HaoXaiRealtime {
         console.log('Stats updated:', data);
         
         // Update any statistics displays
-        this.updateTableStats();
+        this.updateTableStats(data);
         this.updateLinkStats();
     }
 
@@ -425,16 +425,22 @@ class HaoXaiRealtime {
         }
     }
 
-    updateTableStats() {
-        // Refresh dashboard statistics
+    updateTableStats(data) {
+        // Refresh dashboard statistics; data carries row_counts when the server knows them
         if (typeof loadDashboardStats === 'function') {
-            loadDashboardStats();
+            loadDashboardStats(data);
         }
         
         // Update any stat cards
+        const rowCounts = (data && data.row_counts) || {};
         document.querySelectorAll('.stats-card').forEach(card => {
             const table = card.dataset.table;
-            if (table) {
+            if (table && table in rowCounts) {
+                const countElement = card.querySelector('.count');
+                if (countElement) {
+                    countElement.textContent = rowCounts[table];
+                }
+            } else if (table) {
                 fetch(`/main/get-table-count/${table}`)
                     .then(r => r.json())
                     .then(data => {
@@ -680,8 +686,8 @@ document.head.appendChild(style);
 let realtimeClient;
 document.addEventListener('DOMContentLoaded', () => {
     realtimeClient = new HaoXaiRealtime();
+    // Make it globally available once it exists
+    window.realtimeClient = realtimeClient;
 });
 
-// Make it globally available
-window.HaoXaiRealtime = HaoXaiRealtime;
-window.realtimeClient = realtimeClient;
\ No newline at end of file
+window.HaoXaiRealtime = HaoXaiRealtime;
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""Tests for the seeded read alignment in utils.consensus_assembly"""
+import random
+
+from utils.consensus_assembly import SEED_K, chain_anchors, find_seeds, seeded_align
+
+
+def random_sequence(length, seed=1):
+    rng = random.Random(seed)
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+def ungapped(aligned):
+    return aligned.replace('-', '')
+
+
+def test_find_seeds_identical_sequences_lie_on_the_main_diagonal():
+    ref = random_sequence(300)
+    seeds = find_seeds(ref, ref)
+    assert len(seeds) == len(ref) - SEED_K + 1
+    assert all(r == s for r, s in seeds)
+    assert [s for _, s in seeds] == sorted(s for _, s in seeds)
+
+
+def test_find_seeds_offset_read_and_case():
+    ref = random_sequence(400)
+    seq = ref[100:250].lower()
+    seeds = find_seeds(ref, seq)
+    assert seeds
+    assert {r - s for r, s in seeds} == {100}
+
+
+def test_find_seeds_skips_repeated_and_ambiguous_kmers():
+    repeat = random_sequence(SEED_K, seed=2)
+    ref = repeat + random_sequence(50, seed=3) + repeat
+    seeds = find_seeds(ref, repeat)
+    assert seeds == []
+
+    ref = random_sequence(100, seed=4)
+    seq = ref[:40] + 'N' + ref[41:]
+    positions = [s for _, s in find_seeds(ref, seq)]
+    assert not any(s <= 40 < s + SEED_K for s in positions)
+
+
+def test_find_seeds_unrelated_sequences():
+    assert find_seeds(random_sequence(300, seed=5), random_sequence(300, seed=6)) == []
+
+
+def test_chain_anchors_merges_overlapping_seeds_into_one_anchor():
+    ref = random_sequence(300)
+    seq = ref[50:200]
+    assert chain_anchors(find_seeds(ref, seq)) == [(50, 0, 150)]
+
+
+def test_chain_anchors_empty():
+    assert chain_anchors([]) == []
+
+
+def test_chain_anchors_drops_seeds_off_the_main_diagonal():
+    seeds = [(i, i) for i in range(0, 40, 4)] + [(500, 20)]
+    anchors = chain_anchors(seeds, k=4)
+    assert anchors == [(0, 0, 40)]
+
+
+def test_chain_anchors_are_colinear_and_do_not_overlap():
+    ref = random_sequence(600)
+    # A 5 base insertion and a 3 base deletion in the read
+    seq = ref[:200] + 'TTTTT' + ref[200:400] + ref[403:]
+    anchors = chain_anchors(find_seeds(ref, seq))
+    assert len(anchors) >= 3
+    for (r1, s1, l1), (r2, s2, l2) in zip(anchors, anchors[1:]):
+        assert r1 + l1 <= r2 and s1 + l1 <= s2
+    for r, s, length in anchors:
+        assert ref[r:r + length] == seq[s:s + length]
+
+
+def test_seeded_align_keeps_both_sequences_and_matches_anchors():
+    ref = random_sequence(600)
+    seq = ref[:200] + 'TTTTT' + ref[200:400] + ref[403:]
+    aligned_ref, aligned_seq = seeded_align(ref, seq, chain_anchors(find_seeds(ref, seq)))
+    assert len(aligned_ref) == len(aligned_seq)
+    assert ungapped(aligned_ref) == ref
+    assert ungapped(aligned_seq) == seq
+    assert aligned_ref.count('-') == 5
+    assert aligned_seq.count('-') == 3
+    assert all(a == b for a, b in zip(aligned_ref, aligned_seq) if '-' not in (a, b))
+
+
+def test_seeded_align_overhangs_use_free_end_gaps():
+    ref = random_sequence(400)
+    seq = random_sequence(30, seed=7) + ref[100:300] + random_sequence(20, seed=8)
+    aligned_ref, aligned_seq = seeded_align(ref, seq, chain_anchors(find_seeds(ref, seq)))
+    assert ungapped(aligned_ref) == ref
+    assert ungapped(aligned_seq) == seq
+    # The shared middle is aligned column for column
+    start = aligned_seq.index(ref[100:300])
+    assert aligned_ref[start:start + 200] == ref[100:300]
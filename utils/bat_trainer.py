@@ -0,0 +1,435 @@
+"""
+Bat genus/species model training
+
+The cleaning and fitting behind /bat-ml/train-bat-model. Training runs as a
+background job (bat_training_jobs) with progress pushed to the job's SocketIO
+room (``bat_train_job_<id>``): the genus and species RandomForests are fitted
+at the same time, each with parallel tree building, and grown in steps so
+progress can be reported. The cleaned data is fingerprinted, and an upload
+whose fingerprint matches the current models is not trained again.
+
+Trained models are saved as versions under models/bat_models in the shared
+model store (utils.model_store), memory-mapped on load.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+from database.background_jobs import BackgroundJob, BackgroundJobManager
+from utils.model_store import get_model_store
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+ARTIFACT_DIR = os.path.join(MODELS_DIR, 'bat_models')
+
+# Part of the data fingerprint; bump when cleaning or hyperparameters change
+# so models trained the old way are not mistaken for current ones
+TRAINING_VERSION = 1
+
+# Versions kept on disk besides the current one
+KEEP_VERSIONS = 2
+
+# Entries of a bat model set stored as model objects; the rest is metadata
+MODEL_COMPONENTS = ['genus_model', 'species_model', 'genus_encoder', 'species_encoder', 'feature_encoders']
+
+FEATURES = ['FA', 'TIB', 'W', 'Sex', 'Status']
+
+# Trees added per fitting step; progress is reported after each step
+TREE_STEP = 50
+
+# Map BATHOST specific columns to expected model features
+COLUMN_MAPPING = {
+    'forearm_mm': 'FA',
+    'tibia_mm': 'TIB',
+    'weight_g': 'W',
+    'sex': 'Sex',
+    'status': 'Status',
+    'Genus': 'genus',
+    'Species': 'species'
+}
+
+
+class TrainingDataError(ValueError):
+    """The uploaded training sheet cannot be used"""
+
+
+def clean_numeric(value):
+    """
+    Strict numeric parsing for bat measurements.
+    """
+    if pd.isna(value):
+        return np.nan
+
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    # Convert to string and clean
+    s = str(value).strip().lower()
+    if not s or s in ['-', 'none', 'nan', 'unknown', '--', 'null']:
+        return np.nan
+
+    try:
+        # Check for simple numeric strings first
+        if re.match(r'^-?\d+(\.\d+)?$', s):
+            return float(s)
+
+        # Handle ranges (43.1-43.5) by taking average
+        if '-' in s:
+            parts = s.split('-')
+            if len(parts) == 2:
+                # If it looks like box info (e.g. 43-14) or IDs, skip the "smart" decimal conversion
+                # which was causing fake weights like 43.14.
+                # REAL ranges are usually close (e.g. 43.1-43.5).
+                # If they differ by > 20%, it's probably an ID, not a measurement.
+                p1 = re.sub(r'[^-0-9.]', '', parts[0])
+                p2 = re.sub(r'[^-0-9.]', '', parts[1])
+                if p1 and p2:
+                    v1, v2 = float(p1), float(p2)
+                    if abs(v1 - v2) < (max(v1, v2) * 0.2): # Within 20%
+                        return (v1 + v2) / 2
+            return np.nan # Assume junk if not a close range
+
+        # Clean common garbage characters
+        s_clean = re.sub(r'[^-0-9.]', '', s)
+        if s_clean:
+            return float(s_clean)
+    except:
+        pass
+
+    return np.nan
+
+
+def prepare_training_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean an uploaded training sheet: map column names, normalize labels,
+    parse measurements, drop outliers and classes with fewer than 3 rows.
+
+    Raises:
+        TrainingDataError: Required columns are missing or too few rows are left
+    """
+    # Standardize column names
+    df = df.copy()
+    df.columns = [str(col).strip() for col in df.columns]
+    df = df.rename(columns={old: new for old, new in COLUMN_MAPPING.items() if old in df.columns})
+
+    # 1. CLEANING CATEGORICAL DATA (Fix "Sphaerias " vs "Sphaerias")
+    for col in ['genus', 'species', 'Sex', 'Status']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip().str.title()
+            # Remove rows with placeholder text
+            df = df[~df[col].isin(['-', 'None', 'Nan', 'Unknown', 'nan', ''])]
+
+    # 2. CLEANING NUMERIC DATA (Fix "43-14" -> nan, handle ranges correctly)
+    for col in ['FA', 'TIB', 'W']:
+        if col in df.columns:
+            df[col] = df[col].apply(clean_numeric)
+
+    # 3. FILTERING
+    initial_count = len(df)
+    required_cols = ['genus', 'species', 'FA', 'TIB', 'W', 'Sex', 'Status']
+
+    # Last resort case-insensitive search for missing columns
+    for m in [c for c in required_cols if c not in df.columns]:
+        for col in df.columns:
+            if col.lower() == m.lower():
+                df = df.rename(columns={col: m})
+                break
+
+    re_missing = [c for c in required_cols if c not in df.columns]
+    if re_missing:
+        raise TrainingDataError(f'Uploaded file is missing required columns: {", ".join(re_missing)}')
+
+    clean_df = df.dropna(subset=required_cols).copy()
+
+    # CREATE BINOMIAL TARGET early for filtering (ensures uniqueness across genera)
+    clean_df['binomial'] = clean_df['genus'] + "_" + clean_df['species']
+
+    # REMOVE OUTLIERS (Strict filtering for accuracy)
+    for col in ['W', 'TIB', 'FA']:
+        clean_df = clean_df[(clean_df[col] > 0) & (clean_df[col] < 300)]
+
+    # ITERATIVE RARE CLASS FILTERING
+    # We MUST filter on 'binomial' to ensure species models have enough samples
+    # for EVERY unique genus-species combination.
+    for _ in range(2):
+        binomial_counts = clean_df['binomial'].value_counts()
+        valid_binomials = binomial_counts[binomial_counts >= 3].index
+        clean_df = clean_df[clean_df['binomial'].isin(valid_binomials)]
+
+        genus_counts = clean_df['genus'].value_counts()
+        valid_genus = genus_counts[genus_counts >= 3].index
+        clean_df = clean_df[clean_df['genus'].isin(valid_genus)]
+
+    print(f"DEBUG: Clean dataset: {len(clean_df)} records (from {initial_count} initial)")
+    print(f"DEBUG: Unique Genus: {clean_df['genus'].nunique()}, Unique Binomials: {clean_df['binomial'].nunique()}")
+
+    if len(clean_df) < 50:
+        raise TrainingDataError(f'Insufficient clean data ({len(clean_df)} rows). Please check your Excel format.')
+
+    return clean_df[required_cols + ['binomial']].reset_index(drop=True)
+
+
+def data_fingerprint(clean_df: pd.DataFrame) -> str:
+    """Hash of the cleaned training rows (order-independent) and the training version"""
+    row_hashes = np.sort(pd.util.hash_pandas_object(clean_df, index=False).to_numpy())
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(f'{TRAINING_VERSION}:{",".join(clean_df.columns)}'.encode())
+    return digest.hexdigest()
+
+
+def _fit_forest(model: RandomForestClassifier, X, y, n_estimators: int, on_step: Callable[[int], None]):
+    """
+    Fit a forest in TREE_STEP-tree steps with warm_start. Tree seeds come from
+    the same random_state sequence, so the forest equals a single fit.
+    """
+    model.set_params(warm_start=True)
+    for size in range(TREE_STEP, n_estimators + TREE_STEP, TREE_STEP):
+        model.set_params(n_estimators=min(size, n_estimators))
+        model.fit(X, y)
+        on_step(len(model.estimators_))
+    model.set_params(warm_start=False)
+    return model
+
+
+def fit_bat_models(clean_df: pd.DataFrame, progress: Callable[[str, float], None] = None,
+                   n_jobs: int = None) -> Dict[str, Any]:
+    """
+    Fit the genus and species models on cleaned data, at the same time.
+
+    Args:
+        clean_df: Output of prepare_training_data
+        progress: Called with (status, percent) as trees are added
+        n_jobs: Tree building threads per model (default: half the CPUs each)
+
+    Returns:
+        The bat model set (models, encoders and metadata)
+    """
+    if n_jobs is None:
+        n_jobs = max(1, (os.cpu_count() or 2) // 2)
+    clean_df = clean_df.copy()
+
+    # 4. ENCODING
+    feature_encoders = {}
+    for col in ['Sex', 'Status']:
+        le = LabelEncoder()
+        clean_df[col] = le.fit_transform(clean_df[col].astype(str))
+        feature_encoders[col] = le
+
+    # Target encoders
+    genus_le = LabelEncoder()
+    binomial_le = LabelEncoder() # Use binomial for species model
+    y_genus = genus_le.fit_transform(clean_df['genus'])
+    y_binomial = binomial_le.fit_transform(clean_df['binomial'])
+
+    # Hierarchical Encoding: Include Genus in Species features
+    clean_df['genus_enc'] = y_genus
+
+    X_genus = clean_df[FEATURES]
+    X_species = clean_df[FEATURES + ['genus_enc']]
+
+    X_train, X_test, y_g_train, y_g_test = train_test_split(
+        X_genus, y_genus, test_size=0.2, random_state=42, stratify=y_genus
+    )
+    X_train_sp, X_test_sp, y_sp_train, y_sp_test = train_test_split(
+        X_species, y_binomial, test_size=0.2, random_state=42, stratify=y_binomial
+    )
+
+    # 5. MODELING (High-capacity RandomForest for reliability)
+    genus_model = RandomForestClassifier(n_estimators=300, random_state=42, class_weight='balanced', n_jobs=n_jobs)
+    species_model = RandomForestClassifier(n_estimators=500, max_depth=None, random_state=42,
+                                           class_weight='balanced', n_jobs=n_jobs)
+    total_trees = genus_model.n_estimators + species_model.n_estimators
+    grown = {'genus': 0, 'species': 0}
+    lock = threading.Lock()
+
+    def on_step(name):
+        def report(trees):
+            with lock:
+                grown[name] = trees
+                done = grown['genus'] + grown['species']
+            if progress:
+                progress(f"Fitting models ({done}/{total_trees} trees)", 5 + 85 * done / total_trees)
+        return report
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='bat-fit') as pool:
+        genus_future = pool.submit(_fit_forest, genus_model, X_train, y_g_train, 300, on_step('genus'))
+        species_future = pool.submit(_fit_forest, species_model, X_train_sp, y_sp_train, 500, on_step('species'))
+        genus_future.result()
+        species_future.result()
+
+    if progress:
+        progress('Evaluating models', 92)
+    genus_acc = accuracy_score(y_g_test, genus_model.predict(X_test))
+    species_acc = accuracy_score(y_sp_test, species_model.predict(X_test_sp))
+    print(f"DEBUG: Genus Accuracy: {genus_acc:.4f}")
+    print(f"DEBUG: Species Accuracy: {species_acc:.4f}")
+
+    # 6. ASSEMBLE MODEL OBJECT
+    return {
+        'genus_model': genus_model,
+        'species_model': species_model,
+        'genus_encoder': genus_le,
+        'species_encoder': binomial_le, # Stores binomials
+        'feature_encoders': feature_encoders,
+        'features': list(FEATURES),
+        'genus_accuracy': float(genus_acc),
+        'species_accuracy': float(species_acc),
+        'genus_classes': genus_le.classes_.tolist(),
+        'species_classes': binomial_le.classes_.tolist(),
+        'sample_count': int(len(clean_df))
+    }
+
+
+def current_artifact_info(artifact_dir: str = ARTIFACT_DIR) -> Optional[Dict[str, Any]]:
+    """Metadata of the current bat model version, or None if there is none"""
+    try:
+        with open(os.path.join(artifact_dir, 'current.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_bat_artifact(bat_models: Dict[str, Any], fingerprint: str = None,
+                      artifact_dir: str = ARTIFACT_DIR) -> Dict[str, Any]:
+    """
+    Save a bat model set to the model store as a new version and make it
+    current. Returns the version metadata written to current.json.
+    """
+    store = get_model_store(MODELS_DIR)
+    version = datetime.now().strftime('%Y%m%d_%H%M%S') + (f'_{fingerprint[:8]}' if fingerprint else '')
+    metadata = {key: value for key, value in bat_models.items() if key not in MODEL_COMPONENTS}
+    store.save_version(
+        os.path.join(artifact_dir, version),
+        {key: bat_models[key] for key in MODEL_COMPONENTS},
+        version=version,
+        fingerprint=fingerprint,
+        training_version=TRAINING_VERSION,
+        metadata=metadata
+    )
+
+    info = {
+        'version': version,
+        'fingerprint': fingerprint,
+        'created_at': datetime.now().isoformat(),
+        'genus_accuracy': bat_models['genus_accuracy'],
+        'species_accuracy': bat_models['species_accuracy'],
+        'sample_count': bat_models['sample_count'],
+    }
+    with open(os.path.join(artifact_dir, 'current.json.tmp'), 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(os.path.join(artifact_dir, 'current.json.tmp'), os.path.join(artifact_dir, 'current.json'))
+
+    # Keep the newest few older versions for rollback
+    older = sorted(name for name in os.listdir(artifact_dir)
+                   if os.path.isdir(os.path.join(artifact_dir, name)) and name != version)
+    for name in older[:max(0, len(older) - KEEP_VERSIONS)]:
+        store.delete_version(os.path.join(artifact_dir, name))
+    return info
+
+
+def load_bat_artifact(artifact_dir: str = ARTIFACT_DIR) -> Optional[Dict[str, Any]]:
+    """The current bat model set, memory-mapped from the model store; None if there is none"""
+    info = current_artifact_info(artifact_dir)
+    if not info:
+        return None
+    version_dir = os.path.join(artifact_dir, info['version'])
+    store = get_model_store(MODELS_DIR)
+    manifest = store.read_manifest(version_dir)
+    if manifest is None:
+        return None
+    bat_models = dict(manifest['metadata'], **store.load_version(version_dir))
+    bat_models['version'] = info['version']
+    bat_models['fingerprint'] = info.get('fingerprint')
+    return bat_models
+
+
+class BatTrainingJob(BackgroundJob):
+    """One training upload waiting for, or going through, model fitting"""
+
+    ROOM_PREFIX = 'bat_train_job'
+
+    def __init__(self, job_id: str, owner: Any, fingerprint: str, sample_count: int):
+        super().__init__(job_id, owner, progress=0, sample_count=sample_count)
+        self.fingerprint = fingerprint
+
+
+class BatTrainingJobManager(BackgroundJobManager):
+    """
+    Runs bat model training jobs one at a time on a background thread.
+    A job for data that is already being trained on is shared rather than queued again.
+
+    Args:
+        ttl: Seconds a finished job is kept
+        emit_interval: Minimum seconds between progress events for one job
+    """
+
+    EVENT = 'bat_train_progress'
+    THREAD_NAME_PREFIX = 'bat-train'
+
+    def __init__(self, ttl: float = 3600.0, emit_interval: float = 0.25):
+        # Fitting already uses every core; jobs run one after another
+        super().__init__(max_workers=1, ttl=ttl, emit_interval=emit_interval)
+
+    def submit(self, owner: Any, clean_df: pd.DataFrame, fingerprint: str,
+               on_trained: Callable[[Dict[str, Any], str], Any]) -> BatTrainingJob:
+        """
+        Queue training on cleaned data.
+
+        Args:
+            owner: Only this owner can see or join the job
+            clean_df: Output of prepare_training_data
+            fingerprint: data_fingerprint of clean_df
+            on_trained: Called with (bat models, fingerprint) to save the trained set; the job
+                fails if it raises or returns False
+        """
+        self.expire()
+        with self._lock:
+            for job in self._jobs.values():
+                if job.fingerprint == fingerprint and not job.completed and job.owner == owner:
+                    return job
+            job = BatTrainingJob(uuid.uuid4().hex, owner, fingerprint, len(clean_df))
+            self._jobs[job.job_id] = job
+        self._pool().submit(self._run, job, clean_df, on_trained)
+        return job
+
+    def _run(self, job: BatTrainingJob, clean_df: pd.DataFrame, on_trained):
+        def progress(status, percent):
+            self._emit(job, job.update(status=status, progress=round(percent, 1)))
+
+        try:
+            progress('Encoding training data', 2)
+            bat_models = fit_bat_models(clean_df, progress)
+            progress('Saving models', 96)
+            if on_trained(bat_models, job.fingerprint) is False:
+                raise RuntimeError('the trained models could not be saved')
+            result = {
+                'genus_accuracy': round(bat_models['genus_accuracy'] * 100, 2),
+                'species_accuracy': round(bat_models['species_accuracy'] * 100, 2),
+                'sample_count': bat_models['sample_count'],
+                'genus_classes': len(bat_models['genus_classes']),
+                'species_classes': len(bat_models['species_classes']),
+                'pre_trained': False
+            }
+            job.finished_at = time.time()
+            self._emit(job, job.update(status='Bat identification models trained successfully!', progress=100,
+                                       completed=True, success=True, result=result), force=True)
+        except Exception as e:
+            job.finished_at = time.time()
+            self._emit(job, job.update(status=f'Training failed: {str(e)}', completed=True, success=False),
+                       force=True)
+
+
+bat_training_jobs = BatTrainingJobManager()
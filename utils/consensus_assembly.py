@@ -0,0 +1,632 @@
+"""
+Consensus assembly of AB1 read groups
+
+The assembly behind /sequence/upload and /sequence/consensus, moved out of the
+routes so groups can be assembled in parallel. Nothing here reads the Flask
+session: the trimming config ({'enabled', 'custom_start', 'custom_end'}) is
+passed in, so assemble_group() can run in a worker process. assemble_groups()
+runs the groups of a plate on a process pool (each worker
+reuses its aligners) and yields each group's result as soon as it is done.
+
+Reads are merged with a seeded alignment (seeded_align()): k-mers shared by
+the consensus and the read pick the read's orientation and a colinear chain
+of exact-match anchors, and dynamic programming only fills the segments
+between anchors (and the overhangs at both ends). Memory is bounded by the
+largest unanchored segment instead of the product of the two lengths.
+"""
+import multiprocessing
+import os
+import re
+import subprocess
+import threading
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from Bio import SeqIO
+from Bio.Align import PairwiseAligner
+from Bio.Seq import Seq
+
+from utils.trace_store import load_trace
+
+# Groups assembled in the request thread when there are at most this many;
+# starting worker processes costs more than it saves
+INLINE_GROUPS = 1
+
+# Seed length for seeded_align(); k-mers occurring more than once in either
+# sequence are not used as seeds
+SEED_K = 12
+
+# Seeds needed to place a read against the consensus
+MIN_SEEDS = 2
+
+# Seeds further than this from the main diagonal are not chained (indels
+# between the reads shift the diagonal by their length)
+MAX_DIAGONAL_DRIFT = 100
+
+# Set per process by segment_aligner()
+_aligners: Dict[str, PairwiseAligner] = {}
+
+
+def segment_aligner(kind: str = 'inner') -> PairwiseAligner:
+    """
+    Global aligner used to merge reads, created once per process.
+
+    Args:
+        kind: 'inner' (between anchors), 'left' / 'right' (overhang before the
+            first / after the last anchor, where end gaps are free)
+    """
+    aligner = _aligners.get(kind)
+    if aligner is None:
+        aligner = PairwiseAligner()
+        aligner.mode = 'global'
+        aligner.match_score = 2
+        aligner.mismatch_score = -1
+        aligner.open_gap_score = -2
+        aligner.extend_gap_score = -0.5
+        if kind in ('left', 'right'):
+            # Sets left_gap_score / right_gap_score (all gaps at that end)
+            setattr(aligner, f'{kind}_gap_score', 0)
+        _aligners[kind] = aligner
+    return aligner
+
+
+def _unique_kmers(sequence: str, k: int) -> Dict[str, int]:
+    positions: Dict[str, int] = {}
+    repeated = set()
+    for i in range(len(sequence) - k + 1):
+        kmer = sequence[i:i + k]
+        if kmer in positions:
+            repeated.add(kmer)
+        else:
+            positions[kmer] = i
+    for kmer in repeated:
+        del positions[kmer]
+    return positions
+
+
+def find_seeds(ref: str, seq: str, k: int = SEED_K) -> List[Tuple[int, int]]:
+    """(ref position, seq position) of the k-mers occurring exactly once in each sequence, by seq position"""
+    ref_kmers = _unique_kmers(ref.upper(), k)
+    seq_kmers = _unique_kmers(seq.upper(), k)
+    return sorted(((ref_kmers[kmer], pos) for kmer, pos in seq_kmers.items()
+                   if kmer in ref_kmers and 'N' not in kmer), key=lambda seed: seed[1])
+
+
+def chain_anchors(seeds: List[Tuple[int, int]], k: int = SEED_K) -> List[Tuple[int, int, int]]:
+    """
+    Colinear, non-overlapping exact-match anchors from seeds.
+
+    Seeds near the main diagonal are chained with a longest increasing
+    subsequence on the ref position; overlapping seeds on one diagonal are
+    merged into one anchor.
+
+    Returns:
+        (ref start, seq start, length) per anchor, in order
+    """
+    if not seeds:
+        return []
+    main_diagonal = Counter(r - s for r, s in seeds).most_common(1)[0][0]
+    seeds = [(r, s) for r, s in seeds if abs(r - s - main_diagonal) <= MAX_DIAGONAL_DRIFT]
+
+    # Longest chain increasing in both positions (seeds are sorted by seq position)
+    tails, tail_index, previous = [], [], [-1] * len(seeds)
+    for i, (r, _) in enumerate(seeds):
+        j = bisect_left(tails, r)
+        if j == len(tails):
+            tails.append(r)
+            tail_index.append(i)
+        else:
+            tails[j] = r
+            tail_index[j] = i
+        previous[i] = tail_index[j - 1] if j > 0 else -1
+    chain = []
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        chain.append(seeds[i])
+        i = previous[i]
+    chain.reverse()
+
+    anchors: List[Tuple[int, int, int]] = []
+    for r, s in chain:
+        length = k
+        if anchors:
+            ar, as_, al = anchors[-1]
+            if r - s == ar - as_ and s <= as_ + al:
+                anchors[-1] = (ar, as_, max(al, s + k - as_))
+                continue
+            overlap = max(ar + al - r, as_ + al - s, 0)
+            if overlap >= k:
+                continue
+            r, s, length = r + overlap, s + overlap, k - overlap
+        anchors.append((r, s, length))
+    return anchors
+
+
+def _align_segment(ref: str, seq: str, kind: str) -> Tuple[str, str]:
+    if not ref and not seq:
+        return '', ''
+    if not seq:
+        return ref, '-' * len(ref)
+    if not ref:
+        return '-' * len(seq), seq
+    alignment = segment_aligner(kind).align(ref, seq)[0]
+    return str(alignment[0]), str(alignment[1])
+
+
+def seeded_align(ref: str, seq: str, anchors: List[Tuple[int, int, int]]) -> Tuple[str, str]:
+    """
+    Global alignment of seq to ref through the given anchors.
+
+    Returns:
+        (aligned ref, aligned seq), with '-' for gaps
+    """
+    aligned_ref, aligned_seq = [], []
+
+    def add(segment):
+        aligned_ref.append(segment[0])
+        aligned_seq.append(segment[1])
+
+    ref_end, seq_end = anchors[0][0], anchors[0][1]
+    add(_align_segment(ref[:ref_end], seq[:seq_end], 'left'))
+    for index, (r, s, length) in enumerate(anchors):
+        if index > 0:
+            add(_align_segment(ref[ref_end:r], seq[seq_end:s], 'inner'))
+        add((ref[r:r + length], seq[s:s + length]))
+        ref_end, seq_end = r + length, s + length
+    add(_align_segment(ref[ref_end:], seq[seq_end:], 'right'))
+    return ''.join(aligned_ref), ''.join(aligned_seq)
+
+
+def check_tracy_installed():
+    """Check if Tracy command-line tool is available"""
+    try:
+        result = subprocess.run(['tracy', '--version'], 
+                              capture_output=True, 
+                              timeout=5)
+        return result.returncode == 0
+    except:
+        return False
+
+
+def run_tracy_assemble(ab1_files, reference_path, virus_type, session_folder, trimming_config=None,
+                       output_name='consensus'):
+    """Run Tracy assemble command on multiple AB1 files"""
+    trimming_config = trimming_config or {}
+    try:
+        # Output files are named per group so groups can be assembled at the same time
+        output_base = os.path.join(session_folder, output_name)
+        logfile = output_base + '.tracy.log'
+        errfile = output_base + '.tracy.err'
+        
+        # Build Tracy command
+        cmd = ['tracy', 'assemble', '-o', output_base]
+        
+        # Add reference if provided
+        if reference_path:
+            cmd.extend(['-r', reference_path])
+        
+        # Add AB1 files
+        cmd.extend(ab1_files)
+        
+        # Run Tracy
+        with open(logfile, 'w') as log, open(errfile, 'w') as err:
+            result = subprocess.run(cmd, stdout=log, stderr=err, timeout=120)
+        
+        if result.returncode != 0:
+            # Tracy failed, read error
+            with open(errfile, 'r') as err:
+                error_msg = err.read()
+                print(f"Tracy error: {error_msg}")
+            return None
+        
+        # Read Tracy output
+        fasta_file = output_base + '.fasta'
+        
+        if os.path.exists(fasta_file):
+            # Read consensus from FASTA
+            consensus_record = SeqIO.read(fasta_file, 'fasta')
+            consensus_seq = str(consensus_record.seq)
+            
+            # Apply virus-specific trimming
+            custom_start = trimming_config.get('custom_start')
+            custom_end = trimming_config.get('custom_end')
+            
+            trimmed_seq = trim_by_virus_pattern(consensus_seq, virus_type, custom_start, custom_end,
+                                                trimming_config.get('enabled', True))
+            
+            return {
+                'filename': 'consensus',
+                'original_length': len(consensus_seq),
+                'trimmed_length': len(trimmed_seq),
+                'consensus': trimmed_seq,
+                'method': 'Tracy'
+            }
+        
+        return None
+        
+    except Exception as e:
+        print(f"Tracy assembly error: {str(e)}")
+        return None
+
+
+def run_python_assemble(ab1_files, virus_type, trimming_config=None):
+    """Python-based consensus using proper pairwise alignment"""
+    trimming_config = trimming_config or {}
+    try:
+        sequences = []
+        
+        # Read all AB1 files
+        for filepath in ab1_files:
+            try:
+                filename = os.path.basename(filepath)
+                edited_path = filepath + ".edited.fasta"
+                
+                # Check if there's a manually edited version (priority)
+                if os.path.exists(edited_path):
+                    print(f"  Using EDITED sequence for {filename}")
+                    record = SeqIO.read(edited_path, 'fasta')
+                    # For edited sequence, we don't have trace data/quality from original
+                    # So we use dummy high quality
+                    sequences.append({
+                        'sequence': str(record.seq),
+                        'quality': [40] * len(record.seq),
+                        'filename': filename,
+                        'is_edited': True
+                    })
+                else:
+                    trace = load_trace(filepath)
+                    sequences.append({
+                        'sequence': trace.sequence,
+                        'quality': trace.quality,
+                        'filename': filename,
+                        'is_edited': False
+                    })
+            except:
+                continue
+        
+        if not sequences:
+            return None
+        
+        # If only one sequence, just trim it
+        if len(sequences) == 1:
+            seq = sequences[0]['sequence']
+            qual = sequences[0]['quality']
+            trimmed_seq, _ = trim_sequence_by_quality(seq, qual, threshold=20)
+            
+            custom_start = trimming_config.get('custom_start')
+            custom_end = trimming_config.get('custom_end')
+            
+            final_seq = trim_by_virus_pattern(trimmed_seq, virus_type, custom_start, custom_end,
+                                              trimming_config.get('enabled', True))
+            
+            # Clean any ambiguity codes
+            final_seq = ''.join([base if base in 'ATGCatgc' else '' for base in final_seq])
+            
+            return {
+                'filename': 'consensus',
+                'original_length': len(seq),
+                'trimmed_length': len(final_seq),
+                'consensus': final_seq,
+                'method': 'Python'
+            }
+        
+        # Multiple sequences - use proper pairwise alignment
+        print(f"Assembling {len(sequences)} sequences using Python pairwise alignment")
+        print(f"DEBUG: virus_type parameter = '{virus_type}'")
+        
+        # Trim all sequences first
+        trimmed_sequences = []
+        for seq_data in sequences:
+            seq = seq_data['sequence']
+            qual = seq_data['quality']
+            trimmed_seq, trimmed_qual = trim_sequence_by_quality(seq, qual, threshold=20)
+            if trimmed_seq:
+                trimmed_sequences.append({
+                    'sequence': trimmed_seq,
+                    'quality': trimmed_qual,
+                    'filename': seq_data['filename']
+                })
+        
+        if not trimmed_sequences:
+            return None
+        
+        # Start with the longest sequence as reference
+        reference = max(trimmed_sequences, key=lambda x: len(x['sequence']))
+        consensus_seq = reference['sequence']
+        consensus_qual = reference['quality']
+        
+        print(f"Reference: {reference['filename']} ({len(consensus_seq)} bp)")
+        
+        # Align and merge each additional sequence
+        for seq_data in trimmed_sequences:
+            if seq_data == reference:
+                continue
+            
+            print(f"Aligning: {seq_data['filename']} ({len(seq_data['sequence'])} bp)")
+            
+            # Try both forward and reverse complement
+            seq_fwd = seq_data['sequence']
+            seq_rev = str(Seq(seq_data['sequence']).reverse_complement())
+            qual_fwd = seq_data['quality']
+            qual_rev = list(reversed(seq_data['quality']))
+            
+            # The orientation sharing more seeds with the consensus is used
+            seeds_fwd = find_seeds(consensus_seq, seq_fwd)
+            seeds_rev = find_seeds(consensus_seq, seq_rev)
+            if len(seeds_rev) > len(seeds_fwd):
+                print(f"  Using reverse complement ({len(seeds_rev)} seeds)")
+                seeds, seq_to_use, qual_to_use = seeds_rev, seq_rev, qual_rev
+            else:
+                print(f"  Using forward ({len(seeds_fwd)} seeds)")
+                seeds, seq_to_use, qual_to_use = seeds_fwd, seq_fwd, qual_fwd
+            
+            anchors = chain_anchors(seeds)
+            if len(seeds) < MIN_SEEDS or not anchors:
+                # No overlap with the consensus: merging would only make it wrong
+                print(f"  Warning: {seq_data['filename']} does not overlap the consensus, skipped")
+                continue
+            
+            # Merge aligned sequences
+            aligned_ref, aligned_seq = seeded_align(consensus_seq, seq_to_use, anchors)
+            
+            # Build consensus from alignment
+            new_consensus = []
+            new_qual = []
+            ref_idx = 0
+            seq_idx = 0
+            
+            for i in range(len(aligned_ref)):
+                ref_base = aligned_ref[i].upper()
+                seq_base = aligned_seq[i].upper()
+                
+                # Clean ambiguity codes - only allow ATGC or gaps
+                if ref_base not in 'ATGC-':
+                    ref_base = 'N'
+                if seq_base not in 'ATGC-':
+                    seq_base = 'N'
+                
+                ref_q = consensus_qual[ref_idx] if ref_idx < len(consensus_qual) and ref_base != '-' else 0
+                seq_q = qual_to_use[seq_idx] if seq_idx < len(qual_to_use) and seq_base != '-' else 0
+                
+                # Choose base with higher quality, skipping N's
+                if ref_base == '-' and seq_base != '-' and seq_base != 'N':
+                    new_consensus.append(seq_base)
+                    new_qual.append(seq_q)
+                elif seq_base == '-' and ref_base != '-' and ref_base != 'N':
+                    new_consensus.append(ref_base)
+                    new_qual.append(ref_q)
+                elif ref_base == 'N' and seq_base != 'N' and seq_base != '-':
+                    new_consensus.append(seq_base)
+                    new_qual.append(seq_q)
+                elif seq_base == 'N' and ref_base != 'N' and ref_base != '-':
+                    new_consensus.append(ref_base)
+                    new_qual.append(ref_q)
+                elif ref_base == seq_base and ref_base != 'N' and ref_base != '-':
+                    new_consensus.append(ref_base)
+                    new_qual.append(max(ref_q, seq_q))
+                elif ref_base != '-' and seq_base != '-' and ref_base != 'N' and seq_base != 'N':
+                    # Mismatch - use higher quality base
+                    if seq_q > ref_q:
+                        new_consensus.append(seq_base)
+                        new_qual.append(seq_q)
+                    else:
+                        new_consensus.append(ref_base)
+                        new_qual.append(ref_q)
+                elif ref_base != '-' and ref_base != 'N':
+                    new_consensus.append(ref_base)
+                    new_qual.append(ref_q)
+                elif seq_base != '-' and seq_base != 'N':
+                    new_consensus.append(seq_base)
+                    new_qual.append(seq_q)
+                # else: skip if both are gaps or N
+                
+                if ref_base != '-':
+                    ref_idx += 1
+                if seq_base != '-':
+                    seq_idx += 1
+            
+            consensus_seq = ''.join(new_consensus)
+            consensus_qual = new_qual
+            
+            print(f"  New consensus length: {len(consensus_seq)} bp")
+        
+        # Apply virus-specific trimming
+        custom_start = trimming_config.get('custom_start')
+        custom_end = trimming_config.get('custom_end')
+        
+        final_seq = trim_by_virus_pattern(consensus_seq, virus_type, custom_start, custom_end,
+                                          trimming_config.get('enabled', True))
+        
+        # Clean any remaining ambiguity codes
+        final_seq = ''.join([base if base in 'ATGCatgc' else '' for base in final_seq])
+        
+        print(f"Final consensus: {len(final_seq)} bp (after virus trimming)")
+        
+        return {
+            'filename': 'consensus',
+            'original_length': len(consensus_seq),
+            'trimmed_length': len(final_seq),
+            'consensus': final_seq,
+            'method': 'Python'
+        }
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(f"Python assembly error: {str(e)}")
+        return None
+
+
+def trim_by_virus_pattern(sequence, virus_type, custom_start=None, custom_end=None, enabled=True):
+    """Apply virus-specific pattern trimming or custom primers (supports IUPAC ambiguity codes)"""
+
+    # IUPAC ambiguity code mapping
+    iupac_codes = {
+        'R': '[AG]', 'Y': '[CT]', 'M': '[AC]', 'K': '[GT]',
+        'S': '[GC]', 'W': '[AT]', 'H': '[ACT]', 'B': '[CGT]',
+        'V': '[ACG]', 'D': '[AGT]', 'N': '[ACGT]',
+        'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T'
+    }
+    
+    def convert_to_regex(pattern):
+        """Convert primer sequence with IUPAC codes to regex pattern"""
+        if not pattern:
+            return None
+        regex = ''
+        for base in pattern.upper():
+            regex += iupac_codes.get(base, base)
+        return regex
+    
+    # Check if trimming is disabled
+    if not enabled:
+        print("  Trimming disabled, returning original sequence")
+        return sequence
+    
+    # Use custom patterns if provided
+    if custom_start or custom_end:
+        start_pattern = custom_start or ''
+        end_pattern = custom_end or ''
+        print(f"  Using custom trimming patterns: '{start_pattern}' ... '{end_pattern}'")
+    else:
+        # Use default patterns for virus type
+        patterns = {
+            "Hanta": ("TGGTCACC", "CATCATTC"),
+            "Corona": ("AAGTGTGA", "ATGATTCT"),
+            "Paramyxo": ("GGAATAAT", "ATGACCT"),
+            "Flavi": ("AGAAGTTG", "CTCTCCAT"),
+            "Other": None
+        }
+        
+        if virus_type not in patterns or patterns[virus_type] is None:
+            print(f"  No default patterns for {virus_type}, skipping trimming")
+            return sequence
+        
+        start_pattern, end_pattern = patterns[virus_type]
+    
+    # Only trim if both patterns are provided
+    if not start_pattern or not end_pattern:
+        print("  Missing start or end pattern, skipping trimming")
+        return sequence
+    
+    # Convert patterns to regex (handles IUPAC codes like N, R, Y, etc.)
+    start_regex = convert_to_regex(start_pattern)
+    end_regex = convert_to_regex(end_pattern)
+    
+    try:
+        # Search for patterns using regex
+        start_match = re.search(start_regex, sequence, re.IGNORECASE)
+        end_match = None
+        
+        # Find last occurrence of end pattern
+        for match in re.finditer(end_regex, sequence, re.IGNORECASE):
+            end_match = match
+        
+        if start_match and end_match and start_match.start() < end_match.start():
+            start_index = start_match.start()
+            end_index = end_match.end()
+            trimmed = sequence[start_index:end_index]
+            print(f"  Trimmed by {virus_type} pattern: {len(sequence)} bp -> {len(trimmed)} bp")
+            print(f"    Found start at position {start_index}, end at position {end_index}")
+            if custom_start or custom_end:
+                print(f"    Matched: '{sequence[start_index:start_match.end()]}' ... '{sequence[end_match.start():end_index]}'")
+            return trimmed
+        else:
+            print("  Warning: Trimming patterns not found, returning original sequence")
+            if not start_match:
+                print(f"    Start pattern '{start_pattern}' not found")
+                print(f"    Sequence starts with: {sequence[:50]}")
+            if not end_match:
+                print(f"    End pattern '{end_pattern}' not found")
+                print(f"    Sequence ends with: {sequence[-50:]}")
+            return sequence
+    except Exception as e:
+        print(f"  Error during pattern matching: {e}")
+        return sequence
+
+
+def trim_sequence_by_quality(sequence, quality, threshold=20):
+    """Trim sequence ends based on quality threshold"""
+    if not quality or len(quality) != len(sequence):
+        return sequence, []
+    
+    # Find first position with quality >= threshold
+    start = 0
+    for i, q in enumerate(quality):
+        if q >= threshold:
+            start = i
+            break
+    
+    # Find last position with quality >= threshold
+    end = len(sequence)
+    for i in range(len(quality) - 1, -1, -1):
+        if quality[i] >= threshold:
+            end = i + 1
+            break
+    
+    return sequence[start:end], quality[start:end]
+
+
+def assemble_group(group_name: str, ab1_files: List[str], virus_type: str, trimming_config: Dict[str, Any] = None,
+                   use_tracy: bool = False, reference_path: str = None, session_folder: str = None,
+                   output_name: str = 'consensus') -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Assemble one group of reads (picklable, for the process pool).
+
+    Returns:
+        (group name, consensus result or None if assembly failed)
+    """
+    print(f"\n=== Assembling group: {group_name} ({len(ab1_files)} files) ===")
+    if use_tracy:
+        result = run_tracy_assemble(ab1_files, reference_path, virus_type, session_folder, trimming_config,
+                                    output_name)
+    else:
+        result = run_python_assemble(ab1_files, virus_type, trimming_config)
+    return group_name, result
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a process that runs server threads is not safe
+            _executor = ProcessPoolExecutor(max_workers=max(1, min(8, (os.cpu_count() or 2) - 1)),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def assemble_groups(groups: List[Tuple[str, List[str]]], virus_type: str, trimming_config: Dict[str, Any] = None,
+                    use_tracy: bool = False, reference_path: str = None,
+                    session_folder: str = None) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+    """
+    Assemble groups of reads, in parallel when there is more than one.
+
+    Args:
+        groups: (group name, read file paths) per group
+
+    Yields:
+        (group name, consensus result or None) in the order the groups finish
+    """
+    if len(groups) <= INLINE_GROUPS:
+        for group_name, ab1_files in groups:
+            yield assemble_group(group_name, ab1_files, virus_type, trimming_config, use_tracy, reference_path,
+                                 session_folder)
+        return
+
+    pool = _pool()
+    futures = {
+        pool.submit(assemble_group, group_name, ab1_files, virus_type, trimming_config, use_tracy, reference_path,
+                    session_folder, f'consensus_{index}'): group_name
+        for index, (group_name, ab1_files) in enumerate(groups)
+    }
+    for future in as_completed(futures):
+        try:
+            yield future.result()
+        except Exception as e:
+            print(f"Assembly of group {futures[future]} failed: {e}")
+            yield futures[future], None
@@ -0,0 +1,586 @@
+"""
+Local BLAST search against a reference FASTA
+
+/sequence/blast-consensus used to send every consensus to NCBI with
+NCBIWWW.qblast, so a plate of sequences could take an hour and failed whenever
+the network did. With a reference FASTA configured (BLAST_REFERENCE_FASTA, for
+example a virus RefSeq download) the same endpoint searches it locally and
+returns the same hit fields (identity %, query coverage, e-value, bit score,
+...) that save_blast_results_to_db stores.
+
+Two backends, with the same search_many() interface:
+
+- BlastnRunner: runs NCBI blastn against a database built once with
+  makeblastdb. Used when both programs are on the PATH.
+- KmerIndex: a pure Python seed-and-extend search. Reference k-mers (sampled
+  every STRIDE bases) are indexed once into .npy files next to the FASTA and
+  memory-mapped, so every worker process shares them through the page cache.
+  Each query strand is seeded with all its k-mers, the best diagonals are
+  chosen by seed count, and those are extended with a local alignment scored
+  like blastn (match 2, mismatch -3, gap open 5, extend 2). E-values use the
+  Karlin-Altschul parameters of that scoring.
+
+Both rebuild their index when the FASTA changes. Queries run in a process pool.
+
+Usage:
+    python -m utils.local_blast build <reference fasta>
+    python -m utils.local_blast search <reference fasta> <query fasta>
+"""
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from Bio import SeqIO
+from Bio.Align import PairwiseAligner
+
+INDEX_FORMAT = 1
+MANIFEST = 'manifest.json'
+
+# Seed length and reference sampling: an exact match of WORD_SIZE + STRIDE - 1
+# bases is always seeded
+WORD_SIZE = 12
+STRIDE = 4
+
+# Seeds of k-mers occurring more often than this in the reference are ignored
+# (low-complexity and repeat regions)
+MAX_SEED_OCCURRENCES = 2000
+
+# Diagonals within BAND bases of each other are counted as one candidate
+BAND = 64
+
+# Candidate references extended per query, per hit reported, and the seeds a
+# diagonal band needs to be extended at all
+CANDIDATES_PER_HIT = 4
+MIN_SEEDS = 2
+
+# blastn scoring and its Karlin-Altschul parameters (reward 2, penalty -3, gaps 5/2)
+MATCH, MISMATCH, GAP_OPEN, GAP_EXTEND = 2, -3, -5, -2
+LAMBDA, K = 0.625, 0.41
+
+_ENCODE = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(('Aa', 'Cc', 'Gg', 'TtUu')):
+    for _base in _bases:
+        _ENCODE[ord(_base)] = _code
+_DECODE = np.frombuffer(b'ACGTN', dtype=np.uint8)
+
+
+class LocalBlastError(Exception):
+    """The reference or its index cannot be used"""
+
+
+def encode(sequence: str) -> np.ndarray:
+    """Bases as codes 0-3 (A, C, G, T); anything else (N, gaps, ambiguity codes) is 4"""
+    return _ENCODE[np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)]
+
+
+def reverse_complement(codes: np.ndarray) -> np.ndarray:
+    rc = 3 - codes[::-1]
+    rc[codes[::-1] == 4] = 4
+    return rc
+
+
+def kmer_codes(codes: np.ndarray, k: int = WORD_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    2-bit packed k-mers of a coded sequence.
+
+    Returns:
+        (k-mer codes, start positions) of the k-mers without an unknown base
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    valid = ~(windows == 4).any(axis=1)
+    packed = np.zeros(n, dtype=np.uint32)
+    for j in range(k):
+        packed = (packed << 2) | windows[:, j].astype(np.uint32) & 3
+    positions = np.nonzero(valid)[0]
+    return packed[positions], positions
+
+
+def _fasta_signature(fasta_path: str) -> Dict[str, Any]:
+    stat = os.stat(fasta_path)
+    return {'fasta': os.path.abspath(fasta_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(index_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _replace_dir(tmp_dir: str, index_dir: str):
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+
+
+def _organism(title: str) -> str:
+    # Same extraction as the NCBI results: "... [Organism name]"
+    if '[' in title and ']' in title:
+        return title[title.find('[') + 1:title.find(']')]
+    return ''
+
+
+class KmerIndex:
+    """
+    Memory-mapped k-mer index of a reference FASTA.
+
+    Files in the index directory:
+        sequence.npy    all records' bases as codes, separated by one code 4
+        offsets.npy     start of each record in sequence.npy (plus the end)
+        directory.npy   start of each k-mer's run in positions.npy (4**WORD_SIZE + 1)
+        positions.npy   sampled k-mer positions, grouped by k-mer
+        records.json    accession and title of each record
+    """
+
+    def __init__(self, index_dir: str):
+        manifest = _read_manifest(index_dir)
+        if manifest is None or manifest.get('format') != INDEX_FORMAT or manifest.get('backend') != 'kmer':
+            raise LocalBlastError(f'No k-mer index in {index_dir}')
+        self.index_dir = index_dir
+        self.word_size = manifest['word_size']
+        self.db_length = manifest['db_length']
+        self.sequence = np.load(os.path.join(index_dir, 'sequence.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'), mmap_mode='r')
+        self.directory = np.load(os.path.join(index_dir, 'directory.npy'), mmap_mode='r')
+        self.positions = np.load(os.path.join(index_dir, 'positions.npy'), mmap_mode='r')
+        with open(os.path.join(index_dir, 'records.json'), 'r') as f:
+            self.records = json.load(f)
+        self.aligner = PairwiseAligner()
+        self.aligner.mode = 'local'
+        self.aligner.match_score = MATCH
+        self.aligner.mismatch_score = MISMATCH
+        self.aligner.open_gap_score = GAP_OPEN
+        self.aligner.extend_gap_score = GAP_EXTEND
+
+    @staticmethod
+    def is_current(index_dir: str, fasta_path: str) -> bool:
+        manifest = _read_manifest(index_dir)
+        return (manifest is not None and manifest.get('format') == INDEX_FORMAT
+                and manifest.get('backend') == 'kmer' and manifest.get('word_size') == WORD_SIZE
+                and manifest.get('stride') == STRIDE and manifest.get('source') == _fasta_signature(fasta_path))
+
+    @staticmethod
+    def build(fasta_path: str, index_dir: str) -> Dict[str, Any]:
+        """Index a reference FASTA into index_dir (replacing an existing index)"""
+        tmp_dir = f'{index_dir}.tmp_{uuid.uuid4().hex}'
+        os.makedirs(tmp_dir)
+        try:
+            records, chunks, offsets = [], [], []
+            length = 0
+            for record in SeqIO.parse(fasta_path, 'fasta'):
+                codes = encode(str(record.seq))
+                offsets.append(length)
+                records.append({'accession': record.id, 'title': record.description})
+                chunks.append(codes)
+                chunks.append(np.full(1, 4, dtype=np.uint8))
+                length += len(codes) + 1
+            if not records:
+                raise LocalBlastError(f'No sequences in {fasta_path}')
+            offsets.append(length)
+            sequence = np.concatenate(chunks)
+            del chunks
+
+            # Sample k-mers at every STRIDE-th position of the concatenated sequence
+            all_codes, all_positions = [], []
+            chunk_size = 1 << 24
+            for start in range(0, len(sequence), chunk_size):
+                codes, positions = kmer_codes(sequence[start:start + chunk_size + WORD_SIZE - 1])
+                positions = positions + start
+                sampled = positions % STRIDE == 0
+                all_codes.append(codes[sampled])
+                all_positions.append(positions[sampled])
+            codes = np.concatenate(all_codes)
+            positions = np.concatenate(all_positions)
+            position_dtype = np.uint32 if len(sequence) < 2 ** 32 else np.uint64
+            order = np.argsort(codes, kind='stable')
+            positions = positions[order].astype(position_dtype)
+            counts = np.bincount(codes, minlength=4 ** WORD_SIZE)
+            directory = np.zeros(4 ** WORD_SIZE + 1, dtype=np.int64)
+            np.cumsum(counts, out=directory[1:])
+
+            np.save(os.path.join(tmp_dir, 'sequence.npy'), sequence)
+            np.save(os.path.join(tmp_dir, 'offsets.npy'), np.asarray(offsets, dtype=np.int64))
+            np.save(os.path.join(tmp_dir, 'directory.npy'), directory)
+            np.save(os.path.join(tmp_dir, 'positions.npy'), positions)
+            with open(os.path.join(tmp_dir, 'records.json'), 'w') as f:
+                json.dump(records, f)
+            manifest = {
+                'format': INDEX_FORMAT,
+                'backend': 'kmer',
+                'word_size': WORD_SIZE,
+                'stride': STRIDE,
+                'records': len(records),
+                'db_length': int(length - len(records)),
+                'seeds': int(len(positions)),
+                'source': _fasta_signature(fasta_path),
+            }
+            with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            _replace_dir(tmp_dir, index_dir)
+            return manifest
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _candidates(self, query: np.ndarray, limit: int) -> List[Tuple[int, int, int]]:
+        """Best (seed count, record, diagonal) of one query strand, at most one per record"""
+        qcodes, qpos = kmer_codes(query, self.word_size)
+        if len(qcodes) == 0:
+            return []
+        starts = np.asarray(self.directory[qcodes])
+        counts = np.asarray(self.directory[qcodes + 1]) - starts
+        keep = (counts > 0) & (counts <= MAX_SEED_OCCURRENCES)
+        starts, counts, qpos = starts[keep], counts[keep], qpos[keep]
+        total = int(counts.sum())
+        if total == 0:
+            return []
+
+        # Gather every seed hit: position in the reference and in the query
+        run_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        ref_pos = np.asarray(self.positions[np.arange(total) + run_starts], dtype=np.int64)
+        diagonals = ref_pos - np.repeat(qpos, counts)
+
+        _, first_hit, band_counts = np.unique(diagonals // BAND, return_index=True, return_counts=True)
+        order = np.argsort(-band_counts, kind='stable')
+
+        candidates, seen = [], set()
+        for band in order:
+            if band_counts[band] < MIN_SEEDS:
+                break
+            hit = first_hit[band]
+            record = int(np.searchsorted(self.offsets, ref_pos[hit], side='right') - 1)
+            if record in seen:
+                continue
+            seen.add(record)
+            candidates.append((int(band_counts[band]), record, int(diagonals[hit])))
+            if len(candidates) >= limit:
+                break
+        return candidates
+
+    def _extend(self, query: np.ndarray, record: int, diagonal: int) -> Optional[Dict[str, Any]]:
+        """Local alignment of the query against its reference window around a diagonal"""
+        record_start, record_end = int(self.offsets[record]), int(self.offsets[record + 1]) - 1
+        pad = len(query) // 10 + BAND
+        start = max(record_start, diagonal - pad)
+        end = min(record_end, diagonal + len(query) + pad)
+        if end <= start:
+            return None
+        window = _DECODE[np.asarray(self.sequence[start:end])].tobytes().decode('ascii')
+        query_text = _DECODE[query].tobytes().decode('ascii')
+        alignments = self.aligner.align(query_text, window)
+        if alignments.score <= 0:
+            return None
+        alignment = alignments[0]
+        blocks = alignment.aligned
+        if len(blocks[0]) == 0:
+            return None
+
+        identities = matched = gaps = 0
+        previous = None
+        for (q_from, q_to), (t_from, t_to) in zip(blocks[0], blocks[1]):
+            query_codes = query[q_from:q_to]
+            identities += int(np.count_nonzero((query_codes == np.asarray(self.sequence[start + t_from:start + t_to]))
+                                               & (query_codes != 4)))
+            matched += int(q_to - q_from)
+            if previous is not None:
+                gaps += int(q_from - previous[0]) + int(t_from - previous[1])
+            previous = (q_to, t_to)
+        return {
+            'score': float(alignment.score),
+            'identity': identities,
+            'align_length': matched + gaps,
+            'gaps': gaps,
+            'query_from': int(blocks[0][0][0]) + 1,
+            'query_to': int(blocks[0][-1][1]),
+            'hit_from': start + int(blocks[1][0][0]) - record_start + 1,
+            'hit_to': start + int(blocks[1][-1][1]) - record_start,
+        }
+
+    def search(self, sequence: str, hitlist_size: int = 10, expect: float = 10.0) -> List[Dict[str, Any]]:
+        """Hits of one query on both strands, best first (at most one per reference record)"""
+        query = encode(sequence)
+        query_length = len(query)
+        if query_length < self.word_size:
+            return []
+
+        best: Dict[int, Dict[str, Any]] = {}
+        for strand, codes in (('plus', query), ('minus', reverse_complement(query))):
+            for _, record, diagonal in self._candidates(codes, hitlist_size * CANDIDATES_PER_HIT):
+                hsp = self._extend(codes, record, diagonal)
+                if hsp is None:
+                    continue
+                if strand == 'minus':
+                    # Report query coordinates on the original strand, subject coordinates descending
+                    hsp['query_from'], hsp['query_to'] = (query_length - hsp['query_to'] + 1,
+                                                          query_length - hsp['query_from'] + 1)
+                    hsp['hit_from'], hsp['hit_to'] = hsp['hit_to'], hsp['hit_from']
+                if record not in best or hsp['score'] > best[record]['score']:
+                    best[record] = hsp
+
+        hits = []
+        for record, hsp in best.items():
+            bit_score = (LAMBDA * hsp['score'] - math.log(K)) / math.log(2)
+            evalue = query_length * self.db_length * 2.0 ** -bit_score
+            if evalue > expect:
+                continue
+            title = self.records[record]['title']
+            hits.append({
+                'title': title,
+                'accession': self.records[record]['accession'],
+                'organism': _organism(title),
+                'identity': hsp['identity'],
+                'align_length': hsp['align_length'],
+                'evalue': evalue,
+                'bit_score': round(bit_score, 1),
+                'query_coverage': round(hsp['align_length'] / query_length * 100, 2),
+                'identity_percent': round(hsp['identity'] / hsp['align_length'] * 100, 2) if hsp['align_length'] else 0,
+                'query_from': hsp['query_from'],
+                'query_to': hsp['query_to'],
+                'hit_from': hsp['hit_from'],
+                'hit_to': hsp['hit_to'],
+                'gaps': hsp['gaps'],
+            })
+        hits.sort(key=lambda hit: (hit['evalue'], -hit['bit_score']))
+        for rank, hit in enumerate(hits[:hitlist_size], 1):
+            hit['hit_rank'] = rank
+        return hits[:hitlist_size]
+
+
+class BlastnRunner:
+    """NCBI blastn against a database made with makeblastdb from the reference FASTA"""
+
+    OUTFMT = '6 qseqid stitle nident length evalue bitscore qstart qend sstart send gaps'
+
+    def __init__(self, index_dir: str, threads: int = 2):
+        manifest = _read_manifest(index_dir)
+        if manifest is None or manifest.get('backend') != 'blastn':
+            raise LocalBlastError(f'No BLAST database in {index_dir}')
+        self.db = os.path.join(index_dir, 'reference')
+        self.threads = threads
+
+    @staticmethod
+    def available() -> bool:
+        return bool(shutil.which('blastn') and shutil.which('makeblastdb'))
+
+    @staticmethod
+    def is_current(index_dir: str, fasta_path: str) -> bool:
+        manifest = _read_manifest(index_dir)
+        return (manifest is not None and manifest.get('format') == INDEX_FORMAT
+                and manifest.get('backend') == 'blastn' and manifest.get('source') == _fasta_signature(fasta_path))
+
+    @staticmethod
+    def build(fasta_path: str, index_dir: str) -> Dict[str, Any]:
+        tmp_dir = f'{index_dir}.tmp_{uuid.uuid4().hex}'
+        os.makedirs(tmp_dir)
+        try:
+            result = subprocess.run(['makeblastdb', '-in', os.path.abspath(fasta_path), '-dbtype', 'nucl',
+                                     '-out', os.path.join(tmp_dir, 'reference')],
+                                    capture_output=True, text=True, timeout=3600)
+            if result.returncode != 0:
+                raise LocalBlastError(f'makeblastdb failed: {result.stderr.strip()}')
+            manifest = {'format': INDEX_FORMAT, 'backend': 'blastn', 'source': _fasta_signature(fasta_path)}
+            with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            _replace_dir(tmp_dir, index_dir)
+            return manifest
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def search_many(self, queries: List[Tuple[str, str]], hitlist_size: int = 10, expect: float = 10.0,
+                    task: str = 'megablast') -> List[List[Dict[str, Any]]]:
+        """Hits of each (name, sequence) query, in query order"""
+        ids = [f'q{i}' for i in range(len(queries))]
+        fasta = ''.join(f'>{qid}\n{sequence}\n' for qid, (_, sequence) in zip(ids, queries))
+        result = subprocess.run(['blastn', '-task', task, '-db', self.db, '-outfmt', self.OUTFMT,
+                                 '-max_target_seqs', str(hitlist_size), '-max_hsps', '1',
+                                 '-evalue', str(expect), '-num_threads', str(self.threads)],
+                                input=fasta, capture_output=True, text=True, timeout=3600)
+        if result.returncode != 0:
+            raise LocalBlastError(f'blastn failed: {result.stderr.strip()}')
+
+        hits: Dict[str, List[Dict[str, Any]]] = {qid: [] for qid in ids}
+        lengths = {qid: len(sequence) for qid, (_, sequence) in zip(ids, queries)}
+        for line in result.stdout.splitlines():
+            qid, title, nident, length, evalue, bits, qstart, qend, sstart, send, gaps = line.split('\t')
+            length = int(length)
+            query_length = lengths[qid]
+            hits[qid].append({
+                'hit_rank': len(hits[qid]) + 1,
+                'title': title,
+                'accession': title.split()[0] if title else '',
+                'organism': _organism(title),
+                'identity': int(nident),
+                'align_length': length,
+                'evalue': float(evalue),
+                'bit_score': float(bits),
+                'query_coverage': round(length / query_length * 100, 2) if query_length else 0,
+                'identity_percent': round(int(nident) / length * 100, 2) if length else 0,
+                'query_from': int(qstart),
+                'query_to': int(qend),
+                'hit_from': int(sstart),
+                'hit_to': int(send),
+                'gaps': int(gaps),
+            })
+        return [hits[qid] for qid in ids]
+
+
+# Set in each worker process by _init_worker
+_worker_index: Optional[KmerIndex] = None
+
+
+def _init_worker(index_dir: str):
+    global _worker_index
+    _worker_index = KmerIndex(index_dir)
+
+
+def _search_worker(sequence: str, hitlist_size: int, expect: float) -> List[Dict[str, Any]]:
+    return _worker_index.search(sequence, hitlist_size, expect)
+
+
+class LocalBlast:
+    """
+    Local search against one reference FASTA, with its index built on first use.
+
+    Args:
+        fasta_path: Reference sequences
+        index_dir: Where the index is kept (default: <fasta>.index next to the FASTA)
+        backend: 'blastn', 'kmer' or 'auto' (blastn when it is installed)
+        workers: Search processes (k-mer backend) or blastn threads
+    """
+
+    def __init__(self, fasta_path: str, index_dir: str = None, backend: str = 'auto', workers: int = None):
+        self.fasta_path = os.path.abspath(fasta_path)
+        if backend == 'auto':
+            backend = 'blastn' if BlastnRunner.available() else 'kmer'
+        self.backend = backend
+        self.index_dir = index_dir or f'{self.fasta_path}.index'
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._executor = None
+        self._runner = None
+        self._lock = threading.Lock()
+
+    def database_id(self) -> str:
+        """Identifies the reference and index format, e.g. for caching results"""
+        signature = json.dumps(_fasta_signature(self.fasta_path), sort_keys=True)
+        digest = hashlib.sha1(signature.encode()).hexdigest()[:12]
+        return f'local-{self.backend}:{INDEX_FORMAT}:{os.path.basename(self.fasta_path)}:{digest}'
+
+    def ensure_index(self) -> bool:
+        """Build the index if it is missing or older than the FASTA; returns whether it was built"""
+        if not os.path.exists(self.fasta_path):
+            raise LocalBlastError(f'Reference FASTA not found: {self.fasta_path}')
+        index_type = BlastnRunner if self.backend == 'blastn' else KmerIndex
+        with self._lock:
+            if index_type.is_current(self.index_dir, self.fasta_path):
+                return False
+            started = time.perf_counter()
+            index_type.build(self.fasta_path, self.index_dir)
+            print(f"[LOCAL BLAST] Built {self.backend} index of {os.path.basename(self.fasta_path)} "
+                  f"in {time.perf_counter() - started:.1f}s -> {self.index_dir}")
+            # Workers hold the previous index open
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self._runner = None
+            return True
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs server threads is not safe
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker, initargs=(self.index_dir,))
+            return self._executor
+
+    def search_many(self, queries: List[Tuple[str, str]], program: str = 'megablast', hitlist_size: int = 10,
+                    expect: float = 10.0) -> List[Dict[str, Any]]:
+        """
+        Search (name, sequence) queries.
+
+        Returns:
+            One result per query in the NCBI path's format:
+            {'name', 'sequence_length', 'hits'} or {'name', 'error'}
+        """
+        self.ensure_index()
+        if self.backend == 'blastn':
+            with self._lock:
+                if self._runner is None:
+                    self._runner = BlastnRunner(self.index_dir, threads=self.workers)
+                runner = self._runner
+            task = 'blastn' if program == 'blastn' else 'megablast'
+            all_hits = runner.search_many(queries, hitlist_size, expect, task=task)
+        else:
+            pool = self._pool()
+            futures = [pool.submit(_search_worker, sequence, hitlist_size, expect) for _, sequence in queries]
+            all_hits = []
+            for future in futures:
+                try:
+                    all_hits.append(future.result())
+                except Exception as e:
+                    all_hits.append(e)
+
+        results = []
+        for (name, sequence), hits in zip(queries, all_hits):
+            if isinstance(hits, Exception):
+                results.append({'name': name, 'error': str(hits)})
+            else:
+                results.append({'name': name, 'sequence_length': len(sequence), 'hits': hits})
+        return results
+
+
+_engines: Dict[Tuple[str, str], LocalBlast] = {}
+_engines_lock = threading.Lock()
+
+
+def get_local_blast(fasta_path: str, backend: str = 'auto') -> LocalBlast:
+    """The process-wide engine for a reference FASTA"""
+    key = (os.path.abspath(fasta_path), backend)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = LocalBlast(fasta_path, backend=backend)
+        return _engines[key]
+
+
+def _main():
+    parser = argparse.ArgumentParser(description='Build or search the local BLAST index of a reference FASTA')
+    parser.add_argument('command', choices=['build', 'search'])
+    parser.add_argument('reference')
+    parser.add_argument('query', nargs='?')
+    parser.add_argument('--backend', choices=['auto', 'blastn', 'kmer'], default='auto')
+    args = parser.parse_args()
+
+    engine = LocalBlast(args.reference, backend=args.backend)
+    if args.command == 'build':
+        built = engine.ensure_index()
+        print(f"{engine.backend} index {'built' if built else 'is up to date'}: {engine.index_dir}")
+        return
+    if not args.query:
+        parser.error('search needs a query FASTA')
+    queries = [(record.id, str(record.seq)) for record in SeqIO.parse(args.query, 'fasta')]
+    started = time.perf_counter()
+    for result in engine.search_many(queries):
+        best = result.get('hits', [{}])[0] if result.get('hits') else {}
+        print(f"{result['name']:30} {len(result.get('hits', [])):3} hits  "
+              f"{best.get('accession', '-'):15} {best.get('identity_percent', '-')}%  {best.get('evalue', '-')}")
+    print(f"{len(queries)} queries in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    _main()
@@ -18,6 +18,7 @@ from sklearn.preprocessing import LabelEncoder
 import pickle
 import re
 import warnings
+from utils.model_store import get_model_store
 warnings.filterwarnings('ignore')
 
 class MasterPythonTrainer:
@@ -32,6 +33,7 @@ class MasterPythonTrainer:
         os.makedirs(models_dir, exist_ok=True)
         self.versions_dir = os.path.join(models_dir, 'versions')
         os.makedirs(self.versions_dir, exist_ok=True)
+        self.store = get_model_store(models_dir)
     
     def get_connection(self):
         """Get database connection"""
@@ -895,12 +897,13 @@ print(f"Provinces covered: {screening_df['province'].nunique()}")
         version_dir = os.path.join(self.versions_dir, f'master_python_{timestamp}')
         os.makedirs(version_dir, exist_ok=True)
         
-        # Save models
-        for name, model in self.models.items():
-            if hasattr(model, 'predict') or hasattr(model, 'transform'):
-                model_path = os.path.join(version_dir, f'{name}.pkl')
-                with open(model_path, 'wb') as f:
-                    pickle.dump(model, f)
+        # Save models to the store; the version keeps their manifest
+        self.store.save_version(
+            version_dir,
+            {name: model for name, model in self.models.items()
+             if hasattr(model, 'predict') or hasattr(model, 'transform')},
+            version=timestamp
+        )
         
         # Save metadata
         metadata = {
@@ -928,6 +931,12 @@ print(f"Provinces covered: {screening_df['province'].nunique()}")
             latest_version = sorted(versions)[-1]
             version_dir = os.path.join(self.versions_dir, latest_version)
             
+            # Memory-mapped from the store; versions saved before it hold pickles
+            stored = self.store.load_version(version_dir)
+            if stored is not None:
+                self.models.update(stored)
+                return True
+            
             for file in os.listdir(version_dir):
                 if file.endswith('.pkl'):
                     model_name = file[:-4]
@@ -975,8 +984,11 @@ print(f"Provinces covered: {screening_df['province'].nunique()}")
             print(f"Error generating Python code: {e}")
             return None
 
-def train_master_python(db_config, db_type='sqlite'):
-    """Train master Python models"""
+def train_master_python(db_config, db_type='sqlite', progress=None):
+    """
+    Train master Python models.
+    progress, if given, is called with (stage, message, percent) before each step.
+    """
     trainer = MasterPythonTrainer(db_config, db_type)
     
     print("🐍 Training Master Python Models for Advanced Data Analysis")
@@ -984,15 +996,21 @@ def train_master_python(db_config, db_type='sqlite'):
     
     # Analyze database
     print("1. Analyzing database for Python patterns...")
+    if progress:
+        progress('analyze', 'Analyzing database for Python patterns...', 10)
     analysis = trainer.analyze_database_for_python()
     
     # Generate training data
     print("2. Generating comprehensive Python training data...")
+    if progress:
+        progress('generate', 'Generating comprehensive Python training data...', 40)
     training_data = trainer.generate_master_python_training_data(analysis)
     print(f"   Generated {len(training_data)} Python code patterns")
     
     # Train models
     print("3. Training master Python generation models...")
+    if progress:
+        progress('fit', 'Training master Python generation models...', 70)
     success = trainer.train_master_python_models(training_data)
     
     if success:
@@ -16,6 +16,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import re
 import warnings
+from utils.model_store import get_model_store
 warnings.filterwarnings('ignore')
 
 class MasterSQLTrainer:
@@ -30,6 +31,7 @@ class MasterSQLTrainer:
         os.makedirs(models_dir, exist_ok=True)
         self.versions_dir = os.path.join(models_dir, 'versions')
         os.makedirs(self.versions_dir, exist_ok=True)
+        self.store = get_model_store(models_dir)
     
     def get_connection(self):
         """Get database connection"""
@@ -593,12 +595,13 @@ class MasterSQLTrainer:
         version_dir = os.path.join(self.versions_dir, f'master_sql_{timestamp}')
         os.makedirs(version_dir, exist_ok=True)
         
-        # Save models
-        for name, model in self.models.items():
-            if hasattr(model, 'predict') or hasattr(model, 'transform'):
-                model_path = os.path.join(version_dir, f'{name}.pkl')
-                with open(model_path, 'wb') as f:
-                    pickle.dump(model, f)
+        # Save models to the store; the version keeps their manifest
+        self.store.save_version(
+            version_dir,
+            {name: model for name, model in self.models.items()
+             if hasattr(model, 'predict') or hasattr(model, 'transform')},
+            version=timestamp
+        )
         
         # Save metadata
         metadata = {
@@ -626,6 +629,12 @@ class MasterSQLTrainer:
             latest_version = sorted(versions)[-1]
             version_dir = os.path.join(self.versions_dir, latest_version)
             
+            # Memory-mapped from the store; versions saved before it hold pickles
+            stored = self.store.load_version(version_dir)
+            if stored is not None:
+                self.models.update(stored)
+                return True
+            
             for file in os.listdir(version_dir):
                 if file.endswith('.pkl'):
                     model_name = file[:-4]
@@ -673,8 +682,11 @@ class MasterSQLTrainer:
             print(f"Error generating SQL query: {e}")
             return None
 
-def train_master_sql(db_config, db_type='sqlite'):
-    """Train master SQL models"""
+def train_master_sql(db_config, db_type='sqlite', progress=None):
+    """
+    Train master SQL models.
+    progress, if given, is called with (stage, message, percent) before each step.
+    """
     trainer = MasterSQLTrainer(db_config, db_type)
     
     print("🔧 Training Master SQL Models for Advanced Data Analysis")
@@ -682,15 +694,21 @@ def train_master_sql(db_config, db_type='sqlite'):
     
     # Analyze database structure
     print("1. Analyzing database structure...")
+    if progress:
+        progress('analyze', 'Analyzing database structure...', 10)
     structure = trainer.analyze_database_structure()
     
     # Generate training data
     print("2. Generating comprehensive SQL training data...")
+    if progress:
+        progress('generate', 'Generating comprehensive SQL training data...', 40)
     training_data = trainer.generate_master_sql_training_data(structure)
     print(f"   Generated {len(training_data)} SQL query patterns")
     
     # Train models
     print("3. Training master SQL generation models...")
+    if progress:
+        progress('fit', 'Training master SQL generation models...', 70)
     success = trainer.train_master_sql_models(training_data)
     
     if success:
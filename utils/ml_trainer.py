@@ -19,6 +19,7 @@ from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
 import re
 import warnings
+from utils.model_store import get_model_store
 warnings.filterwarnings('ignore')
 
 class DatabaseTrainer:
@@ -38,6 +39,9 @@ class DatabaseTrainer:
         self.versions_dir = os.path.join(models_dir, 'versions')
         os.makedirs(self.versions_dir, exist_ok=True)
         
+        # Model objects are shared by all versions (and processes) through the store
+        self.store = get_model_store(models_dir)
+        
     def get_connection(self):
         """Get database connection"""
         from database.db_manager_flask import DatabaseManagerFlask
@@ -92,6 +96,9 @@ class DatabaseTrainer:
                 cursor.execute("SHOW TABLES")
             
             tables = [row[0] for row in cursor.fetchall()]
+            # Row counts from the shared table stats cache rather than a COUNT(*) per table
+            from database.db_manager_flask import DatabaseManagerFlask
+            counts = DatabaseManagerFlask.get_table_counts(self.db_config, self.db_type, tables=tables)
             
             for table in tables:
                 if self.db_type == 'sqlite':
@@ -101,12 +108,7 @@ class DatabaseTrainer:
                     cursor.execute(f'DESCRIBE `{table}`')
                     columns = [{'name': row[0], 'type': row[1]} for row in cursor.fetchall()]
                 
-                # Get row count
-                if self.db_type == 'sqlite':
-                    cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
-                else:
-                    cursor.execute(f'SELECT COUNT(*) FROM `{table}`')
-                count = cursor.fetchone()[0]
+                count = counts.get(table, {}).get('rows', 0)
                 
                 schema[table] = {'columns': columns, 'row_count': count}
             
@@ -405,12 +407,22 @@ class DatabaseTrainer:
             print(f"Error training response generator: {e}")
             return False
     
-    def train_all_models(self):
-        """Train all models on the current database with versioning"""
+    def train_all_models(self, progress=None):
+        """
+        Train all models on the current database with versioning.
+        progress, if given, is called with (stage, message, percent) as training goes.
+        """
+        def report(stage, message, percent):
+            print(message)
+            if progress:
+                progress(stage, message, percent)
+        
+        version_id = None
         try:
             print("Starting model training...")
             
             # Collect training data
+            report('collect', 'Collecting training data from database...', 5)
             training_data = self.collect_training_data()
             
             if not training_data:
@@ -421,14 +433,24 @@ class DatabaseTrainer:
             version_id = self._create_new_version()
             
             # Train different models
-            results = {
-                'intent_classifier': self.train_intent_classifier(training_data),
-                'table_classifier': self.train_table_classifier(training_data),
-                'response_generator': self.train_response_generator(training_data)
-            }
+            results = {}
+            report('fit_intent', 'Training intent classifier...', 20)
+            results['intent_classifier'] = self.train_intent_classifier(training_data)
+            report('fit_table', 'Training table classifier...', 40)
+            results['table_classifier'] = self.train_table_classifier(training_data)
+            report('fit_responses', 'Generating response templates...', 60)
+            results['response_generator'] = self.train_response_generator(training_data)
             
             if all(results.values()):
+                # Evaluate before anything is persisted, so a model that fails evaluation is never saved
+                report('evaluate', 'Evaluating models...', 70)
+                performance = self._evaluate_models(training_data)
+                if 'error' in performance:
+                    print(f"Model evaluation failed: {performance['error']}")
+                    return False
+                
                 # Save models to version directory
+                report('save_version', f'Saving model version {version_id}...', 85)
                 self._save_models_to_version(version_id)
                 
                 # Update current models
@@ -443,7 +465,7 @@ class DatabaseTrainer:
                     'models_trained': sum(results.values()),
                     'categories': list(set(item['category'] for item in training_data)),
                     'tables': list(set(item['table'] for item in training_data)),
-                    'performance': self._evaluate_models(training_data)
+                    'performance': performance
                 }
                 
                 metadata_path = os.path.join(self.models_dir, 'training_metadata.json')
@@ -451,6 +473,7 @@ class DatabaseTrainer:
                     json.dump(metadata, f, indent=2)
                 
                 print(f"Training completed. Models trained: {sum(results.values())}/3 (Version: {version_id})")
+                version_id = None
                 return True
             else:
                 print("Training failed for some models")
@@ -459,6 +482,10 @@ class DatabaseTrainer:
         except Exception as e:
             print(f"Error in training process: {e}")
             return False
+        finally:
+            # Drop the version of a failed or interrupted run
+            if version_id is not None:
+                self.delete_version(version_id)
     
     def _create_new_version(self):
         """Create a new version directory"""
@@ -489,17 +516,17 @@ class DatabaseTrainer:
         """Save trained models to version directory"""
         version_dir = os.path.join(self.versions_dir, version_id)
         
-        for model_name, model in self.models.items():
-            if model_name == 'response_templates':
-                # Save JSON templates
-                model_path = os.path.join(version_dir, f"{model_name}.json")
-                with open(model_path, 'w') as f:
-                    json.dump(model, f, indent=2)
-            else:
-                # Save pickle models
-                model_path = os.path.join(version_dir, f"{model_name}.pkl")
-                with open(model_path, 'wb') as f:
-                    pickle.dump(model, f)
+        # Save JSON templates
+        if 'response_templates' in self.models:
+            with open(os.path.join(version_dir, 'response_templates.json'), 'w') as f:
+                json.dump(self.models['response_templates'], f, indent=2)
+        
+        # Save the other models to the store; the version keeps their manifest
+        self.store.save_version(
+            version_dir,
+            {name: model for name, model in self.models.items() if name != 'response_templates'},
+            version_id=version_id
+        )
     
     def _update_current_models(self):
         """Update current models with latest versions"""
@@ -567,19 +594,25 @@ class DatabaseTrainer:
             
             loaded_models = 0
             
-            # Load intent classifier
-            intent_path = os.path.join(version_dir, 'intent_classifier.pkl')
-            if os.path.exists(intent_path):
-                with open(intent_path, 'rb') as f:
-                    self.models['intent_classifier'] = pickle.load(f)
-                loaded_models += 1
-            
-            # Load table classifier
-            table_path = os.path.join(version_dir, 'table_classifier.pkl')
-            if os.path.exists(table_path):
-                with open(table_path, 'rb') as f:
-                    self.models['table_classifier'] = pickle.load(f)
-                loaded_models += 1
+            # Memory-mapped from the store; versions saved before it hold pickles
+            stored = self.store.load_version(version_dir)
+            if stored is not None:
+                self.models.update(stored)
+                loaded_models += len(stored)
+            else:
+                # Load intent classifier
+                intent_path = os.path.join(version_dir, 'intent_classifier.pkl')
+                if os.path.exists(intent_path):
+                    with open(intent_path, 'rb') as f:
+                        self.models['intent_classifier'] = pickle.load(f)
+                    loaded_models += 1
+                
+                # Load table classifier
+                table_path = os.path.join(version_dir, 'table_classifier.pkl')
+                if os.path.exists(table_path):
+                    with open(table_path, 'rb') as f:
+                        self.models['table_classifier'] = pickle.load(f)
+                    loaded_models += 1
             
             # Load response templates
             templates_path = os.path.join(version_dir, 'response_templates.json')
@@ -619,9 +652,8 @@ class DatabaseTrainer:
                 print(f"Version {version_id} not found")
                 return False
             
-            # Remove version directory
-            import shutil
-            shutil.rmtree(version_dir)
+            # Remove version directory and the model objects only it used
+            self.store.delete_version(version_dir)
             
             print(f"Deleted version {version_id}")
             return True
@@ -643,7 +675,7 @@ class DatabaseTrainer:
                 # Add model files info
                 model_files = []
                 for file in os.listdir(version_dir):
-                    if file.endswith(('.pkl', '.json')) and file != 'version_info.json':
+                    if file.endswith(('.pkl', '.json')) and file not in ('version_info.json', 'manifest.json'):
                         file_path = os.path.join(version_dir, file)
                         stat = os.stat(file_path)
                         model_files.append({
@@ -653,6 +685,14 @@ class DatabaseTrainer:
                         })
                 
                 version_info['model_files'] = model_files
+                
+                # Checksums of the stored model objects
+                manifest = self.store.read_manifest(version_dir)
+                if manifest:
+                    version_info['stored_models'] = {
+                        name: dict(ref, verified=self.store.verify(ref))
+                        for name, ref in manifest['models'].items()
+                    }
                 return version_info
             else:
                 return None
@@ -687,6 +727,12 @@ class DatabaseTrainer:
                     self.models['response_templates'] = json.load(f)
                 models_loaded += 1
             
+            # Otherwise the latest trained version
+            if not models_loaded:
+                versions = self.get_model_versions()
+                if versions and self.load_models_from_version(versions[0]['version_id']):
+                    return True
+            
             print(f"Loaded {models_loaded} trained models")
             return models_loaded > 0
             
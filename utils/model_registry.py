@@ -0,0 +1,131 @@
+"""
+Process-wide registry of loaded chat models
+
+Unpickling the statistical, master SQL and master Python models is the slow
+part of answering a chat question, so the loaded set is kept in memory per
+database (db config hash, db_type) and shared by every request and thread.
+A reload builds the new set off to the side and swaps it in with a single
+assignment, so requests keep using the old models until the new ones are ready.
+"""
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+
+def config_hash(db_config, db_type) -> str:
+    """Same hash DatabaseTrainer records with each model version"""
+    return hashlib.md5((str(db_config) + str(db_type)).encode()).hexdigest()[:8]
+
+
+class ModelRegistry:
+    """
+    Loaded model sets keyed by (db config hash, db_type).
+
+    Args:
+        loader: Callable(db_config, db_type) returning the loaded model set
+    """
+
+    def __init__(self, loader: Callable[[Any, str], Any]):
+        self.loader = loader
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'reloads': 0, 'load_errors': 0,
+                       'total_load_ms': 0.0, 'max_load_ms': 0.0}
+
+    @staticmethod
+    def key(db_config, db_type) -> Tuple[str, str]:
+        return (config_hash(db_config, db_type), db_type)
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, db_config, db_type):
+        """The model set for a database, loading it on first use"""
+        key = self.key(db_config, db_type)
+        entry = self._entries.get(key)
+        if entry is not None:
+            with self._lock:
+                self._stats['hits'] += 1
+            return entry['models']
+
+        with self._lock:
+            self._stats['misses'] += 1
+        # One thread loads; others asking for the same database wait for it
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key, db_config, db_type)
+        return entry['models']
+
+    def reload(self, db_config, db_type, background: bool = False):
+        """
+        Load the current models from disk and swap them in, e.g. after
+        training or a rollback. Until the swap, requests use the old set.
+        """
+        key = self.key(db_config, db_type)
+
+        def run():
+            with self._key_lock(key):
+                with self._lock:
+                    self._stats['reloads'] += 1
+                self._load(key, db_config, db_type)
+
+        if background:
+            threading.Thread(target=run, name='model-reload', daemon=True).start()
+        else:
+            run()
+
+    def warm_up(self, db_config, db_type):
+        """Load a database's models on a background thread if they are not loaded yet"""
+        if not db_config or self.key(db_config, db_type) in self._entries:
+            return
+
+        def run():
+            try:
+                self.get(db_config, db_type)
+            except Exception as e:
+                print(f"[WARNING] Model warm-up failed: {e}")
+
+        threading.Thread(target=run, name='model-warm-up', daemon=True).start()
+
+    def invalidate(self, db_config, db_type):
+        """Drop a database's models; the next request loads them again"""
+        self._entries.pop(self.key(db_config, db_type), None)
+
+    def _load(self, key, db_config, db_type) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            models = self.loader(db_config, db_type)
+        except Exception:
+            with self._lock:
+                self._stats['load_errors'] += 1
+            raise
+        load_ms = (time.perf_counter() - started) * 1000
+        entry = {'models': models, 'loaded_at': time.time(), 'load_ms': round(load_ms, 3)}
+        # Atomic swap: readers see either the old entry or the new one
+        self._entries[key] = entry
+        with self._lock:
+            self._stats['loads'] += 1
+            self._stats['total_load_ms'] += load_ms
+            self._stats['max_load_ms'] = max(self._stats['max_load_ms'], load_ms)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit and model load-time metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'hit_rate': round(stats['hits'] / lookups, 3) if lookups else 0.0,
+            'avg_load_ms': round(stats['total_load_ms'] / stats['loads'], 3) if stats['loads'] else 0.0,
+            'total_load_ms': round(stats['total_load_ms'], 3),
+            'max_load_ms': round(stats['max_load_ms'], 3),
+            'databases': [
+                {'config_hash': key[0], 'db_type': key[1], 'loaded_at': entry['loaded_at'], 'load_ms': entry['load_ms']}
+                for key, entry in list(self._entries.items())
+            ],
+        })
+        return stats
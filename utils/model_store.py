@@ -0,0 +1,205 @@
+"""
+Content-addressed store for trained model artifacts
+
+Every trainer (DatabaseTrainer, MasterSQLTrainer, MasterPythonTrainer and the
+bat models) used to pickle each model into its own file and unpickle all of
+them on every load, so each worker process held a private copy. Models are now
+written once per content: an uncompressed joblib file named by the SHA-256 of
+its bytes under ``<root>/objects``. A version directory only holds a
+``manifest.json`` naming the objects (with checksum and size) that make it up.
+
+Loads use joblib memory mapping, so NumPy arrays inside a model (TF-IDF idf
+vectors, linear model coefficients, ...) are read-only views of the page cache
+shared by every process that loads the same object, and loaded objects are
+shared by every trainer in a process. The first load of an object in a process
+recomputes its checksum (verify()), so a corrupt or truncated file is never
+unpickled.
+
+Objects are written before the manifest that refers to them, possibly by
+another process, so collect_garbage() leaves objects written or reused within
+GC_GRACE seconds alone; a save in progress never loses its objects.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import joblib
+
+MANIFEST = 'manifest.json'
+OBJECTS_DIR = 'objects'
+HASH_CHUNK = 1 << 20
+
+# Seconds since an object was written or reused before garbage collection may delete it
+GC_GRACE = 3600.0
+
+
+class ModelStoreError(Exception):
+    """An artifact is missing or does not match its manifest"""
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """
+    Model objects under one root directory, shared by the versions below it.
+
+    Args:
+        root: Directory holding the objects directory and the trainers' version directories
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, OBJECTS_DIR)
+        self._loaded: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, f'{sha256}.joblib')
+
+    def put(self, obj: Any) -> Dict[str, Any]:
+        """Store an object (once per content) and return its reference {'sha256', 'size'}"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        tmp_path = os.path.join(self.objects_dir, f'.tmp_{uuid.uuid4().hex}')
+        try:
+            # Uncompressed: joblib can only memory-map plain files
+            joblib.dump(obj, tmp_path)
+            sha256 = _file_sha256(tmp_path)
+            size = os.path.getsize(tmp_path)
+            path = self.object_path(sha256)
+            try:
+                # Already stored: touching it keeps it out of collect_garbage until our manifest exists
+                os.utime(path)
+            except FileNotFoundError:
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return {'sha256': sha256, 'size': size}
+
+    def get(self, ref: Dict[str, Any], mmap_mode: Optional[str] = 'r') -> Any:
+        """Load an object by reference; repeated loads in a process return the same object"""
+        sha256 = ref['sha256']
+        obj = self._loaded.get(sha256)
+        if obj is not None:
+            return obj
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            raise ModelStoreError(f'Model object {sha256[:12]} is missing')
+        if ref.get('size') is not None and os.path.getsize(path) != ref['size']:
+            raise ModelStoreError(f'Model object {sha256[:12]} has the wrong size')
+        if not self.verify(ref):
+            raise ModelStoreError(f'Model object {sha256[:12]} does not match its checksum')
+        obj = joblib.load(path, mmap_mode=mmap_mode)
+        with self._lock:
+            return self._loaded.setdefault(sha256, obj)
+
+    def verify(self, ref: Dict[str, Any]) -> bool:
+        """Whether an object exists and its bytes match its checksum"""
+        path = self.object_path(ref['sha256'])
+        return os.path.exists(path) and _file_sha256(path) == ref['sha256']
+
+    def save_version(self, version_dir: str, models: Dict[str, Any], **metadata) -> Dict[str, Any]:
+        """
+        Store models and write the manifest of a version directory.
+
+        Args:
+            version_dir: Version directory (created if needed)
+            models: Model name -> object
+            metadata: Extra fields recorded in the manifest
+
+        Returns:
+            The manifest
+        """
+        os.makedirs(version_dir, exist_ok=True)
+        manifest = dict(metadata)
+        manifest.setdefault('created_at', datetime.now().isoformat())
+        manifest['models'] = {name: self.put(obj) for name, obj in models.items()}
+        tmp_path = os.path.join(version_dir, MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(version_dir, MANIFEST))
+        return manifest
+
+    @staticmethod
+    def read_manifest(version_dir: str) -> Optional[Dict[str, Any]]:
+        """A version's manifest, or None for versions saved before the store"""
+        try:
+            with open(os.path.join(version_dir, MANIFEST), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load_version(self, version_dir: str, mmap_mode: Optional[str] = 'r') -> Optional[Dict[str, Any]]:
+        """Model name -> object for a version, or None if it has no manifest"""
+        manifest = self.read_manifest(version_dir)
+        if manifest is None:
+            return None
+        return {name: self.get(ref, mmap_mode) for name, ref in manifest['models'].items()}
+
+    def verify_version(self, version_dir: str) -> Dict[str, bool]:
+        """Model name -> whether its object matches the checksum in the manifest"""
+        manifest = self.read_manifest(version_dir) or {'models': {}}
+        return {name: self.verify(ref) for name, ref in manifest['models'].items()}
+
+    def delete_version(self, version_dir: str):
+        """Remove a version directory and the objects no other version uses"""
+        shutil.rmtree(version_dir, ignore_errors=True)
+        self.collect_garbage()
+
+    def collect_garbage(self, grace: float = GC_GRACE) -> int:
+        """
+        Delete objects no manifest under the root refers to and that were not
+        written or reused in the last grace seconds; returns how many were deleted
+        """
+        if not os.path.isdir(self.objects_dir):
+            return 0
+        referenced = set()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != self.objects_dir]
+            if MANIFEST in filenames:
+                manifest = self.read_manifest(dirpath) or {'models': {}}
+                referenced.update(ref['sha256'] for ref in manifest['models'].values())
+        removed = 0
+        cutoff = time.time() - grace
+        for filename in os.listdir(self.objects_dir):
+            sha256, ext = os.path.splitext(filename)
+            if ext != '.joblib' or sha256 in referenced:
+                continue
+            path = os.path.join(self.objects_dir, filename)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        with self._lock:
+            for sha256 in list(self._loaded):
+                if sha256 not in referenced:
+                    del self._loaded[sha256]
+        return removed
+
+
+_stores: Dict[str, ModelStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_model_store(root: str) -> ModelStore:
+    """The process-wide store for a root directory"""
+    root = os.path.abspath(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = ModelStore(root)
+        return _stores[root]
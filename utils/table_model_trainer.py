@@ -0,0 +1,396 @@
+"""
+Table-level ML model training for the chat's /ml endpoints
+
+The training behind /ml/chat/train-auto (one model per table) and
+/ml/chat/train (one model on selected columns), moved out of the routes so it
+can run in a training job process (utils.training_jobs). Results carry the
+pickled models, which the routes put into the user's session when the job is
+collected.
+"""
+import pickle
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.ensemble import IsolationForest, RandomForestClassifier, RandomForestRegressor
+from sklearn.metrics import accuracy_score, mean_squared_error
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import LabelEncoder
+
+
+def train_tables_auto(db_path, model_type='classification', progress=None):
+    """
+    Train a model of model_type on every table of a SQLite database.
+
+    Args:
+        db_path: SQLite database path
+        model_type: 'classification', 'regression', 'clustering' or 'anomaly_detection'
+        progress: Called with (stage, message, percent) before each table
+
+    Returns:
+        Response fields of /ml/chat/train-auto, plus 'full_models' (pickled model data per table)
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        # Get all tables
+        tables_query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        tables_df = pd.read_sql_query(tables_query, conn)
+        tables = tables_df['name'].tolist()
+
+        if not tables:
+            return {
+                'success': False,
+                'message': 'No tables found in database'
+            }
+
+        # Train models on ALL tables in the database
+        models_trained = []
+        failed_tables = []
+        full_models = []
+
+        for index, table in enumerate(tables):
+            if progress:
+                progress('fit_table', f'Training {model_type} model on {table}...', 5 + 90 * index / len(tables))
+            try:
+                # Get table schema and sample data
+                schema_query = f"PRAGMA table_info({table})"
+                schema_df = pd.read_sql_query(schema_query, conn)
+                columns = schema_df['name'].tolist()
+
+                # Load sample data to determine data types
+                sample_query = f"SELECT * FROM {table} LIMIT 100"
+                df = pd.read_sql_query(sample_query, conn)
+
+                # Filter suitable features (exclude id, timestamps, and columns with too many unique values)
+                suitable_features = []
+                for col in columns:
+                    if col in ['id', 'created_at', 'updated_at', 'timestamp', 'date']:
+                        continue
+
+                    # Check if column has reasonable data for ML
+                    unique_count = df[col].nunique()
+                    null_count = df[col].isnull().sum()
+
+                    # Skip columns with too many unique values (likely IDs) or too many nulls
+                    if unique_count > len(df) * 0.8 or null_count > len(df) * 0.5:
+                        continue
+
+                    suitable_features.append(col)
+
+                if len(suitable_features) < 2:
+                    failed_tables.append(f"{table}: Insufficient features")
+                    continue
+
+                # Basic data preprocessing
+                df_clean = df[suitable_features].dropna()
+
+                if len(df_clean) < 10:
+                    failed_tables.append(f"{table}: Insufficient clean data")
+                    continue
+
+                # Auto-select target variable for supervised learning
+                target_variable = None
+                if model_type in ['classification', 'regression']:
+                    # Find a good target variable (categorical for classification, numeric for regression)
+                    for col in suitable_features:
+                        if model_type == 'classification' and df_clean[col].dtype == 'object':
+                            if 2 <= df_clean[col].nunique() <= 10:  # Good for classification
+                                target_variable = col
+                                break
+                        elif model_type == 'regression' and df_clean[col].dtype in ['int64', 'float64']:
+                            target_variable = col
+                            break
+
+                # Prepare features
+                features = [col for col in suitable_features if col != target_variable]
+                X = df_clean[features]
+
+                # Handle categorical variables
+                label_encoders = {}
+                for col in X.select_dtypes(include=['object']).columns:
+                    le = LabelEncoder()
+                    X[col] = le.fit_transform(X[col].astype(str))
+                    label_encoders[col] = le
+
+                # Train model based on type
+                if model_type == 'classification':
+                    if not target_variable:
+                        # Create a synthetic target if none found
+                        target_variable = features[0]
+                        y = (X[target_variable] > X[target_variable].median()).astype(int)
+                    else:
+                        y = df_clean[target_variable]
+                        if y.dtype == 'object':
+                            y_le = LabelEncoder()
+                            # Handle None/NaN values by converting to string first
+                            y_clean = y.astype(str).fillna('Unknown')
+                            y_le.fit(y_clean)
+                            y = y_le.transform(y_clean)
+                            label_encoders['target'] = y_le
+
+                    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+                    model = RandomForestClassifier(n_estimators=100, random_state=42)
+                    model.fit(X_train, y_train)
+
+                    y_pred = model.predict(X_test)
+                    accuracy = accuracy_score(y_test, y_pred)
+
+                    metrics = {
+                        'accuracy': accuracy,
+                        'samples': len(df_clean),
+                        'features': len(features),
+                        'test_samples': len(X_test),
+                        'target_variable': target_variable
+                    }
+
+                elif model_type == 'regression':
+                    if not target_variable:
+                        # Use first numeric feature as target
+                        numeric_features = [col for col in features if X[col].dtype in ['int64', 'float64']]
+                        if numeric_features:
+                            target_variable = numeric_features[0]
+                            features.remove(target_variable)
+                            X = X[features]
+                            y = X[target_variable]
+                        else:
+                            failed_tables.append(f"{table}: No suitable numeric target")
+                            continue
+                    else:
+                        y = df_clean[target_variable]
+
+                    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+                    model = RandomForestRegressor(n_estimators=100, random_state=42)
+                    model.fit(X_train, y_train)
+
+                    y_pred = model.predict(X_test)
+                    mse = mean_squared_error(y_test, y_pred)
+                    rmse = np.sqrt(mse)
+
+                    metrics = {
+                        'mse': mse,
+                        'rmse': rmse,
+                        'samples': len(df_clean),
+                        'features': len(features),
+                        'test_samples': len(X_test),
+                        'target_variable': target_variable
+                    }
+
+                elif model_type == 'clustering':
+                    model = KMeans(n_clusters=min(3, len(X)), random_state=42)
+                    model.fit(X)
+
+                    labels = model.labels_
+                    metrics = {
+                        'clusters': len(np.unique(labels)),
+                        'samples': len(df_clean),
+                        'features': len(features),
+                        'inertia': model.inertia_
+                    }
+
+                elif model_type == 'anomaly_detection':
+                    model = IsolationForest(contamination=0.1, random_state=42)
+                    model.fit(X)
+
+                    predictions = model.predict(X)
+                    anomalies = sum(1 for p in predictions if p == -1)
+
+                    metrics = {
+                        'anomalies': anomalies,
+                        'anomaly_rate': anomalies / len(df_clean),
+                        'samples': len(df_clean),
+                        'features': len(features)
+                    }
+
+                # Store model info (without sklearn objects for JSON serialization)
+                model_info = {
+                    'table': table,
+                    'model_type': model_type,
+                    'features': features,
+                    'target_variable': target_variable,
+                    'label_encoders_count': len(label_encoders),
+                    'metrics': metrics
+                }
+                models_trained.append(model_info)
+
+                # Store full model data with sklearn objects for pickle (separate from JSON response)
+                full_model_data = {
+                    'table': table,
+                    'model': model,
+                    'model_type': model_type,
+                    'features': features,
+                    'target_variable': target_variable,
+                    'label_encoders': label_encoders,
+                    'metrics': metrics
+                }
+                full_models.append(pickle.dumps(full_model_data))
+
+            except Exception as e:
+                failed_tables.append(f"{table}: {str(e)}")
+                continue
+    finally:
+        conn.close()
+
+    if not models_trained:
+        return {
+            'success': False,
+            'message': f'No models could be trained. Failed tables: {"; ".join(failed_tables)}'
+        }
+
+    return {
+        'success': True,
+        'message': f'Trained {len(models_trained)} {model_type} models successfully',
+        'models_trained': len(models_trained),
+        'failed_tables': len(failed_tables),
+        'model_summaries': [
+            {
+                'table': model['table'],
+                'accuracy': model['metrics'].get('accuracy', 'N/A'),
+                'samples': model['metrics']['samples'],
+                'features': model['metrics']['features']
+            } for model in models_trained
+        ],
+        'details': models_trained,
+        'full_models': full_models
+    }
+
+
+def train_table_model(db_path, model_type, data_source, target_variable, features, test_size=0.2, progress=None):
+    """
+    Train one model on selected columns of a table.
+
+    Returns:
+        Response fields of /ml/chat/train, plus 'model_data' (the pickled model data)
+    """
+    if progress:
+        progress('collect', f'Loading {data_source}...', 10)
+    conn = sqlite3.connect(db_path)
+    try:
+        # Load data
+        query = f"SELECT {', '.join(features + ([target_variable] if target_variable else []))} FROM {data_source}"
+        df = pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+
+    # Basic data preprocessing
+    df = df.dropna()
+
+    if len(df) < 10:
+        return {
+            'success': False,
+            'message': 'Insufficient data for training (need at least 10 samples)'
+        }
+
+    if progress:
+        progress('fit', f'Training {model_type} model...', 40)
+    X = df[features]
+
+    # Handle categorical variables
+    label_encoders = {}
+    for col in X.select_dtypes(include=['object']).columns:
+        le = LabelEncoder()
+        X[col] = le.fit_transform(X[col].astype(str))
+        label_encoders[col] = le
+
+    if model_type == 'classification':
+        if not target_variable:
+            return {
+                'success': False,
+                'message': 'Target variable required for classification'
+            }
+
+        y = df[target_variable]
+        if y.dtype == 'object':
+            y_le = LabelEncoder()
+            y = y_le.fit_transform(y.astype(str))
+            label_encoders['target'] = y_le
+
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+
+        model = RandomForestClassifier(n_estimators=100, random_state=42)
+        model.fit(X_train, y_train)
+
+        y_pred = model.predict(X_test)
+        accuracy = accuracy_score(y_test, y_pred)
+
+        metrics = {
+            'accuracy': accuracy,
+            'samples': len(df),
+            'features': len(features),
+            'test_samples': len(X_test)
+        }
+
+    elif model_type == 'regression':
+        if not target_variable:
+            return {
+                'success': False,
+                'message': 'Target variable required for regression'
+            }
+
+        y = df[target_variable]
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+
+        model = RandomForestRegressor(n_estimators=100, random_state=42)
+        model.fit(X_train, y_train)
+
+        y_pred = model.predict(X_test)
+        mse = mean_squared_error(y_test, y_pred)
+        rmse = np.sqrt(mse)
+
+        metrics = {
+            'mse': mse,
+            'rmse': rmse,
+            'samples': len(df),
+            'features': len(features),
+            'test_samples': len(X_test)
+        }
+
+    elif model_type == 'clustering':
+        model = KMeans(n_clusters=3, random_state=42)
+        model.fit(X)
+
+        labels = model.labels_
+        metrics = {
+            'clusters': len(np.unique(labels)),
+            'samples': len(df),
+            'features': len(features),
+            'inertia': model.inertia_
+        }
+
+    elif model_type == 'anomaly_detection':
+        # Simple anomaly detection using isolation forest
+        model = IsolationForest(contamination=0.1, random_state=42)
+        model.fit(X)
+
+        predictions = model.predict(X)
+        anomalies = sum(1 for p in predictions if p == -1)
+
+        metrics = {
+            'anomalies': anomalies,
+            'anomaly_rate': anomalies / len(df),
+            'samples': len(df),
+            'features': len(features)
+        }
+
+    model_data = {
+        'model': model,
+        'model_type': model_type,
+        'features': features,
+        'target_variable': target_variable,
+        'label_encoders': label_encoders,
+        'metrics': metrics
+    }
+
+    return {
+        'success': True,
+        'message': f'{model_type.title()} model trained successfully',
+        'model': {
+            'type': model_type,
+            'features': features,
+            'target': target_variable
+        },
+        'metrics': metrics,
+        'model_data': pickle.dumps(model_data)
+    }
@@ -0,0 +1,158 @@
+"""
+Parsed AB1 trace store
+
+Upload, consensus re-generation, the Python assembly and the chromatogram
+viewer each used to call SeqIO.read(filepath, 'abi') on the same files, and
+every call parses the whole binary trace again. Each AB1 file is now parsed
+once, at upload, into compact arrays saved next to it as
+
+    <file>.trace.npz
+        sequence        base calls (uint8, ASCII)
+        quality         phred quality (uint8)
+        traces          A, C, G, T channels (int16, 4 x scans; the ABIF DATA
+                        channels are 16-bit, reordered by the FWO_ tag)
+        base_positions  peak location of each base call (int32, PLOC2)
+        sample_name     SMPL tag, used to detect the read direction
+        source          size and mtime of the AB1 file, and TRACE_VERSION
+
+load_trace() reads the store and only parses the AB1 file again if the store
+is missing, from an older TRACE_VERSION, or older than the file. The store is
+removed with the session folder.
+"""
+import os
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+from Bio import SeqIO
+
+# Bump when the stored arrays change
+TRACE_VERSION = 1
+
+TRACE_SUFFIX = '.trace.npz'
+
+TRACE_BASES = 'ACGT'
+
+
+class AB1Trace:
+    """Base calls, quality and trace channels of one AB1 (or SCF) file"""
+
+    def __init__(self, sequence: np.ndarray, quality: np.ndarray, traces: np.ndarray,
+                 base_positions: np.ndarray, sample_name: str = ''):
+        self.sequence_codes = sequence
+        self.quality_array = quality
+        self.traces = traces
+        self.base_positions_array = base_positions
+        self.sample_name = sample_name
+
+    @property
+    def sequence(self) -> str:
+        return self.sequence_codes.tobytes().decode('ascii')
+
+    @property
+    def quality(self) -> List[int]:
+        return self.quality_array.tolist()
+
+    @property
+    def base_positions(self) -> List[int]:
+        return self.base_positions_array.tolist()
+
+    @property
+    def trace_data(self) -> Dict[str, List[int]]:
+        """Trace channels by base, as the chromatogram viewer expects them"""
+        return {base: self.traces[i].tolist() if self.traces.shape[1] else [] for i, base in enumerate(TRACE_BASES)}
+
+    def __len__(self):
+        return len(self.sequence_codes)
+
+
+def trace_path(filepath: str) -> str:
+    """Path of the trace store of an AB1 file"""
+    return filepath + TRACE_SUFFIX
+
+
+def _decode(value) -> str:
+    return value.decode('ascii', errors='ignore') if isinstance(value, bytes) else str(value or '')
+
+
+def _tag(abif_raw, name: str, default):
+    # Biopython keys tags by name and number (FWO_1, SMPL1)
+    return abif_raw.get(f'{name}1', abif_raw.get(name, default))
+
+
+def parse_trace(filepath: str) -> AB1Trace:
+    """Parse an AB1 (or SCF) file with Biopython"""
+    record = SeqIO.read(filepath, 'abi' if not filepath.endswith('.scf') else 'scf')
+    abif_raw = record.annotations.get('abif_raw', {}) if hasattr(record, 'annotations') else {}
+
+    # Map the DATA9-12 channels to bases by the filter wheel order (FWO_)
+    fwo = _decode(_tag(abif_raw, 'FWO_', b'GATC'))
+    channels = [abif_raw.get(f'DATA{9 + i}', ()) for i in range(4)]
+    scans = max((len(channel) for channel in channels), default=0)
+    traces = np.zeros((4, scans), dtype=np.int16)
+    for i, base in enumerate(fwo[:4]):
+        if base in TRACE_BASES and len(channels[i]):
+            traces[TRACE_BASES.index(base), :len(channels[i])] = channels[i]
+
+    return AB1Trace(
+        np.frombuffer(str(record.seq).encode('ascii'), dtype=np.uint8),
+        np.asarray(record.letter_annotations.get('phred_quality', []), dtype=np.uint8),
+        traces,
+        np.asarray(abif_raw.get('PLOC2', ()), dtype=np.int32),
+        _decode(_tag(abif_raw, 'SMPL', b''))
+    )
+
+
+def _source_stamp(filepath: str) -> np.ndarray:
+    stat = os.stat(filepath)
+    return np.array([stat.st_size, stat.st_mtime_ns, TRACE_VERSION], dtype=np.int64)
+
+
+def save_trace(trace: AB1Trace, filepath: str):
+    """Write the trace store of filepath (the AB1 file) atomically"""
+    path = trace_path(filepath)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # Uncompressed: loading is a plain read
+            np.savez(f, sequence=trace.sequence_codes, quality=trace.quality_array, traces=trace.traces,
+                     base_positions=trace.base_positions_array, sample_name=np.array(trace.sample_name),
+                     source=_source_stamp(filepath))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_store(filepath: str):
+    path = trace_path(filepath)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if os.path.exists(filepath):
+                if not np.array_equal(data['source'], _source_stamp(filepath)):
+                    return None
+            elif int(data['source'][2]) != TRACE_VERSION:
+                return None
+            return AB1Trace(data['sequence'], data['quality'], data['traces'], data['base_positions'],
+                            str(data['sample_name']))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARNING] Unreadable trace store {path}: {e}")
+        return None
+
+
+def load_trace(filepath: str) -> AB1Trace:
+    """
+    Trace of an AB1 file, from its store if it is current, otherwise parsed
+    (and stored for the next call).
+    """
+    trace = _read_store(filepath)
+    if trace is None:
+        trace = parse_trace(filepath)
+        try:
+            save_trace(trace, filepath)
+        except OSError as e:
+            print(f"[WARNING] Could not store trace of {filepath}: {e}")
+    return trace
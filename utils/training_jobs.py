@@ -0,0 +1,270 @@
+"""
+Background training jobs for the chat models
+
+/chat/training/start and the /ml/chat/train* routes used to train inside the
+HTTP request, blocking a worker thread until the browser gave up. They now
+queue a training job here. Jobs run in a separate process pool, so fitting does
+not compete with request threads for the GIL. Stage progress is sent back over
+a queue and pushed to the job's SocketIO room (``training_job_<id>``).
+
+A second request to train the same thing on the same database while a job is
+queued or running joins that job instead of starting another one. Cancelling
+a queued job stops it from starting. A running job stops at its next stage,
+and its model version is discarded.
+"""
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict
+
+from database.background_jobs import BackgroundJob, BackgroundJobManager
+from utils.model_registry import config_hash
+
+# Set in each worker process by _init_worker
+_progress_queue = None
+_cancelled = None
+_current_job = None
+
+
+class TrainingCancelled(Exception):
+    """The job was cancelled while it was running"""
+
+
+def _init_worker(progress_queue, cancelled):
+    global _progress_queue, _cancelled
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+
+
+def _cancel_requested() -> bool:
+    return _cancelled is not None and _current_job in _cancelled
+
+
+def report_progress(stage: str, status: str, percent: float = None):
+    """
+    Progress callback handed to the trainers in a worker process. Raises
+    TrainingCancelled once the job has been cancelled.
+    """
+    if _cancel_requested():
+        raise TrainingCancelled()
+    if _progress_queue is not None:
+        _progress_queue.put((_current_job, stage, status, percent))
+
+
+def _train_chat_models(params):
+    """Statistical models (DatabaseTrainer), then the master SQL/Python models if asked for"""
+    from utils.master_python_trainer import train_master_python
+    from utils.master_sql_trainer import train_master_sql
+    from utils.ml_trainer import DatabaseTrainer
+
+    trainers = params.get('trainers') or ['statistical']
+    db_config, db_type = params['db_config'], params['db_type']
+    trained = []
+    for index, name in enumerate(trainers):
+        def progress(stage, status, percent, index=index, name=name):
+            # Each trainer gets an equal share of the job's progress
+            report_progress(f'{name}:{stage}', status, (index + (percent or 0) / 100.0) * 100.0 / len(trainers))
+
+        if name == 'statistical':
+            trainer = DatabaseTrainer(db_config, db_type)
+            success = trainer.train_all_models(progress=progress)
+        elif name == 'master_sql':
+            success = train_master_sql(db_config, db_type, progress=progress)
+        elif name == 'master_python':
+            success = train_master_python(db_config, db_type, progress=progress)
+        else:
+            raise ValueError(f'Unknown trainer: {name}')
+
+        if _cancel_requested():
+            raise TrainingCancelled()
+        if not success:
+            return {'success': False, 'message': f'Training failed for the {name} models', 'trained': trained}
+        trained.append(name)
+
+    report_progress('done', 'Loading model info...', 99)
+    trainer = DatabaseTrainer(db_config, db_type)
+    return {
+        'success': True,
+        'message': 'Models trained successfully!',
+        'trained': trained,
+        'model_info': trainer.get_model_info(),
+        'training_status': trainer.get_training_status()
+    }
+
+
+def _train_tables_auto(params):
+    from utils.table_model_trainer import train_tables_auto
+    return train_tables_auto(params['db_path'], params['model_type'], progress=report_progress)
+
+
+def _train_table_model(params):
+    from utils.table_model_trainer import train_table_model
+    return train_table_model(params['db_path'], params['model_type'], params['data_source'],
+                             params['target_variable'], params['features'], params['test_size'],
+                             progress=report_progress)
+
+
+TASKS = {
+    'chat_models': _train_chat_models,
+    'table_models_auto': _train_tables_auto,
+    'table_model': _train_table_model,
+}
+
+
+def _run_task(job_id: str, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Entry point of a job in a worker process"""
+    global _current_job
+    _current_job = job_id
+    try:
+        if _cancel_requested():
+            raise TrainingCancelled()
+        return TASKS[kind](params)
+    finally:
+        _current_job = None
+
+
+class TrainingJob(BackgroundJob):
+    """One training run waiting for, or going through, a worker process"""
+
+    ROOM_PREFIX = 'training_job'
+
+    def __init__(self, job_id: str, owner: Any, kind: str, dedupe_key: tuple):
+        super().__init__(job_id, owner, kind=kind, stage='queued', progress=0, cancelled=False)
+        self.owners = {owner}
+        self.kind = kind
+        self.dedupe_key = dedupe_key
+        self.future = None
+        self.on_success = None
+        self.payload = {}
+
+    def owned_by(self, owner: Any) -> bool:
+        return owner in self.owners
+
+    def _apply(self, changes: Dict[str, Any]):
+        if self._state['completed'] and 'completed' not in changes:
+            # Late progress from the worker must not overwrite the final state
+            return
+        self._state.update(changes)
+
+
+class TrainingJobManager(BackgroundJobManager):
+    """
+    Runs training jobs in a process pool and tracks them by job ID.
+
+    Args:
+        max_workers: Training processes; further jobs wait in the queue
+        ttl: Seconds a finished job is kept
+        emit_interval: Minimum seconds between progress events for one job
+    """
+
+    EVENT = 'training_progress'
+
+    # Result fields kept out of the job state (pickled models for the session)
+    PAYLOAD_FIELDS = ('full_models', 'model_data')
+
+    def __init__(self, max_workers: int = 2, ttl: float = 3600.0, emit_interval: float = 0.25):
+        super().__init__(max_workers, ttl, emit_interval)
+        self._cancelled = None
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that runs server threads is not safe
+        context = multiprocessing.get_context('spawn')
+        manager = context.Manager()
+        progress_queue = manager.Queue()
+        self._cancelled = manager.dict()
+        threading.Thread(target=self._listen, args=(progress_queue,), name='training-progress',
+                         daemon=True).start()
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                   initializer=_init_worker, initargs=(progress_queue, self._cancelled))
+
+    @staticmethod
+    def dedupe_key(kind: str, db_config, db_type: str, *options) -> tuple:
+        """Jobs with the same key train the same models on the same database"""
+        return (kind, config_hash(db_config, db_type)) + tuple(str(option) for option in options)
+
+    def submit(self, owner: Any, kind: str, params: Dict[str, Any], dedupe_key: tuple,
+               on_success: Callable[[Dict[str, Any]], Any] = None) -> TrainingJob:
+        """
+        Queue a training job, or join the active job with the same dedupe key.
+
+        Args:
+            owner: Owners can see, join and cancel the job
+            kind: Key of TASKS
+            params: Arguments of the task (picklable)
+            dedupe_key: See dedupe_key()
+            on_success: Called in this process with the result of a successful job
+        """
+        self.expire()
+        pool = self._pool()
+        with self._lock:
+            for job in self._jobs.values():
+                if job.dedupe_key == dedupe_key and not job.completed:
+                    job.owners.add(owner)
+                    return job
+            job = TrainingJob(uuid.uuid4().hex, owner, kind, dedupe_key)
+            job.on_success = on_success
+            self._jobs[job.job_id] = job
+        job.future = pool.submit(_run_task, job.job_id, kind, params)
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def cancel(self, job_id: str, owner: Any) -> bool:
+        """Cancel a job. A queued job never starts; a running one stops at its next stage."""
+        job = self.get(job_id, owner)
+        if job is None or job.completed:
+            return False
+        self._cancelled[job.job_id] = True
+        if not job.future.cancel():
+            self._emit(job, job.update(status='Cancelling...'), force=True)
+        return True
+
+    def _on_expired(self, job: TrainingJob):
+        if self._cancelled is not None:
+            self._cancelled.pop(job.job_id, None)
+
+    def _listen(self, progress_queue):
+        """Forward progress reported by the worker processes to the jobs' rooms"""
+        while True:
+            try:
+                job_id, stage, status, percent = progress_queue.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            changes = {'stage': stage, 'status': status}
+            if percent is not None:
+                changes['progress'] = round(min(99.0, percent), 1)
+            self._emit(job, job.update(**changes))
+
+    def _finish(self, job: TrainingJob, future):
+        job.finished_at = time.time()
+        if future.cancelled():
+            self._emit(job, job.update(status='Training cancelled', cancelled=True, completed=True, success=False),
+                       force=True)
+            return
+        try:
+            result = future.result()
+        except TrainingCancelled:
+            self._emit(job, job.update(status='Training cancelled', cancelled=True, completed=True, success=False),
+                       force=True)
+            return
+        except Exception as e:
+            self._emit(job, job.update(status=f'Training error: {str(e)}', completed=True, success=False), force=True)
+            return
+
+        job.payload = {field: result.pop(field) for field in self.PAYLOAD_FIELDS if field in result}
+        if result.get('success') and job.on_success:
+            try:
+                job.on_success(result)
+            except Exception as e:
+                print(f"[ERROR] Post-training step failed for job {job.job_id}: {e}")
+        self._emit(job, job.update(status=result.get('message', 'Training finished'), progress=100,
+                                   completed=True, success=bool(result.get('success')), result=result),
+                   force=True)
+
+
+training_jobs = TrainingJobManager()